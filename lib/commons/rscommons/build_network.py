@@ -12,11 +12,11 @@
 #
 # Date:     15 May 2019
 # -------------------------------------------------------------------------------
-from typing import List
+from typing import List, Set
 from osgeo import ogr
 from rsxml import Logger
 from rscommons import get_shp_or_gpkg, VectorBase
-from rscommons.vector_ops import get_geometry_unary_union
+from rscommons.spatial_join import join_fids, iterate_joined_features
 
 # https://nhd.usgs.gov/userGuide/Robohelpfiles/NHD_User_Guide/Feature_Catalog/Hydrography_Dataset/Complete_FCode_List.htm
 FCodeValues = {
@@ -90,25 +90,27 @@ def build_network(flowlines_path: str,
 
     # Process artifical paths through small waterbodies
     if waterbodies_path is not None and waterbody_max_size is not None:
-        small_waterbodies = get_geometry_unary_union(waterbodies_path, epsg, attribute_filter=f'AreaSqKm <= ({waterbody_max_size})')
+        small_waterbody_fids = join_fids(flowlines_path, waterbodies_path, 'intersects',
+                                         source_filter=f'FCode = {ARTIFICIAL_REACHES}',
+                                         join_filter=f'AreaSqKm <= ({waterbody_max_size})')
         log.info(f'Retaining artificial features within waterbody features smaller than {waterbody_max_size}km2')
         process_reaches(flowlines_path,
                         out_path,
                         transform=transform,
                         attribute_filter=f'FCode = {ARTIFICIAL_REACHES}',
-                        clip_shape=small_waterbodies
+                        fids=small_waterbody_fids
                         )
 
     # Retain artifical paths through flow areas
     if flowareas_path:
-        flow_polygons = get_geometry_unary_union(flowareas_path, epsg)
-        if flow_polygons:
+        flow_area_fids = join_fids(flowlines_path, flowareas_path, 'intersects', source_filter=f'FCode = {ARTIFICIAL_REACHES}')
+        if len(flow_area_fids) > 0:
             log.info('Retaining artificial features within flow area features')
             process_reaches(flowlines_path,
                             out_path,
                             transform=transform,
                             attribute_filter=f'FCode = {ARTIFICIAL_REACHES}',
-                            clip_shape=flow_polygons
+                            fids=flow_area_fids
                             )
 
         else:
@@ -121,7 +123,7 @@ def build_network(flowlines_path: str,
     return out_spatial_ref
 
 
-def process_reaches(in_path: str, out_path: str, attribute_filter=None, transform=None, clip_shape=None):
+def process_reaches(in_path: str, out_path: str, attribute_filter=None, transform=None, clip_shape=None, fids: Set[int] = None):
     """[summary]
 
     Args:
@@ -130,12 +132,18 @@ def process_reaches(in_path: str, out_path: str, attribute_filter=None, transfor
         attribute_filter ([type], optional): [description]. Defaults to None.
         transform ([type], optional): [description]. Defaults to None.
         clip_shape ([type], optional): [description]. Defaults to None.
+        fids (Set[int], optional): only copy these features (e.g. from spatial_join.join_fids). Defaults to None.
     """
     log = Logger('process reaches')
 
     with get_shp_or_gpkg(in_path) as in_lyr, get_shp_or_gpkg(out_path, write=True) as out_lyr:
 
-        for feature, _counter, _progbar in in_lyr.iterate_features("Processing reaches", attribute_filter=attribute_filter, clip_shape=clip_shape, write_layers=[out_lyr]):
+        if fids is not None:
+            features = iterate_joined_features(in_lyr, fids, "Processing reaches", attribute_filter=attribute_filter, write_layers=[out_lyr])
+        else:
+            features = in_lyr.iterate_features("Processing reaches", attribute_filter=attribute_filter, clip_shape=clip_shape, write_layers=[out_lyr])
+
+        for feature, _counter, _progbar in features:
             # get the input geometry and reproject the coordinates
             geom = feature.GetGeometryRef()
             if geom.Length() < 1e-10:
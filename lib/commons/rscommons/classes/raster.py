@@ -6,6 +6,7 @@ from osgeo import ogr, osr, gdal
 import numpy as np
 from shapely.geometry import Polygon
 from rsxml import Logger
+from rscommons.raster_sampling import points_to_xy, sample_array
 
 
 class Raster:
@@ -145,23 +146,17 @@ class Raster:
 
         return val
 
-    def lookupRasterValues(self, points):
+    def lookupRasterValues(self, points, method='nearest'):
         """
         Given an array of points with real-world coordinates, lookup values in raster
-        then mask out any nan/nodata values
-        :param points:
-        :param raster:
-        :return:
+        then mask out any nan/nodata values. All the points are converted to pixel
+        indices at once (see rscommons.raster_sampling)
+        :param points: shapely points or (x, y) tuples
+        :param method: 'nearest' or 'bilinear'
+        :return: dictionary with the points and a masked array of their values
         """
-        pointsdict = {"points": points, "values": []}
-
-        for pt in pointsdict['points']:
-            pointsdict['values'].append(self.getPixelVal(pt.coords[0]))
-
-        # Mask out the np.nan values
-        pointsdict['values'] = np.ma.masked_invalid(pointsdict['values'])
-
-        return pointsdict
+        xs, ys = points_to_xy(points)
+        return {"points": points, "values": sample_array(self.array, self.gt, xs, ys, self.nodata, method)}
 
     def write(self, outputRaster):
         """
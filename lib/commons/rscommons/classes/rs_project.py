@@ -14,6 +14,7 @@ import shutil
 import datetime
 from copy import copy
 import json
+import xml.etree.ElementTree as ET
 
 import rasterio.shutil
 from osgeo import ogr
@@ -605,117 +606,125 @@ class RSProject:
             in_proj_files (List[str]): [description]
         """
 
-        working_id_list = copy(rs_id_map)
-
-        # Loop over input project.rs.xml files
-        input_path_meta = []
-        # found_keys = []  # list of found nodes so that they don't get repeated if they exist in two projects
-        # found_in_keys = {}
-        for in_prj_path in in_proj_files:
-            in_prj = RSProject(None, in_prj_path)
-
-            proj_type = in_prj.XMLBuilder.find('ProjectType').text
-            warehouse_node = in_prj.XMLBuilder.find('Warehouse')
-            if warehouse_node is None:
-                continue
-            warehouse_id = warehouse_node.attrib.get('id', None)
-            apiurl = warehouse_node.attrib.get('apiUrl', None)
-            if 'staging' in apiurl:
-                apipath = 'https://staging.data.riverscapes.net/p/'
-            else:
-                apipath = 'https://data.riverscapes.net/p/'
-            input_path_meta.append(RSMeta(f'{proj_type} Input', apipath + warehouse_id, RSMetaTypes.URL, locked=True))
-
-            # Find watershed name in metadata, add if it exists
-            watershed_node = in_prj.XMLBuilder.find('MetaData').find('Meta[@name="Watershed"]')
-            if watershed_node is not None:
-                proj_watershed_node = self.XMLBuilder.find('MetaData').find('Meta[@name="Watershed"]')
-                if proj_watershed_node is None:
-                    self.add_metadata([RSMeta('Watershed', watershed_node.text)])
-
-            # Define our default, generic warehouse and project meta
-            projmeta: Dict[str, RSMeta] = self.meta_keys_ext(in_prj.get_metadata(), RSMetaExt.PROJECT)
-            if 'DEXID' not in projmeta and warehouse_id is not None:
-                projmeta['DEXID'] = RSMeta("DEXID", warehouse_id, RSMetaTypes.GUID, meta_ext=RSMetaExt.WAREHOUSE)
-
-            projtype = None
-            # look for any valid mappings and move metadata into them
-            for id_out, id_in in working_id_list.items():
-                lyrnod_in = None
-                for n in in_prj.XMLBuilder.tree.iter():
-                    if n.tag == 'ProjectType':
-                        projtype = n.text
-                    if 'lyrName' in n.attrib.keys():
-                        if n.attrib['lyrName'] == id_in[0] and projtype == id_in[1]:
-                            # if id_in in found_in_keys.keys():
-                            #     if projtype in found_in_keys[id_in]:
-                            #         continue
-                            lyrnod_in = n
-                    elif 'id' in n.attrib.keys():
-                        if n.attrib['id'] == id_in[0] and projtype == id_in[1]:
-                            # if id_in in found_in_keys.keys():
-                            #     if projtype in found_in_keys[id_in]:
-                            #         continue
-                            lyrnod_in = n
-
-                if lyrnod_in is None:
+        # Every metadata change below is serialized once at the end
+        with self.XMLBuilder.batch():
+            working_id_list = copy(rs_id_map)
+
+            # The layer nodes of the output project are indexed once. Only metadata and descriptions are added below
+            # so the index stays valid for every input project.
+            out_layer_nodes = {key: node for (key, _projtype), node in self.layer_node_index(self.XMLBuilder).items()}
+
+            # Loop over input project.rs.xml files
+            input_path_meta = []
+            # found_keys = []  # list of found nodes so that they don't get repeated if they exist in two projects
+            # found_in_keys = {}
+            for in_prj_path in in_proj_files:
+                in_prj = RSProject(None, in_prj_path)
+
+                proj_type = in_prj.XMLBuilder.find('ProjectType').text
+                warehouse_node = in_prj.XMLBuilder.find('Warehouse')
+                if warehouse_node is None:
                     continue
-                # lyrnod_in = in_prj.XMLBuilder.find('Realizations').find('Realization').find('.//*[@id="{}"]'.format(id_in))
-                lyrmeta: List[RSMeta] = self.meta_keys_ext(in_prj.get_metadata(lyrnod_in), RSMetaExt.DATASET)
-                lyrdesc = lyrnod_in.find('Description')
-
-                lyrnod_out = None
-                for m in self.XMLBuilder.tree.iter():
-                    if 'lyrName' in m.attrib.keys():
-                        if m.attrib['lyrName'] == id_out:
-                            lyrnod_out = m
-                    elif 'id' in m.attrib.keys():
-                        if m.attrib['id'] == id_out:
-                            lyrnod_out = m
-
-                # lyrnod_out = self.XMLBuilder.find('Realizations').find('Realization').find('.//*[@id="{}"]'.format(id_out))
-
-                # if id_out not in found_keys and lyrnod_in is not None and lyrnod_out is not None:
-                if lyrnod_in is not None and lyrnod_out is not None:
-                    # found_keys.append(id_out)
-                    # if id_in in found_in_keys.keys():
-                    #     found_in_keys[id_in].append(projtype)
-                    # else:
-                    #     found_in_keys[id_in] = [projtype]
-                    lyrnod_out.attrib['extRef'] = f"{warehouse_id}:{self.get_rsxpath(in_prj.XMLBuilder, lyrnod_in)}"
-                    if lyrdesc is not None:
-                        lyrout_desc = lyrnod_out.find('Description')
-                        # If there is no description, add one
-                        if lyrout_desc is None:
-                            self.XMLBuilder.add_sub_element(lyrnod_out, "Description", lyrdesc.text)
+                warehouse_id = warehouse_node.attrib.get('id', None)
+                apiurl = warehouse_node.attrib.get('apiUrl', None)
+                if 'staging' in apiurl:
+                    apipath = 'https://staging.data.riverscapes.net/p/'
+                else:
+                    apipath = 'https://data.riverscapes.net/p/'
+                input_path_meta.append(RSMeta(f'{proj_type} Input', apipath + warehouse_id, RSMetaTypes.URL, locked=True))
+
+                # Find watershed name in metadata, add if it exists
+                watershed_node = in_prj.XMLBuilder.find('MetaData').find('Meta[@name="Watershed"]')
+                if watershed_node is not None:
+                    proj_watershed_node = self.XMLBuilder.find('MetaData').find('Meta[@name="Watershed"]')
+                    if proj_watershed_node is None:
+                        self.add_metadata([RSMeta('Watershed', watershed_node.text)])
+
+                # Define our default, generic warehouse and project meta
+                projmeta: Dict[str, RSMeta] = self.meta_keys_ext(in_prj.get_metadata(), RSMetaExt.PROJECT)
+                if 'DEXID' not in projmeta and warehouse_id is not None:
+                    projmeta['DEXID'] = RSMeta("DEXID", warehouse_id, RSMetaTypes.GUID, meta_ext=RSMetaExt.WAREHOUSE)
+
+                # Index the input project's layer nodes once instead of walking its tree for every mapping
+                in_layer_nodes = self.layer_node_index(in_prj.XMLBuilder)
+
+                # look for any valid mappings and move metadata into them
+                for id_out, id_in in working_id_list.items():
+                    lyrnod_in = in_layer_nodes.get((id_in[0], id_in[1]))
+
+                    if lyrnod_in is None:
+                        continue
+                    # lyrnod_in = in_prj.XMLBuilder.find('Realizations').find('Realization').find('.//*[@id="{}"]'.format(id_in))
+                    lyrmeta: List[RSMeta] = self.meta_keys_ext(in_prj.get_metadata(lyrnod_in), RSMetaExt.DATASET)
+                    lyrdesc = lyrnod_in.find('Description')
+
+                    lyrnod_out = out_layer_nodes.get(id_out)
+
+                    # lyrnod_out = self.XMLBuilder.find('Realizations').find('Realization').find('.//*[@id="{}"]'.format(id_out))
+
+                    # if id_out not in found_keys and lyrnod_in is not None and lyrnod_out is not None:
+                    if lyrnod_in is not None and lyrnod_out is not None:
+                        # found_keys.append(id_out)
+                        # if id_in in found_in_keys.keys():
+                        #     found_in_keys[id_in].append(projtype)
+                        # else:
+                        #     found_in_keys[id_in] = [projtype]
+                        lyrnod_out.attrib['extRef'] = f"{warehouse_id}:{self.get_rsxpath(in_prj.XMLBuilder, lyrnod_in)}"
+                        if lyrdesc is not None:
+                            lyrout_desc = lyrnod_out.find('Description')
+                            # If there is no description, add one
+                            if lyrout_desc is None:
+                                self.XMLBuilder.add_sub_element(lyrnod_out, "Description", lyrdesc.text)
+                            else:
+                                # If there is a description, append the new one
+                                lyrout_desc.text = f"{lyrout_desc.text}\n{lyrdesc.text}"
+
+                        if 'id' in lyrnod_in.attrib.keys():
+                            self.add_metadata([
+                                # Copy all the project metadata into the layer we're importing
+                                *projmeta.values(),
+                                # Copy Add all the layer metadata
+                                *lyrmeta.values(),
+                                # Add a few useful extra metadata
+                                RSMeta("projType", in_prj.XMLBuilder.find('ProjectType').text, meta_ext=RSMetaExt.PROJECT),
+                                # The original id of the layer in the original project. Useful for debugging and tracking it later
+                                RSMeta("id", lyrnod_in.attrib['id'], meta_ext=RSMetaExt.DATASET),
+                                # This is the local path from the original project (Might not match the path in this one so it's useful)
+                                RSMeta("path", lyrnod_in.find('Path').text, RSMetaTypes.FILEPATH, meta_ext=RSMetaExt.DATASET)
+                            ], lyrnod_out)
                         else:
-                            # If there is a description, append the new one
-                            lyrout_desc.text = f"{lyrout_desc.text}\n{lyrdesc.text}"
-
-                    if 'id' in lyrnod_in.attrib.keys():
-                        self.add_metadata([
-                            # Copy all the project metadata into the layer we're importing
-                            *projmeta.values(),
-                            # Copy Add all the layer metadata
-                            *lyrmeta.values(),
-                            # Add a few useful extra metadata
-                            RSMeta("projType", in_prj.XMLBuilder.find('ProjectType').text, meta_ext=RSMetaExt.PROJECT),
-                            # The original id of the layer in the original project. Useful for debugging and tracking it later
-                            RSMeta("id", lyrnod_in.attrib['id'], meta_ext=RSMetaExt.DATASET),
-                            # This is the local path from the original project (Might not match the path in this one so it's useful)
-                            RSMeta("path", lyrnod_in.find('Path').text, RSMetaTypes.FILEPATH, meta_ext=RSMetaExt.DATASET)
-                        ], lyrnod_out)
-                    else:
-                        self.add_metadata([
-                            *projmeta.values(),
-                            *lyrmeta.values(),
-                            RSMeta("projType", in_prj.XMLBuilder.find('ProjectType').text, meta_ext=RSMetaExt.PROJECT),
-                            RSMeta("lyrName", lyrnod_in.attrib['lyrName'], meta_ext=RSMetaExt.DATASET)
-                        ], lyrnod_out)
-
-                lyrnod_in = None
-
-        self.add_metadata(input_path_meta)
+                            self.add_metadata([
+                                *projmeta.values(),
+                                *lyrmeta.values(),
+                                RSMeta("projType", in_prj.XMLBuilder.find('ProjectType').text, meta_ext=RSMetaExt.PROJECT),
+                                RSMeta("lyrName", lyrnod_in.attrib['lyrName'], meta_ext=RSMetaExt.DATASET)
+                            ], lyrnod_out)
+
+                    lyrnod_in = None
+
+            self.add_metadata(input_path_meta)
+
+    @staticmethod
+    def layer_node_index(xml_builder: XMLBuilder) -> Dict[tuple, ET.Element]:
+        """Index every node of a project that has a lyrName (or failing that an id) attribute
+
+        Args:
+            xml_builder (XMLBuilder): project document
+
+        Returns:
+            Dict[tuple, ET.Element]: (lyrName or id, project type) -> node. When the same key appears more than once
+                the last node in the document is kept.
+        """
+        index = {}
+        projtype = None
+        for node in xml_builder.tree.iter():
+            if node.tag == 'ProjectType':
+                projtype = node.text
+            if 'lyrName' in node.attrib:
+                index[(node.attrib['lyrName'], projtype)] = node
+            elif 'id' in node.attrib:
+                index[(node.attrib['id'], projtype)] = node
+        return index
 
     def get_rsxpath(self, xml_builder, lyrnod_in):
         """
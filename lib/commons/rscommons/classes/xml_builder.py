@@ -9,6 +9,7 @@
 import xml.etree.ElementTree as ET
 import xml.dom.minidom as minidom
 import os
+from contextlib import contextmanager
 
 
 class XMLBuilder:
@@ -17,6 +18,9 @@ class XMLBuilder:
 
     This is a helper class used to bridge the distance between ET, minidom and the RSProject class
     When in doubt you should probably be using RSProject because it exposes this class as a property
+
+    Parent, id and lyrName indexes are built once when the document is loaded and kept up to date as
+    elements are added or deleted through this class, so lookups don't walk the whole tree.
     """
 
     def __init__(self, xml_file, root_name='', attribs={}):
@@ -33,13 +37,67 @@ class XMLBuilder:
             self.tree = ET.ElementTree(ET.Element(root_name))
         self.root = self.tree.getroot()
 
+        # write() calls are deferred while inside a batch() block
+        self._batch_depth = 0
+        self._pending_write = False
+
         self.set_parent_map()
 
         for k, att in attribs.items():
             self.root.set(k, att)
 
     def set_parent_map(self):
-        self.parent_map = dict((c, p) for p in self.tree.iter() for c in p)
+        """Rebuild the parent, id and lyrName indexes from the whole tree"""
+        self.parent_map = {}
+        self.id_index = {}
+        self.lyr_name_index = {}
+        for parent in self.tree.iter():
+            self._index_element(parent)
+            for child in parent:
+                self.parent_map[child] = parent
+
+    def _index_element(self, element):
+        # The first element in the document with a given id or lyrName wins, the same as a tree walk would
+        if 'id' in element.attrib:
+            self.id_index.setdefault(element.attrib['id'], element)
+        if 'lyrName' in element.attrib:
+            self.lyr_name_index.setdefault(element.attrib['lyrName'], element)
+
+    def _unindex_element(self, element):
+        for sub_element in element.iter():
+            self.parent_map.pop(sub_element, None)
+            for index, key in [(self.id_index, 'id'), (self.lyr_name_index, 'lyrName')]:
+                if key in sub_element.attrib and index.get(sub_element.attrib[key]) is sub_element:
+                    del index[sub_element.attrib[key]]
+
+    def _is_attached(self, element) -> bool:
+        """True if the element is still part of this document"""
+        if element is self.root:
+            return True
+        parent = self.parent_map.get(element)
+        return parent is not None and any(child is element for child in parent)
+
+    def _find_indexed(self, index_name: str, key: str, value: str):
+        """Look up an element in one of the indexes, rebuilding them if the element has since been changed outside this class"""
+        element = getattr(self, index_name).get(value)
+        if element is not None and element.attrib.get(key) == value and self._is_attached(element):
+            return element
+
+        self.set_parent_map()
+        return getattr(self, index_name).get(value)
+
+    @contextmanager
+    def batch(self):
+        """Defer writing the document until the end of the block so that many edits
+        (e.g. adding metadata to hundreds of layers) serialize the XML only once
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._pending_write:
+                self.write()
 
     def delete_sub_element(self, base_element, name, id):
         # ID is the only thing we match
@@ -51,6 +109,7 @@ class XMLBuilder:
             raise Exception('delete_sub_element found more than one node to delete. Cannot continue.')
 
         base_element.remove(found[0])
+        self._unindex_element(found[0])
 
     def add_sub_element(self, base_element, name='', text='', attribs={}, replace=False, element_position=None):
         """
@@ -77,7 +136,9 @@ class XMLBuilder:
         for k, att in attribs.items():
             new_element.set(k, att)
 
-        self.set_parent_map()  # Redoes the parent child mapping, to account for the new element
+        # Add the new element to the parent child mapping and the indexes
+        self.parent_map[new_element] = base_element
+        self._index_element(new_element)
         return new_element
 
     def find(self, element_name):
@@ -90,13 +151,10 @@ class XMLBuilder:
         return None
 
     def find_by_id(self, given_id):
-        for element in self.tree.iter():
-            try:
-                if element.attrib['id'] == given_id:
-                    return element
-            except KeyError:
-                pass
-        return None
+        return self._find_indexed('id_index', 'id', given_id)
+
+    def find_by_lyr_name(self, lyr_name):
+        return self._find_indexed('lyr_name_index', 'lyrName', lyr_name)
 
     def find_element_parent(self, element):
         if element is None:
@@ -115,6 +173,11 @@ class XMLBuilder:
         Creates a pretty-printed XML string for the Element,
         then write it out to the expected file
         """
+        if self._batch_depth > 0:
+            self._pending_write = True
+            return
+        self._pending_write = False
+
         if os.path.exists(self.xml_file):
             os.remove(self.xml_file)
 
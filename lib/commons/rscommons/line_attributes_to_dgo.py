@@ -1,13 +1,24 @@
+from typing import Dict, List
+
+import numpy as np
+import shapely
+from shapely import STRtree
+
 from rsxml import Logger
 from rscommons import get_shp_or_gpkg, VectorBase
 from rscommons.database import SQLiteCon
 
+METHODS = ('lwa', 'lsl')
+
 
 def line_attributes_to_dgo(line_ftrs: str, dgo_ftrs: str, field_map: dict, method: str = 'lwa', update_dgo_ftrs: bool = False, dgo_table: str = None):
     """Copy attributes from a line feature class to a DGO table by either taking the value from the line segment
     with the longest lenght that intersects the DGO or by taking the length weighted average of the line segments that
     intersect the DGO.
 
+    Both layers are read once and the line segments are matched to the DGOs through an STRtree so the
+    intersections for every DGO are computed in a single vectorized overlay.
+
     Args:
         line_ftrs (str): Path to the line feature class
         dgo_ftrs (str): Path to the DGO feature class
@@ -19,6 +30,10 @@ def line_attributes_to_dgo(line_ftrs: str, dgo_ftrs: str, field_map: dict, metho
     log = Logger('Transfer attributes from line to DGO')
     log.info(f'Transferring attributes from {line_ftrs} to DGO features')
 
+    if method not in METHODS:
+        log.error(f'Method {method} not recognised')
+        raise ValueError(f'Method {method} not recognised')
+
     # check that fields from dict exist in both feature classes
     with get_shp_or_gpkg(line_ftrs) as line_lyr, get_shp_or_gpkg(dgo_ftrs) as dgo_lyr:
         for line_field, dgo_field in field_map.items():
@@ -38,49 +53,117 @@ def line_attributes_to_dgo(line_ftrs: str, dgo_ftrs: str, field_map: dict, metho
                     log.error(f'Field {dgo_field} not found in {dgo_table}')
                     raise ValueError(f'Field {dgo_field} not found in {dgo_table}')
 
-    with get_shp_or_gpkg(dgo_ftrs, write=True) as dgo_lyr:
-        if update_dgo_ftrs:
-            dgo_lyr.ogr_layer.StartTransaction()
-        for dgo_feature, _counter, _progbar in dgo_lyr.iterate_features("Processing DGO features"):
-            dgoid = dgo_feature.GetFID()
+    line_geoms = []
+    line_vals = {field: [] for field in field_map.keys()}
+    with get_shp_or_gpkg(line_ftrs) as line_lyr:
+        for line_feature, _counter, _progbar in line_lyr.iterate_features("Loading line features"):
+            line_geom = line_feature.GetGeometryRef()
+            if line_geom is None:
+                continue
+            line_geoms.append(VectorBase.ogr2shapely(line_geom))
+            for field in field_map.keys():
+                line_vals[field].append(line_feature.GetField(field))
+
+    dgoids = []
+    dgo_geoms = []
+    with get_shp_or_gpkg(dgo_ftrs) as dgo_lyr:
+        for dgo_feature, _counter, _progbar in dgo_lyr.iterate_features("Loading DGO features"):
             dgo_geom = dgo_feature.GetGeometryRef()
+            if dgo_geom is None:
+                continue
+            dgoids.append(dgo_feature.GetFID())
+            dgo_geoms.append(VectorBase.ogr2shapely(dgo_geom))
 
-            # get the line segments that intersect the DGO
-            intersecting_lines = {field: {'val': [], 'length': []} for field in field_map.keys()}
-            with get_shp_or_gpkg(line_ftrs) as line_lyr:
-                for line_feature, _counter, _progbar in line_lyr.iterate_features(clip_shape=dgo_geom):
-                    line_geom = line_feature.GetGeometryRef()
-                    intersect_geom = line_geom.Intersection(dgo_geom)
-                    if intersect_geom is not None:
-                        for field in field_map.keys():
-                            intersecting_lines[field]['val'].append(line_feature.GetField(field))
-                            intersecting_lines[field]['length'].append(intersect_geom.Length())
-
-            # calculate the length weighted average or longest segment length
-            for field in field_map.keys():
-                vals_dict = {val: length for val, length in zip(intersecting_lines[field]['val'], intersecting_lines[field]['length']) if val is not None}
-                if len(vals_dict) == 0:
+    log.info(f'Intersecting {len(line_geoms)} line segments with {len(dgo_geoms)} DGOs')
+    dgo_idx, segment_lengths, segment_vals = intersect_segments(dgo_geoms, line_geoms, line_vals)
+
+    # DGO FID -> {DGO field: value}
+    dgo_values: Dict[int, dict] = {}
+    for field, dgo_field in field_map.items():
+        field_values = summarize_segments(dgo_idx, segment_lengths, segment_vals[field], method)
+        for idx, value in field_values.items():
+            dgo_values.setdefault(dgoids[idx], {})[dgo_field] = value
+
+    if update_dgo_ftrs:
+        with get_shp_or_gpkg(dgo_ftrs, write=True) as dgo_lyr:
+            dgo_lyr.ogr_layer.StartTransaction()
+            for dgo_feature, _counter, _progbar in dgo_lyr.iterate_features("Updating DGO features"):
+                values = dgo_values.get(dgo_feature.GetFID())
+                if values is None:
                     continue
-                if method == 'lwa':
-                    total_length = sum(vals_dict.values())
-                    if update_dgo_ftrs:
-                        dgo_feature.SetField(field_map[field], sum([val * length / total_length for val, length in vals_dict.items()]))
-                        dgo_lyr.ogr_layer.SetFeature(dgo_feature)
-                    if dgo_table is not None:
-                        with SQLiteCon(dgo_table) as db:
-                            db.curs.execute(f'UPDATE DGOAttributes SET {field_map[field]} = ? WHERE dgoid = ?', (sum([val * length / total_length for val, length in vals_dict.items()]), dgoid))
-                            db.conn.commit()
-                elif method == 'lsl':
-                    if update_dgo_ftrs:
-                        dgo_feature.SetField(field_map[field], max(vals_dict, key=vals_dict.get))
-                        dgo_lyr.ogr_layer.SetFeature(dgo_feature)
-                    if dgo_table is not None:
-                        with SQLiteCon(dgo_table) as db:
-                            db.curs.execute(f'UPDATE DGOAttributes SET {field_map[field]} = ? WHERE dgoid = ?', (max(vals_dict, key=vals_dict.get), dgoid))
-                            db.conn.commit()
-                else:
-                    log.error(f'Method {method} not recognised')
-                    raise ValueError(f'Method {method} not recognised')
-
-        if update_dgo_ftrs:
+                for dgo_field, value in values.items():
+                    dgo_feature.SetField(dgo_field, value)
+                dgo_lyr.ogr_layer.SetFeature(dgo_feature)
             dgo_lyr.ogr_layer.CommitTransaction()
+
+    if dgo_table is not None:
+        with SQLiteCon(dgo_table) as db:
+            for dgo_field in field_map.values():
+                db.curs.executemany(f'UPDATE DGOAttributes SET {dgo_field} = ? WHERE dgoid = ?',
+                                    [(values[dgo_field], dgoid) for dgoid, values in dgo_values.items() if dgo_field in values])
+            db.conn.commit()
+
+    log.info(f'Attributes transferred to {len(dgo_values)} DGOs')
+
+
+def intersect_segments(dgo_geoms: List, line_geoms: List, line_vals: Dict[str, list]):
+    """Overlay the line segments with the DGOs and keep one record per (DGO, segment) pair
+
+    Args:
+        dgo_geoms (List): Shapely DGO polygons
+        line_geoms (List): Shapely line geometries
+        line_vals (Dict[str, list]): line field name -> attribute values in the same order as line_geoms
+
+    Returns:
+        tuple: DGO index and intersection length of every pair, and the line attribute values for every pair keyed by field
+    """
+
+    if len(dgo_geoms) == 0 or len(line_geoms) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0), {field: [] for field in line_vals.keys()}
+
+    dgo_array = np.asarray(dgo_geoms, dtype=object)
+    line_array = np.asarray(line_geoms, dtype=object)
+
+    tree = STRtree(line_array)
+    dgo_idx, line_idx = tree.query(dgo_array, predicate='intersects')
+    lengths = shapely.length(shapely.intersection(line_array[line_idx], dgo_array[dgo_idx]))
+
+    segment_vals = {field: [vals[i] for i in line_idx] for field, vals in line_vals.items()}
+
+    return dgo_idx, lengths, segment_vals
+
+
+def summarize_segments(dgo_idx: np.ndarray, lengths: np.ndarray, values: list, method: str) -> dict:
+    """Reduce the per-segment values for one field to a single value per DGO
+
+    Args:
+        dgo_idx (np.ndarray): DGO index of every segment
+        lengths (np.ndarray): length of every segment inside its DGO
+        values (list): line attribute value of every segment. None values are ignored.
+        method (str): 'lwa' for length weighted average or 'lsl' for the value of the longest segment
+
+    Returns:
+        dict: DGO index -> value. DGOs without any non-null segments are omitted.
+    """
+
+    valid = np.array([val is not None for val in values], dtype=bool)
+    if not np.any(valid):
+        return {}
+
+    idx = dgo_idx[valid]
+    seg_lengths = lengths[valid]
+
+    if method == 'lwa':
+        seg_vals = np.array([val for val in values if val is not None], dtype=np.float64)
+        total_length = np.bincount(idx, weights=seg_lengths)
+        weighted = np.bincount(idx, weights=seg_vals * seg_lengths)
+        return {int(i): float(weighted[i] / total_length[i]) for i in np.unique(idx) if total_length[i] > 0}
+
+    if method == 'lsl':
+        seg_vals = [val for val in values if val is not None]
+        # Sort by DGO then by descending length so the first segment of every DGO is its longest
+        order = np.lexsort((-seg_lengths, idx))
+        first = order[np.r_[True, idx[order][1:] != idx[order][:-1]]]
+        return {int(idx[i]): seg_vals[i] for i in first}
+
+    raise ValueError(f'Method {method} not recognised')
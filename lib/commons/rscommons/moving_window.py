@@ -2,12 +2,11 @@
 for each igo in the input dataset.
 """
 
-import os
-import sqlite3
-
+import numpy as np
 from osgeo import ogr
 
 from rscommons import GeopackageLayer, VectorBase
+from rscommons.network_topology import level_path_key
 
 
 def get_moving_windows(igo: str, dgo: str, level_paths: list, distance: dict):
@@ -45,23 +44,34 @@ def get_moving_windows(igo: str, dgo: str, level_paths: list, distance: dict):
 
 
 def moving_window_dgo_ids(igo: str, dgo: str, level_paths: list, distance: dict):
+    """DGO IDs in the moving window around every IGO. The DGOs are read once and sorted by
+    level path and seg_distance so each window is a slice found by binary search rather than
+    an attribute query on the DGO layer.
+    """
 
     windows = {}
+    level_path_keys = {level_path_key(level_path) for level_path in level_paths}
+
+    # level path -> (sorted seg distances, fids in the same order)
+    dgo_lookup = {}
+    with GeopackageLayer(dgo) as lyr_dgo:
+        for feat_seg_poly, *_ in lyr_dgo.iterate_features():
+            lp_key = level_path_key(feat_seg_poly.GetField('level_path'))
+            seg_distance = feat_seg_poly.GetField('seg_distance')
+            if lp_key in level_path_keys and seg_distance is not None:
+                dgo_lookup.setdefault(lp_key, []).append((seg_distance, feat_seg_poly.GetFID()))
+    for lp_key, segments in dgo_lookup.items():
+        segments.sort()
+        dgo_lookup[lp_key] = (np.array([seg[0] for seg in segments]), np.array([seg[1] for seg in segments]))
+
     dists = {}
+    for level_path in level_paths:
+        sds = dgo_lookup.get(level_path_key(level_path), (np.empty(0), None))[0]
+        dists[level_path] = sds[1] - sds[0] if len(sds) >= 2 else None
 
-    with sqlite3.connect(os.path.dirname(dgo)) as conn:
-        curs = conn.cursor()
-        for level_path in level_paths:
-            curs.execute(f'SELECT seg_distance FROM {os.path.basename(dgo)} WHERE level_path = {level_path}')
-            sds = [row[0] for row in curs.fetchall() if row[0] is not None]
-            sds.sort()
-            if len(sds) >= 2:
-                dists[level_path] = sds[1] - sds[0]
-            else:
-                dists[level_path] = None
-
-    with GeopackageLayer(igo) as lyr_igo, GeopackageLayer(dgo) as lyr_dgo:
+    with GeopackageLayer(igo) as lyr_igo:
         for level_path in level_paths:
+            sds, fids = dgo_lookup.get(level_path_key(level_path), (np.empty(0), np.empty(0, dtype=np.int64)))
             for feat_seg_pt, *_, in lyr_igo.iterate_features(f'Finding windows on {level_path}', attribute_filter=f"level_path = {level_path}"):
                 window_distance = distance[str(feat_seg_pt.GetField('stream_size'))]
                 if dists[level_path] is not None:
@@ -71,10 +81,10 @@ def moving_window_dgo_ids(igo: str, dgo: str, level_paths: list, distance: dict)
                 min_dist = dist - 0.5 * window_distance
                 max_dist = dist + 0.5 * window_distance
 
-                dgoids = []
-                for feat_seg_poly, *_ in lyr_dgo.iterate_features(attribute_filter=f"level_path = {int(level_path)} and seg_distance >= {int(min_dist)} and seg_distance <= {int(max_dist)}"):
-                    dgoids.append(feat_seg_poly.GetFID())
-                windows[feat_seg_pt.GetFID()] = dgoids
+                # Same bounds as the attribute filter this replaces: seg_distance >= int(min_dist) and seg_distance <= int(max_dist)
+                start = np.searchsorted(sds, int(min_dist), 'left')
+                end = np.searchsorted(sds, int(max_dist), 'right')
+                windows[feat_seg_pt.GetFID()] = sorted(int(fid) for fid in fids[start:end])
 
     return windows
 
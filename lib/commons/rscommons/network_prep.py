@@ -0,0 +1,172 @@
+# Name:     Network Preparation
+#
+# Purpose:  Columnar helpers for preparing a flowline network (e.g. the VBET network).
+#           The flowline attributes and geometries are read once into arrays, FCode
+#           selection is done with set operations on those arrays and the flowlines
+#           are tested against all the polygon layers they are compared to (waterbodies
+#           to exclude, flow areas to include) with a single STRtree query. Zone
+#           classification of a data field is vectorized over all the features.
+# -------------------------------------------------------------------------------
+from typing import Dict, List, Tuple
+
+import numpy as np
+import shapely
+from shapely import STRtree
+
+from rsxml import Logger
+from rscommons import get_shp_or_gpkg, VectorBase
+from rscommons.spatial_join import load_layer_geometries
+
+
+class FlowlineTable:
+    """FIDs, attribute values and shapely geometries of a flowline layer, read in one pass
+
+    Args:
+        layer (VectorBase): open flowline layer
+        fields (List[str]): attribute fields to load. Fields missing from the layer are loaded as None.
+        name (str, optional): progress bar label. Defaults to None.
+    """
+
+    def __init__(self, layer: VectorBase, fields: List[str], name: str = None):
+        self.spatial_ref = layer.spatial_ref
+        layer_fields = [layer.ogr_layer_def.GetFieldDefn(i).GetName() for i in range(layer.ogr_layer_def.GetFieldCount())]
+        field_idx = {field: layer_fields.index(field) if field in layer_fields else None for field in fields}
+
+        fids = []
+        geoms = []
+        values = {field: [] for field in fields}
+        for feature, _counter, _progbar in layer.iterate_features(name):
+            fids.append(feature.GetFID())
+            geom = feature.GetGeometryRef()
+            geoms.append(VectorBase.ogr2shapely(geom) if geom is not None and not geom.IsEmpty() else None)
+            for field, idx in field_idx.items():
+                values[field].append(feature.GetField(idx) if idx is not None else None)
+
+        self.fids = np.array(fids, dtype=np.int64)
+        self.geometries = np.empty(len(geoms), dtype=object)
+        self.geometries[:] = geoms
+        self.values = {}
+        for field, field_values in values.items():
+            self.values[field] = np.empty(len(field_values), dtype=object)
+            self.values[field][:] = field_values
+
+    def __len__(self) -> int:
+        return len(self.fids)
+
+    def codes(self, field: str) -> np.ndarray:
+        """Values of a code field (e.g. FCode) as strings, None where the value is missing"""
+        return np.array([code_string(value) for value in self.values[field]], dtype=object)
+
+
+def code_string(value) -> str:
+    """A code (e.g. FCode) as a string, the way it compares against a quoted code in an attribute filter"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def named_stream_codes(codes: np.ndarray, names: np.ndarray, include_codes: List[str]) -> List[str]:
+    """Add the codes of every flowline that shares a name (e.g. GNIS_Name) with an included flowline
+
+    Args:
+        codes (np.ndarray): code of each flowline (see FlowlineTable.codes)
+        names (np.ndarray): name of each flowline
+        include_codes (List[str]): codes already included
+
+    Returns:
+        List[str]: include_codes followed by the extra codes in sorted order
+    """
+    include_codes = [code_string(code) for code in include_codes]
+    included_names = set(names[np.isin(codes, include_codes)]) - {None}
+    if len(included_names) == 0:
+        return include_codes
+
+    extra_codes = set(codes[np.isin(names, list(included_names))]) - set(include_codes) - {None}
+    return include_codes + sorted(extra_codes)
+
+
+def polygon_relations(flowlines: FlowlineTable, within_path: str = None, intersects_path: str = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Which flowlines are within a polygon of one layer and which intersect a polygon of another
+
+    The polygons of both layers go into one STRtree (reprojected to the flowlines if needed)
+    and all the flowlines are queried against it once. The within test is only evaluated
+    on the pairs that intersect.
+
+    Args:
+        flowlines (FlowlineTable): flowlines
+        within_path (str, optional): polygons the flowlines must be within (e.g. waterbodies). Defaults to None.
+        intersects_path (str, optional): polygons the flowlines must intersect (e.g. flow areas). Defaults to None.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: boolean arrays, one value per flowline, for within and intersects
+    """
+    log = Logger('Network Preparation')
+
+    within = np.zeros(len(flowlines), dtype=bool)
+    intersects = np.zeros(len(flowlines), dtype=bool)
+
+    polygons = []
+    layer_idx = []
+    for idx, path in enumerate([within_path, intersects_path]):
+        if path is None:
+            continue
+        with get_shp_or_gpkg(path) as lyr:
+            transform = None
+            if flowlines.spatial_ref is not None and lyr.spatial_ref is not None and not flowlines.spatial_ref.IsSame(lyr.spatial_ref):
+                transform = VectorBase.get_transform(lyr.spatial_ref, flowlines.spatial_ref)
+            _fids, geoms = load_layer_geometries(lyr, transform=transform)
+        polygons.append(geoms)
+        layer_idx.append(np.full(len(geoms), idx, dtype=np.int8))
+
+    if len(polygons) == 0 or sum(len(geoms) for geoms in polygons) == 0:
+        return within, intersects
+
+    polygons = np.concatenate(polygons)
+    layer_idx = np.concatenate(layer_idx)
+    has_geom = np.flatnonzero([geom is not None for geom in flowlines.geometries])
+
+    log.info(f'Testing {len(has_geom):,} flowlines against {len(polygons):,} polygons')
+    tree = STRtree(polygons)
+    line_idx, polygon_idx = tree.query(flowlines.geometries[has_geom], predicate='intersects')
+    line_idx = has_geom[line_idx]
+
+    intersect_pairs = layer_idx[polygon_idx] == 1
+    intersects[line_idx[intersect_pairs]] = True
+
+    within_pairs = layer_idx[polygon_idx] == 0
+    within_lines = line_idx[within_pairs]
+    is_within = shapely.within(flowlines.geometries[within_lines], polygons[polygon_idx[within_pairs]])
+    within[within_lines[is_within]] = True
+
+    return within, intersects
+
+
+def classify_zones(values: np.ndarray, zone_values: Dict) -> np.ndarray:
+    """Zone of each value
+
+    The zone is the key of the first zone value that the value is less than. Zone
+    values that are empty (e.g. '' or 0) have no upper limit, so the last of them
+    is used for values that aren't less than any of the others.
+
+    Args:
+        values (np.ndarray): data values. NaN values get no zone.
+        zone_values (Dict): zone -> upper limit, in order
+
+    Returns:
+        np.ndarray: zone of each value, None where there isn't one
+    """
+    values = np.asarray(values, dtype=np.float64)
+    zones = np.full(len(values), None, dtype=object)
+
+    unlimited = [zone for zone, limit in zone_values.items() if not limit]
+    if len(unlimited) > 0:
+        zones[:] = unlimited[-1]
+
+    # Apply the limits last to first so the first limit a value is less than wins
+    for zone, limit in reversed([(zone, limit) for zone, limit in zone_values.items() if limit]):
+        zones[values < limit] = zone
+
+    zones[np.isnan(values)] = None
+    return zones
@@ -0,0 +1,127 @@
+# Name:     Network Topology
+#
+# Purpose:  In-memory level path graph built from the NHDPlus value added
+#           attributes (LevelPathI -> DnLevelPat). The VAA table is read
+#           once per geopackage and upstream/downstream closures are then
+#           graph traversals instead of repeated SQL round trips.
+# -------------------------------------------------------------------------------
+import os
+import sqlite3
+from typing import Dict, Set
+
+import networkx as nx
+
+Path = str
+
+# (geopackage, table, fields) -> (modified time, LevelPathTopology). Reloaded if the geopackage is modified.
+_topologies: Dict[tuple, tuple] = {}
+# (geopackage, table, fields) -> (modified time, level path values). Reloaded if the geopackage is modified.
+_level_path_values: Dict[tuple, tuple] = {}
+
+
+def level_path_key(value) -> str:
+    """Normalise a level path ID the way the tools store them ('7000400012345', 7000400012345.0 -> '7000400012345')"""
+    if value is None:
+        return None
+    try:
+        return str(int(float(value)))
+    except (TypeError, ValueError):
+        return str(value)
+
+
+class LevelPathTopology:
+    """Directed graph of level paths where every edge points downstream
+
+    Args:
+        gpkg (Path): geopackage containing the VAA table
+        table (str, optional): table or view with the level path columns. Defaults to 'catchments_vaa'.
+        level_path_field (str, optional): level path column. Defaults to 'LevelPathI'.
+        down_level_path_field (str, optional): downstream level path column. Defaults to 'DnLevelPat'.
+    """
+
+    def __init__(self, gpkg: Path, table: str = 'catchments_vaa', level_path_field: str = 'LevelPathI', down_level_path_field: str = 'DnLevelPat'):
+        self.gpkg = gpkg
+        self.table = table
+        self.graph = nx.DiGraph()
+
+        with sqlite3.connect(gpkg) as conn:
+            curs = conn.cursor()
+            curs.execute(f'SELECT DISTINCT {level_path_field}, {down_level_path_field} FROM {table}')
+            for level_path, down_level_path in curs.fetchall():
+                level_path = level_path_key(level_path)
+                if level_path is None:
+                    continue
+                self.graph.add_node(level_path)
+                down_level_path = level_path_key(down_level_path)
+                # DnLevelPat of 0 means the level path is a terminal outlet
+                if down_level_path is not None and down_level_path not in ('0', level_path):
+                    self.graph.add_edge(level_path, down_level_path)
+
+    def __contains__(self, level_path) -> bool:
+        return level_path_key(level_path) in self.graph
+
+    def upstream(self, level_path, include_self: bool = True) -> Set[str]:
+        """Every level path that drains to this one (its tributaries, their tributaries...)"""
+        level_path = level_path_key(level_path)
+        if level_path not in self.graph:
+            return {level_path} if include_self else set()
+        out = nx.ancestors(self.graph, level_path)
+        if include_self:
+            out.add(level_path)
+        return out
+
+    def downstream(self, level_path, include_self: bool = True) -> Set[str]:
+        """Every level path this one drains through on the way to its outlet"""
+        level_path = level_path_key(level_path)
+        if level_path not in self.graph:
+            return {level_path} if include_self else set()
+        out = nx.descendants(self.graph, level_path)
+        if include_self:
+            out.add(level_path)
+        return out
+
+
+def get_level_path_topology(gpkg: Path, table: str = 'catchments_vaa', level_path_field: str = 'LevelPathI', down_level_path_field: str = 'DnLevelPat') -> LevelPathTopology:
+    """Load (or reuse) the level path topology for a geopackage table. See LevelPathTopology for the arguments."""
+    key = (os.path.abspath(gpkg), table, level_path_field, down_level_path_field)
+    mtime = os.path.getmtime(gpkg)
+    cached = _topologies.get(key)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, LevelPathTopology(gpkg, table, level_path_field, down_level_path_field))
+        _topologies[key] = cached
+    return cached[1]
+
+
+def level_path_values(gpkg: Path, table: str, value_field: str, level_path_field: str = 'level_path') -> Dict[str, list]:
+    """All the values of one column grouped by level path, read in a single query
+
+    Args:
+        gpkg (Path): geopackage
+        table (str): table name
+        value_field (str): column to collect
+        level_path_field (str, optional): level path column. Defaults to 'level_path'.
+
+    Returns:
+        Dict[str, list]: level path -> values sorted ascending. Null values are dropped.
+    """
+    out = {}
+    with sqlite3.connect(gpkg) as conn:
+        curs = conn.cursor()
+        curs.execute(f'SELECT {level_path_field}, {value_field} FROM {table} WHERE {value_field} IS NOT NULL ORDER BY {value_field}')
+        for level_path, value in curs.fetchall():
+            out.setdefault(level_path_key(level_path), []).append(value)
+    return out
+
+
+def get_level_path_values(gpkg: Path, table: str, value_field: str, level_path_field: str = 'level_path') -> Dict[str, list]:
+    """Load (or reuse) the values of one column grouped by level path. See level_path_values for the arguments.
+
+    Like the topology, the lookup is read once per geopackage and reloaded only if the geopackage is modified.
+    """
+    key = (os.path.abspath(gpkg), table, value_field, level_path_field)
+    mtime = os.path.getmtime(gpkg)
+    cached = _level_path_values.get(key)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, level_path_values(gpkg, table, value_field, level_path_field))
+        _level_path_values[key] = cached
+    return cached[1]
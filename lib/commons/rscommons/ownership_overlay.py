@@ -0,0 +1,136 @@
+# Name:     Ownership Overlay
+#
+# Purpose:  Land ownership polygons loaded once for an area of interest (e.g. a HUC)
+#           and held in a spatial index keyed by administering agency. Point lookups
+#           (which agency administers each reach midpoint) and areas by agency within
+#           any polygon are then answered for all the inputs at once with vectorized
+#           STRtree queries instead of one spatial filter on the ownership layer per feature.
+# -------------------------------------------------------------------------------
+from typing import Dict, List
+
+import numpy as np
+import shapely
+from osgeo import osr
+from shapely.geometry.base import BaseGeometry
+
+from rscommons.classes.vector_base import VectorBase
+from rscommons.classes.vector_classes import get_shp_or_gpkg
+
+# Land ownership field in the BLM surface management agency layer
+AGENCY_FIELD = 'ADMIN_AGEN'
+
+
+class OwnershipOverlay:
+    """Ownership polygons with their agencies in an STRtree
+
+    Args:
+        agencies (List[str]): agency of each polygon
+        geometries (List[BaseGeometry]): ownership polygons
+        spatial_ref (osr.SpatialReference, optional): spatial reference of the polygons. Needed to calculate areas in another projection.
+    """
+
+    def __init__(self, agencies: List[str], geometries: List[BaseGeometry], spatial_ref: osr.SpatialReference = None):
+        self.agencies = np.empty(len(agencies), dtype=object)
+        self.agencies[:] = agencies
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.spatial_ref = spatial_ref
+
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+
+    def __len__(self) -> int:
+        return len(self.geometries)
+
+    @classmethod
+    def from_layer(cls, ownership_path: str, clip_shape: BaseGeometry = None, clip_rect: List[float] = None,
+                   clip: bool = True, field: str = AGENCY_FIELD) -> 'OwnershipOverlay':
+        """Load the ownership polygons that intersect an area of interest
+
+        Args:
+            ownership_path (str): ownership feature class (ShapeFile or GeoPackage layer)
+            clip_shape (BaseGeometry, optional): only load polygons that intersect this shape. Defaults to None.
+            clip_rect (List[float], optional): only load polygons that intersect this [minx, miny, maxx, maxy] rectangle. Defaults to None.
+            clip (bool, optional): also clip the polygons to clip_shape so they only cover the area of interest. Defaults to True.
+            field (str, optional): agency field. Defaults to AGENCY_FIELD.
+
+        Returns:
+            OwnershipOverlay: polygons in the spatial reference of the ownership layer
+        """
+        agencies = []
+        geometries = []
+        with get_shp_or_gpkg(ownership_path) as ownership_lyr:
+            spatial_ref = ownership_lyr.spatial_ref.Clone() if ownership_lyr.spatial_ref is not None else None
+            for feature, *_ in ownership_lyr.iterate_features(clip_shape=clip_shape, clip_rect=clip_rect):
+                geom = feature.GetGeometryRef()
+                if geom is None:
+                    continue
+                agencies.append(feature.GetField(field))
+                geometries.append(VectorBase.ogr2shapely(geom))
+
+        geometries = np.asarray(geometries, dtype=object)
+        if clip and clip_shape is not None and len(geometries) > 0:
+            geometries = shapely.intersection(geometries, clip_shape)
+
+        return cls(agencies, geometries, spatial_ref)
+
+    def features_at_points(self, points) -> np.ndarray:
+        """Index of the ownership polygon that intersects each point
+
+        Where polygons overlap the last one (in layer order) wins, the same as
+        looping over the features returned by a spatial filter on the point.
+
+        Args:
+            points: shapely points
+
+        Returns:
+            np.ndarray: polygon index for every point, -1 where no polygon intersects the point
+        """
+        points = np.asarray(points, dtype=object)
+        found = np.full(len(points), -1, dtype=np.int64)
+        if len(points) == 0 or len(self.geometries) == 0:
+            return found
+
+        point_idx, polygon_idx = self.tree.query(points, predicate='intersects')
+        np.maximum.at(found, point_idx, polygon_idx)
+        return found
+
+    def agencies_at_points(self, points) -> np.ndarray:
+        """Agency of the ownership polygon that intersects each point (None where there isn't one)"""
+        found = self.features_at_points(points)
+        agencies = np.full(len(found), None, dtype=object)
+        agencies[found >= 0] = self.agencies[found[found >= 0]]
+        return agencies
+
+    def area_by_agency(self, polygon: BaseGeometry = None, epsg: int = None) -> Dict[str, float]:
+        """Area of each agency within a polygon
+
+        Args:
+            polygon (BaseGeometry, optional): area of interest. Defaults to None, meaning all the (clipped) ownership polygons.
+            epsg (int, optional): projection to calculate the areas in (e.g. UTM). Defaults to None, meaning the overlay's own units.
+
+        Returns:
+            Dict[str, float]: agency -> area, in the order the agencies first appear. Polygons without an agency are ignored.
+        """
+        if polygon is None:
+            idx = np.arange(len(self.geometries))
+            geoms = self.geometries
+        else:
+            idx = self.tree.query(polygon, predicate='intersects')
+            geoms = shapely.intersection(self.geometries[idx], polygon)
+
+        agencies = self.agencies[idx]
+        geoms = shapely.make_valid(geoms)
+        keep = np.array([agency is not None and agency != '' for agency in agencies], dtype=bool) \
+            & ~shapely.is_empty(geoms) & (shapely.area(geoms) > 0)
+        agencies = agencies[keep]
+        geoms = geoms[keep]
+        if len(geoms) == 0:
+            return {}
+
+        if epsg is not None:
+            _srs, transform = VectorBase.get_transform_from_epsg(self.spatial_ref, epsg)
+            geoms = shapely.transform(geoms, lambda coords: np.asarray(transform.TransformPoints(coords.tolist()))[:, :2])
+
+        names, first, inverse = np.unique(agencies.astype(str), return_index=True, return_inverse=True)
+        areas = np.bincount(inverse, weights=shapely.area(geoms), minlength=len(names))
+        return {str(names[i]): float(areas[i]) for i in np.argsort(first)}
@@ -7,10 +7,20 @@
 #
 # Date:     15 Aug 2019
 # -------------------------------------------------------------------------------
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Tuple
+import matplotlib
 import matplotlib.pyplot as plt
 from scipy import stats
 import os
 
+# A chart to render: (plotting function, positional args) or (plotting function, positional args, keyword args).
+# The function must be importable at module level (e.g. box_plot) so it can be sent to a worker process.
+ChartJob = Tuple[Callable, tuple]
+
+# Below this many charts it is quicker to draw them in process than to start workers
+MIN_PARALLEL_CHARTS = 4
+
 
 def validation_chart(values, chart_title):
 
@@ -243,3 +253,41 @@ def vertical_bar(values, labels, y_axis_label, chart_title, file_path, color="#0
 
     # plt.tight_layout()
     plt.savefig(file_path, bbox_inches="tight")
+
+
+def _init_chart_worker():
+    """Use the non-interactive backend in chart worker processes"""
+    matplotlib.use('Agg', force=True)
+    plt.switch_backend('Agg')
+
+
+def _render_chart(job: ChartJob):
+    func, args = job[0], job[1]
+    kwargs = job[2] if len(job) > 2 else {}
+    func(*args, **kwargs)
+    plt.close('all')
+
+
+def render_charts(jobs: List[ChartJob], max_workers: int = None) -> None:
+    """Render a batch of charts, in parallel worker processes when there are enough of them.
+
+    Charts only write image files so report builders can queue them while building the HTML and
+    render them all at the end. Each worker uses the non-interactive Agg backend and pyplot state is
+    never shared between charts.
+
+    Args:
+        jobs (List[ChartJob]): charts to render
+        max_workers (int, optional): worker processes. Defaults to None (one per CPU). 1 renders in process.
+    """
+    if len(jobs) == 0:
+        return
+
+    workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+    if workers <= 1 or len(jobs) < MIN_PARALLEL_CHARTS:
+        for job in jobs:
+            _render_chart(job)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=_init_chart_worker) as executor:
+        # list() so that any exception raised while drawing is re-raised here
+        list(executor.map(_render_chart, jobs))
@@ -0,0 +1,227 @@
+# Name:     Raster Preparation
+#
+# Purpose:  Clip and reproject a batch of rasters (e.g. all the national rasters
+#           that RS Context clips to a watershed) concurrently.
+#
+#           Each clip boundary is read, dissolved into a single polygon and
+#           written to an in-memory (/vsimem) dataset once. Every raster clipped
+#           to that boundary shares the prepared cutline instead of GDAL reading
+#           and unioning the boundary layer again for each warp.
+#
+#           The warps run on a thread pool (GDAL releases the GIL) with a shared
+#           GDAL_CACHEMAX, an explicit warp memory limit and multithreaded warping.
+#           As in raster_warp, each warp goes to a VRT that is then translated to
+#           the output. The output is a tiled, DEFLATE compressed Cloud Optimized
+#           GeoTIFF with its overviews built by the same translate.
+# -------------------------------------------------------------------------------
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Union
+
+from osgeo import gdal, ogr
+from rsxml import Logger
+from rsxml.util import safe_remove_file
+from rscommons import VectorBase
+
+# Block cache shared by all the concurrent warps and translates
+GDAL_CACHEMAX_MB = 1024
+# Working memory of each warp
+WARP_MEMORY_MB = 512
+# Rasters prepared at the same time
+DEFAULT_WORKERS = 4
+
+# Categorical rasters (e.g. vegetation types) must not be averaged
+DEFAULT_OVERVIEW_RESAMPLING = 'NEAREST'
+
+
+class RasterPrep:
+    """A batch of rasters to clip and reproject to the same spatial reference
+
+    Add the rasters with add() and then call run() to prepare them all.
+
+    Args:
+        epsg (int): output spatial reference EPSG identifier
+        workers (int, optional): rasters prepared at the same time. Defaults to DEFAULT_WORKERS (at most the number of CPUs).
+        cache_max_mb (int, optional): GDAL_CACHEMAX while the batch runs. Defaults to GDAL_CACHEMAX_MB.
+        warp_memory_mb (int, optional): working memory of each warp. Defaults to WARP_MEMORY_MB.
+    """
+
+    def __init__(self, epsg: int, workers: int = None, cache_max_mb: int = GDAL_CACHEMAX_MB, warp_memory_mb: int = WARP_MEMORY_MB):
+        cpus = os.cpu_count() or 1
+        self.epsg = epsg
+        self.workers = max(1, min(workers or DEFAULT_WORKERS, cpus))
+        # Split the CPUs between the warps running at the same time
+        self.threads = max(1, cpus // self.workers)
+        self.cache_max_mb = cache_max_mb
+        self.warp_memory_mb = warp_memory_mb
+        self.jobs = []
+        self.cutlines = {}
+        self.vsimem = f'/vsimem/raster_prep_{uuid.uuid4().hex}'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, _value, _traceback):
+        self.close()
+
+    def close(self) -> None:
+        """Release the prepared cutlines"""
+        for cutline in self.cutlines.values():
+            gdal.Unlink(cutline)
+        self.cutlines = {}
+
+    def add(self, inrasters: Union[str, List[str]], outraster: str, clip: str = None, warp_options: dict = None,
+            overview_resampling: str = DEFAULT_OVERVIEW_RESAMPLING, clean: bool = False) -> None:
+        """Queue a raster to be prepared
+
+        Args:
+            inrasters (Union[str, List[str]]): input raster, or several rasters to mosaic together (like raster_vrt_stitch)
+            outraster (str): output raster. Skipped if it already exists.
+            clip (str, optional): polygon feature class to clip (and crop) the output to. Defaults to None.
+            warp_options (dict, optional): extra gdal.WarpOptions keyword arguments (e.g. cutlineBlend). Defaults to None.
+            overview_resampling (str, optional): resampling used for the overviews. Defaults to DEFAULT_OVERVIEW_RESAMPLING.
+            clean (bool, optional): delete the input rasters once the output is written or found to exist already. Defaults to False.
+        """
+        inrasters = [inrasters] if isinstance(inrasters, str) else list(inrasters)
+        if clip is not None:
+            self.cutline(clip)
+        self.jobs.append({
+            'inrasters': inrasters,
+            'outraster': outraster,
+            'clip': clip,
+            'warp_options': warp_options or {},
+            'overview_resampling': overview_resampling,
+            'clean': clean
+        })
+
+    def cutline(self, clip: str) -> str:
+        """The prepared cutline for a clip boundary (prepared the first time the boundary is used)
+
+        Args:
+            clip (str): polygon feature class
+
+        Returns:
+            str: path of the single feature /vsimem dataset holding the dissolved boundary
+        """
+        if clip in self.cutlines:
+            return self.cutlines[clip]
+
+        log = Logger('Raster Prep')
+        log.info(f'Preparing cutline from {clip}')
+
+        clip_ds, clip_layer = VectorBase.path_sorter(clip)
+        src_ds = ogr.Open(clip_ds)
+        src_lyr = src_ds.GetLayerByName(clip_layer) if clip_layer else src_ds.GetLayer(0)
+        if src_lyr is None:
+            raise Exception(f'Could not open the clip layer {clip}')
+
+        boundary = ogr.Geometry(ogr.wkbMultiPolygon)
+        for feature in src_lyr:
+            geom = feature.GetGeometryRef()
+            if geom is None or geom.IsEmpty():
+                continue
+            boundary = boundary.Union(geom)
+        if boundary.IsEmpty():
+            raise Exception(f'The clip layer {clip} has no polygons')
+
+        cutline = f'{self.vsimem}/cutline_{len(self.cutlines)}.gpkg'
+        out_ds = ogr.GetDriverByName('GPKG').CreateDataSource(cutline)
+        out_lyr = out_ds.CreateLayer('cutline', src_lyr.GetSpatialRef(), ogr.wkbMultiPolygon)
+        out_feature = ogr.Feature(out_lyr.GetLayerDefn())
+        out_feature.SetGeometry(ogr.ForceToMultiPolygon(boundary))
+        out_lyr.CreateFeature(out_feature)
+        out_ds = None
+        src_ds = None
+
+        self.cutlines[clip] = cutline
+        return cutline
+
+    def run(self) -> List[str]:
+        """Prepare all the queued rasters concurrently
+
+        Raises:
+            Exception: the first raster that failed, once all the others have finished
+
+        Returns:
+            List[str]: the output rasters, in the order they were added
+        """
+        log = Logger('Raster Prep')
+        jobs = self.jobs
+        self.jobs = []
+        if len(jobs) == 0:
+            return []
+
+        log.info(f'Preparing {len(jobs)} rasters using {self.workers} workers with {self.threads} threads each')
+        # Same as setting GDAL_CACHEMAX, but also applies once the block cache is in use
+        previous_cache = gdal.GetCacheMax()
+        gdal.SetCacheMax(self.cache_max_mb * 1024 * 1024)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self._prepare, job) for job in jobs]
+            errors = [future.exception() for future in futures if future.exception() is not None]
+        finally:
+            gdal.SetCacheMax(previous_cache)
+
+        if len(errors) > 0:
+            raise errors[0]
+
+        return [job['outraster'] for job in jobs]
+
+    def _prepare(self, job: Dict) -> None:
+        """Warp one raster to a VRT and translate the VRT to a Cloud Optimized GeoTIFF"""
+        log = Logger('Raster Prep')
+        outraster = job['outraster']
+        if os.path.isfile(outraster):
+            log.info(f'Skipping raster because output exists {outraster}')
+        else:
+            log.info(f'Preparing {outraster} from {len(job["inrasters"])} raster(s)')
+            os.makedirs(os.path.dirname(outraster), exist_ok=True)
+
+            job_folder = f'{self.vsimem}/{uuid.uuid4().hex}'
+            try:
+                self._warp(job, f'{job_folder}/mosaic.vrt', f'{job_folder}/warp.vrt')
+            finally:
+                for path in gdal.ReadDirRecursive(job_folder) or []:
+                    gdal.Unlink(f'{job_folder}/{path}')
+            log.info(f'Prepared {outraster}')
+
+        # The inputs are removed even when the output already existed (the same as raster_vrt_stitch)
+        if job['clean']:
+            for rpath in job['inrasters']:
+                safe_remove_file(rpath)
+
+    def _warp(self, job: Dict, mosaicvrt: str, warpvrt: str) -> None:
+        """Mosaic (if needed), warp and translate one raster using temporary /vsimem VRTs"""
+        outraster = job['outraster']
+        source = job['inrasters'][0]
+        if len(job['inrasters']) > 1:
+            source = mosaicvrt
+            gdal.BuildVRT(source, job['inrasters'], options=gdal.BuildVRTOptions())
+
+        warp_kwargs = {
+            'dstSRS': f'EPSG:{self.epsg}',
+            'format': 'VRT',
+            'multithread': True,
+            'warpMemoryLimit': self.warp_memory_mb,
+            'warpOptions': [f'NUM_THREADS={self.threads}']
+        }
+        if job['clip'] is not None:
+            warp_kwargs.update({'cutlineDSName': self.cutline(job['clip']), 'cutlineLayer': 'cutline', 'cropToCutline': True})
+        warp_kwargs.update(job['warp_options'])
+
+        ds = gdal.Warp(warpvrt, source, options=gdal.WarpOptions(**warp_kwargs))
+        if ds is None:
+            raise Exception(f'Error running GDAL Warp for {outraster}')
+
+        translate_options = gdal.TranslateOptions(format='COG', creationOptions=[
+            'COMPRESS=DEFLATE',
+            'BIGTIFF=IF_SAFER',
+            f'NUM_THREADS={self.threads}',
+            f'OVERVIEW_RESAMPLING={job["overview_resampling"]}'
+        ])
+        out_ds = gdal.Translate(outraster, ds, options=translate_options)
+        if out_ds is None:
+            raise Exception(f'Error running GDAL Translate for {outraster}')
+        out_ds = None
+        ds = None
@@ -0,0 +1,155 @@
+# Name:     Raster Sampling
+#
+# Purpose:  Sample raster values at many points at once. Map coordinates are
+#           converted to pixel indices in one array operation and the values
+#           are gathered from the raster array with fancy indexing.
+# -------------------------------------------------------------------------------
+from typing import Callable, Tuple
+
+import numpy as np
+from shapely import get_coordinates
+
+SAMPLE_METHODS = ['nearest', 'bilinear']
+
+# Relative tolerance used when comparing values to the nodata value (the same as Raster.getPixelVal)
+NODATA_REL_TOL = 1e-07
+
+# fetch(rows, cols) -> (values, valid) for integer pixel indices that are inside the raster
+PixelFetch = Callable[[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray]]
+
+
+def points_to_xy(points) -> Tuple[np.ndarray, np.ndarray]:
+    """Split points into X and Y coordinate arrays
+
+    Args:
+        points: shapely points, (x, y) tuples or an (n, 2) array
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: X and Y coordinates
+    """
+    if len(points) == 0:
+        return np.empty(0), np.empty(0)
+
+    first = points[0]
+    if hasattr(first, 'geom_type'):
+        coords = get_coordinates(np.asarray(points, dtype=object))
+    else:
+        coords = np.asarray(points, dtype=np.float64).reshape(len(points), -1)
+
+    return coords[:, 0], coords[:, 1]
+
+
+def world_to_pixel(geotransform, xs: np.ndarray, ys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Convert map coordinates to fractional pixel coordinates
+
+    The geotransform is inverted so rotated rasters are handled too. Pixel (0, 0) covers
+    the area from 0.0 to 1.0 in both directions, so the pixel containing a point is floor() of its coordinates.
+
+    Args:
+        geotransform: GDAL geotransform
+        xs (np.ndarray): X coordinates
+        ys (np.ndarray): Y coordinates
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: fractional rows and columns
+    """
+    gt = geotransform
+    dx = np.asarray(xs, dtype=np.float64) - gt[0]
+    dy = np.asarray(ys, dtype=np.float64) - gt[3]
+    if gt[2] == 0 and gt[4] == 0:
+        # North up. Divide directly so points on cell edges land in the same cell as Raster.getPixelVal
+        return dy / gt[5], dx / gt[1]
+
+    det = gt[1] * gt[5] - gt[2] * gt[4]
+    cols = (gt[5] * dx - gt[2] * dy) / det
+    rows = (gt[1] * dy - gt[4] * dx) / det
+    return rows, cols
+
+
+def valid_values(values: np.ndarray, nodata: float = None) -> np.ndarray:
+    """Boolean mask of the values that are not NaN and not (close to) the nodata value"""
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    if nodata is not None and not np.isnan(nodata):
+        valid &= ~(np.abs(values - nodata) <= NODATA_REL_TOL * np.maximum(np.abs(values), abs(nodata)))
+    return valid
+
+
+def array_fetch(array: np.ndarray, nodata: float = None) -> PixelFetch:
+    """Pixel fetch for a 2D array (or masked array) that is already in memory"""
+    data = np.ma.getdata(array)
+    mask = np.ma.getmaskarray(array) if isinstance(array, np.ma.MaskedArray) else None
+
+    def fetch(rows: np.ndarray, cols: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        values = data[rows, cols].astype(np.float64)
+        valid = valid_values(values, nodata)
+        if mask is not None:
+            valid &= ~mask[rows, cols]
+        return values, valid
+
+    return fetch
+
+
+def sample_pixels(fetch: PixelFetch, shape: Tuple[int, int], geotransform, xs: np.ndarray, ys: np.ndarray, method: str = 'nearest') -> np.ma.MaskedArray:
+    """Sample a raster at map coordinates
+
+    Args:
+        fetch (PixelFetch): returns the values (and whether they are valid) of whole pixels
+        shape (Tuple[int, int]): raster rows and columns
+        geotransform: GDAL geotransform
+        xs (np.ndarray): X coordinates
+        ys (np.ndarray): Y coordinates
+        method (str, optional): 'nearest' (the value of the cell containing the point) or 'bilinear'
+            (interpolated between the four closest cell centres, ignoring nodata cells). Defaults to 'nearest'.
+
+    Raises:
+        ValueError: unknown sample method
+
+    Returns:
+        np.ma.MaskedArray: float64 values. Points outside the raster or on nodata are masked.
+    """
+    if method not in SAMPLE_METHODS:
+        raise ValueError(f'Raster sample method {method} not recognised. Use one of {", ".join(SAMPLE_METHODS)}')
+
+    n_rows, n_cols = shape
+    rows, cols = world_to_pixel(geotransform, xs, ys)
+    out = np.full(rows.shape, np.nan)
+    inside = (rows >= 0) & (rows < n_rows) & (cols >= 0) & (cols < n_cols)
+
+    if method == 'nearest':
+        values, valid = fetch(rows[inside].astype(np.int64), cols[inside].astype(np.int64))
+        out[np.flatnonzero(inside)[valid]] = values[valid]
+        return np.ma.masked_invalid(out)
+
+    # Bilinear: offset to cell centres and clamp the neighbours at the raster edges
+    r = rows[inside] - 0.5
+    c = cols[inside] - 0.5
+    r0 = np.floor(r)
+    c0 = np.floor(c)
+    fr = r - r0
+    fc = c - c0
+    r0 = r0.astype(np.int64)
+    c0 = c0.astype(np.int64)
+
+    # The four neighbours are fetched together in a single gather
+    neighbour_rows = np.concatenate([np.clip(r0 + dr, 0, n_rows - 1) for dr in (0, 0, 1, 1)])
+    neighbour_cols = np.concatenate([np.clip(c0 + dc, 0, n_cols - 1) for dc in (0, 1, 0, 1)])
+    values, valid = fetch(neighbour_rows, neighbour_cols)
+    weight = np.concatenate([(1 - fr) * (1 - fc), (1 - fr) * fc, fr * (1 - fc), fr * fc])
+    weight[~valid] = 0.0
+
+    total = np.sum((np.where(valid, values, 0.0) * weight).reshape(4, -1), axis=0)
+    weights = np.sum(weight.reshape(4, -1), axis=0)
+
+    # Renormalise over the valid neighbours. A point that only touches nodata cells stays masked
+    has_value = weights > 0
+    interpolated = np.full(len(r), np.nan)
+    interpolated[has_value] = total[has_value] / weights[has_value]
+    out[inside] = interpolated
+    return np.ma.masked_invalid(out)
+
+
+def sample_array(array: np.ndarray, geotransform, xs: np.ndarray, ys: np.ndarray, nodata: float = None, method: str = 'nearest') -> np.ma.MaskedArray:
+    """Sample an in-memory raster array at map coordinates (see sample_pixels)"""
+    return sample_pixels(array_fetch(array, nodata), array.shape, geotransform, xs, ys, method)
+
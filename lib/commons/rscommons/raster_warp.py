@@ -23,9 +23,10 @@ from rsxml import Logger
 from rsxml.util import safe_remove_file
 from rscommons.download import get_unique_file_path
 from rscommons import VectorBase
+from rscommons.raster_prep import WARP_MEMORY_MB
 
 
-def raster_vrt_stitch(inrasters, outraster, epsg, clip=None, clean=False, warp_options: dict = {}):
+def raster_vrt_stitch(inrasters, outraster, epsg, clip=None, clean=False, warp_options: dict = {}, num_threads: int = 1):
     """[summary]
     https://gdal.org/python/osgeo.gdal-module.html#BuildVRT
     Keyword arguments are :
@@ -68,7 +69,7 @@ def raster_vrt_stitch(inrasters, outraster, epsg, clip=None, clean=False, warp_o
     vrt_options = gdal.BuildVRTOptions()
     gdal.BuildVRT(path_vrt, inrasters, options=vrt_options)
 
-    raster_warp(path_vrt, outraster, epsg, clip, warp_options)
+    raster_warp(path_vrt, outraster, epsg, clip, warp_options, num_threads=num_threads)
 
     if clean:
         for rpath in inrasters:
@@ -80,7 +81,8 @@ def raster_vrt_stitch(inrasters, outraster, epsg, clip=None, clean=False, warp_o
     #     os.remove(path_vrt)
 
 
-def raster_warp(inraster: str, outraster: str, epsg, clip=None, warp_options: dict = {}, raster_compression: str = " -co COMPRESS=DEFLATE"):
+def raster_warp(inraster: str, outraster: str, epsg, clip=None, warp_options: dict = {}, raster_compression: str = " -co COMPRESS=DEFLATE",
+                num_threads: int = 1, warp_memory_mb: int = WARP_MEMORY_MB):
     """Reproject a raster to a different coordinate system.
 
     :param inraster: Input dataset
@@ -90,6 +92,8 @@ def raster_warp(inraster: str, outraster: str, epsg, clip=None, warp_options: di
     :param clip: Optional Polygon dataset to clip the output.
     :param warp_options: Extra GDALWarpOptions (e.g. xRes, yRes for resolution) see link below
     :param raster_compression: Compression options for the output raster.
+    :param num_threads: Threads used by the warp (or 'ALL_CPUS'). Callers running several warps at once should share the CPUs out.
+    :param warp_memory_mb: Working memory of the warp in MB.
     :return: None
 
     https://gdal.org/python/osgeo.gdal-module.html#WarpOptions
@@ -110,10 +114,15 @@ def raster_warp(inraster: str, outraster: str, epsg, clip=None, warp_options: di
     output_folder = os.path.dirname(outraster)
     if not os.path.isdir(output_folder):
         os.mkdir(output_folder)
-    warpvrt = os.path.join(os.path.dirname(outraster), 'temp_gdal_warp_output.vrt')
+    # Unique so a temporary VRT left in the output folder by another warp is never overwritten
+    warpvrt = get_unique_file_path(output_folder, 'temp_gdal_warp_output.vrt')
 
     log.info('Performing GDAL warp to temporary VRT file.')
 
+    # A larger working buffer than the GDAL default and, when asked for, multithreaded warping. Callers can still override these.
+    thread_options = {'multithread': True, 'warpOptions': [f'NUM_THREADS={num_threads}']} if num_threads != 1 else {}
+    warp_options = {'warpMemoryLimit': warp_memory_mb, **thread_options, **warp_options}
+
     if clip:
         log.info('Clipping to polygons using {}'.format(clip))
         clip_ds, clip_layer = VectorBase.path_sorter(clip)
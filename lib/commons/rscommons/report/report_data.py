@@ -0,0 +1,208 @@
+# Name:     Report Data
+#
+# Purpose:  Columnar data layer for the HTML reports. Every column a report
+#           needs from a table or view is read in a single query and the
+#           value counts, bins and summary statistics are then computed on
+#           NumPy arrays instead of issuing one SQL query per metric or bin.
+# -------------------------------------------------------------------------------
+import sqlite3
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from rsxml import Logger
+
+
+class ReportFrame:
+    """Columns of a table or view read in one pass
+
+    Args:
+        columns (Dict[str, np.ndarray]): column name -> raw values (object array, NULL values are None)
+        missing (List[str], optional): requested columns that do not exist in the table. Defaults to None.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray], missing: List[str] = None):
+        self.columns = columns
+        self.missing = missing or []
+        self._numeric = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if len(self.columns) > 0 else 0
+
+    def numeric(self, name: str) -> np.ndarray:
+        """Column as float64 with NaN for NULL (and non numeric) values. Cached after the first call."""
+        if name not in self._numeric:
+            self._numeric[name] = to_float(self.columns[name])
+        return self._numeric[name]
+
+
+def read_columns(database: str, table: str, columns: List[str], where: str = None) -> ReportFrame:
+    """Read several columns of a table or view in a single SELECT
+
+    Columns that don't exist in the table are skipped (and logged) rather than failing the whole read.
+
+    Args:
+        database (str): SQLite database or GeoPackage
+        table (str): table or view name
+        columns (List[str]): column names (matched case insensitively, keyed in the frame as requested)
+        where (str, optional): SQL filter without the WHERE keyword. Defaults to None.
+
+    Returns:
+        ReportFrame: the requested columns
+    """
+    log = Logger('Report Data')
+
+    with sqlite3.connect(database) as conn:
+        curs = conn.cursor()
+        curs.execute(f'PRAGMA table_info({table})')
+        existing = {row[1].lower() for row in curs.fetchall()}
+
+        found = []
+        missing = []
+        for column in dict.fromkeys(columns):
+            (found if column.lower() in existing else missing).append(column)
+
+        if len(missing) > 0:
+            log.warning(f'Columns not found in {table}: {", ".join(missing)}')
+
+        if len(found) == 0:
+            return ReportFrame({}, missing)
+
+        sql = f'SELECT {", ".join(found)} FROM {table}'
+        if where is not None:
+            sql += f' WHERE {where}'
+        curs.execute(sql)
+        rows = curs.fetchall()
+
+    data = np.empty((len(rows), len(found)), dtype=object)
+    if len(rows) > 0:
+        data[:] = rows
+
+    return ReportFrame({column: data[:, idx] for idx, column in enumerate(found)}, missing)
+
+
+def to_float(values) -> np.ndarray:
+    """Convert raw column values to float64 with NaN for NULL and non numeric values"""
+    values = np.asarray(values, dtype=object)
+    try:
+        return np.array([np.nan if val is None else val for val in values], dtype=np.float64)
+    except (TypeError, ValueError):
+        out = np.full(len(values), np.nan)
+        for idx, val in enumerate(values):
+            try:
+                out[idx] = float(val)
+            except (TypeError, ValueError):
+                pass
+        return out
+
+
+def value_counts(values) -> Tuple[list, list]:
+    """Count the distinct values of a column in order of first appearance (the same order as collections.Counter)
+
+    Args:
+        values (array like): raw column values. NULL values are counted as None.
+
+    Returns:
+        Tuple[list, list]: distinct values and their counts
+    """
+    values = np.asarray(values, dtype=object)
+    if len(values) == 0:
+        return [], []
+
+    numeric = np.array([val is None or isinstance(val, (int, float)) for val in values], dtype=bool)
+    if not np.all(numeric):
+        # Text columns (or mixed types) can't be sorted so use a hash table
+        counts = {}
+        for val in values:
+            counts[val] = counts.get(val, 0) + 1
+        return list(counts.keys()), list(counts.values())
+
+    _uniques, first, counts = np.unique(to_float(values), return_index=True, return_counts=True)
+    order = np.argsort(first, kind='stable')
+    return [values[first[i]] for i in order], [int(counts[i]) for i in order]
+
+
+def summary_stats(values, fill_null: float = None) -> Dict[str, float]:
+    """Count, minimum, maximum and average of a numeric column
+
+    Args:
+        values (array like): raw or float values
+        fill_null (float, optional): value substituted for NULLs before the statistics are calculated.
+            Defaults to None (NULLs are ignored and only counted).
+
+    Returns:
+        Dict[str, float]: 'Values', 'Maximum', 'Minimum', 'Average' and 'NULL Values'. The statistics are None when there are no values.
+    """
+    vals = to_float(values)
+    nulls = np.isnan(vals)
+    if fill_null is not None:
+        vals = np.where(nulls, fill_null, vals)
+    else:
+        vals = vals[~nulls]
+
+    if len(vals) == 0:
+        return {'Values': 0, 'Maximum': None, 'Minimum': None, 'Average': None, 'NULL Values': int(np.sum(nulls))}
+
+    return {
+        'Values': int(len(vals)),
+        'Maximum': float(np.max(vals)),
+        'Minimum': float(np.min(vals)),
+        'Average': float(np.mean(vals)),
+        'NULL Values': int(np.sum(nulls))
+    }
+
+
+def interval_mask(values: np.ndarray, lower: float = None, upper: float = None) -> np.ndarray:
+    """Boolean mask of lower < value <= upper. Either bound can be omitted. NaN values never match."""
+    values = np.asarray(values, dtype=np.float64)
+    mask = ~np.isnan(values)
+    if lower is not None:
+        mask &= values > lower
+    if upper is not None:
+        mask &= values <= upper
+    return mask
+
+
+def upper_bin_sums(values: np.ndarray, weights: np.ndarray, uppers: List[float]) -> np.ndarray:
+    """Sum the weights into the first bin whose (inclusive) upper limit is greater than or equal to the value
+
+    Values above the last upper limit and NaN values or weights are dropped.
+
+    Args:
+        values (np.ndarray): values used to pick the bin
+        weights (np.ndarray): values summed within each bin
+        uppers (List[float]): ascending upper limits of the bins
+
+    Returns:
+        np.ndarray: one sum per bin
+    """
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    valid = ~np.isnan(values) & ~np.isnan(weights)
+    bin_idx = np.searchsorted(np.asarray(uppers, dtype=np.float64), values[valid], side='left')
+    keep = bin_idx < len(uppers)
+    return np.bincount(bin_idx[keep], weights=weights[valid][keep], minlength=len(uppers))[:len(uppers)]
+
+
+def group_sums(keys, weights: np.ndarray) -> Dict[object, float]:
+    """Sum a numeric column for each distinct key (like SELECT key, SUM(weight) ... GROUP BY key)
+
+    Args:
+        keys (array like): group keys
+        weights (np.ndarray): values to sum. NaN values are ignored.
+
+    Returns:
+        Dict[object, float]: key -> sum in order of first appearance
+    """
+    labels, _counts = value_counts(keys)
+    lookup = {label: idx for idx, label in enumerate(labels)}
+    codes = np.array([lookup[key] for key in keys], dtype=np.int64)
+    weights = np.nan_to_num(np.asarray(weights, dtype=np.float64), nan=0.0)
+    sums = np.bincount(codes, weights=weights, minlength=len(labels))
+    return {label: float(sums[idx]) for idx, label in enumerate(labels)}
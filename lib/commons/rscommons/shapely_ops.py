@@ -7,7 +7,19 @@
 #
 # Date:     11 Oct 2021
 # -------------------------------------------------------------------------------
+import os
+import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import numpy as np
+import shapely
+from shapely.ops import unary_union
 from shapely.geometry import Point, LineString
+from shapely.geometry.base import BaseGeometry
+
+# Number of geometries unioned together by each worker before the partial unions are merged
+UNION_PARTITION_SIZE = 500
 
 
 def line_segments(curve: LineString) -> list:
@@ -114,3 +126,61 @@ def cut_line_segment(line, distance_start, distance_stop):
         if pd > distance_stop:
             cp = line.interpolate(distance_stop)
             return LineString(coords[: i] + [(cp.x, cp.y)])
+
+
+def str_partitions(geoms: List[BaseGeometry], partition_size: int = UNION_PARTITION_SIZE) -> List[np.ndarray]:
+    """Group geometries into spatially compact partitions using Sort-Tile-Recursive packing
+    (the same packing STRtree uses for its leaf nodes)
+
+    Args:
+        geoms (List[BaseGeometry]): non-empty geometries
+        partition_size (int, optional): maximum number of geometries per partition. Defaults to UNION_PARTITION_SIZE.
+
+    Returns:
+        List[np.ndarray]: indices into geoms for each partition. Neighbouring partitions are spatially adjacent.
+    """
+    bounds = shapely.bounds(np.asarray(geoms, dtype=object))
+    center_x = (bounds[:, 0] + bounds[:, 2]) / 2
+    center_y = (bounds[:, 1] + bounds[:, 3]) / 2
+
+    num_partitions = math.ceil(len(geoms) / partition_size)
+    slab_size = math.ceil(math.sqrt(num_partitions)) * partition_size
+
+    partitions = []
+    order = np.argsort(center_x, kind='stable')
+    for slab_start in range(0, len(order), slab_size):
+        slab = order[slab_start:slab_start + slab_size]
+        slab = slab[np.argsort(center_y[slab], kind='stable')]
+        for start in range(0, len(slab), partition_size):
+            partitions.append(slab[start:start + partition_size])
+
+    return partitions
+
+
+def hierarchical_union(geoms: List[BaseGeometry], partition_size: int = UNION_PARTITION_SIZE, max_workers: int = 1) -> BaseGeometry:
+    """Union a large number of geometries by unioning spatial partitions in parallel worker processes
+    and then merging the partial unions. The final merge is a single unary_union, which GEOS
+    performs as a balanced (cascaded) tree over the partial results, so no geometry is folded
+    into an ever-growing running union.
+
+    Args:
+        geoms (List[BaseGeometry]): geometries to union. None and empty geometries are ignored.
+        partition_size (int, optional): number of geometries per partition. Defaults to UNION_PARTITION_SIZE.
+        max_workers (int, optional): number of worker processes. Defaults to 1, which stays in-process. None uses every CPU.
+
+    Returns:
+        BaseGeometry: union of all the geometries or None if there are none
+    """
+    geoms = [geom for geom in geoms if geom is not None and not geom.is_empty]
+    if len(geoms) == 0:
+        return None
+
+    workers = min(max_workers or os.cpu_count() or 1, math.ceil(len(geoms) / partition_size))
+    if workers <= 1:
+        return unary_union(geoms)
+
+    partitions = [[geoms[idx] for idx in partition] for partition in str_partitions(geoms, partition_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        partial_unions = list(executor.map(unary_union, partitions))
+
+    return unary_union(partial_unions)
@@ -0,0 +1,138 @@
+# Name:     Spatial Join
+#
+# Purpose:  Match the features of one layer to the features of another
+#           layer using a spatial predicate. Both layers are read once,
+#           the second layer is bulk loaded into an STRtree and the first
+#           layer's geometries are tested against it in a single query
+#           (shapely prepares the query geometries internally).
+# -------------------------------------------------------------------------------
+from typing import Iterator, Set, Tuple
+
+import numpy as np
+from osgeo import ogr
+from shapely import STRtree
+
+from rsxml import Logger, ProgressBar
+from rscommons import get_shp_or_gpkg, VectorBase
+
+# Predicate names accepted by spatial_join mapped to the shapely predicate.
+# The predicate is evaluated as <source feature> <predicate> <join feature>
+PREDICATES = {
+    'within': 'within',
+    'intersects': 'intersects',
+    'covered_by': 'covered_by',
+    'contains': 'contains',
+    'covers': 'covers'
+}
+
+# Number of FIDs fetched with each "FID IN (...)" filter by iterate_joined_features
+FID_CHUNK_SIZE = 1000
+
+
+def load_layer_geometries(layer: VectorBase, attribute_filter: str = None, transform=None, name: str = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Read the FIDs and shapely geometries of a layer in one pass
+
+    Args:
+        layer (VectorBase): open layer
+        attribute_filter (str, optional): attribute filter applied while reading. Defaults to None.
+        transform (osr.CoordinateTransformation, optional): transform applied to every geometry. Defaults to None.
+        name (str, optional): progress bar label. Defaults to None (no progress bar).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: FIDs and geometries. Features without geometry are skipped.
+    """
+    fids = []
+    geoms = []
+    for feature, _counter, _progbar in layer.iterate_features(name, attribute_filter=attribute_filter):
+        geom = feature.GetGeometryRef()
+        if geom is None or geom.IsEmpty():
+            continue
+        fids.append(feature.GetFID())
+        geoms.append(VectorBase.ogr2shapely(geom, transform))
+
+    return np.array(fids, dtype=np.int64), np.array(geoms, dtype=object)
+
+
+def spatial_join(source_path: str, join_path: str, predicate: str = 'intersects',
+                 source_filter: str = None, join_filter: str = None) -> np.ndarray:
+    """Find every pair of features where the source feature satisfies the predicate against the join feature
+
+    Args:
+        source_path (str): layer whose features are tested (e.g. flowlines)
+        join_path (str): layer the source features are tested against (e.g. waterbody polygons). Reprojected to the source layer if needed.
+        predicate (str, optional): one of PREDICATES. Defaults to 'intersects'.
+        source_filter (str, optional): attribute filter for the source layer. Defaults to None.
+        join_filter (str, optional): attribute filter for the join layer. Defaults to None.
+
+    Raises:
+        ValueError: unknown predicate
+
+    Returns:
+        np.ndarray: (n, 2) array of (source FID, join FID) pairs
+    """
+    log = Logger('Spatial Join')
+
+    if predicate not in PREDICATES:
+        raise ValueError(f'Spatial join predicate {predicate} not recognised. Use one of {", ".join(PREDICATES)}')
+
+    with get_shp_or_gpkg(source_path) as source_lyr, get_shp_or_gpkg(join_path) as join_lyr:
+        transform = None
+        if source_lyr.spatial_ref is not None and join_lyr.spatial_ref is not None and not source_lyr.spatial_ref.IsSame(join_lyr.spatial_ref):
+            transform = VectorBase.get_transform(join_lyr.spatial_ref, source_lyr.spatial_ref)
+
+        join_ids, join_geoms = load_layer_geometries(join_lyr, join_filter, transform)
+        if len(join_ids) == 0:
+            return np.empty((0, 2), dtype=np.int64)
+        source_fids, source_geoms = load_layer_geometries(source_lyr, source_filter)
+
+    log.info(f'Joining {len(source_fids):,} features to {len(join_ids):,} features using "{predicate}"')
+    tree = STRtree(join_geoms)
+    source_idx, join_idx = tree.query(source_geoms, predicate=PREDICATES[predicate])
+
+    return np.column_stack((source_fids[source_idx], join_ids[join_idx]))
+
+
+def join_fids(source_path: str, join_path: str, predicate: str = 'intersects',
+              source_filter: str = None, join_filter: str = None) -> Set[int]:
+    """FIDs of the source features that satisfy the predicate against at least one join feature
+    (see spatial_join for the arguments)
+    """
+    pairs = spatial_join(source_path, join_path, predicate, source_filter, join_filter)
+    return set(int(fid) for fid in np.unique(pairs[:, 0]))
+
+
+def iterate_joined_features(layer: VectorBase, fids: Set[int], name: str = None, write_layers: list = None,
+                            attribute_filter: str = None) -> Iterator[Tuple[ogr.Feature, int, object]]:
+    """Stream the features of a layer that are in a set of FIDs (e.g. the result of join_fids)
+    so they can be written straight to an output layer
+
+    The features are fetched FID_CHUNK_SIZE at a time with an "FID IN (...)" attribute filter
+    (resolved by the FID index) so only the joined features are read, not the whole layer.
+
+    Args:
+        layer (VectorBase): open source layer
+        fids (Set[int]): FIDs to keep
+        name (str, optional): progress bar label. Defaults to None.
+        write_layers (list, optional): layers written to inside the loop (committed once per chunk). Defaults to None.
+        attribute_filter (str, optional): attribute filter. Defaults to None.
+
+    Yields:
+        Tuple[ogr.Feature, int, ProgressBar]: same as VectorBase.iterate_features
+    """
+    # ShapeFiles have no FID column but OGR SQL understands the FID special field
+    fid_column = layer.ogr_layer.GetFIDColumn() or 'FID'
+    sorted_fids = sorted(int(fid) for fid in fids)
+
+    progbar = ProgressBar(len(sorted_fids), 50, name) if name is not None else None
+    counter = 0
+    for start in range(0, len(sorted_fids), FID_CHUNK_SIZE):
+        fid_filter = f'{fid_column} IN ({", ".join(str(fid) for fid in sorted_fids[start:start + FID_CHUNK_SIZE])})'
+        chunk_filter = f'({attribute_filter}) AND {fid_filter}' if attribute_filter else fid_filter
+        for feature, _counter, _progbar in layer.iterate_features(None, write_layers=write_layers, commit_thresh=FID_CHUNK_SIZE, attribute_filter=chunk_filter):
+            counter += 1
+            if progbar is not None:
+                progbar.update(counter)
+            yield feature, counter, progbar
+
+    if progbar is not None:
+        progbar.finish()
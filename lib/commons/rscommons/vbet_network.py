@@ -12,18 +12,22 @@
 # -------------------------------------------------------------------------------
 import os
 import sqlite3
-from typing import List
+from typing import List, Set
+import numpy as np
 from osgeo import ogr
 from shapely.geometry.base import BaseGeometry
 from rsxml import Logger
 from rscommons import VectorBase, GeopackageLayer
-from rscommons.vector_ops import get_geometry_unary_union
+from rscommons.spatial_join import iterate_joined_features
+from rscommons.network_prep import FlowlineTable, classify_zones, code_string, named_stream_codes, polygon_relations
+from rscommons.network_topology import get_level_path_topology, get_level_path_values, level_path_key, level_path_values
 from rscommons import get_shp_or_gpkg
 
 Path = str
 
 
-def vbet_network(flow_lines_path: str, flow_areas_path: str, out_path: str, epsg: int = None, fcodes: List[str] = None, reach_code_field='FCode', flow_areas_path_exclude=None, hard_clip_shape=None):
+def vbet_network(flow_lines_path: str, flow_areas_path: str, out_path: str, epsg: int = None, fcodes: List[str] = None, reach_code_field='FCode',
+                 flow_areas_path_exclude=None, hard_clip_shape=None, include_named_streams: bool = False):
 
     log = Logger('VBET Network')
     log.info('Generating perennial network')
@@ -32,60 +36,53 @@ def vbet_network(flow_lines_path: str, flow_areas_path: str, out_path: str, epsg
     with get_shp_or_gpkg(out_path, write=True) as vbet_net, \
             get_shp_or_gpkg(flow_lines_path) as flow_lines_lyr:
 
-        # add fcodes from included level paths that aren't already in the list
-        stream_names = []
-        for line_ftr, *_ in flow_lines_lyr.iterate_features():
-            if str(line_ftr.GetField(reach_code_field)) in fcodes:
-                if len(stream_names) > 0 and line_ftr.GetField('GNIS_Name') not in stream_names and line_ftr.GetField('GNIS_Name') is not None:
-                    stream_names.append(line_ftr.GetField('GNIS_Name'))  # this is NHD only this way
+        # Flowline codes, names and geometries are read once and everything below works on these arrays
+        flowlines = FlowlineTable(flow_lines_lyr, [reach_code_field, 'GNIS_Name'], 'Loading Flowlines')
+        codes = flowlines.codes(reach_code_field)
 
-        for line_ftr, *_ in flow_lines_lyr.iterate_features():
-            if len(stream_names) > 0 and line_ftr.GetField('GNIS_Name') in stream_names:
-                if str(line_ftr.GetField(reach_code_field)) not in fcodes:
-                    fcodes.append(str(line_ftr.GetField(reach_code_field)))
+        # add fcodes from included level paths that aren't already in the list (this is NHD only this way)
+        fcodes = named_stream_codes(codes, flowlines.values['GNIS_Name'], fcodes) if include_named_streams else [code_string(fcode) for fcode in fcodes]
 
         # Add input Layer Fields to the output Layer if it is the one we want
         vbet_net.create_layer_from_ref(flow_lines_lyr, epsg=epsg)
 
-        exclude_fids = []
         if flow_areas_path_exclude is not None:
-            with get_shp_or_gpkg(flow_areas_path_exclude) as lyr_exclude:
-                for poly_feat, *_ in lyr_exclude.iterate_features("Filtering waterbodies"):
-                    poly_geom = poly_feat.GetGeometryRef()
-                    for line_feat, *_ in flow_lines_lyr.iterate_features(clip_shape=poly_geom):
-                        line_geom = line_feat.GetGeometryRef()
-                        if line_geom.Within(poly_geom):
-                            fid = line_feat.GetFID()
-                            exclude_fids.append(fid)
+            log.info('Filtering flowlines within waterbodies')
+        within_waterbody, in_flow_area = polygon_relations(flowlines, flow_areas_path_exclude, flow_areas_path)
 
         # Perennial features
         log.info('Incorporating perennial features')
-        fcode_filter = f"{reach_code_field} = " + f" or {reach_code_field} = ".join([f"'{fcode}'" for fcode in fcodes]) if len(fcodes) > 0 else ""  # e.g. "FCode = '46006' or FCode = '55800'"
-        fids = include_features(flow_lines_lyr, vbet_net, fcode_filter, excluded_fids=exclude_fids, hard_clip_shape=hard_clip_shape)
+        perennial = ~within_waterbody
+        if len(fcodes) > 0:
+            perennial &= np.isin(codes, fcodes)
+        fids = include_features(flow_lines_lyr, vbet_net, hard_clip_shape=hard_clip_shape, fids=set(flowlines.fids[perennial].tolist()))
 
         # Flow area features
-        if flow_areas_path is not None:
-            polygon = get_geometry_unary_union(flow_areas_path, epsg=epsg)
-            if polygon is not None:
-                log.info('Incorporating flow areas.')
-                include_features(flow_lines_lyr, vbet_net, f"{reach_code_field} <> '46006'", polygon, excluded_fids=fids, hard_clip_shape=hard_clip_shape)
+        not_perennial_code = np.array([code is not None and code != '46006' for code in codes], dtype=bool)
+        flow_area_fids = set(flowlines.fids[in_flow_area & not_perennial_code & ~perennial].tolist())
+        if len(flow_area_fids) > 0:
+            log.info('Incorporating flow areas.')
+            fids += include_features(flow_lines_lyr, vbet_net, hard_clip_shape=hard_clip_shape, fids=flow_area_fids)
 
-        fcount = flow_lines_lyr.ogr_layer.GetFeatureCount()
+        log.info('VBET network generated with {} features'.format(len(fids)))
 
-        log.info('VBET network generated with {} features'.format(fcount))
 
-
-def include_features(source_layer: VectorBase, out_layer: VectorBase, attribute_filter: str = None, clip_shape: BaseGeometry = None, excluded_fids: list = None, hard_clip_shape=None):
+def include_features(source_layer: VectorBase, out_layer: VectorBase, attribute_filter: str = None, clip_shape: BaseGeometry = None, excluded_fids: list = None, hard_clip_shape=None, fids: Set[int] = None):
 
     included_fids = []
-    excluded_fids = [] if excluded_fids is None else excluded_fids
-    for feature, _counter, _progbar in source_layer.iterate_features('Including Features', write_layers=[out_layer], attribute_filter=attribute_filter, clip_shape=clip_shape):
+    excluded_fids = set() if excluded_fids is None else set(excluded_fids)
+    if fids is not None:
+        features = iterate_joined_features(source_layer, fids, 'Including Features', write_layers=[out_layer], attribute_filter=attribute_filter)
+    else:
+        features = source_layer.iterate_features('Including Features', write_layers=[out_layer], attribute_filter=attribute_filter, clip_shape=clip_shape)
+
+    for feature, _counter, _progbar in features:
         out_feature = ogr.Feature(out_layer.ogr_layer_def)
 
         if feature.GetFID() not in excluded_fids:
             fid = feature.GetFID()
             included_fids.append(fid)
-            excluded_fids.append(fid)
+            excluded_fids.add(fid)
             # Add field values from input Layer
             for i in range(0, out_layer.ogr_layer_def.GetFieldCount()):
                 out_feature.SetField(out_layer.ogr_layer_def.GetFieldDefn(i).GetNameRef(), feature.GetField(i))
@@ -110,6 +107,13 @@ def create_stream_size_zones(catchment_layer: str, id_field: str, data_field: st
         out_layer (str): output layer
     """
 
+    # Classify all the catchments at once from the data values before copying the features
+    with sqlite3.connect(os.path.dirname(catchment_layer)) as conn:
+        rows = conn.execute(f'SELECT rowid, "{data_field}" FROM "{os.path.basename(catchment_layer)}"').fetchall()
+    row_idx = {fid: idx for idx, (fid, _value) in enumerate(rows)}
+    data_values = np.array([value if value is not None else np.nan for _fid, value in rows], dtype=np.float64)
+    zone_classes = {zone_type: classify_zones(data_values, zone_values) for zone_type, zone_values in zones.items()}
+
     with GeopackageLayer(os.path.dirname(catchment_layer), layer_name=os.path.basename(catchment_layer)) as lyr_source, \
             GeopackageLayer(os.path.dirname(out_layer), layer_name=os.path.basename(out_layer), write=True) as lyr_destination:
 
@@ -129,20 +133,11 @@ def create_stream_size_zones(catchment_layer: str, id_field: str, data_field: st
             feat_dest.SetFID(int(id_value))
             geom: ogr.Geometry = feat_source.GetGeometryRef()
             feat_dest.SetGeometry(geom)
-            data_value = feat_source.GetField(data_field)
-            feat_dest.SetField(data_field, data_value)
-            if data_value is not None:
-                out_zones = {}
-                for zone_type, zone_values in zones.items():
-                    for i, value in zone_values.items():
-                        if value:
-                            if data_value < value:
-                                out_zones[zone_type] = i
-                                break
-                        else:
-                            out_zones[zone_type] = i
-                for zone_field, zone_value in out_zones.items():
-                    feat_dest.SetField(f'{zone_field}_Zone', zone_value)
+            feat_dest.SetField(data_field, feat_source.GetField(data_field))
+            idx = row_idx[feat_source.GetFID()]
+            for zone_type, zone_values in zone_classes.items():
+                if zone_values[idx] is not None:
+                    feat_dest.SetField(f'{zone_type}_Zone', zone_values[idx])
             lyr_destination.ogr_layer.CreateFeature(feat_dest)
         lyr_destination.ogr_layer.CommitTransaction()
 
@@ -257,20 +252,16 @@ def get_channel_level_path(channel_area, lines, unique_stream_field, unique_reac
 
 def get_levelpath_catchment(level_path_id: int, catchments_fc: Path) -> BaseGeometry:
 
-    with sqlite3.connect(os.path.dirname(catchments_fc)) as conn:
-        selected = 0
-        cursor = conn.cursor()
-        level_paths = tuple([level_path_id, '0'])
-        out_level_paths = tuple(set([level_path_id]))
-        while len(level_paths) != selected:
-            selected = len(level_paths)
-            down_level_paths = cursor.execute('SELECT LevelPathI from catchments_vaa where DnLevelPat in {}'.format(level_paths)).fetchall()
-            level_paths = tuple([str(int(down_path[0])) for down_path in down_level_paths if down_path not in level_paths])
-            out_level_paths = tuple(set(level_paths + out_level_paths))
+    # The level path graph and the level path -> catchment fid lookup are loaded once per geopackage
+    # and the upstream closure is a graph traversal
+    gpkg = os.path.dirname(catchments_fc)
+    topology = get_level_path_topology(gpkg)
+    level_path_fids = get_level_path_values(gpkg, os.path.basename(catchments_fc), 'fid', 'LevelPathI')
+    fids = set(fid for level_path in topology.upstream(level_path_id) for fid in level_path_fids.get(level_path, []))
 
     out_geom = ogr.Geometry(ogr.wkbMultiPolygon)
     with GeopackageLayer(catchments_fc) as lyr:
-        for feat, *_ in lyr.iterate_features(attribute_filter="LevelPathI in {}".format(out_level_paths)):
+        for feat, _counter, _progbar in iterate_joined_features(lyr, fids):
             geom = feat.GetGeometryRef()
             out_geom.AddGeometry(geom)
 
@@ -282,63 +273,59 @@ def get_distance_lookup(outputs_gpkg, level_paths, level_paths_drainage, vbet_ru
 
     output = {}
 
-    with sqlite3.connect(outputs_gpkg) as conn:
-        curs = conn.cursor()
-        for level_path in level_paths:
-            if level_path is None:
-                continue
+    # Segment distances for every level path in one query rather than one query per level path
+    level_path_dists = level_path_values(outputs_gpkg, 'vbet_igos', 'seg_distance') if conversion is not None else {}
+
+    for level_path in level_paths:
+        if level_path is None:
+            continue
 
+        dists = level_path_dists.get(level_path_key(level_path), [])
+        if len(dists) > 2:
+            min_dist = dists[1] - dists[0]
+        else:
+            min_dist = 0
+
+        if level_paths_drainage[level_path] < vbet_run['Zones']['Slope'][0]:
             if conversion is not None:
-                curs.execute(f"SELECT seg_distance FROM vbet_igos WHERE level_path = '{level_path}'")
-                dists = [row[0] for row in curs.fetchall()]
-                if len(dists) > 2:
-                    dists.sort()
-                    min_dist = dists[1] - dists[0]
+                if min_dist > conversion[0]:
+                    output[level_path] = min_dist
                 else:
-                    min_dist = 0
+                    output[level_path] = conversion[0]
             else:
-                min_dist = 0
-
-            if level_paths_drainage[level_path] < vbet_run['Zones']['Slope'][0]:
-                if conversion is not None:
-                    if min_dist > conversion[0]:
-                        output[level_path] = min_dist
-                    else:
-                        output[level_path] = conversion[0]
-                else:
-                    output[level_path] = 0
-            elif vbet_run['Zones']['Slope'][0] <= level_paths_drainage[level_path] < vbet_run['Zones']['Slope'][1]:
-                if conversion is not None:
-                    if min_dist > conversion[1]:
-                        output[level_path] = min_dist
-                    else:
-                        output[level_path] = conversion[1]
+                output[level_path] = 0
+        elif vbet_run['Zones']['Slope'][0] <= level_paths_drainage[level_path] < vbet_run['Zones']['Slope'][1]:
+            if conversion is not None:
+                if min_dist > conversion[1]:
+                    output[level_path] = min_dist
                 else:
-                    output[level_path] = 1
-            elif vbet_run['Zones']['Slope'][1] <= level_paths_drainage[level_path] < vbet_run['Zones']['Slope'][2]:
-                if conversion is not None:
-                    if min_dist > conversion[2]:
-                        output[level_path] = min_dist
-                    else:
-                        output[level_path] = conversion[2]
+                    output[level_path] = conversion[1]
+            else:
+                output[level_path] = 1
+        elif vbet_run['Zones']['Slope'][1] <= level_paths_drainage[level_path] < vbet_run['Zones']['Slope'][2]:
+            if conversion is not None:
+                if min_dist > conversion[2]:
+                    output[level_path] = min_dist
                 else:
-                    output[level_path] = 2
-            elif vbet_run['Zones']['Slope'][3] != '' and vbet_run['Zones']['Slope'][2] <= level_paths_drainage[level_path] < vbet_run['Zones']['Slope'][3]:
-                if conversion is not None:
-                    if min_dist > conversion[3]:
-                        output[level_path] = min_dist
-                    else:
-                        output[level_path] = conversion[3]
+                    output[level_path] = conversion[2]
+            else:
+                output[level_path] = 2
+        elif vbet_run['Zones']['Slope'][3] != '' and vbet_run['Zones']['Slope'][2] <= level_paths_drainage[level_path] < vbet_run['Zones']['Slope'][3]:
+            if conversion is not None:
+                if min_dist > conversion[3]:
+                    output[level_path] = min_dist
                 else:
-                    output[level_path] = 3
-            elif vbet_run['Zones']['Slope'][3] != '' and vbet_run['Zones']['Slope'][3] < level_paths_drainage[level_path]:
-                if conversion is not None:
-                    if min_dist > conversion[4]:
-                        output[level_path] = min_dist
-                    else:
-                        output[level_path] = conversion[4]
+                    output[level_path] = conversion[3]
+            else:
+                output[level_path] = 3
+        elif vbet_run['Zones']['Slope'][3] != '' and vbet_run['Zones']['Slope'][3] < level_paths_drainage[level_path]:
+            if conversion is not None:
+                if min_dist > conversion[4]:
+                    output[level_path] = min_dist
                 else:
-                    output[level_path] = 4
+                    output[level_path] = conversion[4]
+            else:
+                output[level_path] = 4
 
     return output
 
@@ -15,7 +15,7 @@ from typing import Union, List
 from functools import reduce
 
 from osgeo import ogr, gdal, osr
-from shapely.ops import unary_union, linemerge
+from shapely.ops import linemerge
 from shapely.geometry.base import BaseGeometry
 from shapely.geometry import mapping, Point, MultiPoint, LineString, MultiLineString, GeometryCollection, Polygon, MultiPolygon
 
@@ -23,6 +23,7 @@ from rsxml import Logger, ProgressBar
 from rsxml.util import sizeof_fmt, get_obj_size
 from rscommons import get_shp_or_gpkg, Timer, VectorBase, GeopackageLayer
 from rscommons.geometry_ops import reduce_precision
+from rscommons.shapely_ops import hierarchical_union
 from rscommons.classes.vector_base import VectorBaseException
 
 Path = str
@@ -40,7 +41,8 @@ def print_geom_size(logger: Logger, geom_obj: BaseGeometry):
 def get_geometry_union(in_layer_path: str, epsg: int = None,
                        attribute_filter: str = None,
                        clip_shape: BaseGeometry = None,
-                       clip_rect: List[float] = None
+                       clip_rect: List[float] = None,
+                       max_workers: int = 1
                        ) -> BaseGeometry:
     """[summary]
 
@@ -50,6 +52,7 @@ def get_geometry_union(in_layer_path: str, epsg: int = None,
         attribute_filter (str, optional): [description]. Defaults to None.
         clip_shape (BaseGeometry, optional): [description]. Defaults to None.
         clip_rect (List[double minx, double miny, double maxx, double maxy)]): Iterate over a subset by clipping to a Shapely-ish geometry. Defaults to None.
+        max_workers (int, optional): worker processes used for the union. Defaults to 1 (no worker processes). None uses every CPU.
 
     Returns:
         BaseGeometry: [description]
@@ -57,26 +60,33 @@ def get_geometry_union(in_layer_path: str, epsg: int = None,
 
     log = Logger('get_geometry_union')
 
+    shapes = []
     with get_shp_or_gpkg(in_layer_path) as in_layer:
 
         transform = None
         if epsg:
             _outref, transform = VectorBase.get_transform_from_epsg(in_layer.spatial_ref, epsg)
 
-        geom = None
-
         for feature, _counter, progbar in in_layer.iterate_features("Getting geometry union", attribute_filter=attribute_filter, clip_shape=clip_shape, clip_rect=clip_rect):
             if feature.GetGeometryRef() is None:
                 progbar.erase()  # get around the progressbar
                 log.warning('Feature with FID={} has no geometry. Skipping'.format(feature.GetFID()))
                 continue
 
-            new_shape = VectorBase.ogr2shapely(feature, transform=transform)
-            try:
-                geom = geom.union(new_shape) if geom is not None else new_shape
-            except Exception:
-                progbar.erase()  # get around the progressbar
-                log.warning('Union failed for shape with FID={} and will be ignored'.format(feature.GetFID()))
+            shapes.append((feature.GetFID(), VectorBase.ogr2shapely(feature, transform=transform)))
+
+    try:
+        return hierarchical_union([shape for _fid, shape in shapes], max_workers=max_workers)
+    except Exception:
+        log.warning('Hierarchical union failed. Falling back to unioning one shape at a time')
+
+    # Slow path that can skip the individual shapes that GEOS can't union
+    geom = None
+    for fid, new_shape in shapes:
+        try:
+            geom = geom.union(new_shape) if geom is not None else new_shape
+        except Exception:
+            log.warning('Union failed for shape with FID={} and will be ignored'.format(fid))
 
     return geom
 
@@ -84,9 +94,11 @@ def get_geometry_union(in_layer_path: str, epsg: int = None,
 def get_geometry_unary_union(in_layer_path: str, epsg: int = None, spatial_ref: osr.SpatialReference = None,
                              attribute_filter: str = None,
                              clip_shape: BaseGeometry = None,
-                             clip_rect: List[float] = None
+                             clip_rect: List[float] = None,
+                             max_workers: int = 1
                              ) -> BaseGeometry:
-    """Load all features from a ShapeFile and union them together into a single geometry
+    """Load all features from a ShapeFile and union them together into a single geometry.
+    The features can be unioned in spatial partitions across worker processes (see hierarchical_union)
 
     Args:
         in_layer_path (str): path to layer
@@ -95,6 +107,7 @@ def get_geometry_unary_union(in_layer_path: str, epsg: int = None, spatial_ref:
         attribute_filter (str, optional): Filter to a set of attributes. Defaults to None.
         clip_shape (BaseGeometry, optional): Clip to a specified shape. Defaults to None.
         clip_rect (List[double minx, double miny, double maxx, double maxy)]): Iterate over a subset by clipping to a Shapely-ish geometry. Defaults to None.
+        max_workers (int, optional): worker processes used for the union. Defaults to 1 (no worker processes). None uses every CPU.
 
     Raises:
         VectorBaseException: [description]
@@ -146,18 +159,13 @@ def get_geometry_unary_union(in_layer_path: str, epsg: int = None, spatial_ref:
                 log.warning('Zero Area for shape with FID={}'.format(feature.GetFID()))
             else:
                 geom_list.append(VectorBase.ogr2shapely(new_geom, transform))
-
-                # IF we get past a certain size then run the union
-                if len(geom_list) >= 500:
-                    geom_list = [unary_union(geom_list)]
             new_geom = None
 
     log.debug('finished iterating with list of size: {}'.format(len(geom_list)))
 
     if len(geom_list) > 1:
-        log.debug('Starting final union of geom_list of size: {}'.format(len(geom_list)))
-        # Do a final union to clean up anything that might still be in the list
-        geom_union = unary_union(geom_list)
+        log.debug('Starting union of geom_list of size: {}'.format(len(geom_list)))
+        geom_union = hierarchical_union(geom_list, max_workers=max_workers)
     elif len(geom_list) == 0:
         log.warning('No geometry found to union')
         return None
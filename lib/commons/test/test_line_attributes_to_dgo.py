@@ -0,0 +1,47 @@
+""" Testing for the line to DGO attribute transfer
+
+"""
+import unittest
+from shapely.geometry import LineString, box
+from rscommons.line_attributes_to_dgo import intersect_segments, summarize_segments
+
+
+class LineAttributesToDGOTest(unittest.TestCase):
+    """Segment overlay and reduction without touching any feature classes
+    """
+
+    def setUp(self):
+        super(LineAttributesToDGOTest, self).setUp()
+        self.dgos = [box(0, 0, 10, 10), box(10, 0, 20, 10), box(100, 100, 110, 110)]
+        # Two segments share the same value inside the first DGO
+        self.lines = [
+            LineString([(0, 2), (6, 2)]),
+            LineString([(0, 4), (2, 4)]),
+            LineString([(0, 6), (2, 6)]),
+            LineString([(5, 8), (15, 8)])
+        ]
+        self.vals = {'stream_power': [1.0, 1.0, 7.0, None]}
+
+    def test_lwa(self):
+        dgo_idx, lengths, seg_vals = intersect_segments(self.dgos, self.lines, self.vals)
+        result = summarize_segments(dgo_idx, lengths, seg_vals['stream_power'], 'lwa')
+
+        # (1 * 6 + 1 * 2 + 7 * 2) / 10. Segments with the same value are not collapsed
+        self.assertAlmostEqual(result[0], 2.2)
+        self.assertNotIn(1, result)
+        self.assertNotIn(2, result)
+
+    def test_lsl(self):
+        dgo_idx, lengths, seg_vals = intersect_segments(self.dgos, self.lines, self.vals)
+        result = summarize_segments(dgo_idx, lengths, seg_vals['stream_power'], 'lsl')
+
+        self.assertEqual(result, {0: 1.0})
+
+    def test_bad_method(self):
+        dgo_idx, lengths, seg_vals = intersect_segments(self.dgos, self.lines, self.vals)
+        with self.assertRaises(ValueError):
+            summarize_segments(dgo_idx, lengths, seg_vals['stream_power'], 'mean')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+""" Testing for the flowline network preparation helpers
+
+"""
+import unittest
+import numpy as np
+from rscommons.network_prep import classify_zones, named_stream_codes
+
+
+class NetworkPrepTest(unittest.TestCase):
+    """Columnar FCode selection and zone classification
+    """
+
+    def test_named_stream_codes(self):
+        codes = np.array(['46006', '46003', '46003', '55800', None], dtype=object)
+        names = np.array(['Bear Creek', 'Bear Creek', None, 'Elk Creek', 'Bear Creek'], dtype=object)
+        # The intermittent reach of Bear Creek brings its FCode in. Unnamed and other streams don't
+        self.assertListEqual(named_stream_codes(codes, names, ['46006']), ['46006', '46003'])
+        self.assertListEqual(named_stream_codes(codes, names, [33400]), ['33400'])
+
+    def test_classify_zones(self):
+        zones = classify_zones(np.array([0.5, 1.0, 4.0, 12.0, np.nan]), {0: 1, 1: 5, 2: ''})
+        self.assertListEqual(zones.tolist(), [0, 1, 1, 2, None])
+
+        # Without an open ended zone the largest values get no zone
+        zones = classify_zones(np.array([0.5, 12.0]), {'0': 1, '1': 5})
+        self.assertListEqual(zones.tolist(), ['0', None])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+""" Testing for the level path topology
+
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+from rscommons.network_topology import get_level_path_topology, get_level_path_values
+
+
+class NetworkTopologyTest(unittest.TestCase):
+    """Level path graph and the cached level path lookups
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.gpkg = os.path.join(self.temp_dir.name, 'hydro.gpkg')
+        with sqlite3.connect(self.gpkg) as conn:
+            conn.execute('CREATE TABLE catchments_vaa (fid INTEGER PRIMARY KEY, LevelPathI REAL, DnLevelPat REAL)')
+            # Level path 3 drains to 2, which drains to the outlet 1
+            conn.executemany('INSERT INTO catchments_vaa VALUES (?, ?, ?)', [(1, 1.0, 0.0), (2, 1.0, 0.0), (3, 2.0, 1.0), (4, 3.0, 2.0)])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_upstream(self):
+        topology = get_level_path_topology(self.gpkg)
+        self.assertSetEqual(topology.upstream(1), {'1', '2', '3'})
+        self.assertSetEqual(topology.upstream(2, include_self=False), {'3'})
+        self.assertSetEqual(topology.downstream('3'), {'1', '2', '3'})
+
+    def test_level_path_values(self):
+        fids = get_level_path_values(self.gpkg, 'catchments_vaa', 'fid', 'LevelPathI')
+        self.assertDictEqual(fids, {'1': [1, 2], '2': [3], '3': [4]})
+        # The lookup is reused until the geopackage changes
+        self.assertIs(get_level_path_values(self.gpkg, 'catchments_vaa', 'fid', 'LevelPathI'), fids)
+
+        with sqlite3.connect(self.gpkg) as conn:
+            conn.execute('INSERT INTO catchments_vaa VALUES (5, 3.0, 2.0)')
+        os.utime(self.gpkg, (0, 0))
+        self.assertListEqual(get_level_path_values(self.gpkg, 'catchments_vaa', 'fid', 'LevelPathI')['3'], [4, 5])
+
+
+if __name__ == '__main__':
+    unittest.main()
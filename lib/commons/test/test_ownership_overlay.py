@@ -0,0 +1,40 @@
+""" Testing for the land ownership overlay
+
+"""
+import unittest
+from shapely.geometry import Point, box
+from rscommons.ownership_overlay import OwnershipOverlay
+
+
+class OwnershipOverlayTest(unittest.TestCase):
+    """Query a few ownership polygons held in memory
+    """
+
+    def setUp(self):
+        super(OwnershipOverlayTest, self).setUp()
+        # BLM on the left, private on the right and a forest service block overlapping both in the middle
+        self.overlay = OwnershipOverlay(
+            ['BLM', 'PVT', 'USFS', ''],
+            [box(0, 0, 10, 10), box(10, 0, 20, 10), box(8, 0, 12, 5), box(0, 10, 20, 12)]
+        )
+
+    def test_agencies_at_points(self):
+        agencies = self.overlay.agencies_at_points([Point(2, 8), Point(15, 8), Point(9, 2), Point(30, 30)])
+        # The later polygon wins where polygons overlap
+        self.assertListEqual(agencies.tolist(), ['BLM', 'PVT', 'USFS', None])
+
+    def test_features_at_points(self):
+        found = self.overlay.features_at_points([Point(30, 30), Point(5, 11)])
+        self.assertListEqual(found.tolist(), [-1, 3])
+
+    def test_area_by_agency(self):
+        areas = self.overlay.area_by_agency(box(0, 0, 20, 5))
+        # Polygons without an agency are ignored
+        self.assertDictEqual(areas, {'BLM': 50.0, 'PVT': 50.0, 'USFS': 20.0})
+
+        areas = self.overlay.area_by_agency()
+        self.assertDictEqual(areas, {'BLM': 100.0, 'PVT': 100.0, 'USFS': 20.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+""" Testing for the batched raster preparation against raster_warp
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+try:
+    from osgeo import gdal, ogr, osr
+    from rscommons.raster_prep import RasterPrep
+    from rscommons.raster_warp import raster_warp
+except ImportError:
+    gdal = None
+
+NODATA = -9999.0
+SOURCE_EPSG = 26912
+OUTPUT_EPSG = 5070
+
+
+@unittest.skipIf(gdal is None, 'GDAL is not installed')
+class RasterPrepTest(unittest.TestCase):
+    """Clip and reproject a small synthetic raster with both RasterPrep and raster_warp
+    """
+
+    def setUp(self):
+        super(RasterPrepTest, self).setUp()
+        self.folder = tempfile.mkdtemp()
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(SOURCE_EPSG)
+
+        # 40 columns x 30 rows of 10m cells with a band of nodata down the middle
+        self.raster = os.path.join(self.folder, 'source.tif')
+        ds = gdal.GetDriverByName('GTiff').Create(self.raster, 40, 30, 1, gdal.GDT_Float32)
+        ds.SetGeoTransform((500000.0, 10.0, 0.0, 4500000.0, 0.0, -10.0))
+        ds.SetProjection(srs.ExportToWkt())
+        array = np.arange(1200, dtype=np.float32).reshape(30, 40)
+        array[:, 20] = NODATA
+        band = ds.GetRasterBand(1)
+        band.SetNoDataValue(NODATA)
+        band.WriteArray(array)
+        ds = None
+
+        # Clip polygon inside the raster
+        clip_gpkg = os.path.join(self.folder, 'clip.gpkg')
+        ds = ogr.GetDriverByName('GPKG').CreateDataSource(clip_gpkg)
+        lyr = ds.CreateLayer('clip', srs, ogr.wkbPolygon)
+        feature = ogr.Feature(lyr.GetLayerDefn())
+        feature.SetGeometry(ogr.CreateGeometryFromWkt('POLYGON ((500055 4499945, 500345 4499945, 500345 4499755, 500055 4499755, 500055 4499945))'))
+        lyr.CreateFeature(feature)
+        ds = None
+        self.clip = os.path.join(clip_gpkg, 'clip')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+        super(RasterPrepTest, self).tearDown()
+
+    def test_matches_raster_warp(self):
+        warped = os.path.join(self.folder, 'warp', 'warped.tif')
+        prepared = os.path.join(self.folder, 'prep', 'prepared.tif')
+
+        raster_warp(self.raster, warped, OUTPUT_EPSG, self.clip)
+        with RasterPrep(OUTPUT_EPSG, workers=2) as prep:
+            prep.add(self.raster, prepared, self.clip)
+            self.assertListEqual(prep.run(), [prepared])
+
+        warped_ds = gdal.Open(warped)
+        prepared_ds = gdal.Open(prepared)
+
+        # Same extent, cells and nodata as the two step warp and translate
+        self.assertEqual((prepared_ds.RasterXSize, prepared_ds.RasterYSize), (warped_ds.RasterXSize, warped_ds.RasterYSize))
+        np.testing.assert_allclose(prepared_ds.GetGeoTransform(), warped_ds.GetGeoTransform())
+        self.assertEqual(prepared_ds.GetRasterBand(1).GetNoDataValue(), warped_ds.GetRasterBand(1).GetNoDataValue())
+        self.assertEqual(prepared_ds.GetRasterBand(1).GetNoDataValue(), NODATA)
+        np.testing.assert_array_equal(prepared_ds.GetRasterBand(1).ReadAsArray(), warped_ds.GetRasterBand(1).ReadAsArray())
+
+        # The output is a Cloud Optimized GeoTIFF
+        self.assertEqual(prepared_ds.GetMetadataItem('LAYOUT', 'IMAGE_STRUCTURE'), 'COG')
+        self.assertEqual(prepared_ds.GetMetadataItem('COMPRESSION', 'IMAGE_STRUCTURE'), 'DEFLATE')
+
+        warped_ds = None
+        prepared_ds = None
+
+    def test_existing_output_skipped(self):
+        prepared = os.path.join(self.folder, 'prepared.tif')
+        with open(prepared, 'w', encoding='utf8') as file:
+            file.write('existing')
+
+        with RasterPrep(OUTPUT_EPSG) as prep:
+            prep.add(self.raster, prepared, self.clip)
+            prep.run()
+
+        with open(prepared, 'r', encoding='utf8') as file:
+            self.assertEqual(file.read(), 'existing')
+        self.assertTrue(os.path.isfile(self.raster))
+
+    def test_existing_output_clean(self):
+        prepared = os.path.join(self.folder, 'prepared.tif')
+        with open(prepared, 'w', encoding='utf8') as file:
+            file.write('existing')
+
+        # The warp is skipped but the input is still removed
+        with RasterPrep(OUTPUT_EPSG) as prep:
+            prep.add(self.raster, prepared, self.clip, clean=True)
+            prep.run()
+
+        with open(prepared, 'r', encoding='utf8') as file:
+            self.assertEqual(file.read(), 'existing')
+        self.assertFalse(os.path.isfile(self.raster))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+""" Testing for the vectorized raster point sampler
+
+"""
+import unittest
+import numpy as np
+from shapely.geometry import Point
+from rscommons.raster_sampling import points_to_xy, sample_array, world_to_pixel
+
+
+class RasterSamplingTest(unittest.TestCase):
+    """Sample a small in-memory raster without touching any files
+    """
+
+    def setUp(self):
+        super(RasterSamplingTest, self).setUp()
+        # 4 rows x 5 columns of 10m cells with the top left corner at (1000, 2000)
+        self.gt = (1000.0, 10.0, 0.0, 2000.0, 0.0, -10.0)
+        self.nodata = -9999.0
+        self.array = np.arange(20, dtype=np.float32).reshape(4, 5)
+        self.array[3, 4] = self.nodata
+
+    def test_world_to_pixel(self):
+        rows, cols = world_to_pixel(self.gt, np.array([1000.0, 1025.0]), np.array([2000.0, 1985.0]))
+        np.testing.assert_allclose(rows, [0.0, 1.5])
+        np.testing.assert_allclose(cols, [0.0, 2.5])
+
+    def test_nearest(self):
+        points = [Point(1005, 1995), Point(1035, 1965), Point(1045, 1965), Point(999, 1995), Point(1005, 2001)]
+        values = sample_array(self.array, self.gt, *points_to_xy(points), nodata=self.nodata)
+
+        self.assertEqual(values[0], 0)
+        self.assertEqual(values[1], 18)
+        # Nodata and both points outside the raster are masked
+        self.assertListEqual(values.mask.tolist(), [False, False, True, True, True])
+
+    def test_bilinear(self):
+        # Half way between the centres of cells (1, 1), (1, 2), (2, 1) and (2, 2)
+        values = sample_array(self.array, self.gt, np.array([1020.0]), np.array([1980.0]), self.nodata, 'bilinear')
+        self.assertAlmostEqual(values[0], (6 + 7 + 11 + 12) / 4)
+
+        # The nodata neighbour is left out and the other weights renormalised
+        values = sample_array(self.array, self.gt, np.array([1040.0]), np.array([1970.0]), self.nodata, 'bilinear')
+        self.assertAlmostEqual(values[0], (13 + 14 + 18) / 3)
+
+    def test_masked_array(self):
+        masked = np.ma.masked_equal(self.array, 0)
+        values = sample_array(masked, self.gt, np.array([1005.0, 1015.0]), np.array([1995.0, 1995.0]))
+        self.assertListEqual(values.mask.tolist(), [True, False])
+
+    def test_bad_method(self):
+        with self.assertRaises(ValueError):
+            sample_array(self.array, self.gt, np.array([1005.0]), np.array([1995.0]), method='cubic')
+
+
+if __name__ == '__main__':
+    unittest.main()
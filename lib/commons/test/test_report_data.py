@@ -0,0 +1,90 @@
+""" Testing for the columnar report data
+
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import numpy as np
+from rscommons.report.report_data import ReportFrame, read_columns, value_counts, summary_stats, upper_bin_sums, group_sums
+
+
+class ReportDataTest(unittest.TestCase):
+    """Read a small SQLite table into a ReportFrame and check the reductions against SQL
+    """
+
+    def setUp(self):
+        super(ReportDataTest, self).setUp()
+        self.folder = tempfile.mkdtemp()
+        self.database = os.path.join(self.folder, 'report.sqlite')
+        with sqlite3.connect(self.database) as conn:
+            conn.execute('CREATE TABLE dgos (owner TEXT, stream_order INTEGER, length REAL)')
+            conn.execute('CREATE TABLE empty (owner TEXT, length REAL)')
+            conn.executemany('INSERT INTO dgos VALUES (?, ?, ?)', [
+                ('BLM', 2, 10.0),
+                ('USFS', 1, 5.0),
+                ('BLM', 1, 2.5),
+                (None, 3, 1.0),
+                ('USFS', 2, None),
+                ('BLM', 2, 4.0),
+            ])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+        super(ReportDataTest, self).tearDown()
+
+    def test_read_columns(self):
+        frame = read_columns(self.database, 'dgos', ['owner', 'LENGTH', 'not_a_column'])
+        self.assertEqual(len(frame), 6)
+        self.assertIn('LENGTH', frame)
+        self.assertListEqual(frame.missing, ['not_a_column'])
+        np.testing.assert_array_equal(frame.numeric('LENGTH'), [10.0, 5.0, 2.5, 1.0, np.nan, 4.0])
+
+        frame = read_columns(self.database, 'dgos', ['owner'], where="owner = 'BLM'")
+        self.assertEqual(len(frame), 3)
+
+    def test_grouping(self):
+        frame = read_columns(self.database, 'dgos', ['owner', 'stream_order', 'length'])
+
+        self.assertEqual(value_counts(frame['owner']), (['BLM', 'USFS', None], [3, 2, 1]))
+        self.assertEqual(value_counts(frame['stream_order']), ([2, 1, 3], [3, 2, 1]))
+
+        # Same as SELECT owner, SUM(length) ... GROUP BY owner
+        with sqlite3.connect(self.database) as conn:
+            expected = {row[0]: row[1] for row in conn.execute('SELECT owner, coalesce(SUM(length), 0) FROM dgos GROUP BY owner')}
+        self.assertDictEqual(group_sums(frame['owner'], frame.numeric('length')), expected)
+
+        is_blm = frame['owner'] == 'BLM'
+        self.assertDictEqual(group_sums(frame['stream_order'][is_blm], frame.numeric('length')[is_blm]), {2: 14.0, 1: 2.5})
+
+    def test_aggregation(self):
+        frame = read_columns(self.database, 'dgos', ['stream_order', 'length'])
+
+        stats = summary_stats(frame['length'])
+        self.assertDictEqual(stats, {'Values': 5, 'Maximum': 10.0, 'Minimum': 1.0, 'Average': 4.5, 'NULL Values': 1})
+        self.assertEqual(summary_stats(frame['length'], fill_null=0)['Values'], 6)
+
+        # Orders 1 and 2 fall in the first two bins and order 3 is above the last upper limit
+        sums = upper_bin_sums(frame.numeric('stream_order'), frame.numeric('length'), [1, 2])
+        np.testing.assert_allclose(sums, [7.5, 14.0])
+
+    def test_empty_frame(self):
+        frame = read_columns(self.database, 'empty', ['owner', 'length'])
+        self.assertEqual(len(frame), 0)
+        self.assertEqual(len(frame.numeric('length')), 0)
+        self.assertEqual(value_counts(frame['owner']), ([], []))
+        self.assertDictEqual(group_sums(frame['owner'], frame.numeric('length')), {})
+        self.assertEqual(summary_stats(frame['length'])['Values'], 0)
+        self.assertIsNone(summary_stats(frame['length'])['Average'])
+        np.testing.assert_array_equal(upper_bin_sums(frame.numeric('length'), frame.numeric('length'), [1, 2]), [0.0, 0.0])
+
+        # No columns at all
+        frame = read_columns(self.database, 'empty', ['not_a_column'])
+        self.assertEqual(len(frame), 0)
+        self.assertNotIn('not_a_column', frame)
+        self.assertEqual(len(ReportFrame({})), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
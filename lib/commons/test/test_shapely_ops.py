@@ -0,0 +1,39 @@
+""" Testing for the partitioned union in shapely_ops
+
+"""
+import unittest
+import numpy as np
+from shapely.ops import unary_union
+from shapely.geometry import box
+
+from rscommons.shapely_ops import str_partitions, hierarchical_union
+
+
+class HierarchicalUnionTest(unittest.TestCase):
+    """A 12 x 12 grid of overlapping squares split into partitions of 10
+    """
+
+    def setUp(self):
+        super(HierarchicalUnionTest, self).setUp()
+        self.geoms = [box(col, row, col + 1.5, row + 1.5) for row in range(12) for col in range(12)]
+
+    def test_str_partitions(self):
+        partitions = str_partitions(self.geoms, 10)
+        self.assertEqual(len(partitions), 15)
+        self.assertTrue(all(len(partition) <= 10 for partition in partitions))
+        # Every geometry ends up in exactly one partition
+        np.testing.assert_array_equal(np.sort(np.concatenate(partitions)), np.arange(len(self.geoms)))
+
+    def test_matches_unary_union(self):
+        expected = unary_union(self.geoms)
+        for max_workers in [1, 2]:
+            result = hierarchical_union(self.geoms, partition_size=10, max_workers=max_workers)
+            self.assertAlmostEqual(result.area, expected.area)
+            self.assertAlmostEqual(result.symmetric_difference(expected).area, 0.0)
+
+    def test_empty(self):
+        self.assertIsNone(hierarchical_union([None, box(0, 0, 1, 1).intersection(box(2, 2, 3, 3))]))
+
+
+if __name__ == '__main__':
+    unittest.main()
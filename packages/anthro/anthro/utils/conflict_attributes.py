@@ -23,6 +23,8 @@ from rscommons.database import write_db_attributes
 from rscommons.vector_ops import intersect_feature_classes, get_geometry_unary_union, load_geometries, intersect_geometry_with_feature_class, copy_feature_class
 from rscommons.classes.vector_classes import get_shp_or_gpkg, GeopackageLayer
 from rscommons.database import SQLiteCon
+from rscommons.ownership_overlay import OwnershipOverlay
+import shapely
 from shapely.ops import unary_union
 import datetime
 
@@ -169,31 +171,30 @@ def admin_agency(database, reaches, ownership, results):
     # Load the agency lookups
     with SQLiteCon(database) as database:
         database.curs.execute('SELECT AgencyID, Name, Abbreviation FROM Agencies')
-        agencies = {row['Abbreviation']: {'AgencyID': row['AgencyID'], 'Name': row['Name'], 'RawGeometries': [], 'GeometryUnion': None} for row in database.curs.fetchall()}
+        agencies = {row['Abbreviation']: {'AgencyID': row['AgencyID'], 'Name': row['Name']} for row in database.curs.fetchall()}
 
-    with get_shp_or_gpkg(ownership) as ownership_lyr:
-
-        progbar = ProgressBar(len(reaches), 50, "Calc administration agency")
-        counter = 0
+    if len(reaches) == 0:
+        return
 
-        # Loop over stream reaches and assign agency
-        for reach_id, polyline in reaches.items():
-            counter += 1
-            progbar.update(counter)
+    # Look up the ownership polygon under every reach midpoint at once
+    reach_ids = list(reaches.keys())
+    mid_points = shapely.line_interpolate_point(np.asarray(list(reaches.values()), dtype=object), 0.5, normalized=True)
+    overlay = OwnershipOverlay.from_layer(ownership, clip_rect=list(shapely.total_bounds(mid_points)), clip=False)
+    found = overlay.features_at_points(mid_points)
 
-            if reach_id not in results:
-                results[reach_id] = {}
+    for reach_id, feature_idx in zip(reach_ids, found):
+        if reach_id not in results:
+            results[reach_id] = {}
 
-            mid_point = polyline.interpolate(0.5, normalized=True)
-            results[reach_id]['AgencyID'] = None
+        results[reach_id]['AgencyID'] = None
+        if feature_idx < 0:
+            continue
 
-            for feature, _counter, _progbar in ownership_lyr.iterate_features(clip_shape=mid_point):
-                agency = feature.GetField('ADMIN_AGEN')
-                if agency not in agencies:
-                    raise Exception('The ownership agency "{}" is not found in the BRAT SQLite database'.format(agency))
-                results[reach_id]['AgencyID'] = agencies[agency]['AgencyID']
+        agency = overlay.agencies[feature_idx]
+        if agency not in agencies:
+            raise Exception('The ownership agency "{}" is not found in the BRAT SQLite database'.format(agency))
+        results[reach_id]['AgencyID'] = agencies[agency]['AgencyID']
 
-    progbar.finish()
     log.info('Adminstration agency assignment complete')
 
 
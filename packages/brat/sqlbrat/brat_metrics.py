@@ -9,6 +9,116 @@ from rsxml import dotenv
 from rscommons import RSProject, RSLayer
 from rsxml import Logger
 
+# Metrics are reported for the whole network and the perennial network. group -> SQL filter
+NETWORK_GROUPS = [
+    ('all', None),
+    ('perennial', 'ReachCode IN (46006, 55800)')
+]
+
+# Reach length summaries. metric -> [(key, SQL condition on vwReaches)]
+LENGTH_CLASSES = {
+    'ex_capacity_length': [
+        ('none', 'oCC_EX == 0'),
+        ('rare', 'oCC_EX > 0 AND oCC_EX <= 1'),
+        ('occasional', 'oCC_EX > 1 AND oCC_EX <= 5'),
+        ('frequent', 'oCC_EX > 5 AND oCC_EX <= 15'),
+        ('pervasive', 'oCC_EX > 15')
+    ],
+    'hist_capacity_length': [
+        ('none', 'oCC_HPE == 0'),
+        ('rare', 'oCC_HPE > 0 AND oCC_HPE <= 1'),
+        ('occasional', 'oCC_HPE > 1 AND oCC_HPE <= 5'),
+        ('frequent', 'oCC_HPE > 5 AND oCC_HPE <= 15'),
+        ('pervasive', 'oCC_HPE > 15')
+    ],
+    'risk_length': [
+        ('negligible', "Risk = 'Negligible Risk'"),
+        ('minor', "Risk = 'Minor Risk'"),
+        ('some', "Risk = 'Some Risk'"),
+        ('considerable', "Risk = 'Considerable Risk'")
+    ],
+    'limited_length': [
+        ('anthropogenic', "Limitation = 'Anthropogenically Limited'"),
+        ('stream_power', "Limitation = 'Stream Power Limited'"),
+        ('slope', "Limitation = 'Slope Limited'"),
+        ('reservoir_or_land_use', "Limitation = 'Potential Reservoir or Land Use Change'"),
+        ('naturally_vegetation', "Limitation = 'Naturally Vegetation Limited'"),
+        ('stream_size', "Limitation = 'Stream Size Limited'"),
+        ('dam_building_possible', "Limitation = 'Dam Building Possible'")
+    ],
+    'opportunity_length': [
+        ('conservation', "Opportunity = 'Conservation/Appropriate for Translocation'"),
+        ('beaver_expansion', "Opportunity = 'Encourage Beaver Expansion/Colonization'"),
+        ('beaver_mimicry', "Opportunity = 'Beaver Mimicry'"),
+        ('land_management', "Opportunity = 'Land Management Chanage'"),
+        ('conflict_management', "Opportunity = 'Conflict Management'"),
+        ('potential_floodplain', "Opportunity = 'Potential Floodplain/Side Channel Opportunities'"),
+        ('natural_or_anthropogenic', "Opportunity = 'Natural or Anthropogenic Limitations'")
+    ]
+}
+
+
+def _conditional_sum(expression: str, *conditions: str) -> str:
+    """SQL sum of an expression over the rows that meet all the (non None) conditions"""
+    conditions = [condition for condition in conditions if condition is not None]
+    if len(conditions) == 0:
+        return f'SUM({expression})'
+    return f'SUM(CASE WHEN {" AND ".join(conditions)} THEN {expression} END)'
+
+
+def dgo_capacity_metrics(curs) -> dict:
+    """Total and area weighted average dam capacity for every network group in a single scan of vwDgos
+
+    Args:
+        curs (sqlite3.Cursor): cursor on the BRAT geopackage
+
+    Returns:
+        dict: group -> totalExistingDamCapacity, totalHistoricDamCapacity, avgExistingDamCapacity and avgHistoricDamCapacity
+    """
+    # The averages are weighted by the area of the DGOs that have a seg_distance
+    weighted = 'seg_distance IS NOT NULL'
+    columns = []
+    for group, group_filter in NETWORK_GROUPS:
+        area = _conditional_sum('segment_area', weighted, group_filter)
+        columns += [
+            ((group, 'totalExistingDamCapacity'), _conditional_sum('mCC_EX_CT', group_filter)),
+            ((group, 'totalHistoricDamCapacity'), _conditional_sum('mCC_HPE_CT', group_filter)),
+            ((group, 'avgExistingDamCapacity'), f"{_conditional_sum('oCC_EX * segment_area', weighted, group_filter)} / {area}"),
+            ((group, 'avgHistoricDamCapacity'), f"{_conditional_sum('oCC_HPE * segment_area', weighted, group_filter)} / {area}")
+        ]
+
+    curs.execute(f'SELECT {", ".join(sql for _key, sql in columns)} FROM vwDgos')
+    row = curs.fetchone()
+
+    out = {}
+    for ((group, metric), _sql), value in zip(columns, row):
+        out.setdefault(group, {})[metric] = value
+    return out
+
+
+def reach_length_metrics(curs) -> dict:
+    """Reach length in each of the LENGTH_CLASSES for every network group in a single scan of vwReaches
+
+    Args:
+        curs (sqlite3.Cursor): cursor on the BRAT geopackage
+
+    Returns:
+        dict: group -> {metric: {key: length}}. Lengths are None when no reach is in the class.
+    """
+    columns = []
+    for group, group_filter in NETWORK_GROUPS:
+        for metric, classes in LENGTH_CLASSES.items():
+            for key, condition in classes:
+                columns.append(((group, metric, key), _conditional_sum('iGeo_Len', condition, group_filter)))
+
+    curs.execute(f'SELECT {", ".join(sql for _key, sql in columns)} FROM vwReaches')
+    row = curs.fetchone()
+
+    out = {}
+    for ((group, metric, key), _sql), value in zip(columns, row):
+        out.setdefault(group, {}).setdefault(metric, {})[key] = value
+    return out
+
 
 def brat_metrics(brat_proj_path, hydro_proj_path, anthro_proj_path):
     """Append BRAT metrics to the metrics"""
@@ -16,10 +126,6 @@ def brat_metrics(brat_proj_path, hydro_proj_path, anthro_proj_path):
     log = Logger('BRAT Context Metrics')
     log.info('Calculating BRAT Metrics')
 
-    brat_metrics = {}
-    all = {}
-    perennial = {}
-
     hydro_metrics = None
     anthro_metrics = None
 
@@ -47,168 +153,10 @@ def brat_metrics(brat_proj_path, hydro_proj_path, anthro_proj_path):
 
     with sqlite3.connect(os.path.join(brat_proj_path, 'outputs', 'brat.gpkg')) as conn:
         curs = conn.cursor()
-        curs.execute("SELECT SUM(mCC_EX_CT) FROM vwDgos WHERE mCC_EX_CT IS NOT NULL")
-        all['totalExistingDamCapacity'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(mCC_HPE_CT) FROM vwDgos WHERE mCC_HPE_CT IS NOT NULL")
-        all['totalHistoricDamCapacity'] = curs.fetchone()[0]
-        curs.execute("""SELECT SUM(frac) FROM (SELECT oCC_EX * (segment_area / tot_area) frac FROM (SELECT oCC_EX, segment_area
-                     FROM vwDgos WHERE seg_distance IS NOT NULL), (SELECT SUM(segment_area) AS tot_area FROM vwDgos WHERE seg_distance IS NOT NULL))""")
-        all['avgExistingDamCapacity'] = curs.fetchone()[0]
-        curs.execute("""SELECT SUM(frac) FROM (SELECT oCC_HPE * (segment_area / tot_area) frac FROM (SELECT oCC_HPE, segment_area
-                     FROM vwDgos WHERE seg_distance IS NOT NULL), (SELECT SUM(segment_area) AS tot_area FROM vwDgos WHERE seg_distance IS NOT NULL))""")
-        all['avgHistoricDamCapacity'] = curs.fetchone()[0]
-
-        curs.execute("SELECT SUM(mCC_EX_CT) FROM vwDgos WHERE mCC_EX_CT IS NOT NULL AND ReachCode IN (46006, 55800)")
-        perennial['totalExistingDamCapacity'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(mCC_HPE_CT) FROM vwDgos WHERE mCC_HPE_CT IS NOT NULL AND ReachCode IN (46006, 55800)")
-        perennial['totalHistoricDamCapacity'] = curs.fetchone()[0]
-        curs.execute("""SELECT SUM(frac) FROM (SELECT oCC_EX * (segment_area / tot_area) frac FROM (SELECT oCC_EX, segment_area
-                     FROM vwDgos WHERE seg_distance IS NOT NULL AND ReachCode IN (46006, 55800)), (SELECT SUM(segment_area) AS tot_area FROM vwDgos WHERE seg_distance IS NOT NULL AND ReachCode IN (46006, 55800)))""")
-        perennial['avgExistingDamCapacity'] = curs.fetchone()[0]
-        curs.execute("""SELECT SUM(frac) FROM (SELECT oCC_HPE * (segment_area / tot_area) frac FROM (SELECT oCC_HPE, segment_area
-                     FROM vwDgos WHERE seg_distance IS NOT NULL AND ReachCode IN (46006, 55800)), (SELECT SUM(segment_area) AS tot_area FROM vwDgos WHERE seg_distance IS NOT NULL AND ReachCode IN (46006, 55800)))""")
-        perennial['avgHistoricDamCapacity'] = curs.fetchone()[0]
-
-        ex_capacity_length = {}
-        hist_capacity_length = {}
-        risk_length = {}
-        limited_length = {}
-        opportunity_length = {}
-
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_EX == 0")
-        ex_capacity_length['none'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_EX > 0 AND oCC_EX <= 1")
-        ex_capacity_length['rare'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_EX > 1 AND oCC_EX <= 5")
-        ex_capacity_length['occasional'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_EX > 5 AND oCC_EX <= 15")
-        ex_capacity_length['frequent'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_EX > 15")
-        ex_capacity_length['pervasive'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_HPE == 0")
-        hist_capacity_length['none'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_HPE > 0 AND oCC_HPE <= 1")
-        hist_capacity_length['rare'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_HPE > 1 AND oCC_HPE <= 5")
-        hist_capacity_length['occasional'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_HPE > 5 AND oCC_HPE <= 15")
-        hist_capacity_length['frequent'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_HPE > 15")
-        hist_capacity_length['pervasive'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Risk = 'Negligible Risk'")
-        risk_length['negligible'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Risk = 'Minor Risk'")
-        risk_length['minor'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Risk = 'Some Risk'")
-        risk_length['some'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Risk = 'Considerable Risk'")
-        risk_length['considerable'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Limitation = 'Anthropogenically Limited'")
-        limited_length['anthropogenic'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Limitation = 'Stream Power Limited'")
-        limited_length['stream_power'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Limitation = 'Slope Limited'")
-        limited_length['slope'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Limitation = 'Potential Reservoir or Land Use Change'")
-        limited_length['reservoir_or_land_use'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Limitation = 'Naturally Vegetation Limited'")
-        limited_length['naturally_vegetation'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Limitation = 'Stream Size Limited'")
-        limited_length['stream_size'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Limitation = 'Dam Building Possible'")
-        limited_length['dam_building_possible'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Opportunity = 'Conservation/Appropriate for Translocation'")
-        opportunity_length['conservation'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Opportunity = 'Encourage Beaver Expansion/Colonization'")
-        opportunity_length['beaver_expansion'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Opportunity = 'Beaver Mimicry'")
-        opportunity_length['beaver_mimicry'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Opportunity = 'Land Management Chanage'")
-        opportunity_length['land_management'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Opportunity = 'Conflict Management'")
-        opportunity_length['conflict_management'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Opportunity = 'Potential Floodplain/Side Channel Opportunities'")
-        opportunity_length['potential_floodplain'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Opportunity = 'Natural or Anthropogenic Limitations'")
-        opportunity_length['natural_or_anthropogenic'] = curs.fetchone()[0]
-
-        all['ex_capacity_length'] = ex_capacity_length
-        all['hist_capacity_length'] = hist_capacity_length
-        all['risk_length'] = risk_length
-        all['limited_length'] = limited_length
-        all['opportunity_length'] = opportunity_length
-
-        ex_capacity_length = {}
-        hist_capacity_length = {}
-        risk_length = {}
-        limited_length = {}
-        opportunity_length = {}
-
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_EX == 0 AND ReachCode IN (46006, 55800)")
-        ex_capacity_length['none'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_EX > 0 AND oCC_EX <= 1 AND ReachCode IN (46006, 55800)")
-        ex_capacity_length['rare'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_EX > 1 AND oCC_EX <= 5 AND ReachCode IN (46006, 55800)")
-        ex_capacity_length['occasional'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_EX > 5 AND oCC_EX <= 15 AND ReachCode IN (46006, 55800)")
-        ex_capacity_length['frequent'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_EX > 15 AND ReachCode IN (46006, 55800)")
-        ex_capacity_length['pervasive'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_HPE == 0 AND ReachCode IN (46006, 55800)")
-        hist_capacity_length['none'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_HPE > 0 AND oCC_HPE <= 1 AND ReachCode IN (46006, 55800)")
-        hist_capacity_length['rare'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_HPE > 1 AND oCC_HPE <= 5 AND ReachCode IN (46006, 55800)")
-        hist_capacity_length['occasional'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_HPE > 5 AND oCC_HPE <= 15 AND ReachCode IN (46006, 55800)")
-        hist_capacity_length['frequent'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE oCC_HPE > 15 AND ReachCode IN (46006, 55800)")
-        hist_capacity_length['pervasive'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Risk = 'Negligible Risk' AND ReachCode IN (46006, 55800)")
-        risk_length['negligible'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Risk = 'Minor Risk' AND ReachCode IN (46006, 55800)")
-        risk_length['minor'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Risk = 'Some Risk' AND ReachCode IN (46006, 55800)")
-        risk_length['some'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Risk = 'Considerable Risk' AND ReachCode IN (46006, 55800)")
-        risk_length['considerable'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Limitation = 'Anthropogenically Limited' AND ReachCode IN (46006, 55800)")
-        limited_length['anthropogenic'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Limitation = 'Stream Power Limited' AND ReachCode IN (46006, 55800)")
-        limited_length['stream_power'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Limitation = 'Slope Limited' AND ReachCode IN (46006, 55800)")
-        limited_length['slope'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Limitation = 'Potential Reservoir or Land Use Change' AND ReachCode IN (46006, 55800)")
-        limited_length['reservoir_or_land_use'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Limitation = 'Naturally Vegetation Limited' AND ReachCode IN (46006, 55800)")
-        limited_length['naturally_vegetation'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Limitation = 'Stream Size Limited' AND ReachCode IN (46006, 55800)")
-        limited_length['stream_size'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Limitation = 'Dam Building Possible' AND ReachCode IN (46006, 55800)")
-        limited_length['dam_building_possible'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Opportunity = 'Conservation/Appropriate for Translocation' AND ReachCode IN (46006, 55800)")
-        opportunity_length['conservation'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Opportunity = 'Encourage Beaver Expansion/Colonization' AND ReachCode IN (46006, 55800)")
-        opportunity_length['beaver_expansion'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Opportunity = 'Beaver Mimicry' AND ReachCode IN (46006, 55800)")
-        opportunity_length['beaver_mimicry'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Opportunity = 'Land Management Chanage' AND ReachCode IN (46006, 55800)")
-        opportunity_length['land_management'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Opportunity = 'Conflict Management' AND ReachCode IN (46006, 55800)")
-        opportunity_length['conflict_management'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Opportunity = 'Potential Floodplain/Side Channel Opportunities' AND ReachCode IN (46006, 55800)")
-        opportunity_length['potential_floodplain'] = curs.fetchone()[0]
-        curs.execute("SELECT SUM(iGeo_Len) FROM vwReaches WHERE Opportunity = 'Natural or Anthropogenic Limitations' AND ReachCode IN (46006, 55800)")
-        opportunity_length['natural_or_anthropogenic'] = curs.fetchone()[0]
-
-        perennial['ex_capacity_length'] = ex_capacity_length
-        perennial['hist_capacity_length'] = hist_capacity_length
-        perennial['risk_length'] = risk_length
-        perennial['limited_length'] = limited_length
-        perennial['opportunity_length'] = opportunity_length
-
-        brat_metrics['all'] = all
-        brat_metrics['perennial'] = perennial
+        # One scan of the DGOs and one scan of the reaches for every metric of every network group
+        brat_metrics = dgo_capacity_metrics(curs)
+        for group, class_lengths in reach_length_metrics(curs).items():
+            brat_metrics[group].update(class_lengths)
 
     metrics['brat'] = brat_metrics
 
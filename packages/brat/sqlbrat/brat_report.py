@@ -1,12 +1,14 @@
 import argparse
 import sqlite3
 import os
+import numpy as np
 
 from xml.etree import ElementTree as ET
 
 from rscommons import ModelConfig, RSReport, RSProject
 from rsxml.util import safe_makedirs
-from rscommons.plotting import xyscatter, box_plot, pie, horizontal_bar
+from rscommons.plotting import xyscatter, box_plot, pie, horizontal_bar, render_charts
+from rscommons.report.report_data import read_columns, summary_stats, interval_mask
 from rsxml import Logger, dotenv
 
 from sqlbrat.__version__ import __version__
@@ -17,6 +19,12 @@ id_cols = [
     'Type ID'
 ]
 
+# Reach attributes that are summarized into bins
+BINNED_ATTRIBUTES = ['iGeo_Slope', 'iHyd_SPLow', 'iHyd_SP2', 'oPC_Dist', 'iPC_LU', 'oCC_EX', 'oCC_HPE', 'mCC_EX_CT', 'mCC_HPE_CT', 'oVC_EX', 'oVC_HPE']
+
+# Reach view fields used for the hydrology scatter plots and the geophysical box plots
+REACH_VIEW_FIELDS = ['iGeo_DA', 'iHyd_QLow', 'iHyd_Q2', 'oPC_Dist', 'iGeo_Slope', 'iGeo_ElMax', 'iGeo_ElMin', 'iGeo_Len']
+
 
 class BratReport(RSReport):
     """In order to write a report we will extend the RSReport class from the rscommons
@@ -147,6 +155,12 @@ class BratReport(RSReport):
         self.images_dir = os.path.join(os.path.dirname(report_path), 'images')
         safe_makedirs(self.images_dir)
 
+        # The reach attributes are read once and every summary is calculated from these columns.
+        # Charts are queued while the HTML is built and rendered together at the end.
+        self.reaches = read_columns(self.database, 'ReachAttributes', ['iGeo_Len'] + BINNED_ATTRIBUTES)
+        self.reach_view = read_columns(self.database, 'vwReaches', REACH_VIEW_FIELDS)
+        self.chart_jobs = []
+
         # Now we just need to write the sections we want in the report in order
         outputs_section = self.section('Outputs', 'Model Outputs')
         pEl = ET.Element('p')
@@ -169,6 +183,7 @@ class BratReport(RSReport):
 
         # self.reach_attribute_summaries()
 
+        render_charts(self.chart_jobs)
         self.log.info('Finished writing report')
 
     def dam_capacity(self, parent_sec):
@@ -271,7 +286,7 @@ class BratReport(RSReport):
 
             pie_path = os.path.join(self.images_dir, '{}_pie.png'.format(label))
             col = [self.bratcolors[x[0]] for x in table_data]
-            pie([x[4] for x in table_data], [x[0] for x in table_data], '{} by Stream Length'.format(label), col, pie_path)
+            self.chart_jobs.append((pie, ([x[4] for x in table_data], [x[0] for x in table_data], '{} by Stream Length'.format(label), col, pie_path)))
 
             plot_wrapper = ET.Element('div', attrib={'class': 'plots'})
             img_wrap = ET.Element('div', attrib={'class': 'imgWrap'})
@@ -284,7 +299,7 @@ class BratReport(RSReport):
             section.append(plot_wrapper)
 
             bar_path = os.path.join(self.images_dir, '{}_bar.png'.format(label))
-            horizontal_bar([x[1] for x in table_data], [x[0] for x in table_data], col, 'Reach Length (km)', '{} by Stream Length'.format(label), bar_path, 'Reach Length (mi)')
+            self.chart_jobs.append((horizontal_bar, ([x[1] for x in table_data], [x[0] for x in table_data], col, 'Reach Length (km)', '{} by Stream Length'.format(label), bar_path, 'Reach Length (mi)')))
 
             plot_wrapper = ET.Element('div', attrib={'class': 'plots'})
             img_wrap = ET.Element('div', attrib={'class': 'imgWrap'})
@@ -361,9 +376,8 @@ class BratReport(RSReport):
             self.log.info('Generating XY scatter for {} against drainage area.'.format(variable))
             image_path = os.path.join(self.images_dir, 'drainage_area_{}.png'.format(variable.lower()))
 
-            curs.execute('SELECT iGeo_DA, {} FROM vwReaches'.format(variable))
-            values = [(row[0], row[1]) for row in curs.fetchall()]
-            xyscatter(values, 'Drainage Area (sqkm)', ylabel, variable, image_path)
+            values = list(zip(self.reach_view['iGeo_DA'], self.reach_view[variable]))
+            self.chart_jobs.append((xyscatter, (values, 'Drainage Area (sqkm)', ylabel, variable, image_path)))
 
             img_wrap = ET.Element('div', attrib={'class': 'imgWrap'})
             img = ET.Element('img', attrib={
@@ -434,12 +448,7 @@ class BratReport(RSReport):
         }
         RSReport.create_table_from_dict(dist_dict, section)
 
-        conn = sqlite3.connect(self.database)
-        conn.row_factory = _dict_factory
-        curs = conn.cursor()
-        curs.execute('SELECT oPC_Dist FROM vwReaches')
-        distances = [row for row in curs.fetchall() if row['oPC_Dist'] is not None]
-        if len(distances) > 0:
+        if np.any(~np.isnan(self.reach_view.numeric('oPC_Dist'))):
             self.attribute_table_and_pie('oPC_Dist', [
                 {'label': 'Not Close', 'lower': 1000},
                 {'label': 'Outside Range of Concern', 'lower': 300, 'upper': 1000},
@@ -485,7 +494,7 @@ class BratReport(RSReport):
                 col.append(self.bratcolors[x[0]])
             else:
                 col.append('#b2b2b2')
-        horizontal_bar([i[2] for i in table_data], [i[0] for i in table_data], col, 'Reach Length (km)', 'Ownership by Stream Length', bar_path, 'Reach_Length (mi)')
+        self.chart_jobs.append((horizontal_bar, ([i[2] for i in table_data], [i[0] for i in table_data], col, 'Reach Length (km)', 'Ownership by Stream Length', bar_path, 'Reach_Length (mi)')))
 
         plot_wrapper = ET.Element('div', attrib={'class': 'plots'})
         img_wrap = ET.Element('div', attrib={'class': 'imgWrap'})
@@ -545,7 +554,7 @@ class BratReport(RSReport):
         # create a list of colors from lables using the color dictionary
         col = [self.bratcolors[x[0]] for x in table_data]
         bar_path = os.path.join(self.images_dir, 'Reach_type_bar.png')
-        horizontal_bar([x[1] for x in table_data], [x[0] for x in table_data], col, 'Reach Length (km)', 'Reach Types', bar_path, 'Reach Length (mi)')
+        self.chart_jobs.append((horizontal_bar, ([x[1] for x in table_data], [x[0] for x in table_data], col, 'Reach Length (km)', 'Reach Types', bar_path, 'Reach Length (mi)')))
 
         plot_wrapper = ET.Element('div', attrib={'class': 'plots'})
         img_wrap = ET.Element('div', attrib={'class': 'imgWrap'})
@@ -632,27 +641,18 @@ class BratReport(RSReport):
         # Use a class here because it repeats
         # section = self.section(None, attribute, parent_el, level=2)
         RSReport.header(3, attribute, parent_el)
-        conn = sqlite3.connect(self.database)
-        conn.row_factory = _dict_factory
-        curs = conn.cursor()
-
-        # Summary statistics (min, max etc) for the current attribute
-        curs.execute('SELECT Count({0}) "Values", Max({0}) Maximum, Min({0}) Minimum, Avg({0}) Average FROM vwReaches WHERE {0} IS NOT NULL'.format(attribute))
-        values = curs.fetchone()
+        # Summary statistics (min, max etc) and the number of NULL values for the current attribute
+        attribute_values = self.reach_view.numeric(attribute)
+        values = summary_stats(attribute_values)
 
         reach_wrapper_inner = ET.Element('div', attrib={'class': 'reachAtributeInner'})
         parent_el.append(reach_wrapper_inner)
-
-        # Add the number of NULL values
-        curs.execute('SELECT Count({0}) "NULL Values" FROM vwReaches WHERE {0} IS NULL'.format(attribute))
-        values.update(curs.fetchone())
         RSReport.create_table_from_dict(values, reach_wrapper_inner)
 
         # Box plot
         image_path = os.path.join(self.images_dir, 'attribute_{}.png'.format(attribute))
-        curs.execute('SELECT {0} FROM vwReaches WHERE {0} IS NOT NULL'.format(attribute))
-        values = [row[attribute] for row in curs.fetchall()]
-        box_plot(values, self.f_names[attribute], image_path)
+        values = attribute_values[~np.isnan(attribute_values)].tolist()
+        self.chart_jobs.append((box_plot, (values, self.f_names[attribute], image_path)))
 
         img_wrap = ET.Element('div', attrib={'class': 'imgWrap'})
         img = ET.Element('img', attrib={'class': 'boxplot', 'alt': 'boxplot', 'src': '{}/{}'.format(os.path.basename(self.images_dir), os.path.basename(image_path))})
@@ -677,40 +677,21 @@ class BratReport(RSReport):
 
         RSReport.header(4, '{} Summary'.format(self.f_names[attribute_field]), elParent)
 
-        conn = sqlite3.connect(self.database)
-        conn.row_factory = _dict_factory
-        curs = conn.cursor()
+        lengths = self.reaches.numeric('iGeo_Len')
+        values = self.reaches.numeric(attribute_field)
+        total_length = np.nansum(lengths)
 
         data = []
         for abin in bins:
-            label = abin['label']
-            lower = abin['lower'] if 'lower' in abin else None
-            upper = abin['upper'] if 'upper' in abin else None
-            where_clause = ''
-            sql_args = []
-
-            if lower is not None:
-                where_clause = ' ({} > ?)'.format(attribute_field)
-                sql_args.append(lower)
-
-            if upper is not None:
-                if len(where_clause) > 0:
-                    where_clause += ' AND '
-                sql_args.append(upper)
-
-                where_clause += ' ({} <= ?) '.format(attribute_field)
-
-            curs.execute("""SELECT count(*) ReachCount, (sum(iGeo_Len) / 1000) LengthKM, (sum(igeo_len) * 0.000621371) LengthMiles, (0.1 * sum(iGeo_Len) / t.total_length) Percent
-                        FROM ReachAttributes r,
-                        (select sum(igeo_len) / 1000 total_length from ReachAttributes) t
-                         WHERE {}""".format(where_clause), sql_args)
-            row = curs.fetchone()
+            # Lower bounds are exclusive and upper bounds inclusive
+            in_bin = interval_mask(values, abin.get('lower'), abin.get('upper'))
+            bin_length = float(np.nansum(lengths[in_bin]))
             data.append((
-                label,
-                (row['ReachCount'] or 0),
-                (row['LengthKM'] or 0),
-                (row['LengthMiles'] or 0),
-                (row['Percent'] or 0)
+                abin['label'],
+                int(np.sum(in_bin)),
+                bin_length / 1000,
+                bin_length * 0.000621371,
+                100 * bin_length / total_length if total_length > 0 else 0
             ))
 
         total_row = self.get_total_row(data)
@@ -723,7 +704,7 @@ class BratReport(RSReport):
 
         image_path = os.path.join(self.images_dir, '{}_pie.png'.format(attribute_field.lower()))
         col = [self.bratcolors[x[0]] for x in data]
-        pie([x[4] for x in data], [x[0] for x in data], '{} by Stream Length'.format(self.f_names[attribute_field]), col, image_path)
+        self.chart_jobs.append((pie, ([x[4] for x in data], [x[0] for x in data], '{} by Stream Length'.format(self.f_names[attribute_field]), col, image_path)))
 
         plot_wrapper = ET.Element('div', attrib={'class': 'plots'})
         img_wrap = ET.Element('div', attrib={'class': 'imgWrap'})
@@ -736,7 +717,7 @@ class BratReport(RSReport):
         elParent.append(plot_wrapper)
 
         bar_path = os.path.join(self.images_dir, '{}_bar.png'.format(attribute_field))
-        horizontal_bar([x[2] for x in data], [x[0] for x in data], col, 'Reach Length (km)', '{} by Stream Length'.format(self.f_names[attribute_field]), bar_path, 'Reach Length (Miles)')
+        self.chart_jobs.append((horizontal_bar, ([x[2] for x in data], [x[0] for x in data], col, 'Reach Length (km)', '{} by Stream Length'.format(self.f_names[attribute_field]), bar_path, 'Reach Length (Miles)')))
 
         plot_wrapper = ET.Element('div', attrib={'class': 'plots'})
         img_wrap = ET.Element('div', attrib={'class': 'imgWrap'})
@@ -4,8 +4,11 @@ import sys
 import traceback
 import argparse
 
+from typing import Dict
+
 import numpy as np
-from shapely.ops import nearest_points, unary_union
+import shapely
+from shapely import STRtree
 import matplotlib.pyplot as plt
 from scipy.stats import linregress
 
@@ -14,6 +17,15 @@ from rsxml import Logger, dotenv
 from rscommons.classes.vector_base import VectorBase
 from rscommons.database import SQLiteCon
 
+# Dam capacity classes (dams/km). (key, label, SQL condition on dam_counts)
+CAPACITY_CLASSES = [
+    ('none', 'None', 'predicted_capacity = 0'),
+    ('rare', 'Rare', 'predicted_capacity > 0 and predicted_capacity <= 1'),
+    ('occasional', 'Occasional', 'predicted_capacity > 1 and predicted_capacity <= 5'),
+    ('frequent', 'Frequent', 'predicted_capacity > 5 and predicted_capacity <= 15'),
+    ('pervasive', 'Pervasive', 'predicted_capacity > 15')
+]
+
 
 def validate_capacity(brat_gpkg_path: str, dams_gpkg_path: str):
 
@@ -27,61 +39,101 @@ def validate_capacity(brat_gpkg_path: str, dams_gpkg_path: str):
     log.info('Done')
 
 
+def assign_dams_to_reaches(reach_fids: np.ndarray, reach_geoms: np.ndarray, reach_lengths: np.ndarray, dam_geoms: np.ndarray,
+                           max_distance: float, snap_distance: float, min_length: float = 100) -> Dict[int, int]:
+    """Count the dams on each reach with an indexed nearest line join
+
+    Each dam is snapped to the closest point on the drainage network (dams further than max_distance are ignored
+    and ties go to the reach with the lowest FID).
+    The dam is assigned to the first reach (lowest FID) within snap_distance of that point that is at least
+    min_length long, so dams at a confluence with a short reach fall on the neighbouring reach.
+
+    Args:
+        reach_fids (np.ndarray): reach FIDs
+        reach_geoms (np.ndarray): shapely reach geometries
+        reach_lengths (np.ndarray): reach lengths (iGeo_Len)
+        dam_geoms (np.ndarray): shapely dam points
+        max_distance (float): maximum distance from a dam to the network (layer units)
+        snap_distance (float): tolerance used to find the reaches that touch the snapped point (layer units)
+        min_length (float, optional): reaches shorter than this never get dams. Defaults to 100.
+
+    Returns:
+        Dict[int, int]: reach FID -> dam count for the reaches with at least one dam
+    """
+    if len(reach_geoms) == 0 or len(dam_geoms) == 0:
+        return {}
+
+    tree = STRtree(reach_geoms)
+    dam_idx, nearest_idx = tree.query_nearest(dam_geoms, max_distance=max_distance, all_matches=True)
+    if len(dam_idx) == 0:
+        return {}
+
+    # A dam that is equidistant from several reaches snaps to the one with the lowest FID
+    order = np.lexsort((reach_fids[nearest_idx], dam_idx))
+    dam_idx = dam_idx[order]
+    nearest_idx = nearest_idx[order]
+    first = np.r_[True, dam_idx[1:] != dam_idx[:-1]]
+    dam_idx = dam_idx[first]
+    nearest_idx = nearest_idx[first]
+
+    # Closest point on the network to each dam
+    snapped = shapely.get_point(shapely.shortest_line(reach_geoms[nearest_idx], dam_geoms[dam_idx]), 0)
+    snap_idx, reach_idx = tree.query(shapely.buffer(snapped, snap_distance), predicate='intersects')
+
+    long_enough = reach_lengths[reach_idx] >= min_length
+    snap_idx = snap_idx[long_enough]
+    reach_idx = reach_idx[long_enough]
+    if len(snap_idx) == 0:
+        return {}
+
+    # First qualifying reach (lowest FID) for every snapped dam
+    order = np.lexsort((reach_fids[reach_idx], snap_idx))
+    snap_idx = snap_idx[order]
+    first = np.r_[True, snap_idx[1:] != snap_idx[:-1]]
+    dam_reaches = reach_fids[reach_idx[order][first]]
+
+    fids, counts = np.unique(dam_reaches, return_counts=True)
+    return {int(fid): int(count) for fid, count in zip(fids, counts)}
+
+
 def dam_count_table(brat_gpkg_path: str, dams_gpkg_path: str):
 
     log = Logger('Dam Count Table')
 
-    dam_cts = {}  # reachid: dam count
-
     with GeopackageLayer(os.path.join(brat_gpkg_path, 'vwReaches')) as brat_lyr, \
             GeopackageLayer(os.path.join(dams_gpkg_path, 'dams')) as dams_lyr:
 
         buffer_distance = brat_lyr.rough_convert_metres_to_vector_units(0.1)
         max_distance = brat_lyr.rough_convert_metres_to_vector_units(30)
 
-        # create a dissolved drainage network
-        line_geoms = [ftr for ftr in brat_lyr.ogr_layer]
-        line_geoms_shapely = [VectorBase.ogr2shapely(line_geom) for line_geom in line_geoms]
-        merged_line = unary_union(line_geoms_shapely)
+        reach_fids = []
+        reach_geoms = []
+        reach_lengths = []
+        for line_ftr, *_ in brat_lyr.iterate_features('Loading reaches'):
+            line_geom = line_ftr.GetGeometryRef()
+            if line_geom is None:
+                continue
+            reach_fids.append(line_ftr.GetFID())
+            reach_geoms.append(VectorBase.ogr2shapely(line_geom))
+            length = line_ftr.GetField('iGeo_Len')
+            reach_lengths.append(length if length is not None else np.nan)
 
-        # get the points on the line network that are closest to the dam points
-        for dam_ftr, *_ in dams_lyr.iterate_features('Finding dam counts for reaches'):
-            dam_id = dam_ftr.GetFID()
+        dam_geoms = []
+        for dam_ftr, *_ in dams_lyr.iterate_features('Loading dams'):
             dam_geom = dam_ftr.GetGeometryRef()
-            nearest_line = nearest_points(merged_line, VectorBase.ogr2shapely(dam_geom))
-            if nearest_line[0].distance(VectorBase.ogr2shapely(dam_geom)) > max_distance:
-                continue
-            dam_buf = nearest_line[0].buffer(buffer_distance)
-
-            ct = 0
-            for line_ftr, *_ in brat_lyr.iterate_features(clip_shape=dam_buf):
-                if ct == 0:
-                    if line_ftr.GetField('iGeo_Len') < 100:
-                        continue
-                    reachid = line_ftr.GetFID()
-                    line_geom = line_ftr.GetGeometryRef()
-                    if line_geom is not None:
-                        if reachid not in dam_cts.keys():
-                            dam_cts[reachid] = 1
-                            ct += 1
-                        else:
-                            dam_cts[reachid] += 1
-                            ct += 1
+            if dam_geom is not None:
+                dam_geoms.append(VectorBase.ogr2shapely(dam_geom))
+
+    log.info(f'Assigning {len(dam_geoms):,} dams to {len(reach_fids):,} reaches')
+    dam_cts = assign_dams_to_reaches(np.array(reach_fids, dtype=np.int64), np.array(reach_geoms, dtype=object), np.array(reach_lengths, dtype=np.float64),
+                                     np.array(dam_geoms, dtype=object), max_distance, buffer_distance)
 
     with SQLiteCon(brat_gpkg_path) as db:
-        db.curs.execute('SELECT fid FROM vwReaches')
-        reachids = [row['fid'] for row in db.curs.fetchall()]
         db.curs.execute('DROP TABLE IF EXISTS dam_counts')
         db.curs.execute('CREATE TABLE dam_counts (ReachID INTEGER PRIMARY KEY, FCode INTEGER, WatershedID TEXT, dam_count INTEGER, dam_density REAL, predicted_capacity REAL, length REAL, percent_capacity REAL)')
-        db.curs.execute('INSERT INTO dam_counts (ReachID, FCode, WatershedID, predicted_capacity, length) SELECT fid, ReachCode, WatershedID, oCC_EX, iGeo_Len FROM vwReaches')
-        for reachid in reachids:
-            if reachid in dam_cts.keys():
-                db.curs.execute('UPDATE dam_counts SET dam_count = ? WHERE reachid = ?', (dam_cts[reachid], reachid))
-            else:
-                db.curs.execute('UPDATE dam_counts SET dam_count = ? WHERE reachid = ?', (0, reachid))
-        db.curs.execute('UPDATE dam_counts SET dam_density = dam_count / (length/1000)')
-        db.conn.commit()
-        db.curs.execute('UPDATE dam_counts SET percent_capacity = dam_density / predicted_capacity')
+        db.curs.execute('INSERT INTO dam_counts (ReachID, FCode, WatershedID, dam_count, predicted_capacity, length) SELECT fid, ReachCode, WatershedID, 0, oCC_EX, iGeo_Len FROM vwReaches')
+        db.curs.executemany('UPDATE dam_counts SET dam_count = ? WHERE ReachID = ?', [(count, reachid) for reachid, count in dam_cts.items()])
+        db.curs.execute('UPDATE dam_counts SET dam_density = dam_count / (length/1000), percent_capacity = (dam_count / (length/1000)) / predicted_capacity')
         db.conn.commit()
         # db.curs.execute('UPDATE dam_counts SET predicted_capacity = 0 WHERE predicted_capacity IS NULL')
         # db.conn.commit()
@@ -101,6 +153,38 @@ def dam_count_table(brat_gpkg_path: str, dams_gpkg_path: str):
             log.info('vwCapacity already exists)')
 
 
+def capacity_class_stats(gpkg_path: str) -> Dict[str, dict]:
+    """Surveyed dams, stream length, estimated capacity and average densities for every capacity class
+    in a single grouped scan of the dam_counts table. Only perennial reaches and reaches with dams are included.
+
+    Args:
+        gpkg_path (str): BRAT geopackage with the dam_counts table
+
+    Returns:
+        Dict[str, dict]: capacity class key (see CAPACITY_CLASSES) -> dams, length, capacity, avg_dam_density and avg_pred_cap.
+            Classes without any reaches are omitted. The 'total' entry sums every reach, including those without a capacity.
+    """
+    class_case = ' '.join(f"WHEN {condition} THEN '{key}'" for key, _label, condition in CAPACITY_CLASSES)
+
+    stats = {}
+    total = {'dams': 0, 'length': 0, 'capacity': 0}
+    with SQLiteCon(gpkg_path) as db:
+        db.curs.execute(f"""SELECT CASE {class_case} END AS capacity_class,
+                                   SUM(dam_count) AS dams, SUM(length) AS length, SUM(predicted_capacity * (length/1000)) AS capacity,
+                                   AVG(dam_density) AS avg_dam_density, AVG(predicted_capacity) AS avg_pred_cap
+                            FROM dam_counts
+                            WHERE dam_count > 0 or FCode in (46006, 55800)
+                            GROUP BY capacity_class""")
+        for row in db.curs.fetchall():
+            for key in total:
+                total[key] += row[key] or 0
+            if row['capacity_class'] is not None:
+                stats[row['capacity_class']] = dict(row)
+
+    stats['total'] = total
+    return stats
+
+
 def electivity_index(gpkg_path: str):
     out_path = os.path.join(os.path.dirname(gpkg_path), 'validation/electivity_index.csv')
     if os.path.exists(out_path):
@@ -112,54 +196,50 @@ def electivity_index(gpkg_path: str):
     err_segs = {}
     none_segs = {}
 
-    with SQLiteCon(gpkg_path) as db:
-        db.curs.execute('SELECT SUM(dam_count) AS dams FROM dam_counts')
-        total_dams = db.curs.fetchone()['dams']
-        db.curs.execute('SELECT SUM(length) As len FROM dam_counts where dam_count > 0 or FCode in (46006, 55800)')
-        total_length = db.curs.fetchone()['len']
-        db.curs.execute('SELECT SUM(dam_count) AS dc, SUM(length) AS sl, SUM(predicted_capacity * (length/1000)) AS cap FROM dam_counts WHERE predicted_capacity = 0 and (dam_count > 0 or FCode in (46006, 55800))')
-        none_cap = db.curs.fetchone()
-        none_len = none_cap['sl']
-        none_ct = none_cap['dc']
-        none_predcap = none_cap['cap']
-        if none_len is None:
-            none_len = 0.001
-            none_ct = 0
-            none_predcap = 0
-            none_percap = 0
-            none_ei = 0
+    stats = capacity_class_stats(gpkg_path)
+    # Every dam is on a reach in the scan so the class totals are the totals for the network
+    total_dams = stats['total']['dams']
+    total_length = stats['total']['length']
+
+    rows = []
+    for key, label, _condition in CAPACITY_CLASSES:
+        class_stats = stats.get(key)
+        if class_stats is None or class_stats['length'] is None:
+            class_len = 0.001
+            class_ct = 0
+            class_predcap = 0
+            class_percap = 0
+            class_ei = 0
         else:
-            none_percap = round((none_ct / none_predcap)*100, 2) if none_predcap > 0 else 'NA'
-            none_ei = (none_ct / total_dams) / (none_len / total_length)
-        db.curs.execute('SELECT SUM(dam_count) AS dc, SUM(length) AS sl, SUM(predicted_capacity * (length/1000)) AS cap FROM dam_counts WHERE predicted_capacity > 0 and predicted_capacity <= 1 and (dam_count > 0 or FCode in (46006, 55800))')
-        rare_cap = db.curs.fetchone()
-        rare_len = rare_cap['sl']
-        rare_ct = rare_cap['dc']
-        rare_predcap = rare_cap['cap']
-        rare_percap = round((rare_ct / rare_predcap)*100, 2) if rare_predcap > 0 else 'NA'
-        rare_ei = (rare_ct / total_dams) / (rare_len / total_length)
-        db.curs.execute('SELECT SUM(dam_count) AS dc, SUM(length) AS sl, SUM(predicted_capacity * (length/1000)) AS cap FROM dam_counts WHERE predicted_capacity > 1 and predicted_capacity <= 5 and (dam_count > 0 or FCode in (46006, 55800))')
-        occ_cap = db.curs.fetchone()
-        occ_len = occ_cap['sl']
-        occ_ct = occ_cap['dc']
-        occ_predcap = occ_cap['cap']
-        occ_ei = (occ_ct / total_dams) / (occ_len / total_length)
-        occ_percap = round((occ_ct / occ_predcap)*100, 2) if occ_predcap > 0 else 'NA'
-        db.curs.execute('SELECT SUM(dam_count) AS dc, SUM(length) AS sl, SUM(predicted_capacity * (length/1000)) AS cap FROM dam_counts WHERE predicted_capacity > 5 and predicted_capacity <= 15 and (dam_count > 0 or FCode in (46006, 55800))')
-        freq_cap = db.curs.fetchone()
-        freq_len = freq_cap['sl']
-        freq_ct = freq_cap['dc']
-        freq_predcap = freq_cap['cap']
-        freq_percap = round((freq_ct / freq_predcap)*100, 2) if freq_predcap > 0 else 'NA'
-        freq_ei = (freq_ct / total_dams) / (freq_len / total_length)
-        db.curs.execute('SELECT SUM(dam_count) AS dc, SUM(length) AS sl, SUM(predicted_capacity * (length/1000)) AS cap FROM dam_counts WHERE predicted_capacity > 15 and (dam_count > 0 or FCode in (46006, 55800))')
-        perv_cap = db.curs.fetchone()
-        perv_len = perv_cap['sl']
-        perv_ct = perv_cap['dc']
-        perv_predcap = perv_cap['cap']
-        perv_percap = round((perv_ct / perv_predcap)*100, 2) if perv_predcap > 0 else 'NA'
-        perv_ei = (perv_ct / total_dams) / (perv_len / total_length)
+            class_len = class_stats['length']
+            class_ct = class_stats['dams']
+            class_predcap = class_stats['capacity'] or 0
+            class_percap = round((class_ct / class_predcap)*100, 2) if class_predcap > 0 else 'NA'
+            class_ei = (class_ct / total_dams) / (class_len / total_length)
+
+        rows.append({'Capacity': label,
+                     'Stream Length (km)': int(class_len/1000),
+                     'Percent of Drainage Network': round((class_len/total_length)*100, 1),
+                     'Surveyed Dams': class_ct,
+                     'BRAT Estimated Capacity': int(class_predcap),
+                     'Average Surveyed Dam Density (dams/km)': round(class_ct / (class_len/1000), 3),
+                     'Average Predicted Capacity (dams/km)': round(class_predcap / (class_len/1000), 2),
+                     'Percent of Modeled Capacity': class_percap,
+                     'Electivity Index': round(class_ei, 2)})
+
+    class_dams = sum(row['Surveyed Dams'] for row in rows)
+    class_capacity = sum(stats[key]['capacity'] or 0 for key, _label, _condition in CAPACITY_CLASSES if key in stats)
+    rows.append({'Capacity': 'Total',
+                 'Stream Length (km)': int(total_length/1000),
+                 'Percent of Drainage Network': 100,
+                 'Surveyed Dams': total_dams,
+                 'BRAT Estimated Capacity': int(class_capacity),
+                 'Average Surveyed Dam Density (dams/km)': round(class_dams / (total_length/1000), 3),
+                 'Average Predicted Capacity (dams/km)': round(class_capacity / (total_length/1000), 2),
+                 'Percent of Modeled Capacity': round((class_dams / class_capacity)*100, 2),
+                 'Electivity Index': 'NA'})
 
+    with SQLiteCon(gpkg_path) as db:
         db.curs.execute('SELECT ReachID, dam_count, predicted_capacity*(length/1000) AS pred FROM dam_counts WHERE dam_count > 0 and predicted_capacity NOT NULL')
         for row in db.curs.fetchall():
             if row['dam_count'] > row['pred'] + 1 or row['pred'] == 0:
@@ -174,60 +254,7 @@ def electivity_index(gpkg_path: str):
                       'Average Surveyed Dam Density (dams/km)', 'Average Predicted Capacity (dams/km)', 'Percent of Modeled Capacity', 'Electivity Index']
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         writer.writeheader()
-        writer.writerow({'Capacity': 'None',
-                         'Stream Length (km)': int(none_len/1000),
-                         'Percent of Drainage Network': round((none_len/total_length)*100, 1),
-                         'Surveyed Dams': none_ct,
-                         'BRAT Estimated Capacity': int(none_predcap),
-                         'Average Surveyed Dam Density (dams/km)': round(none_ct / (none_len/1000), 3),
-                         'Average Predicted Capacity (dams/km)': round(none_predcap / (none_len/1000), 2),
-                         'Percent of Modeled Capacity': none_percap,
-                         'Electivity Index': round(none_ei, 2)})
-        writer.writerow({'Capacity': 'Rare',
-                         'Stream Length (km)': int(rare_len/1000),
-                         'Percent of Drainage Network': round((rare_len/total_length)*100, 1),
-                         'Surveyed Dams': rare_ct,
-                         'BRAT Estimated Capacity': int(rare_predcap),
-                         'Average Surveyed Dam Density (dams/km)': round(rare_ct / (rare_len/1000), 3),
-                         'Average Predicted Capacity (dams/km)': round(rare_predcap / (rare_len/1000), 2),
-                         'Percent of Modeled Capacity': rare_percap,
-                         'Electivity Index': round(rare_ei, 2)})
-        writer.writerow({'Capacity': 'Occasional',
-                         'Stream Length (km)': int(occ_len/1000),
-                         'Percent of Drainage Network': round((occ_len/total_length)*100, 1),
-                         'Surveyed Dams': occ_ct,
-                         'BRAT Estimated Capacity': int(occ_predcap),
-                         'Average Surveyed Dam Density (dams/km)': round(occ_ct / (occ_len/1000), 3),
-                         'Average Predicted Capacity (dams/km)': round(occ_predcap / (occ_len/1000), 2),
-                         'Percent of Modeled Capacity': occ_percap,
-                         'Electivity Index': round(occ_ei, 2)})
-        writer.writerow({'Capacity': 'Frequent',
-                         'Stream Length (km)': int(freq_len/1000),
-                         'Percent of Drainage Network': round((freq_len/total_length)*100, 1),
-                         'Surveyed Dams': freq_ct,
-                         'BRAT Estimated Capacity': int(freq_predcap),
-                         'Average Surveyed Dam Density (dams/km)': round(freq_ct / (freq_len/1000), 3),
-                         'Average Predicted Capacity (dams/km)': round(freq_predcap / (freq_len/1000), 2),
-                         'Percent of Modeled Capacity': freq_percap,
-                         'Electivity Index': round(freq_ei, 2)})
-        writer.writerow({'Capacity': 'Pervasive',
-                         'Stream Length (km)': int(perv_len/1000),
-                         'Percent of Drainage Network': round((perv_len/total_length)*100, 1),
-                         'Surveyed Dams': perv_ct,
-                         'BRAT Estimated Capacity': int(perv_predcap),
-                         'Average Surveyed Dam Density (dams/km)': round(perv_ct / (perv_len/1000), 3),
-                         'Average Predicted Capacity (dams/km)': round(perv_predcap / (perv_len/1000), 2),
-                         'Percent of Modeled Capacity': perv_percap,
-                         'Electivity Index': round(perv_ei, 2)})
-        writer.writerow({'Capacity': 'Total',
-                         'Stream Length (km)': int(total_length/1000),
-                         'Percent of Drainage Network': 100,
-                         'Surveyed Dams': total_dams,
-                         'BRAT Estimated Capacity': int(none_predcap + rare_predcap + occ_predcap + freq_predcap + perv_predcap),
-                         'Average Surveyed Dam Density (dams/km)': round((none_ct + rare_ct + occ_ct + freq_ct + perv_ct) / (total_length/1000), 3),
-                         'Average Predicted Capacity (dams/km)': round((none_predcap + rare_predcap + occ_predcap + freq_predcap + perv_predcap) / (total_length/1000), 2),
-                         'Percent of Modeled Capacity': round(((none_ct + rare_ct + occ_ct + freq_ct + perv_ct) / (none_predcap + rare_predcap + occ_predcap + freq_predcap + perv_predcap))*100, 2),
-                         'Electivity Index': 'NA'})
+        writer.writerows(rows)
 
     if len(err_segs) > 0:
         with open(os.path.join(os.path.dirname(gpkg_path), 'validation/error_segments.csv'), 'w', newline='') as csvfile:
@@ -247,27 +274,11 @@ def electivity_index(gpkg_path: str):
 
 
 def validation_plots(brat_gpkg_path: str):
+    stats = capacity_class_stats(brat_gpkg_path)
     pred_obs = {}
-    with SQLiteCon(brat_gpkg_path) as db:
-        db.curs.execute('SELECT AVG(dam_density) AS avg_dam_density, AVG(predicted_capacity) AS avg_pred_cap FROM dam_counts WHERE predicted_capacity = 0 and (dam_count > 0 or FCode in (46006, 55800))')
-        none_res = db.curs.fetchone()
-        if none_res['avg_dam_density'] is None:
-            none_res['avg_dam_density'] = 0
-        if none_res['avg_pred_cap'] is None:
-            none_res['avg_pred_cap'] = 0
-        pred_obs['none'] = [none_res['avg_dam_density'], none_res['avg_pred_cap']]
-        db.curs.execute('SELECT AVG(dam_density) AS avg_dam_density, AVG(predicted_capacity) AS avg_pred_cap FROM dam_counts WHERE predicted_capacity > 0 and predicted_capacity <= 1 and (dam_count > 0 or FCode in (46006, 55800))')
-        rare_res = db.curs.fetchone()
-        pred_obs['rare'] = [rare_res['avg_dam_density'], rare_res['avg_pred_cap']]
-        db.curs.execute('SELECT AVG(dam_density) AS avg_dam_density, AVG(predicted_capacity) AS avg_pred_cap FROM dam_counts WHERE predicted_capacity > 1 and predicted_capacity <= 5 and (dam_count > 0 or FCode in (46006, 55800))')
-        occ_res = db.curs.fetchone()
-        pred_obs['occ'] = [occ_res['avg_dam_density'], occ_res['avg_pred_cap']]
-        db.curs.execute('SELECT AVG(dam_density) AS avg_dam_density, AVG(predicted_capacity) AS avg_pred_cap FROM dam_counts WHERE predicted_capacity > 5 and predicted_capacity <= 15 and (dam_count > 0 or FCode in (46006, 55800))')
-        freq_res = db.curs.fetchone()
-        pred_obs['freq'] = [freq_res['avg_dam_density'], freq_res['avg_pred_cap']]
-        db.curs.execute('SELECT AVG(dam_density) AS avg_dam_density, AVG(predicted_capacity) AS avg_pred_cap FROM dam_counts WHERE predicted_capacity > 15 and (dam_count > 0 or FCode in (46006, 55800))')
-        perv_res = db.curs.fetchone()
-        pred_obs['perv'] = [perv_res['avg_dam_density'], perv_res['avg_pred_cap']]
+    for key, _label, _condition in CAPACITY_CLASSES:
+        class_stats = stats.get(key, {})
+        pred_obs[key] = [class_stats.get('avg_dam_density') or 0, class_stats.get('avg_pred_cap') or 0]
 
     pred = np.asarray([v[1] for v in pred_obs.values()])
     obs = np.asarray([v[0] for v in pred_obs.values()])
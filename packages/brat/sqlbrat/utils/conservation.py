@@ -7,8 +7,9 @@ import os
 import sys
 import traceback
 import argparse
+import numpy as np
 from rsxml import Logger, dotenv
-from rscommons.database import load_attributes, write_db_attributes, SQLiteCon
+from rscommons.database import write_db_attributes, SQLiteCon
 
 
 def conservation(database: str, max_da: float = None):
@@ -24,42 +25,226 @@ def conservation(database: str, max_da: float = None):
     write_db_attributes(database, results, ['OpportunityID', 'LimitationID', 'RiskID'])
 
 
+INPUT_FIELDS = ['ReachCode', 'oVC_HPE', 'oVC_EX', 'oCC_HPE', 'oCC_EX', 'iGeo_Slope', 'iPC_VLowLU', 'iPC_HighLU', 'iPC_LU', 'iPC_RoadX', 'iPC_RoadVB', 'iPC_RailVB', 'iHyd_SPLow', 'iHyd_SP2', 'iPC_Canal', 'Dam_Setting', 'iGeo_DA']
+
+# Inputs that are compared against category values rather than thresholds
+CATEGORY_FIELDS = ['ReachCode', 'Dam_Setting']
+
+
 def calculate_conservation(database: str, max_da: float = None):
     """ Perform conservation calculations
 
+    The decision rules are evaluated over whole columns (see classify_risks, classify_limitations
+    and classify_opportunities) rather than one reach at a time.
+
     Args:
         database (str): path to BRAT geopackage
 
     Returns:
-        dict: dictionary of conservation values keyed by Reach ID
+        dict: dictionary of conservation values (RiskID, LimitationID, OpportunityID) keyed by Reach ID
     """
 
     log = Logger('Conservation')
 
     # Verify all the input fields are present and load their values
-    reaches = load_attributes(database,
-                              ['ReachCode', 'oVC_HPE', 'oVC_EX', 'oCC_HPE', 'oCC_EX', 'iGeo_Slope', 'iPC_VLowLU', 'iPC_HighLU', 'iPC_LU', 'iPC_RoadX', 'iPC_RoadVB', 'iPC_RailVB', 'iHyd_SPLow', 'iHyd_SP2', 'iPC_Canal', 'Dam_Setting', 'iGeo_DA'],
-                              '(oCC_EX IS NOT NULL)')
+    reach_ids, inputs = load_conservation_inputs(database, '(oCC_EX IS NOT NULL)')
 
-    log.info(f'Calculating conservation for {len(reaches):,} reaches.')
+    log.info(f'Calculating conservation for {len(reach_ids):,} reaches.')
 
     risks = load_lookup(database, 'SELECT Name, RiskID AS ID FROM DamRisks')
     limitations = load_lookup(database, 'SELECT Name, LimitationID AS ID FROM DamLimitations')
     opportunties = load_lookup(database, 'SELECT Name, OpportunityID AS ID FROM DamOpportunities')
 
-    for values in reaches.values():
-
-        # Areas beavers can build dams, but could have undesireable impacts
-        values['RiskID'] = calc_risks(risks, values['oCC_EX'], values['iPC_LU'], values['iPC_Canal'], values['iPC_RoadX'], values['iPC_RoadVB'], values['iPC_RailVB'])
+    # Areas beavers can build dams, but could have undesireable impacts
+    risk_ids = classify_risks(risks, inputs['oCC_EX'], inputs['iPC_LU'], inputs['iPC_Canal'], inputs['iPC_RoadX'], inputs['iPC_RoadVB'], inputs['iPC_RailVB'])
 
-        # Areas beavers can't build dams and why
-        values['LimitationID'] = calc_limited(limitations, values['oVC_HPE'], values['oVC_EX'], values['oCC_EX'], values['iGeo_Slope'], values['iPC_LU'], values['iHyd_SPLow'], values['iHyd_SP2'], values['iGeo_DA'], max_da)
+    # Areas beavers can't build dams and why
+    limitation_ids = classify_limitations(limitations, inputs['oVC_HPE'], inputs['oVC_EX'], inputs['oCC_EX'], inputs['iGeo_Slope'], inputs['iPC_LU'], inputs['iHyd_SPLow'], inputs['iHyd_SP2'], inputs['iGeo_DA'], max_da)
 
-        # Conservation and restoration opportunties
-        values['OpportunityID'] = calc_opportunities(opportunties, risks, values['RiskID'], values['ReachCode'], values['oCC_EX'], values['oVC_EX'], values['iPC_VLowLU'], values['iPC_HighLU'], values['Dam_Setting'])
+    # Conservation and restoration opportunties
+    opportunity_ids = classify_opportunities(opportunties, risks, risk_ids, inputs['ReachCode'], inputs['oCC_EX'], inputs['oVC_EX'], inputs['iPC_VLowLU'], inputs['iPC_HighLU'], inputs['Dam_Setting'])
 
     log.info('Conservation calculation complete')
-    return reaches
+    return {
+        int(reach_id): {'RiskID': int(risk_id), 'LimitationID': int(limitation_id), 'OpportunityID': int(opportunity_id)}
+        for reach_id, risk_id, limitation_id, opportunity_id in zip(reach_ids, risk_ids, limitation_ids, opportunity_ids)
+    }
+
+
+def load_conservation_inputs(database: str, where_clause: str = None):
+    """ Load the conservation input fields as columns in a single query
+
+    Args:
+        database (str): path to BRAT geopackage
+        where_clause (str, optional): reach filter. Defaults to None.
+
+    Returns:
+        tuple: ReachID array and a dictionary of input columns. Numeric fields are float arrays with NaN for NULL,
+            the CATEGORY_FIELDS are object arrays.
+    """
+
+    with SQLiteCon(database) as db:
+        db.curs.execute(f'SELECT ReachID, {", ".join(INPUT_FIELDS)} FROM vwReaches' + (f' WHERE {where_clause}' if where_clause else ''))
+        rows = db.curs.fetchall()
+
+    reach_ids = np.array([row['ReachID'] for row in rows], dtype=np.int64)
+    inputs = {}
+    for field in INPUT_FIELDS:
+        values = [row[field] for row in rows]
+        if field in CATEGORY_FIELDS:
+            inputs[field] = np.array(values, dtype=object)
+        else:
+            inputs[field] = np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+    return reach_ids, inputs
+
+
+def _lookup_ids(lookup: dict, names: list, codes: np.ndarray) -> np.ndarray:
+    """Convert category codes (indexes into names) to database IDs. Only the names that are used must be in the lookup."""
+    ids = np.zeros(len(names), dtype=np.int64)
+    for code in np.unique(codes):
+        ids[code] = lookup[names[code]]
+    return ids[codes]
+
+
+def _column(values) -> np.ndarray:
+    """Numeric input as a float array with NaN for missing values (NaN never passes a threshold test)"""
+    values = np.asarray(values, dtype=object) if not isinstance(values, np.ndarray) else values
+    if values.dtype == object:
+        return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+    return values.astype(np.float64)
+
+
+def classify_risks(risks: dict, occ_ex, ipc_lu, ipc_canal, ipc_roadx, ipc_roadvb, ipc_railvb) -> np.ndarray:
+    """ Vectorized calc_risks. Every argument after the lookup is a column with one value per reach.
+
+    Returns:
+        np.ndarray: RiskID for every reach
+    """
+
+    names = ['Negligible Risk', 'Minor Risk', 'Some Risk', 'Considerable Risk']
+    negligible, minor, some, considerable = range(len(names))
+
+    occ_ex = _column(occ_ex)
+    ipc_lu = _column(ipc_lu)
+    ipc_canal = _column(ipc_canal)
+    # Distance to the closest infrastructure ignoring missing distances
+    conf_inputs = np.vstack([_column(ipc_roadx), _column(ipc_roadvb), _column(ipc_railvb)])
+    all_missing = np.all(np.isnan(conf_inputs), axis=0)
+    min_conf = np.full(occ_ex.shape, np.nan)
+    min_conf[~all_missing] = np.nanmin(conf_inputs[:, ~all_missing], axis=0)
+    has_inputs = ~np.isnan(min_conf) & ~np.isnan(ipc_lu)
+    frequent = occ_ex >= 5.0
+
+    codes = np.select([
+        ipc_canal <= 20,
+        ~has_inputs,
+        (min_conf <= 30) | (ipc_lu >= 66),
+        min_conf <= 100,
+        (min_conf <= 300) | (ipc_lu >= 33)
+    ], [
+        considerable,
+        negligible,
+        np.where(frequent, considerable, some),
+        np.where(frequent, some, minor),
+        minor
+    ], negligible)
+
+    return _lookup_ids(risks, names, codes)
+
+
+def classify_limitations(limitations: dict, ovc_hpe, ovc_ex, occ_ex, slope, landuse, splow, sp2, da, max_da: float) -> np.ndarray:
+    """ Vectorized calc_limited. Every argument after the lookup (except max_da) is a column with one value per reach.
+
+    Returns:
+        np.ndarray: LimitationID for every reach
+    """
+
+    names = ['Potential Reservoir or Land Use Change', 'Naturally Vegetation Limited', 'Stream Size Limited', 'Slope Limited',
+             'Stream Power Limited', 'Anthropogenically Limited', 'Other', 'Dam Building Possible']
+    reservoir, natural_veg, stream_size, slope_limited, stream_power, anthropogenic, other, possible = range(len(names))
+
+    ovc_hpe = _column(ovc_hpe)
+    ovc_ex = _column(ovc_ex)
+    occ_ex = _column(occ_ex)
+    da = _column(da)
+    landuse = _column(landuse)
+
+    if max_da is not None:
+        too_big = da > max_da
+        below_max_da = da < max_da
+    else:
+        too_big = np.zeros(occ_ex.shape, dtype=bool)
+        below_max_da = np.ones(occ_ex.shape, dtype=bool)
+
+    codes = np.select([
+        ovc_hpe <= 0,
+        too_big,
+        _column(slope) > 0.23,
+        (_column(splow) >= 190) | (_column(sp2) >= 2400),
+        occ_ex <= 0
+    ], [
+        np.where(ovc_ex > 0, reservoir, natural_veg),
+        stream_size,
+        slope_limited,
+        stream_power,
+        np.where(below_max_da & (landuse > 30), anthropogenic, other)
+    ], possible)
+
+    return _lookup_ids(limitations, names, codes)
+
+
+def classify_opportunities(opportunities: dict, risks: dict, risk_ids, reachcode, occ_ex, ovc_ex, ipc_vlowlu, ipc_highlu, dam_setting) -> np.ndarray:
+    """ Vectorized calc_opportunities. Every argument after the lookups is a column with one value per reach.
+
+    Returns:
+        np.ndarray: OpportunityID for every reach
+    """
+
+    names = ['Natural or Anthropogenic Limitations', 'Conservation/Appropriate for Translocation', 'Encourage Beaver Expansion/Colonization',
+             'Land Management Change', 'Conflict Management', 'Beaver Mimicry', 'Potential Floodplain/Side Channel Opportunities']
+    limitations, conservation, expansion, land_management, conflict, mimicry, floodplain = range(len(names))
+
+    reachcode = np.asarray(reachcode, dtype=object)
+    dam_setting = np.asarray(dam_setting, dtype=object)
+    occ_ex = _column(occ_ex)
+    ovc_ex = _column(ovc_ex)
+    ipc_vlowlu = _column(ipc_vlowlu)
+    ipc_highlu = _column(ipc_highlu)
+
+    complete = ~np.isnan(occ_ex) & ~np.isnan(ipc_vlowlu) & ~np.isnan(ipc_highlu) & np.array([code is not None for code in reachcode], dtype=bool)
+    perennial = complete & np.isin(reachcode, [46006, 55800])
+    intermittent = complete & np.isin(reachcode, [46003])
+    classic = np.isin(dam_setting, ['Classic', 'Steep'])
+    low_risk = np.isin(np.asarray(risk_ids), [risks['Negligible Risk'], risks['Minor Risk']])
+    very_low_lu = ipc_vlowlu > 90
+
+    # Perennial reaches in classic or steep settings with negligible or minor risk of conflict
+    low_risk_classic = np.select([
+        occ_ex > 10,
+        (occ_ex >= 5) & (occ_ex < 10)
+    ], [
+        np.where(very_low_lu, conservation, expansion),
+        np.where(very_low_lu, conservation, expansion)
+    ], np.where(very_low_lu, limitations, land_management))
+
+    # Perennial reaches in classic or steep settings with some or considerable risk of conflict
+    risky_classic = np.where(occ_ex > 5, conflict, np.where(ipc_highlu >= 50, limitations, mimicry))
+
+    # Perennial reaches in floodplain settings
+    floodplain_setting = np.where(low_risk & (ovc_ex >= 5) & ~(ipc_highlu > 25), floodplain, limitations)
+
+    codes = np.select([
+        perennial & classic,
+        perennial & (dam_setting == 'Floodplain'),
+        intermittent & classic & low_risk
+    ], [
+        np.where(low_risk, low_risk_classic, risky_classic),
+        floodplain_setting,
+        mimicry
+    ], limitations)
+
+    return _lookup_ids(opportunities, names, codes)
 
 
 def calc_risks(risks: dict, occ_ex: float, ipc_lu: float, ipc_canal: float, ipc_roadx: float, ipc_roadvb: float, ipc_railvb: float) -> int:
@@ -0,0 +1,63 @@
+""" Testing for the indexed dam to reach assignment
+
+"""
+import unittest
+import numpy as np
+from shapely.geometry import LineString, Point
+from sqlbrat.utils.capacity_validation import assign_dams_to_reaches
+
+MAX_DISTANCE = 30
+SNAP_DISTANCE = 0.1
+
+# FID -> reach. 10 and 11 meet at (200, 0), 12 runs parallel to 10 and 13 is a short tributary at the end of 11
+REACHES = {
+    10: LineString([(0, 0), (200, 0)]),
+    11: LineString([(200, 0), (400, 0)]),
+    12: LineString([(0, 20), (200, 20)]),
+    13: LineString([(400, 0), (400, 50)]),
+}
+
+
+class AssignDamsTest(unittest.TestCase):
+    """Dams with known nearest reaches
+    """
+
+    def assign(self, dams, fids=None):
+        fids = fids or [12, 11, 10, 13]
+        return assign_dams_to_reaches(np.array(fids, dtype=np.int64), np.array([REACHES[fid] for fid in fids], dtype=object),
+                                      np.array([REACHES[fid].length for fid in fids], dtype=np.float64),
+                                      np.array([Point(*dam) for dam in dams], dtype=object), MAX_DISTANCE, SNAP_DISTANCE)
+
+    def test_nearest_reach(self):
+        self.assertDictEqual(self.assign([(100, 5), (300, 2), (100, 15), (100, 49)]), {10: 1, 11: 1, 12: 2})
+
+    def test_equidistant(self):
+        # Half way between two parallel reaches
+        self.assertDictEqual(self.assign([(100, 10)]), {10: 1})
+        # Closest to the node that two reaches share
+        self.assertDictEqual(self.assign([(200, -3)]), {10: 1})
+        # Equidistant from 11 and the short reach 13, which never gets dams
+        self.assertDictEqual(self.assign([(402, 0)]), {11: 1})
+
+    def test_reach_order(self):
+        dams = [(100, 10), (200, -3), (402, 0), (300, 2)]
+        expected = self.assign(dams)
+        for fids in [[10, 11, 12, 13], [13, 12, 11, 10], [11, 13, 10, 12]]:
+            self.assertDictEqual(self.assign(dams, fids), expected)
+
+    def test_outside_search_distance(self):
+        self.assertDictEqual(self.assign([(100, 51), (100, -40), (500, 0)]), {})
+        self.assertDictEqual(self.assign([(100, 51), (100, 5)]), {10: 1})
+
+    def test_short_reach(self):
+        # Only the short reach is close enough
+        self.assertDictEqual(self.assign([(401, 30)]), {})
+
+    def test_empty(self):
+        self.assertDictEqual(self.assign([]), {})
+        self.assertDictEqual(assign_dams_to_reaches(np.array([], dtype=np.int64), np.array([], dtype=object), np.array([]),
+                                                    np.array([Point(0, 0)], dtype=object), MAX_DISTANCE, SNAP_DISTANCE), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
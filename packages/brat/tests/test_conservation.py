@@ -0,0 +1,77 @@
+""" Testing for the vectorized conservation classifiers
+
+"""
+import unittest
+import numpy as np
+from sqlbrat.utils.conservation import calc_risks, calc_limited, calc_opportunities, classify_risks, classify_limitations, classify_opportunities
+
+RISKS = {'Negligible Risk': 1, 'Minor Risk': 2, 'Some Risk': 3, 'Considerable Risk': 4}
+LIMITATIONS = {'Potential Reservoir or Land Use Change': 1, 'Naturally Vegetation Limited': 2, 'Stream Size Limited': 3, 'Slope Limited': 4,
+               'Stream Power Limited': 5, 'Anthropogenically Limited': 6, 'Other': 7, 'Dam Building Possible': 8}
+OPPORTUNITIES = {'Natural or Anthropogenic Limitations': 1, 'Conservation/Appropriate for Translocation': 2, 'Encourage Beaver Expansion/Colonization': 3,
+                 'Land Management Change': 4, 'Conflict Management': 5, 'Beaver Mimicry': 6, 'Potential Floodplain/Side Channel Opportunities': 7}
+
+
+class ConservationTest(unittest.TestCase):
+    """Compare the column classifiers with the per-reach functions on a synthetic attribute table
+    """
+
+    def setUp(self):
+        super(ConservationTest, self).setUp()
+        rng = np.random.default_rng(42)
+        self.size = 5000
+
+        def column(values, null_fraction=0.1):
+            # Values drawn from the thresholds used by the rules (and either side of them) with some NULLs
+            return [None if rng.random() < null_fraction else float(val) for val in rng.choice(values, self.size)]
+
+        self.reaches = {
+            'oCC_EX': column([0, 0.5, 1, 4.9, 5, 7, 10, 12, 20], 0),
+            'oVC_EX': column([0, 1, 4.9, 5, 10]),
+            'oVC_HPE': column([-1, 0, 1, 5]),
+            'iPC_LU': column([0, 30, 31, 33, 50, 66, 70]),
+            'iPC_Canal': column([0, 20, 21, 500]),
+            'iPC_RoadX': column([0, 30, 31, 100, 101, 300, 301, 1000], 0.5),
+            'iPC_RoadVB': column([0, 30, 31, 100, 101, 300, 301, 1000], 0.5),
+            'iPC_RailVB': column([0, 30, 31, 100, 101, 300, 301, 1000], 0.5),
+            'iGeo_Slope': column([0.01, 0.23, 0.24]),
+            'iHyd_SPLow': column([100, 190, 200]),
+            'iHyd_SP2': column([1000, 2400, 3000]),
+            'iGeo_DA': column([10, 500, 1000, 5000]),
+            'iPC_VLowLU': column([0, 50, 90, 95]),
+            'iPC_HighLU': column([0, 25, 26, 50, 60]),
+            'ReachCode': [None if rng.random() < 0.05 else int(val) for val in rng.choice([46006, 55800, 46003, 33600], self.size)],
+            'Dam_Setting': [val if val != 'None' else None for val in rng.choice(['Classic', 'Steep', 'Floodplain', 'None'], self.size)]
+        }
+
+    def test_risks(self):
+        r = self.reaches
+        vectorized = classify_risks(RISKS, r['oCC_EX'], r['iPC_LU'], r['iPC_Canal'], r['iPC_RoadX'], r['iPC_RoadVB'], r['iPC_RailVB'])
+        expected = [calc_risks(RISKS, r['oCC_EX'][i], r['iPC_LU'][i], r['iPC_Canal'][i], r['iPC_RoadX'][i], r['iPC_RoadVB'][i], r['iPC_RailVB'][i]) for i in range(self.size)]
+        self.assertEqual(vectorized.tolist(), expected)
+
+    def test_limitations(self):
+        r = self.reaches
+        for max_da in [None, 1000]:
+            vectorized = classify_limitations(LIMITATIONS, r['oVC_HPE'], r['oVC_EX'], r['oCC_EX'], r['iGeo_Slope'], r['iPC_LU'], r['iHyd_SPLow'], r['iHyd_SP2'], r['iGeo_DA'], max_da)
+            expected = [calc_limited(LIMITATIONS, r['oVC_HPE'][i], r['oVC_EX'][i], r['oCC_EX'][i], r['iGeo_Slope'][i], r['iPC_LU'][i], r['iHyd_SPLow'][i],
+                                     r['iHyd_SP2'][i], r['iGeo_DA'][i], max_da) for i in range(self.size)]
+            self.assertEqual(vectorized.tolist(), expected)
+
+    def test_opportunities(self):
+        r = self.reaches
+        risk_ids = classify_risks(RISKS, r['oCC_EX'], r['iPC_LU'], r['iPC_Canal'], r['iPC_RoadX'], r['iPC_RoadVB'], r['iPC_RailVB'])
+        # The per-reach function can't compare a missing oVC_EX so only floodplain reaches with a value are compared
+        keep = [i for i in range(self.size) if r['oVC_EX'][i] is not None or r['Dam_Setting'][i] != 'Floodplain']
+        columns = {field: [values[i] for i in keep] for field, values in r.items()}
+        risk_ids = risk_ids[keep]
+
+        vectorized = classify_opportunities(OPPORTUNITIES, RISKS, risk_ids, columns['ReachCode'], columns['oCC_EX'], columns['oVC_EX'], columns['iPC_VLowLU'],
+                                            columns['iPC_HighLU'], columns['Dam_Setting'])
+        expected = [calc_opportunities(OPPORTUNITIES, RISKS, risk_ids[i], columns['ReachCode'][i], columns['oCC_EX'][i], columns['oVC_EX'][i], columns['iPC_VLowLU'][i],
+                                       columns['iPC_HighLU'][i], columns['Dam_Setting'][i]) for i in range(len(keep))]
+        self.assertEqual(vectorized.tolist(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""
+Per-label reductions of a raster over a label image (e.g. the rasterized channel units).
+
+Every statistic is calculated for all the labels in a single pass over the cells
+with bincount instead of one boolean scan of the whole raster for each label.
+"""
+from typing import Dict
+
+import numpy as np
+
+
+class LabelStats:
+    """Count, sum and maximum of the valid raster cells for every label
+
+    :param labels: integer label image. Cells with a label of 0 (or less) are ignored
+    :param values: raster values with the same shape. Masked and NaN cells are ignored
+    """
+
+    def __init__(self, labels: np.ndarray, values: np.ndarray):
+        labels = np.asarray(labels)
+        data = np.ma.getdata(values).astype(np.float64)
+        valid = (labels > 0) & ~np.ma.getmaskarray(values) & ~np.isnan(data)
+
+        lbl = labels[valid].astype(np.int64)
+        vals = data[valid]
+        size = int(lbl.max()) + 1 if len(lbl) > 0 else 1
+
+        self.counts = np.bincount(lbl, minlength=size)
+        self.sums = np.bincount(lbl, weights=vals, minlength=size)
+        self.maxes = np.full(size, -np.inf)
+        np.maximum.at(self.maxes, lbl, vals)
+
+    def _lookup(self, array: np.ndarray, label: int, default):
+        if label < 0 or label >= len(array) or self.counts[label] == 0:
+            return default
+        return array[label]
+
+    def count(self, label: int) -> int:
+        """Number of valid cells with this label"""
+        return int(self._lookup(self.counts, label, 0))
+
+    def sum(self, label: int) -> float:
+        """Sum of the valid cells with this label (0 if there are none)"""
+        return float(self._lookup(self.sums, label, 0.0))
+
+    def max(self, label: int) -> float:
+        """Maximum of the valid cells with this label (None if there are none)"""
+        value = self._lookup(self.maxes, label, None)
+        return float(value) if value is not None else None
+
+    def volume(self, label: int, cell_area: float) -> float:
+        """Sum of the valid cells with this label multiplied by the cell area (e.g. depth -> water volume)"""
+        return self.sum(label) * cell_area
+
+    def as_dict(self) -> Dict[int, dict]:
+        """label -> {'Count', 'Sum', 'Max'} for every label that has at least one valid cell"""
+        return {int(label): {'Count': self.count(label), 'Sum': self.sum(label), 'Max': self.max(label)}
+                for label in np.flatnonzero(self.counts)}
@@ -0,0 +1,68 @@
+"""
+Station profiles along many lines at once (cross sections, thalwegs).
+
+Stations for every line are generated as one array of (line, distance) pairs and
+interpolated with a single shapely call, so all the lines can then be sampled
+against a raster in one vectorized lookup and summarized per line with array reductions.
+"""
+from typing import Tuple
+
+import numpy as np
+import shapely
+
+
+class Profiles:
+    """
+    Regularly spaced stations along a list of lines. The stations of line i are
+    points[starts[i]:ends[i]] and always finish with the end point of the line.
+    :param lines: shapely LineStrings
+    :param interval: distance between stations
+    """
+
+    def __init__(self, lines, interval: float):
+        self.lines = np.asarray(lines, dtype=object)
+        self.lengths = shapely.length(self.lines) if len(self.lines) > 0 else np.empty(0)
+
+        # Same stations as np.arange(0, length, interval) followed by the line end point
+        counts = np.maximum(np.ceil(self.lengths / interval), 0).astype(np.int64) + 1
+        self.ends = np.cumsum(counts)
+        self.starts = self.ends - counts
+        self.line_index = np.repeat(np.arange(len(self.lines)), counts)
+
+        self.distances = (np.arange(len(self.line_index)) - self.starts[self.line_index]) * interval
+        self.distances[self.ends - 1] = self.lengths
+        self.points = shapely.line_interpolate_point(self.lines[self.line_index], self.distances)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def line_points(self, index: int) -> np.ndarray:
+        """Station points of one line"""
+        return self.points[self.starts[index]:self.ends[index]]
+
+    def sample(self, raster) -> np.ma.MaskedArray:
+        """Values of a champ_metrics Raster at every station, read in one lookup"""
+        return raster.lookupRasterValues(self.points)['values']
+
+    def split(self, values):
+        """Split station values into one array per line"""
+        return [values[start:end] for start, end in zip(self.starts, self.ends)]
+
+    def end_values(self, values: np.ma.MaskedArray) -> Tuple[np.ma.MaskedArray, np.ma.MaskedArray]:
+        """Values at the first and last station of every line"""
+        values = np.ma.asarray(values)
+        return values[self.starts], values[self.ends - 1]
+
+    def reduce_max(self, values, valid) -> np.ndarray:
+        """Maximum of the valid station values of every line (NaN where there are none)"""
+        filled = np.where(valid, values, -np.inf)
+        out = np.maximum.reduceat(filled, self.starts) if len(filled) > 0 else np.empty(0)
+        return np.where(np.isneginf(out), np.nan, out)
+
+    def reduce_mean(self, values, valid) -> np.ndarray:
+        """Mean of the valid station values of every line (NaN where there are none)"""
+        counts = np.bincount(self.line_index[valid], minlength=len(self.lines))
+        sums = np.bincount(self.line_index[valid], weights=np.asarray(values)[valid], minlength=len(self.lines))
+        out = np.full(len(self.lines), np.nan)
+        np.divide(sums, counts, out=out, where=counts > 0)
+        return out
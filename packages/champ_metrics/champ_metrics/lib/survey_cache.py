@@ -0,0 +1,91 @@
+"""
+Process-wide cache of parsed topo survey data (rasters and TINs).
+
+Entries are keyed by the content of the survey files rather than their path so
+the same survey that appears in more than one project folder is only parsed once.
+Content hashes are themselves memoized on (path, size, mtime) so unchanged files
+are only read once per process.
+
+Cached objects are shared between callers and must be treated as read-only.
+"""
+import os
+import hashlib
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+
+from champ_metrics.lib.raster import Raster
+
+# Maximum number of parsed objects held in memory by each process
+CACHE_SIZE = int(os.environ.get('CHAMP_SURVEY_CACHE_SIZE', '12'))
+HASH_BLOCK_SIZE = 2 ** 20
+
+_hashes: Dict[Tuple[str, int, int], str] = {}
+_cache: OrderedDict = OrderedDict()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _file_hash(file_path: str) -> str:
+    stat = os.stat(file_path)
+    stat_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if stat_key not in _hashes:
+        sha = hashlib.sha1()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                sha.update(block)
+        _hashes[stat_key] = sha.hexdigest()
+    return _hashes[stat_key]
+
+
+def content_key(survey_path: str) -> str:
+    """Hash the content of a survey file, or of every file in a survey folder (e.g. an ADF TIN)"""
+    if os.path.isdir(survey_path):
+        sha = hashlib.sha1()
+        for name in sorted(os.listdir(survey_path)):
+            file_path = os.path.join(survey_path, name)
+            if os.path.isfile(file_path):
+                sha.update(name.encode('utf-8'))
+                sha.update(_file_hash(file_path).encode('utf-8'))
+        return sha.hexdigest()
+    return _file_hash(survey_path)
+
+
+def _get(kind: str, survey_path: str, loader: Callable):
+    # Missing files fall straight through to the loader so it can raise its usual exception
+    if not os.path.exists(survey_path):
+        return loader(survey_path)
+
+    key = (kind, content_key(survey_path))
+    if key in _cache:
+        _stats['hits'] += 1
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    _stats['misses'] += 1
+    value = loader(survey_path)
+    _cache[key] = value
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+    return value
+
+
+def get_raster(raster_path: str) -> Raster:
+    """Load a survey raster, reusing the parsed Raster if identical content was already loaded"""
+    return _get('raster', raster_path, Raster)
+
+
+def get_tin(tin_path: str):
+    """Load an ADF TIN folder, reusing the parsed TIN if identical content was already loaded"""
+    # Imported here because most callers only ever need rasters
+    from champ_metrics.lib.tin import TIN
+    return _get('tin', tin_path, TIN)
+
+
+def cache_stats() -> Dict[str, int]:
+    """Hit and miss counts for this process"""
+    return dict(_stats, entries=len(_cache))
+
+
+def clear_cache():
+    """Drop every cached survey object"""
+    _cache.clear()
+    _hashes.clear()
@@ -1,9 +1,153 @@
 import struct
 import os
-from shapely.geometry import Point, Polygon, LineString
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+
+# Record layouts of the ESRI ADF TIN files. Everything is big endian except where noted
+NODE_XY_DTYPE = np.dtype([('x', '>f8'), ('y', '>f8')])
+NODE_Z_DTYPE = np.dtype('>f4')
+TRIANGLE_DTYPE = np.dtype(('>i4', 3))
+EDGE_VALUE_DTYPE = np.dtype([('corner1', '>i4'), ('corner2', '>i4'), ('type', '>i4'), ('unknown', '>i4')])
+HULL_DTYPE = np.dtype('>i4')
+NODE_INFO_DTYPE = np.dtype('>i2')
+NODE_TAG_DTYPE = np.dtype('<i4')
+HEADER_DTYPE = np.dtype([
+    ('number_total_points', '>i4'),
+    ('number_triangles', '>i4'),
+    ('number_indices', '>i4'),
+    ('number_breaking_edge_entries', '>i4'),
+    ('number_traingles_nomask', '>i4'),
+    ('number_regular_points', '>i4'),
+    ('number_super_points', '>i4'),
+    ('min_height', '>f4'),
+    ('max_height', '>f4'),
+    ('unknown_1', '>i4'),
+    ('extent_mix_x', '>f8'),
+    ('extent_mix_y', '>f8'),
+    ('extent_max_x', '>f8'),
+    ('extent_max_y', '>f8'),
+    ('unknown_2', '>f8'),
+    ('unknown_3', '>f8'),
+    ('unknown_4', '>i4'),
+    ('number_tags', '<i4'),
+    ('unknown_5', '>i4'),
+    ('unknown_6', '>i4')
+])
+
+# Edge type code used for hard breaklines in teval.adf
+HARD_EDGE = 4
+
+# Maximum number of (triangle, cell) candidate pairs tested at once when rasterizing
+RASTERIZE_CHUNK = 2 ** 22
+
+
+def read_adf_array(file_path, dtype):
+    """
+    Memory map a file of fixed size records as a NumPy array and copy it into memory in one read.
+    Any partial record at the end of the file is ignored.
+    :param file_path: ADF file
+    :param dtype: record dtype
+    :return: array of records (native byte order)
+    """
+    count = os.path.getsize(file_path) // dtype.itemsize
+    if count == 0:
+        return np.empty(0, dtype=dtype.newbyteorder('=') if dtype.fields is None else dtype)
+
+    mapped = np.memmap(file_path, dtype=dtype, mode='r', shape=(count,))
+    if dtype.fields is not None:
+        return np.array(mapped)
+    return np.array(mapped, dtype=mapped.dtype.newbyteorder('='))
+
+
+def rasterize_triangles(xy, z, triangles, geotransform, shape, nodata=-9999.0):
+    """
+    Linearly interpolate a triangulated surface onto a grid using barycentric coordinates.
+    Each triangle is only tested against the cell centres inside its bounding box and all the
+    (triangle, cell) pairs are evaluated as arrays.
+    :param xy: (n, 2) node coordinates
+    :param z: (n,) node elevations
+    :param triangles: (m, 3) zero based node indices of each triangle
+    :param geotransform: GDAL geotransform of the output grid (no rotation)
+    :param shape: (rows, cols) of the output grid
+    :param nodata: value of cells outside every triangle
+    :return: float32 array
+    """
+    rows, cols = shape
+    out = np.full(shape, nodata, dtype=np.float32)
+    if len(triangles) == 0:
+        return out
+
+    tx = xy[triangles, 0]
+    ty = xy[triangles, 1]
+    tz = z[triangles]
+
+    # Range of cell centres covered by each triangle's bounding box
+    col_a = (tx.min(axis=1) - geotransform[0]) / geotransform[1] - 0.5
+    col_b = (tx.max(axis=1) - geotransform[0]) / geotransform[1] - 0.5
+    row_a = (ty.min(axis=1) - geotransform[3]) / geotransform[5] - 0.5
+    row_b = (ty.max(axis=1) - geotransform[3]) / geotransform[5] - 0.5
+    col_min = np.clip(np.ceil(np.minimum(col_a, col_b)), 0, cols).astype(np.int64)
+    col_max = np.clip(np.floor(np.maximum(col_a, col_b)), -1, cols - 1).astype(np.int64)
+    row_min = np.clip(np.ceil(np.minimum(row_a, row_b)), 0, rows).astype(np.int64)
+    row_max = np.clip(np.floor(np.maximum(row_a, row_b)), -1, rows - 1).astype(np.int64)
+    n_cols = np.maximum(col_max - col_min + 1, 0)
+    n_cells = n_cols * np.maximum(row_max - row_min + 1, 0)
+
+    denom = (ty[:, 1] - ty[:, 2]) * (tx[:, 0] - tx[:, 2]) + (tx[:, 2] - tx[:, 1]) * (ty[:, 0] - ty[:, 2])
+    candidates = np.flatnonzero((n_cells > 0) & (denom != 0))
+    ends = np.cumsum(n_cells[candidates])
+    eps = 1e-9
+
+    start = 0
+    while start < len(candidates):
+        # Take as many triangles as fit in one chunk (at least one)
+        first_pairs = ends[start - 1] if start > 0 else 0
+        stop = max(start + 1, int(np.searchsorted(ends, first_pairs + RASTERIZE_CHUNK, side='right')))
+        tri = candidates[start:stop]
+        counts = n_cells[tri]
+
+        pair_tri = np.repeat(tri, counts)
+        offset = np.arange(len(pair_tri)) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_row = row_min[pair_tri] + offset // n_cols[pair_tri]
+        pair_col = col_min[pair_tri] + offset % n_cols[pair_tri]
+
+        px = geotransform[0] + (pair_col + 0.5) * geotransform[1]
+        py = geotransform[3] + (pair_row + 0.5) * geotransform[5]
+        x = tx[pair_tri]
+        y = ty[pair_tri]
+        d = denom[pair_tri]
+        w1 = ((y[:, 1] - y[:, 2]) * (px - x[:, 2]) + (x[:, 2] - x[:, 1]) * (py - y[:, 2])) / d
+        w2 = ((y[:, 2] - y[:, 0]) * (px - x[:, 2]) + (x[:, 0] - x[:, 2]) * (py - y[:, 2])) / d
+        w3 = 1.0 - w1 - w2
+
+        inside = (w1 >= -eps) & (w2 >= -eps) & (w3 >= -eps)
+        zt = tz[pair_tri[inside]]
+        out[pair_row[inside], pair_col[inside]] = w1[inside] * zt[:, 0] + w2[inside] * zt[:, 1] + w3[inside] * zt[:, 2]
+        start = stop
+
+    return out
+
+
+def boundary_edges(triangles):
+    """
+    Edges that belong to only one triangle (the outline of the triangulation and of any holes in it)
+    :param triangles: (m, 3) node indices
+    :return: (k, 2) node indices of each boundary edge, in the direction they occur in their triangle
+    """
+    if len(triangles) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    edges = np.concatenate([triangles[:, [0, 1]], triangles[:, [1, 2]], triangles[:, [2, 0]]])
+    _unique, inverse, counts = np.unique(np.sort(edges, axis=1), axis=0, return_inverse=True, return_counts=True)
+    return edges[counts[inverse.ravel()] == 1]
 
 
 class TIN(object):
+    """
+    ESRI ADF TIN loaded into arrays. Node numbers in the ADF files are one based so node N is
+    row N - 1 of the node arrays. The first number_super_points nodes are the super nodes.
+    """
 
     def __init__(self, tin_path):
         self.path = tin_path
@@ -31,185 +175,148 @@ class TIN(object):
 
         # Load TIN
         self.header_stats = self.load_header_stats()
-        self.nodes, self.supernodes = self.load_nodes(self.header_stats["number_super_points"])
-        self.raw_nodes = dict(self.nodes.items() + self.supernodes.items())
-        self.node_info = self.load_node_info() if self.tnodinfo else []
-        self.node_tags = self.load_node_tags() if self.tnval else []
-        self.triangle_indices, self.raw_indices = self.load_triangle_indices()
-        self.triangles = self.generate_triangles(self.raw_nodes, self.triangle_indices)
-        self.edges, self.edge_values = self.load_edges()
-        self.hull_index = self.load_hull()
-        self.hull_polygons = self.generate_hull_polygons(self.raw_nodes, self.hull_index)
-        self.tin_nodes = self.generate_tin_nodes()
-        self.breaklines = self.generate_breaklines()
+        self.xy, self.z = self.load_nodes()
+        self.super_point_count = min(self.header_stats["number_super_points"], len(self.z))
+        self.node_info = read_adf_array(self.tnodinfo, NODE_INFO_DTYPE) if self.tnodinfo else np.empty(0, dtype=np.int16)
+        self.node_tags = read_adf_array(self.tnval, NODE_TAG_DTYPE) if self.tnval else np.empty(0, dtype=np.int32)
+        self.triangle_nodes = self.load_triangle_indices()
+        self.triangle_edges = read_adf_array(self.tedg, TRIANGLE_DTYPE).astype(np.int64)
+        self.edge_values = read_adf_array(self.teval, EDGE_VALUE_DTYPE) if self.teval else np.empty(0, dtype=EDGE_VALUE_DTYPE)
+        self.hull_index = read_adf_array(self.thul, HULL_DTYPE).astype(np.int64)
+        self.hull_polygons = self.generate_hull_polygons()
 
         self.mask_header, self.mask = self.load_mask()
         self.mask_index_header, self.mask_index = self.load_mask_index()
         self.raw_proj = self.__load_projection() if self.prj else None
 
-    def load_nodes(self, numbersuperpoints=None):
-        coords = {}
-        supercoords = {}
-        with open(self.tnxy, 'rb') as f:
-            with open(self.tnz, 'rb') as fz:
-                i = 0
-                while True:
-                    chunkx = f.read(8)
-                    chunky = f.read(8)
-                    chunkz = fz.read(4)
-                    if any(c == '' for c in [chunkx, chunky, chunkz]):
-                        break
-                    else:
-                        i = i + 1
-                        if i <= numbersuperpoints:
-                            supercoords[i] = Point(struct.unpack('>d', chunkx)[0],
-                                              struct.unpack('>d', chunky)[0],
-                                              struct.unpack('>f', chunkz)[0])
-                        else:
-                            coords[i] = Point(struct.unpack('>d', chunkx)[0],
-                                              struct.unpack('>d', chunky)[0],
-                                              struct.unpack('>f', chunkz)[0])
-        return coords, supercoords
+    @property
+    def node_count(self):
+        return len(self.z)
+
+    @property
+    def xyz(self):
+        """(n, 3) coordinates of every node including the super nodes"""
+        return np.column_stack((self.xy, self.z))
+
+    def load_nodes(self):
+        """
+        Node coordinates from tnxy.adf and elevations from tnz.adf
+        :return: (n, 2) float64 XY and (n,) float64 Z
+        """
+        xy = read_adf_array(self.tnxy, NODE_XY_DTYPE)
+        z = read_adf_array(self.tnz, NODE_Z_DTYPE).astype(np.float64)
+        count = min(len(xy), len(z))
+        return np.column_stack((xy['x'][:count], xy['y'][:count])), z[:count]
 
     def load_triangle_indices(self):
-        indices = {}
-        raw_index = {}
-        with open(self.tnod, 'rb') as f:
-            i = 0
-            iraw = 0
-            while True:
-                chunk1 = f.read(4)
-                chunk2 = f.read(4)
-                chunk3 = f.read(4)
-                if any(c == '' for c in [chunk1, chunk2, chunk3]):
-                    break
-                else:
-                    i = i + 1
-                    indices[i] = (struct.unpack('>i', chunk1)[0],
-                                  struct.unpack('>i', chunk2)[0],
-                                  struct.unpack('>i', chunk3)[0])
-                iraw = iraw + 1
-                raw_index[iraw] = self.raw_nodes[struct.unpack('>i', chunk1)[0]]
-                iraw = iraw + 1
-                raw_index[iraw] = self.raw_nodes[struct.unpack('>i', chunk2)[0]]
-                iraw = iraw + 1
-                raw_index[iraw] = self.raw_nodes[struct.unpack('>i', chunk3)[0]]
-        return indices, raw_index
-
-    def load_edges(self):
-        edges = {}
-        with open(self.tedg, 'rb') as f:
-            i = 0
-            while True:
-                chunk1 = f.read(4)
-                chunk2 = f.read(4)
-                chunk3 = f.read(4)
-                if any(c == '' for c in [chunk1, chunk2, chunk3]):
-                    break
-                else:
-                    i = i + 1
-                    edges[i] = (struct.unpack('>i', chunk1)[0],
-                                struct.unpack('>i', chunk2)[0],
-                                struct.unpack('>i', chunk3)[0])
-        edge_values = {}
-        with open(self.teval, 'rb') as f:
-            i = 0
-            while True:
-                chunk1 = f.read(4)
-                chunk2 = f.read(4)
-                chunk3 = f.read(4)
-                chunk4 = f.read(4)
-                if any(c == '' for c in [chunk1, chunk2, chunk3, chunk4]):
-                    break
-                else:
-                    i = i + 1
-                    edge_values[i] = (struct.unpack('>i', chunk1)[0],
-                                      struct.unpack('>i', chunk2)[0],
-                                      struct.unpack('>i', chunk3)[0])
-                                      # struct.unpack('>i', chunk4)[0])
-        return edges, edge_values
-
-    def generate_triangles(self, nodes, indices):
-        triangles = {}
-        for tindex, nodeindices in indices.items():
-            if all(nodes[i].z > 0 for i in nodeindices):
-                triangles[tindex] = Polygon([(nodes[i].x, nodes[i].y) for i in nodeindices])
-        return triangles
-
-    def generate_hull_polygons(self, nodes, hull_indices):
-        hull_polygon_nodes = {}
+        """
+        Node indices of every triangle from tnod.adf
+        :return: (m, 3) zero based node indices
+        """
+        return read_adf_array(self.tnod, TRIANGLE_DTYPE).astype(np.int64) - 1
+
+    def valid_triangles(self):
+        """
+        Triangles whose nodes are all real survey nodes with a positive elevation
+        (i.e. not connected to a super node)
+        :return: boolean mask over triangle_nodes
+        """
+        if len(self.triangle_nodes) == 0:
+            return np.zeros(0, dtype=bool)
+        nodes = self.triangle_nodes
+        in_range = np.all((nodes >= 0) & (nodes < self.node_count), axis=1)
+        valid = np.zeros(len(nodes), dtype=bool)
+        safe = nodes[in_range]
+        valid[in_range] = np.all(self.z[safe] > 0, axis=1) & np.all(safe >= self.super_point_count, axis=1)
+        return valid
+
+    def triangle_polygons(self):
+        """
+        Shapely polygons of the valid triangles, created in one vectorized call
+        :return: triangle numbers (one based) and polygons
+        """
+        valid = np.flatnonzero(self.valid_triangles())
+        rings = self.xy[self.triangle_nodes[valid]]
+        return valid + 1, shapely.polygons(np.concatenate([rings, rings[:, :1]], axis=1))
+
+    def generate_hull_polygons(self):
+        """
+        Polygons of the TIN hull. thul.adf lists the super hull, then -1, then the node numbers
+        of each hull polygon separated by 0
+        :return: dictionary of polygons keyed by the order they appear in the file
+        """
         hull_polygons = {}
-        i = 0
-        hull_polygon_nodes[i] = []
-        for index in hull_indices[hull_indices.index(-1) + 1:]:  # Ignore Superhull
-            if index == 0:
-                i = i + 1
-                hull_polygon_nodes[i] = []
-            else:
-                hull_polygon_nodes[i].append(nodes[index])
-        for indexhull, hnodes in hull_polygon_nodes.items():
-            hull_polygons[indexhull] = Polygon([(n.x, n.y) for n in hnodes])
+        separators = np.flatnonzero(self.hull_index == -1)
+        if len(separators) == 0:
+            return hull_polygons
+
+        index = self.hull_index[separators[0] + 1:]  # Ignore Superhull
+        breaks = np.flatnonzero(index == 0)
+        for i, part in enumerate(np.split(index, breaks)):
+            part = part[part != 0]
+            if len(part) >= 3:
+                hull_polygons[i] = Polygon(self.xy[part - 1])
         return hull_polygons
 
-    def generate_breaklines(self):
-        segments = {}
-        for i, edge in self.edge_values.items():
-            segments[i] = {"geometry": LineString([(self.raw_indices[edge[0]].x, self.raw_indices[edge[0]].y, self.raw_indices[edge[0]].z),
-                                                   (self.raw_indices[edge[1]].x, self.raw_indices[edge[1]].y, self.raw_indices[edge[1]].z,)]),
-                           "linetype": "HARD" if edge[2] == 4 else "SOFT"}
-
-        # from shapely.ops import linemerge
-        #
-        # outsegs = {}
-        # i2 = 0
-        # for ltype in ['HARD', 'SOFT']:
-        #     i2 = i2 + 1
-        #     segs = [s['geometry'] for s in segments.values() if s['linetype'] == ltype]
-        #     for line in list(linemerge(segs)):
-        #         outsegs[i2] = {'geometry':line, 'linetype': ltype}
-
-        return segments
-
-    def generate_tin_nodes(self):
-        from shapely.prepared import prep
-        prep_hull = prep(self.hull_polygons[0])
-        return dict(filter(prep_hull.covers, list(self.nodes.values())))
+    def tin_nodes(self):
+        """
+        The regular (non super) nodes that are covered by the outer hull
+        :return: zero based node indices
+        """
+        regular = np.arange(self.super_point_count, self.node_count)
+        if 0 not in self.hull_polygons:
+            return regular
+        covered = shapely.covers(self.hull_polygons[0], shapely.points(self.xy[regular]))
+        return regular[covered]
+
+    def boundary(self):
+        """
+        Boundary edges of the valid triangles, extracted from the triangle arrays
+        :return: (k, 2, 3) start and end coordinates of each boundary edge
+        """
+        edges = boundary_edges(self.triangle_nodes[self.valid_triangles()])
+        return self.xyz[edges]
+
+    def breaklines(self):
+        """
+        Breakline segments from teval.adf. Each record refers to two triangle corners
+        (one based positions in the flattened tnod.adf node list)
+        :return: (k, 2, 3) start and end coordinates and (k,) boolean that is True for hard breaklines
+        """
+        if len(self.edge_values) == 0:
+            return np.empty((0, 2, 3)), np.empty(0, dtype=bool)
+
+        corners = self.triangle_nodes.ravel()
+        nodes = np.column_stack((corners[self.edge_values['corner1'] - 1], corners[self.edge_values['corner2'] - 1]))
+        return self.xyz[nodes], self.edge_values['type'] == HARD_EDGE
+
+    def to_raster(self, cell_size, nodata=-9999.0, bounds=None):
+        """
+        Interpolate the valid triangles onto a DEM grid
+        :param cell_size: cell width and height
+        :param nodata: value of cells outside the TIN
+        :param bounds: (minx, miny, maxx, maxy) of the grid. Defaults to the extent of the valid triangles
+        :return: float32 array and the GDAL geotransform of the grid
+        """
+        triangles = self.triangle_nodes[self.valid_triangles()]
+        if bounds is None:
+            if len(triangles) == 0:
+                raise Exception('The TIN has no valid triangles to rasterize')
+            used = self.xy[np.unique(triangles)]
+            bounds = (used[:, 0].min(), used[:, 1].min(), used[:, 0].max(), used[:, 1].max())
+
+        # Snap the grid to whole cells
+        left = float(np.floor(bounds[0] / cell_size) * cell_size)
+        top = float(np.ceil(bounds[3] / cell_size) * cell_size)
+        cols = int(np.ceil((bounds[2] - left) / cell_size))
+        rows = int(np.ceil((top - bounds[1]) / cell_size))
+        geotransform = (left, cell_size, 0.0, top, 0.0, -cell_size)
+
+        return rasterize_triangles(self.xy, self.z, triangles, geotransform, (rows, cols), nodata), geotransform
 
     def load_header_stats(self):
-        stats = {}
-        with open(self.tdenv, 'rb') as f:
-            stats["number_total_points"] = struct.unpack('>i', f.read(4))[0]
-            stats["number_triangles"] = struct.unpack('>i', f.read(4))[0]
-            stats["number_indices"] = struct.unpack('>i', f.read(4))[0]
-            stats["number_breaking_edge_entries"] = struct.unpack('>i', f.read(4))[0]
-            stats["number_traingles_nomask"] = struct.unpack('>i', f.read(4))[0]
-            stats["number_regular_points"] = struct.unpack('>i', f.read(4))[0]
-            stats["number_super_points"] = struct.unpack('>i', f.read(4))[0]
-            stats["min_height"] = struct.unpack('>f', f.read(4))[0]
-            stats["max_height"] = struct.unpack('>f', f.read(4))[0]
-            stats["unknown_1"] = struct.unpack('>i', f.read(4))[0]
-            stats["extent_mix_x"] = struct.unpack('>d', f.read(8))[0]
-            stats["extent_mix_y"] = struct.unpack('>d', f.read(8))[0]
-            stats["extent_max_x"] = struct.unpack('>d', f.read(8))[0]
-            stats["extent_max_y"] = struct.unpack('>d', f.read(8))[0]
-            stats["unknown_2"] = struct.unpack('>d', f.read(8))[0]
-            stats["unknown_3"] = struct.unpack('>d', f.read(8))[0]
-            stats["unknown_4"] = struct.unpack('>i', f.read(4))[0]
-            stats["number_tags"] = struct.unpack('<i', f.read(4))[0]
-            stats["unknown_5"] = struct.unpack('>i', f.read(4))[0]
-            stats["unknown_6"] = struct.unpack('>i', f.read(4))[0]
-        return stats
-
-    def load_hull(self):
-        hull_index = []
-        with open(self.thul, 'rb') as f:
-            while True:
-                chunk = f.read(4)
-                if chunk == "":
-                    break
-                else:
-                    hull_index.append(struct.unpack('>i', chunk)[0])
-        return hull_index
+        header = read_adf_array(self.tdenv, HEADER_DTYPE)[0]
+        return {name: header[name].item() for name in HEADER_DTYPE.names}
 
     def load_mask(self):
         mask = {}
@@ -225,34 +332,6 @@ class TIN(object):
 
         return mask_index_header, mask_index
 
-    def load_node_info(self):
-        node_info = []
-        with open(self.tnodinfo, 'rb') as f:
-            i = 0
-            while True:
-                chunk = f.read(2)
-                if chunk == "":
-                    break
-                else:
-                    i = i + 1
-                    node_info.append((i,
-                                      struct.unpack('>h', chunk)[0]))
-        return node_info
-
-    def load_node_tags(self):
-        node_tags = []
-        with open(self.tnval, 'rb') as f:
-            i = 0
-            while True:
-                chunk = f.read(4)
-                if chunk == "":
-                    break
-                else:
-                    i = i + 1
-                    node_tags.append((i,
-                                      struct.unpack('<i', chunk)[0]))
-        return node_tags
-
     def __load_projection(self):
         with open(self.prj, 'rt') as f:
             return f.readline()
@@ -268,14 +347,13 @@ class TIN(object):
         layer.CreateField(ogr.FieldDefn('id', ogr.OFTInteger))
         defn = layer.GetLayerDefn()
 
-        ## If there are multiple geometries, put the "for" loop here
-        for id, point in self.tin_nodes.items():
+        nodes = self.tin_nodes()
+        for id, wkb in zip(nodes + 1, shapely.to_wkb(shapely.points(self.xyz[nodes]))):
             # Create a new feature (attribute and geometry)
             feat = ogr.Feature(defn)
             feat.SetField('id', int(id))
 
-            # Make a geometry, from Shapely object
-            geom = ogr.CreateGeometryFromWkb(point.wkb)
+            geom = ogr.CreateGeometryFromWkb(wkb)
             feat.SetGeometry(geom)
 
             layer.CreateFeature(feat)
@@ -297,14 +375,13 @@ class TIN(object):
         layer.CreateField(ogr.FieldDefn('id', ogr.OFTInteger))
         defn = layer.GetLayerDefn()
 
-        ## If there are multiple geometries, put the "for" loop here
-        for id, poly in self.triangles.items():
+        ids, polys = self.triangle_polygons()
+        for id, wkb in zip(ids, shapely.to_wkb(polys)):
             # Create a new feature (attribute and geometry)
             feat = ogr.Feature(defn)
             feat.SetField('id', int(id))
 
-            # Make a geometry, from Shapely object
-            geom = ogr.CreateGeometryFromWkb(poly.wkb)
+            geom = ogr.CreateGeometryFromWkb(wkb)
             feat.SetGeometry(geom)
 
             layer.CreateFeature(feat)
@@ -355,15 +432,14 @@ class TIN(object):
 
         defn = layer.GetLayerDefn()
 
-        ## If there are multiple geometries, put the "for" loop here
-        for id, line in self.breaklines.items():
+        segments, hard = self.breaklines()
+        for id, (wkb, is_hard) in enumerate(zip(shapely.to_wkb(shapely.linestrings(segments)), hard), start=1):
             # Create a new feature (attribute and geometry)
             feat = ogr.Feature(defn)
-            feat.SetField('id', int(id))
-            feat.SetField('LineType', line['linetype'])
+            feat.SetField('id', id)
+            feat.SetField('LineType', 'HARD' if is_hard else 'SOFT')
 
-            # Make a geometry, from Shapely object
-            geom = ogr.CreateGeometryFromWkb(line['geometry'].wkb)
+            geom = ogr.CreateGeometryFromWkb(wkb)
             feat.SetGeometry(geom)
 
             layer.CreateFeature(feat)
@@ -372,6 +448,29 @@ class TIN(object):
         # Save and close everything
         ds = layer = feat = geom = None
 
+    def export_raster(self, outraster, cell_size, nodata=-9999.0):
+        """
+        Write the TIN surface to a GeoTiff DEM
+        :param outraster: output GeoTiff path
+        :param cell_size: cell width and height
+        :param nodata: value of cells outside the TIN
+        """
+        from osgeo import gdal
+
+        array, geotransform = self.to_raster(cell_size, nodata)
+
+        driver = gdal.GetDriverByName('GTiff')
+        ds = driver.Create(outraster, array.shape[1], array.shape[0], 1, gdal.GDT_Float32, ['COMPRESS=DEFLATE'])
+        ds.SetGeoTransform(geotransform)
+        if self.raw_proj:
+            ds.SetProjection(self.raw_proj)
+        band = ds.GetRasterBand(1)
+        band.SetNoDataValue(nodata)
+        band.WriteArray(array)
+        band.FlushCache()
+
+        # Save and close everything
+        ds = band = None
 
     @staticmethod
     def shp_header(f):
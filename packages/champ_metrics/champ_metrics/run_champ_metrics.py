@@ -15,12 +15,13 @@ from champ_metrics.topoauxmetrics.topoauxmetrics import visit_topo_aux_metrics
 initGDALOGRErrors()
 
 
-def run_champ_metrics(topo_project_xml_path: str, output_dir: str) -> None:
+def run_champ_metrics(topo_project_xml_path: str, output_dir: str) -> dict:
     """
     Run CHaMP topo, aux and topo+aux metrics for a given topo project
     :param topo_project: Path to the topo project.rs.xml file
     :param output_folder: Top level folder where results will be written.
         The code will create visit folder inside this.
+    :return: Dictionary of the topo, aux and topo+aux metrics keyed by engine
     """
 
     log = Logger('CHaMP Metrics')
@@ -46,10 +47,16 @@ def run_champ_metrics(topo_project_xml_path: str, output_dir: str) -> None:
     topo_metrics = visit_topo_metrics(visit_id, topo_project_xml_path, topo_metric_xml)
     aux_metrics = visit_aux_metrics(visit_id, visit_year, aux_data_folder, aux_metric_xml)
 
-    visit_topo_aux_metrics(visit_id, topo_metrics, aux_metrics, topo_aux_metric_xml)
+    topo_aux_metrics = visit_topo_aux_metrics(visit_id, topo_metrics, aux_metrics, topo_aux_metric_xml)
 
     log.info('CHaMP Metrics processing complete.')
 
+    return {
+        'Topo': topo_metrics,
+        'Aux': {key: val for key, val in aux_metrics.items() if key != 'AuxMeasurements'},
+        'TopoAux': topo_aux_metrics
+    }
+
 
 def load_visit_info(topo_project_xml_path: str) -> Tuple[str, str, int, int]:
     """
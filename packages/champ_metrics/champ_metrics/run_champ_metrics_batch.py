@@ -4,16 +4,20 @@ Philip Bailey
 9 Oct 2025
 """
 import argparse
+import csv
 import os
 import traceback
 import sys
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Tuple
 from rsxml import Logger, dotenv
 from champ_metrics.run_champ_metrics import run_champ_metrics
+from champ_metrics.lib.survey_cache import cache_stats
 from champ_metrics.scripts.load_project_guids_from_csv import load_project_guids_from_csv
 
 
-def champ_metrics_batch(csv_dir: str, projects_dir: str, output_dir: str):
+def champ_metrics_batch(csv_dir: str, projects_dir: str, output_dir: str, workers: int = None):
     """Process each of the different kind of metrics.
 
     Note that in both directry arguments are parent folders. The code will append
@@ -22,6 +26,7 @@ def champ_metrics_batch(csv_dir: str, projects_dir: str, output_dir: str):
     :param csv_dir: Directory containing CSV files with project GUIDs to process
     :param projects_dir: Local parent folder where the topo projects are already downloaded
     :param output_folder: Parent folder where output metric XML files will be saved
+    :param workers: Number of worker processes. Defaults to the CPU count. Use 1 to run in this process.
     """
 
     log = Logger('CHaMP Metrics Batch')
@@ -57,17 +62,75 @@ def champ_metrics_batch(csv_dir: str, projects_dir: str, output_dir: str):
 
     log.info(f'{len(visit_ids)} visit IDs retrieved from project.rs.xml files.')
 
-    for visit_id, project_xml in visit_ids.items():
-        log.info(f'Processing Visit ID {visit_id} with project file {project_xml}')
-        try:
-            run_champ_metrics(project_xml, output_dir)
-        except Exception as e:
-            log.error(f'Error processing Visit ID {visit_id}: {e}')
-            continue
+    # Each visit runs in its own worker process. Failures are caught inside the worker
+    # so one bad visit never takes down the rest of the batch.
+    results = {}
+    if workers == 1:
+        for visit_id, project_xml in visit_ids.items():
+            results[visit_id] = _process_visit(visit_id, project_xml, output_dir)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_process_visit, visit_id, project_xml, output_dir): visit_id for visit_id, project_xml in visit_ids.items()}
+            for future in as_completed(futures):
+                visit_id = futures[future]
+                try:
+                    results[visit_id] = future.result()
+                except Exception as e:
+                    # Only happens if the worker process itself dies
+                    results[visit_id] = (None, f'Worker failed: {e}')
+                    log.error(f'Error processing Visit ID {visit_id}: {e}')
+
+    failed = [visit_id for visit_id, (_metrics, error) in results.items() if error is not None]
+    metrics_csv = os.path.join(output_dir, 'champ_metrics.csv')
+    write_metrics_table(results, metrics_csv)
+    log.info(f'Consolidated metrics for {len(results) - len(failed)} visits written to {metrics_csv}')
+    if len(failed) > 0:
+        log.warning(f'{len(failed)} visits failed: {", ".join(str(v) for v in sorted(failed))}')
 
     log.info('Finished processing all visits.')
 
 
+def _process_visit(visit_id: int, project_xml: str, output_dir: str) -> Tuple[Dict, str]:
+    """Worker entry point. Returns the flattened metrics for the visit and an error message (None on success)"""
+
+    log = Logger('CHaMP Metrics Batch')
+    log.info(f'Processing Visit ID {visit_id} with project file {project_xml}')
+    try:
+        metrics = run_champ_metrics(project_xml, output_dir)
+        log.debug(f'Survey cache for process {os.getpid()}: {cache_stats()}')
+        return flatten_metrics(metrics), None
+    except Exception as e:
+        log.error(f'Error processing Visit ID {visit_id}: {e}')
+        return None, str(e)
+
+
+def flatten_metrics(metrics: dict, prefix: str = '') -> Dict[str, object]:
+    """Flatten the nested metric dictionaries into dotted column names.
+    Lists (such as the per channel unit metrics) are skipped because they don't fit one row per visit.
+    """
+    flat = {}
+    for key, value in metrics.items():
+        name = f'{prefix}.{key}' if prefix else str(key)
+        if isinstance(value, dict):
+            flat.update(flatten_metrics(value, name))
+        elif not isinstance(value, list):
+            flat[name] = value
+    return flat
+
+
+def write_metrics_table(results: Dict[int, Tuple[Dict, str]], csv_path: str) -> None:
+    """Write one row per visit with every metric produced across the batch as a column"""
+
+    columns = sorted({col for metrics, _error in results.values() if metrics is not None for col in metrics})
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['VisitID', 'Error'] + columns)
+        for visit_id in sorted(results):
+            metrics, error = results[visit_id]
+            metrics = metrics or {}
+            writer.writerow([visit_id, error] + [metrics.get(col) for col in columns])
+
+
 def main():
     """Parse CHaMP Metrics command line arguments and call the main processing function."""
 
@@ -75,6 +138,7 @@ def main():
     args.add_argument('csv_dir', help='Directory containing CSV files with project GUIDs to process', type=str)
     args.add_argument('topo_project_parent_dir', help='Local parent folder where the topo projects are already downloaded', type=str)
     args.add_argument('output_folder', help='Parent folder where output metric XML files will be saved', type=str)
+    args.add_argument('--workers', help='Number of visits to process in parallel. Defaults to the CPU count', type=int, default=None)
     args.add_argument('--verbose', help='Get more information in your logs.', action='store_true', default=False)
     args.add_argument('--debug', help='(optional) more output about thigs like memory usage. There is a performance cost', action='store_true', default=False)
     args = dotenv.parse_args_env(args)
@@ -83,7 +147,7 @@ def main():
     log.setup(logPath=os.path.join(args.output_folder, "champ_metrics.log"), verbose=args.verbose)
 
     try:
-        champ_metrics_batch(args.csv_dir, args.topo_project_parent_dir, args.output_folder)
+        champ_metrics_batch(args.csv_dir, args.topo_project_parent_dir, args.output_folder, args.workers)
     except Exception as ex:
         log.error(ex)
         traceback.print_exc(file=sys.stdout)
@@ -1,12 +1,14 @@
 import sys
 from os import path
 import numpy as np
-from shapely.geometry import Point
-from champ_metrics.lib.raster import Raster
+import shapely
+from champ_metrics.lib.survey_cache import get_raster
 from champ_metrics.lib.shapefileloader import Shapefile
 from champ_metrics.lib.exception import DataException
 from champ_metrics.lib.channelunits import dUnitDefs
 from champ_metrics.lib.channelunits import getCleanTierName
+from champ_metrics.lib.label_stats import LabelStats
+from champ_metrics.lib.profiles import Profiles
 from champ_metrics.lib.metrics import CHaMPMetric
 from champ_metrics.lib.exception import MissingException
 
@@ -105,7 +107,7 @@ class ChannelUnitMetrics(CHaMPMetric):
         thalwegLine = thalweg[0]['geometry']
 
         # Load the depth raster
-        depthRaster = Raster(rasDepth)
+        depthRaster = get_raster(rasDepth)
 
         # Load the channel unit polygons and calculate the total area
         # The channel units should be clipped to the wetted extent and so this
@@ -117,8 +119,16 @@ class ChannelUnitMetrics(CHaMPMetric):
         for aFeat in feats:
             dResultsChannelSummary['Main']['Area'] += aFeat['geometry'].area
 
+        # Depth statistics for every channel unit in one pass over the rasterized units
+        cuDepthStats = LabelStats(arrCU, depthRaster.array)
+        cellArea = depthRaster.cellWidth**2
+
+        # Intersect the thalweg with every channel unit up front so all the thalweg depths are sampled in one batch
+        cuThalwegs = [ChannelUnitMetrics.thalwegInUnit(thalwegLine, aFeat['geometry']) for aFeat in feats]
+        thalwegDepths, exitDepths = ChannelUnitMetrics.lookupThalwegDepths(cuThalwegs, depthRaster)
+
         # Loop over each channel unit and calculate topometrics
-        for aFeat in feats:
+        for cuIndex, aFeat in enumerate(feats):
             nCUNumber = int(aFeat['fields']['UnitNumber'])
 
             if nCUNumber not in dUnits:
@@ -142,15 +152,13 @@ class ChannelUnitMetrics(CHaMPMetric):
             unitMetrics['DepthAtThalwegExit'] = None
             unitMetrics['ThalwegIntersect'] = 0
 
-            # Get the depth raster for this unit as variable so we can check
-            # whether it is entirely masked below.
-            depArr = depthRaster.array[arrCU == nCUNumber]
-            if depArr.count() == 0:
+            # Units that are entirely masked in the depth raster have no depth or volume
+            if cuDepthStats.count(nCUNumber) == 0:
                 unitMetrics['MaxDepth'] = 0
                 unitMetrics['Volume'] = 0
             else:
-                unitMetrics['MaxDepth'] = np.max(depArr)
-                unitMetrics['Volume'] = np.sum(depthRaster.array[arrCU == nCUNumber]) * (depthRaster.cellWidth**2)
+                unitMetrics['MaxDepth'] = cuDepthStats.max(nCUNumber)
+                unitMetrics['Volume'] = cuDepthStats.volume(nCUNumber, cellArea)
 
             if nSegment != 1:
                 dSideChannelSummary = dResultsChannelSummary['SideChannelSummary']
@@ -182,23 +190,10 @@ class ChannelUnitMetrics(CHaMPMetric):
             else:
                 dResultsChannelSummary['ChannelUnitBreakdown']['Other'] += 1
 
-            if (thalwegLine.intersects(aFeat['geometry'])):
-                cuThalwegLine = thalwegLine.intersection(aFeat['geometry'])
-
-                exitPoint = None
-                if cuThalwegLine.geom_type == 'LineString':
-                    exitPoint = cuThalwegLine.coords[0]
-                elif cuThalwegLine.geom_type == 'MultiLineString':
-                    cuThalwegLine = cuThalwegLine.geoms[0]
-                    exitPoint = cuThalwegLine.coords[0]
-                else:
-                    raise DataException(f"Unexpected geometry type for cuThalwegLine: {cuThalwegLine.type}")
-
-                # Retrieve a list of points along the Thalweg in the channel unit
-                thalwegPoints = ChannelUnitMetrics.interpolatePointsAlongLine(cuThalwegLine, 0.13)
-                thalwegDepths = ChannelUnitMetrics.lookupRasterValuesAtPoints(thalwegPoints, depthRaster)
-                unitMetrics['MaxDepth'] = np.nanmax(thalwegDepths['values'])
-                unitMetrics['DepthAtThalwegExit'] = depthRaster.getPixelVal(exitPoint)
+            if cuThalwegs[cuIndex] is not None:
+                cuThalwegLine = cuThalwegs[cuIndex][0]
+                unitMetrics['MaxDepth'] = np.nanmax(thalwegDepths[cuIndex])
+                unitMetrics['DepthAtThalwegExit'] = exitDepths[cuIndex]
                 unitMetrics['ResidualDepth'] = unitMetrics['MaxDepth'] - unitMetrics['DepthAtThalwegExit']
                 unitMetrics['Length'] = cuThalwegLine.length
                 unitMetrics['ThalwegIntersect'] = 1
@@ -263,29 +258,48 @@ class ChannelUnitMetrics(CHaMPMetric):
                 tierMetrics['DepthAtThalwegExit'] = unitMetrics['DepthAtThalwegExit']
 
     @staticmethod
-    def interpolatePointsAlongLine(line, fStationInterval):
+    def thalwegInUnit(thalwegLine, unitGeom):
         """
-        Given a cross section (Linestring) and a spacing point return regularly spaced points
-        along that line
-        :param line:
-        :param fStationInterval:
-        :return:
+        The part of the thalweg inside a channel unit and the point where it exits the unit
+        :param thalwegLine: thalweg LineString
+        :param unitGeom: channel unit polygon
+        :return: (LineString, exit point coordinates) or None if the thalweg doesn't pass through the unit
         """
-        try:
-            points = [line.interpolate(currDist) for currDist in np.arange(0, line.length, fStationInterval)]
-        except TypeError as e:
-            raise DataException("Error interpolating thalweg in channel unit. Only linear types support this operation. Type of 'line' is '{}'".format(line.type))
-
-        # The line can be a single line if the thalweg passes through the CU once
-        # or multi part line if the thalweg passes through multiple times.
-        # So unify the return type as a list of lines.
-        if line.type == 'LineString':
-            line = [line]
-
-        # Add the endpoint if it doesn't already exist
-        if points[-1] != line[-1].coords[-1]:
-            points.append(Point(line[-1].coords[-1]))
-        return points
+        if not thalwegLine.intersects(unitGeom):
+            return None
+
+        cuThalwegLine = thalwegLine.intersection(unitGeom)
+        if cuThalwegLine.geom_type == 'MultiLineString':
+            cuThalwegLine = cuThalwegLine.geoms[0]
+        elif cuThalwegLine.geom_type != 'LineString':
+            raise DataException(f"Unexpected geometry type for cuThalwegLine: {cuThalwegLine.geom_type}")
+
+        return cuThalwegLine, cuThalwegLine.coords[0]
+
+    @staticmethod
+    def lookupThalwegDepths(cuThalwegs, depthRaster):
+        """
+        Sample the depth raster along the thalweg in every channel unit with a single raster lookup
+        :param cuThalwegs: list of thalwegInUnit results (None for units without thalweg)
+        :param depthRaster: Raster object
+        :return: list of masked depth arrays along the thalweg and list of depths at the thalweg exit (None for units without thalweg)
+        """
+        units = [idx for idx, cuThalweg in enumerate(cuThalwegs) if cuThalweg is not None]
+
+        # Points along the Thalweg in every channel unit followed by the exit point of each unit
+        profiles = Profiles([cuThalwegs[idx][0] for idx in units], 0.13)
+        exitPoints = shapely.points(np.array([cuThalwegs[idx][1][:2] for idx in units]).reshape(-1, 2))
+        values = ChannelUnitMetrics.lookupRasterValuesAtPoints(np.concatenate([profiles.points, exitPoints]), depthRaster)['values']
+        thalwegValues = profiles.split(values[:len(profiles.points)])
+        exitValues = values[len(profiles.points):].filled(np.nan)
+
+        thalwegDepths = [None] * len(cuThalwegs)
+        exitDepths = [None] * len(cuThalwegs)
+        for profileIdx, unitIdx in enumerate(units):
+            thalwegDepths[unitIdx] = thalwegValues[profileIdx]
+            exitDepths[unitIdx] = float(exitValues[profileIdx])
+
+        return thalwegDepths, exitDepths
 
     @staticmethod
     def lookupRasterValuesAtPoints(points, raster):
@@ -296,15 +310,7 @@ class ChannelUnitMetrics(CHaMPMetric):
         :param raster:
         :return:
         """
-        pointsdict = {"points": points, "values": []}
-
-        for pt in pointsdict['points']:
-            pointsdict['values'].append(raster.getPixelVal(pt.coords[0]))
-
-        # Mask out the np.nan values
-        pointsdict['values'] = np.ma.masked_invalid(pointsdict['values'])
-
-        return pointsdict
+        return raster.lookupRasterValues(points)
 
 
 if __name__ == "__main__":
@@ -1,15 +1,15 @@
 import sys
 import copy
 import numpy as np
-from shapely.errors import TopologicalError
-from shapely.geometry import MultiLineString
+import shapely
+from shapely.errors import GEOSException, TopologicalError
 
 from rsxml import Logger
 from champ_metrics.lib.shapefileloader import Shapefile
-from champ_metrics.lib.raster import Raster
+from champ_metrics.lib.survey_cache import get_raster
 from champ_metrics.lib.metrics import CHaMPMetric
 from champ_metrics.lib.exception import DataException
-from .thalweg import ThalwegMetrics
+from champ_metrics.lib.profiles import Profiles
 
 # There are various ways of summarizing the attributes of a dictionary:
 # best - this is a way of picking one of the other three methods.
@@ -107,13 +107,14 @@ class CrossSectionMetrics(CHaMPMetric):
 
             # Calculate the topometrics from scratch for a single cross section
             shpXS = Shapefile(crosssections)
-            demRaster = Raster(demPath)
+            demRaster = get_raster(demPath)
 
             if shpXS.loaded:
-                for aFeat in shpXS.featuresToShapely():
-                    # Calculate the topometrics for this cross section. They will be stored on the aFeat dict under key 'topometrics'
-                    calcXSMetrics(aFeat, polyRiverShape, demRaster, stationInterval)
+                xsFeatures = shpXS.featuresToShapely()
+                # Calculate the topometrics for all the cross sections at once. They will be stored on each feature dict under key 'topometrics'
+                calcXSMetricsBatch(xsFeatures, polyRiverShape, demRaster, stationInterval)
 
+                for aFeat in xsFeatures:
                     # Build the all features dictionary that would be expect had the topometrics already
                     # existed in the XS shapefile and simply got loaded. This is a combination of the new topometrics
                     # and also the existing fields on the XS ShapeFile.
@@ -170,114 +171,99 @@ class CrossSectionMetrics(CHaMPMetric):
         log.info("Cross Section Metrics Complete")
 
 
-def calcXSMetrics(xs, rivershapeWithDonuts, demRaster, fStationInterval):
+def calcXSMetricsBatch(xsList, rivershapeWithDonuts, demRaster, fStationInterval):
     """
-    Calculate topometrics for a list of cross sections
-    :param xs: The cross section to generate topometrics from
+    Calculate topometrics for a list of cross sections. The stations of every cross section
+    are interpolated together, the DEM is sampled once for all of them and the depths
+    are summarized per cross section with array reductions.
+    :param xsList: The cross sections (feature dicts with 'geometry' and 'fields') to generate topometrics from
     :param rivershapeWithDonuts: The original rivershape file with donuts
     :param dem: Raster object
     :param fStationInterval: some interval (float)
-    :return:
+    :return: list of dictionaries of the station points and their DEM values, one per cross section
     """
+    if len(xsList) == 0:
+        return []
 
-    regularPoints = ThalwegMetrics.interpolateRasterAlongLine(xs['geometry'], fStationInterval)
+    profiles = Profiles([xs['geometry'] for xs in xsList], fStationInterval)
     # Augment these points with values from the raster
-    ptsdict = demRaster.lookupRasterValues(regularPoints)
-
-    # Get the reference Elevation from the edges
-    refElev = getRefElev(ptsdict['values'])
-
-    xsmXSLength = xs['geometry'].length
-    xsmWetWidth = dryWidth(xs['geometry'], rivershapeWithDonuts)
-    xsmDryWidth = xsmXSLength - xsmWetWidth
-
-    if refElev == 0:
-        xs['fields']['isValid'] = False
-        xsmMaxDepth = None
-        xsmMeanDepth = None
-        xsmW2MxDepth = None
-        xsmW2AvDepth = None
-    else:
-        # The depth array must be calculated
-        deptharr = refElev - ptsdict['values']
-
-        xsmMaxDepth = maxDepth(deptharr)
-        xsmMeanDepth = meanDepth(deptharr)
-
-        xsmW2MxDepth = None
-        xsmW2AvDepth = None
-
-        if xsmWetWidth is not None and xsmMaxDepth is not None and xsmMaxDepth != 0:
-            xsmW2MxDepth = xsmWetWidth / xsmMaxDepth
-
-        if xsmWetWidth is not None and xsmMeanDepth is not None and xsmMeanDepth != 0:
-            xsmW2AvDepth = xsmWetWidth / xsmMeanDepth
-
-    # Make sure that everything has a value
-    xs['topometrics'] = {
-        "XSLength": metricSanitize(xsmXSLength),
-        "WetWidth": metricSanitize(xsmWetWidth),
-        "DryWidth": metricSanitize(xsmDryWidth),
-        "MaxDepth": metricSanitize(xsmMaxDepth),
-        "MeanDepth": metricSanitize(xsmMeanDepth),
-        "W2MxDepth": metricSanitize(xsmW2MxDepth),
-        "W2AvDepth": metricSanitize(xsmW2AvDepth),
-        "BFElev": metricSanitize(refElev),
-        "BFArea": None,
-        "HRadius": None,
-        "NumStat": None
-    }
+    values = profiles.sample(demRaster)
+
+    # Get the reference Elevation from the edges. Zero when either edge has no data
+    first, last = profiles.end_values(values)
+    edgeMissing = np.ma.getmaskarray(first) | np.ma.getmaskarray(last)
+    refElevs = np.where(edgeMissing, 0, (first.filled(0) + last.filled(0)) / 2)
+
+    # The depth arrays must be calculated. Depths are only summarized for cross sections with a reference elevation
+    valid = ~np.ma.getmaskarray(values)
+    depths = refElevs[profiles.line_index] - values.filled(np.nan)
+    maxDepths = profiles.reduce_max(depths, valid)
+    meanDepths = profiles.reduce_mean(depths, valid & (depths > 0))
+
+    wetWidths = dryWidths(profiles.lines, rivershapeWithDonuts)
+
+    results = []
+    for idx, xs in enumerate(xsList):
+        refElev = refElevs[idx]
+        xsmXSLength = profiles.lengths[idx]
+        xsmWetWidth = wetWidths[idx]
+        xsmDryWidth = xsmXSLength - xsmWetWidth
+
+        if refElev == 0:
+            xs['fields']['isValid'] = False
+            xsmMaxDepth = None
+            xsmMeanDepth = None
+            xsmW2MxDepth = None
+            xsmW2AvDepth = None
+        else:
+            xsmMaxDepth = maxDepths[idx]
+            xsmMeanDepth = None if np.isnan(meanDepths[idx]) else meanDepths[idx]
 
-    return ptsdict
+            xsmW2MxDepth = None
+            xsmW2AvDepth = None
 
+            if xsmWetWidth is not None and xsmMaxDepth is not None and xsmMaxDepth != 0:
+                xsmW2MxDepth = xsmWetWidth / xsmMaxDepth
 
-def maxDepth(arr):
-    """
-    Calculate the maximum   depth from a list of values
-    :param arr:
-    :return:
-    """
-    # Note we don't need to worry about negative depths because we're using max
-    # Also don't worry about np.nan because the metricSanitize catches things
-    return np.nanmax(arr)
+            if xsmWetWidth is not None and xsmMeanDepth is not None and xsmMeanDepth != 0:
+                xsmW2AvDepth = xsmWetWidth / xsmMeanDepth
 
+        # Make sure that everything has a value
+        xs['topometrics'] = {
+            "XSLength": metricSanitize(xsmXSLength),
+            "WetWidth": metricSanitize(xsmWetWidth),
+            "DryWidth": metricSanitize(xsmDryWidth),
+            "MaxDepth": metricSanitize(xsmMaxDepth),
+            "MeanDepth": metricSanitize(xsmMeanDepth),
+            "W2MxDepth": metricSanitize(xsmW2MxDepth),
+            "W2AvDepth": metricSanitize(xsmW2AvDepth),
+            "BFElev": metricSanitize(refElev),
+            "BFArea": None,
+            "HRadius": None,
+            "NumStat": None
+        }
 
-def meanDepth(deptharr):
-    """
-    Calculate the mean depth from a list of depths
-    :param deptharr:
-    :return:
-    """
-    fValue = np.average([x for x in deptharr if x > 0])
-    if np.isnan(fValue):
-        return None
+        results.append({"points": profiles.line_points(idx), "values": values[profiles.starts[idx]:profiles.ends[idx]]})
 
-    return fValue
+    return results
 
 
-def dryWidth(xs, rivershapeWithDonuts):
+def dryWidths(xsLines, rivershapeWithDonuts):
     """
-
-    :param xs: shapely cross section object
+    Length of every cross section inside the river shape
+    :param xsLines: shapely cross section lines
     :param rivershapeWithDonuts: Polygon with non-qualifying donuts retained
-    :return:
+    :return: array of lengths
     """
-    # Get all intersects of this crosssection with the rivershape
     log = Logger("dryWidth")
     try:
-        intersects = xs.intersection(rivershapeWithDonuts.buffer(0))  # KMW: buffer(0) clears up invalid geoms
-    except TopologicalError as e:
+        # KMW: buffer(0) clears up invalid geoms. Only done once for all the cross sections
+        rivershape = rivershapeWithDonuts.buffer(0)
+        return shapely.length(shapely.intersection(np.asarray(xsLines, dtype=object), rivershape))
+    except (TopologicalError, GEOSException) as e:
         log.error(e)
         raise DataException("Could not perform intersection on `rivershapeWithDonuts`. Look for small, invalid islands as a possible cause.")
 
-    # The intersect may be one object (LineString) or many. We have to handle both cases
-    if intersects.type == "LineString":
-        intersects = MultiLineString([intersects])
-    elif intersects.type == "Point":
-        return 0
-
-    return sum([intersect.length for intersect in intersects.geoms])
-
 
 def metricSanitize(metric):
     """
@@ -297,20 +283,6 @@ def metricSanitize(metric):
     return num
 
 
-def getRefElev(arr):
-    """
-    Take a masked array and return a reference depth
-    :param arr: Masked array
-    :return:
-    """
-    if isinstance(arr, np.ma.MaskedArray) and (arr.mask[0] or arr.mask[-1]):
-        fValue = 0
-    else:
-        fValue = np.average(arr[0] + arr[-1]) / 2
-
-    return fValue
-
-
 def populateChannelStatistics(dChannelMetrics, filteringName, metricName, featureList):
 
     if not filteringName in dChannelMetrics:
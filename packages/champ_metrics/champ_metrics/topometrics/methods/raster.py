@@ -2,7 +2,7 @@ import sys
 from os import path
 import numpy as np
 from rsxml import Logger
-from champ_metrics.lib.raster import Raster
+from champ_metrics.lib.survey_cache import get_raster
 
 
 def RasterMetrics(rpath):
@@ -14,7 +14,7 @@ def RasterMetrics(rpath):
     log.info(f'Calculating {path.splitext(path.basename(rpath))[0].replace("_", " ")} Raster Metrics')
 
     result = {'StDev': None}
-    theRaster = Raster(rpath)
+    theRaster = get_raster(rpath)
     result['StDev'] = np.std(theRaster.array)
 
     return result
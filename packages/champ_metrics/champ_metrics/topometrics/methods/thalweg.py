@@ -8,7 +8,8 @@ from rsxml import Logger
 from champ_metrics.lib.shapefileloader import Shapefile
 from champ_metrics.lib.exception import DataException, MissingException
 from champ_metrics.lib.metrics import CHaMPMetric
-from champ_metrics.lib.raster import Raster
+from champ_metrics.lib.survey_cache import get_raster
+from champ_metrics.lib.profiles import Profiles
 
 
 class ThalwegMetrics(CHaMPMetric):
@@ -59,14 +60,15 @@ class ThalwegMetrics(CHaMPMetric):
             raise DataException("Thalweg shapefile has no features")
 
         thalweg = sfile[0]['geometry']
-        depthRaster = Raster(sDepthRaster)
-        waterSurfaceRaster = Raster(sWaterSurfaceRaster)
+        depthRaster = get_raster(sDepthRaster)
+        waterSurfaceRaster = get_raster(sWaterSurfaceRaster)
         samplepts = ThalwegMetrics.interpolateRasterAlongLine(thalweg, fDist)
         results = ThalwegMetrics.lookupRasterValues(samplepts, depthRaster)['values']
 
-        # Get the elevation at the first (downstream) point on the Thalweg
-        dsElev = waterSurfaceRaster.getPixelVal(thalweg.coords[0])
-        usElev = waterSurfaceRaster.getPixelVal(thalweg.coords[-1])
+        # Get the elevation at the first (downstream) and last (upstream) points on the Thalweg in one lookup
+        endElevs = waterSurfaceRaster.lookupRasterValues([thalweg.coords[0], thalweg.coords[-1]])['values'].filled(np.nan)
+        dsElev = endElevs[0]
+        usElev = endElevs[1]
 
         if (np.isnan(dsElev)):
             raise DataException('nodata detected in the raster for downstream point on the thalweg')
@@ -110,11 +112,8 @@ class ThalwegMetrics(CHaMPMetric):
         :param fStationInterval:
         :return:
         """
-        points = [line.interpolate(currDist) for currDist in np.arange(0, line.length, fStationInterval)]
-        # Add the endpoint if it doesn't already exist
-        if points[-1] != line.coords[-1]:
-            points.append(Point(line.coords[-1]))
-        return points
+        # Stations every fStationInterval plus the end point, interpolated in one call
+        return list(Profiles([line], fStationInterval).line_points(0))
 
     @staticmethod
     def lookupRasterValues(points, raster):
@@ -125,15 +124,7 @@ class ThalwegMetrics(CHaMPMetric):
         :param raster:
         :return:
         """
-        pointsdict = {"points": points, "values": []}
-
-        for pt in pointsdict['points']:
-            pointsdict['values'].append(raster.getPixelVal(pt.coords[0]))
-
-        # Mask out the np.nan values
-        pointsdict['values'] = np.ma.masked_invalid(pointsdict['values'])
-
-        return pointsdict
+        return raster.lookupRasterValues(points)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,7 @@
 import os
 import sys
 import numpy as np
-from champ_metrics.lib.raster import Raster
+from champ_metrics.lib.survey_cache import get_raster
 from champ_metrics.lib.shapefileloader import Shapefile
 from champ_metrics.lib.metrics import CHaMPMetric
 from champ_metrics.lib.exception import MissingException
@@ -33,7 +33,7 @@ class WaterExtentMetrics(CHaMPMetric):
             raise MissingException("Missing depth raster")
 
         # Load the depth raster
-        depthRaster = Raster(rasDepth)
+        depthRaster = get_raster(rasDepth)
 
         # Load the water extent ShapeFile and sum the area of all features
         shpExtent = Shapefile(shpWaterExtent)
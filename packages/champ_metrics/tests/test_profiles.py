@@ -0,0 +1,45 @@
+""" Testing for the batched station profiles
+
+"""
+import unittest
+import numpy as np
+from shapely.geometry import LineString
+from champ_metrics.lib.profiles import Profiles
+
+
+class ProfilesTest(unittest.TestCase):
+    """Stations and per line reductions for a few cross sections sampled together
+    """
+
+    def setUp(self):
+        super(ProfilesTest, self).setUp()
+        self.profiles = Profiles([LineString([(0, 0), (2.5, 0)]), LineString([(0, 1), (0, 3)])], 1.0)
+
+    def test_stations(self):
+        # Every interval along the line followed by the line end point
+        np.testing.assert_array_equal(self.profiles.starts, [0, 4])
+        np.testing.assert_array_equal(self.profiles.ends, [4, 7])
+        np.testing.assert_allclose(self.profiles.distances, [0, 1, 2, 2.5, 0, 1, 2])
+        self.assertListEqual([(pt.x, pt.y) for pt in self.profiles.line_points(1)], [(0, 1), (0, 2), (0, 3)])
+
+    def test_all_masked_cross_section(self):
+        # The second cross section has no data at any station
+        values = np.ma.masked_array([1.0, 3.0, 2.0, 1.0, 0.0, 0.0, 0.0], mask=[False] * 4 + [True] * 3)
+        first, last = self.profiles.end_values(values)
+        self.assertListEqual(np.ma.getmaskarray(first).tolist(), [False, True])
+        self.assertListEqual(np.ma.getmaskarray(last).tolist(), [False, True])
+
+        valid = ~np.ma.getmaskarray(values)
+        depths = 3.0 - values.filled(np.nan)
+        max_depths = self.profiles.reduce_max(depths, valid)
+        mean_depths = self.profiles.reduce_mean(depths, valid & (depths > 0))
+
+        self.assertEqual(max_depths[0], 2.0)
+        self.assertAlmostEqual(mean_depths[0], 5.0 / 3)
+        # No valid stations gives NaN rather than an error or a misleading zero
+        self.assertTrue(np.isnan(max_depths[1]))
+        self.assertTrue(np.isnan(mean_depths[1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
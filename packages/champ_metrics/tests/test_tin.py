@@ -0,0 +1,85 @@
+""" Testing for the TIN loader and rasterizer with a small synthetic TIN
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from champ_metrics.lib.tin import HEADER_DTYPE, NODE_XY_DTYPE, NODE_Z_DTYPE, TRIANGLE_DTYPE, HULL_DTYPE, TIN, boundary_edges, rasterize_triangles
+
+NODATA = -9999.0
+
+
+def plane(x, y):
+    """Surface of the synthetic TIN. Linear interpolation reproduces it exactly"""
+    return 10.0 + x + 2.0 * y
+
+
+class TINTest(unittest.TestCase):
+    """A 4m square split into two triangles plus one super node
+    """
+
+    def setUp(self):
+        super(TINTest, self).setUp()
+        # Node 0 is the super node. Nodes 1-4 are the corners of the square
+        self.xy = np.array([[-100.0, -100.0], [0.0, 0.0], [4.0, 0.0], [4.0, 4.0], [0.0, 4.0]])
+        self.z = np.array([0.0] + [plane(x, y) for x, y in self.xy[1:]])
+        self.triangles = np.array([[1, 2, 3], [1, 3, 4]])
+
+        self.folder = tempfile.mkdtemp()
+        self.write_adf('tnxy.adf', np.array([tuple(pt) for pt in self.xy], dtype=NODE_XY_DTYPE))
+        self.write_adf('tnz.adf', self.z.astype(NODE_Z_DTYPE))
+        # One based node numbers. The first triangle touches the super node so it isn't part of the surface
+        self.write_adf('tnod.adf', np.array([[1, 2, 3]] + (self.triangles + 1).tolist(), dtype=TRIANGLE_DTYPE.base))
+        self.write_adf('tedg.adf', np.zeros((3, 3), dtype=TRIANGLE_DTYPE.base))
+        # Super hull, separator and then the one hull polygon
+        self.write_adf('thul.adf', np.array([1, -1, 2, 3, 4, 5], dtype=HULL_DTYPE))
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header['number_total_points'] = len(self.z)
+        header['number_triangles'] = 3
+        header['number_super_points'] = 1
+        self.write_adf('tdenv9.adf', header)
+        for name in ['tmsk.adf', 'tmsx.adf']:
+            self.write_adf(name, np.zeros(100, dtype=np.uint8))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+        super(TINTest, self).tearDown()
+
+    def write_adf(self, name, array):
+        with open(os.path.join(self.folder, name), 'wb') as file:
+            file.write(array.tobytes())
+
+    def test_rasterize_triangles(self):
+        # 1m cells covering the square and two columns to the east of it
+        geotransform = (0.0, 1.0, 0.0, 4.0, 0.0, -1.0)
+        out = rasterize_triangles(self.xy, self.z, self.triangles, geotransform, (4, 6), NODATA)
+
+        cols, rows = np.meshgrid(np.arange(4) + 0.5, 4.0 - (np.arange(4) + 0.5))
+        np.testing.assert_allclose(out[:, :4], plane(cols, rows), rtol=1e-6)
+        # Cells outside the hull are nodata
+        self.assertTrue(np.all(out[:, 4:] == NODATA))
+
+    def test_boundary_edges(self):
+        # The shared diagonal is not part of the outline
+        edges = {tuple(sorted(edge)) for edge in boundary_edges(self.triangles).tolist()}
+        self.assertSetEqual(edges, {(1, 2), (2, 3), (3, 4), (1, 4)})
+        self.assertEqual(boundary_edges(np.empty((0, 3), dtype=np.int64)).shape, (0, 2))
+
+    def test_tin(self):
+        tin = TIN(self.folder)
+        self.assertListEqual(tin.valid_triangles().tolist(), [False, True, True])
+        self.assertListEqual(tin.tin_nodes().tolist(), [1, 2, 3, 4])
+        self.assertEqual(len(tin.boundary()), 4)
+
+        array, geotransform = tin.to_raster(1.0, NODATA, bounds=(0.0, 0.0, 6.0, 4.0))
+        self.assertTupleEqual(geotransform, (0.0, 1.0, 0.0, 4.0, 0.0, -1.0))
+        self.assertTupleEqual(array.shape, (4, 6))
+        self.assertAlmostEqual(float(array[3, 0]), plane(0.5, 0.5), places=4)
+        self.assertAlmostEqual(float(array[0, 3]), plane(3.5, 3.5), places=4)
+        self.assertTrue(np.all(array[:, 4:] == NODATA))
+
+
+if __name__ == '__main__':
+    unittest.main()
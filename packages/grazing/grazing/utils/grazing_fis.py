@@ -1,180 +1,238 @@
 import rasterio
 import skfuzzy as fuzz
-import skfuzzy.control as ctrl
 import numpy as np
+from scipy.interpolate import RegularGridInterpolator
 
 from rsxml import Logger, ProgressBar
 
+# Input universes. Values outside these are clipped to the ends of the universe (the skfuzzy default).
+WATER_UNIVERSE = np.arange(0, 50000, 1)
+SLOPE_UNIVERSE = np.arange(0, 100, 1)
+VEG_UNIVERSE = np.arange(0, 4, 0.01)
+GRAZING_UNIVERSE = np.arange(0, 1, 0.01)
+
+WATER_TERMS = {
+    'close': fuzz.trapmf(WATER_UNIVERSE, [0, 0, 100, 500]),
+    'moderately_far': fuzz.trapmf(WATER_UNIVERSE, [100, 500, 800, 2000]),
+    'too_far': fuzz.trapmf(WATER_UNIVERSE, [800, 2000, 50000, 50000]),
+}
+
+SLOPE_TERMS = {
+    'flat': fuzz.trapmf(SLOPE_UNIVERSE, [0, 0, 2, 3]),
+    'gentle': fuzz.trapmf(SLOPE_UNIVERSE, [2, 3, 11, 17]),
+    'too_steep': fuzz.trapmf(SLOPE_UNIVERSE, [11, 17, 100, 100]),
+}
+
+VEG_TERMS = {
+    'unsuitable': fuzz.trapmf(VEG_UNIVERSE, [0, 0, 0.5, 1]),
+    'barely_suitable': fuzz.trapmf(VEG_UNIVERSE, [0.5, 1, 1.5, 2]),
+    'moderately_suitable': fuzz.trapmf(VEG_UNIVERSE, [1.5, 2, 2.5, 3]),
+    'suitable': fuzz.trapmf(VEG_UNIVERSE, [2.5, 3, 3.5, 4]),
+    'preferred': fuzz.trimf(VEG_UNIVERSE, [3.5, 4, 4]),
+}
+
+GRAZING_TERMS = {
+    'none': fuzz.trimf(GRAZING_UNIVERSE, [0, 0, 0.0005]),
+    'low_prob_use': fuzz.trapmf(GRAZING_UNIVERSE, [0, 0.0005, 0.4, 0.5]),
+    'moderate_prob_use': fuzz.trapmf(GRAZING_UNIVERSE, [0.4, 0.5, 0.9, 0.95]),
+    'high_prob_use': fuzz.trapmf(GRAZING_UNIVERSE, [0.9, 0.95, 1, 1]),
+}
+
+# (vegetation, slope, water) -> grazing. None means the antecedent is not part of the rule.
+RULES = [
+    ('unsuitable', None, None, 'none'),
+    ('barely_suitable', 'flat', 'close', 'low_prob_use'),
+    ('barely_suitable', 'gentle', 'close', 'moderate_prob_use'),
+    ('moderately_suitable', 'flat', 'close', 'low_prob_use'),
+    ('suitable', 'flat', 'close', 'moderate_prob_use'),
+    ('preferred', 'flat', 'close', 'high_prob_use'),
+    ('barely_suitable', 'gentle', 'close', 'low_prob_use'),
+    ('moderately_suitable', 'gentle', 'close', 'low_prob_use'),
+    ('suitable', 'gentle', 'close', 'low_prob_use'),
+    ('preferred', 'gentle', 'close', 'moderate_prob_use'),
+    ('barely_suitable', 'too_steep', 'close', 'low_prob_use'),
+    ('moderately_suitable', 'too_steep', 'close', 'low_prob_use'),
+    ('suitable', 'too_steep', 'close', 'low_prob_use'),
+    ('preferred', 'too_steep', 'close', 'low_prob_use'),
+    ('barely_suitable', 'flat', 'moderately_far', 'low_prob_use'),
+    ('moderately_suitable', 'flat', 'moderately_far', 'low_prob_use'),
+    ('suitable', 'flat', 'moderately_far', 'low_prob_use'),
+    ('preferred', 'flat', 'moderately_far', 'moderate_prob_use'),
+    ('barely_suitable', 'gentle', 'moderately_far', 'none'),
+    ('moderately_suitable', 'gentle', 'moderately_far', 'low_prob_use'),
+    ('suitable', 'gentle', 'moderately_far', 'low_prob_use'),
+    ('preferred', 'gentle', 'moderately_far', 'low_prob_use'),
+    ('barely_suitable', 'too_steep', 'moderately_far', 'none'),
+    ('moderately_suitable', 'too_steep', 'moderately_far', 'none'),
+    ('suitable', 'too_steep', 'moderately_far', 'low_prob_use'),
+    ('preferred', 'too_steep', 'moderately_far', 'low_prob_use'),
+    ('barely_suitable', 'flat', 'too_far', 'none'),
+    ('moderately_suitable', 'flat', 'too_far', 'none'),
+    ('suitable', 'flat', 'too_far', 'low_prob_use'),
+    ('preferred', 'flat', 'too_far', 'moderate_prob_use'),
+    ('barely_suitable', 'gentle', 'too_far', 'none'),
+    ('moderately_suitable', 'gentle', 'too_far', 'none'),
+    ('suitable', 'gentle', 'too_far', 'none'),
+    ('preferred', 'gentle', 'too_far', 'low_prob_use'),
+    ('barely_suitable', 'too_steep', 'too_far', 'none'),
+    ('moderately_suitable', 'too_steep', 'too_far', 'none'),
+    ('suitable', 'too_steep', 'too_far', 'none'),
+    ('preferred', 'too_steep', 'too_far', 'low_prob_use'),
+]
+
+# Offsets (as a fraction of the ramp width) used to refine the lookup grid either side of every
+# membership function breakpoint. The centroid moves very quickly when an output term first switches on
+# so the surface needs nodes packed in tightly there for linear interpolation to follow it.
+BREAKPOINT_REFINEMENT = np.array([1e-4, 3e-4, 1e-3, 3e-3, 1e-2, 3e-2, 1e-1])
+
+
+def _lookup_axis(base: np.ndarray, breakpoints: list, ramp: float, universe: np.ndarray) -> np.ndarray:
+    """Lookup grid axis made from a base spacing plus refinement around each breakpoint, limited to the universe"""
+    refined = [base, universe[[0, -1]]]
+    for point in breakpoints:
+        refined.extend([point - BREAKPOINT_REFINEMENT * ramp, np.array([point]), point + BREAKPOINT_REFINEMENT * ramp])
+    axis = np.unique(np.concatenate(refined))
+    return np.unique(np.clip(axis, universe[0], universe[-1])).astype(np.float64)
+
+
+# Lookup grid axes. Dense where the membership functions change and a single node
+# across the ranges where every membership is constant so the surface is flat there.
+WATER_AXIS = _lookup_axis(np.arange(0, 2001, 20), [100, 500, 800, 2000], 400, WATER_UNIVERSE)
+SLOPE_AXIS = _lookup_axis(np.arange(0, 17.001, 0.5), [2, 3, 11, 17], 1, SLOPE_UNIVERSE)
+VEG_AXIS = _lookup_axis(np.arange(0, 4, 0.1), [0.5, 1, 1.5, 2, 2.5, 3, 3.5], 0.5, VEG_UNIVERSE)
+
+GRID_CHUNK_SIZE = 20000
+
+_lookup = None
+
+
+def evaluate_fis(water: np.ndarray, slope: np.ndarray, veg: np.ndarray) -> np.ndarray:
+    """Evaluate the grazing FIS for arrays of crisp inputs.
+
+    This is the Mamdani inference that skfuzzy's ControlSystemSimulation performs
+    (min for AND, max for aggregation, centroid defuzzification on the output universe
+    upsampled with the cut points), done with whole array operations instead of one
+    cell at a time.
+
+    Args:
+        water (np.ndarray): distance to water
+        slope (np.ndarray): slope (percent)
+        veg (np.ndarray): vegetation suitability (0-4)
+
+    Returns:
+        np.ndarray: grazing likelihood (0-1). Cells with no membership in any output term get 0.
+    """
+    water = np.clip(np.asarray(water, dtype=np.float64).ravel(), WATER_UNIVERSE[0], WATER_UNIVERSE[-1])
+    slope = np.clip(np.asarray(slope, dtype=np.float64).ravel(), SLOPE_UNIVERSE[0], SLOPE_UNIVERSE[-1])
+    veg = np.clip(np.asarray(veg, dtype=np.float64).ravel(), VEG_UNIVERSE[0], VEG_UNIVERSE[-1])
+
+    water_mem = {term: np.interp(water, WATER_UNIVERSE, mf) for term, mf in WATER_TERMS.items()}
+    slope_mem = {term: np.interp(slope, SLOPE_UNIVERSE, mf) for term, mf in SLOPE_TERMS.items()}
+    veg_mem = {term: np.interp(veg, VEG_UNIVERSE, mf) for term, mf in VEG_TERMS.items()}
+
+    # Rule activation, accumulated onto each output term
+    cuts = {term: np.zeros_like(water) for term in GRAZING_TERMS}
+    for veg_term, slope_term, water_term, out_term in RULES:
+        activation = veg_mem[veg_term]
+        if slope_term is not None:
+            activation = np.fmin(activation, slope_mem[slope_term])
+        if water_term is not None:
+            activation = np.fmin(activation, water_mem[water_term])
+        np.fmax(cuts[out_term], activation, out=cuts[out_term])
+
+    # Upsample the output universe with the points where each term's membership crosses its cut
+    u = GRAZING_UNIVERSE
+    extra_points = []
+    for term, mf in GRAZING_TERMS.items():
+        for i in np.where(mf[1:] != mf[:-1])[0]:
+            cut = cuts[term]
+            frac = (cut - mf[i]) / (mf[i + 1] - mf[i])
+            valid = (frac >= 0) & (frac <= 1)
+            extra_points.append(np.where(valid, u[i] + frac * (u[i + 1] - u[i]), u[0]))
+
+    x = np.concatenate([np.broadcast_to(u, (len(water), len(u)))] + [p[:, np.newaxis] for p in extra_points], axis=1)
+    x.sort(axis=1)
+
+    # Aggregated output membership at every point
+    mfx = np.zeros_like(x)
+    for term, mf in GRAZING_TERMS.items():
+        np.fmax(mfx, np.fmin(cuts[term][:, np.newaxis], np.interp(x, u, mf)), out=mfx)
+
+    # Exact centroid of the piecewise linear membership function
+    x1, x2 = x[:, :-1], x[:, 1:]
+    y1, y2 = mfx[:, :-1], mfx[:, 1:]
+    area = 0.5 * (x2 - x1) * (y1 + y2)
+    moment = (x2 - x1) * (x1 * (2 * y1 + y2) + x2 * (y1 + 2 * y2)) / 6.0
+    sum_area = area.sum(axis=1)
+    return np.where(sum_area > 0, moment.sum(axis=1) / np.fmax(sum_area, np.finfo(float).eps), 0.0)
+
+
+def grazing_lookup() -> RegularGridInterpolator:
+    """The FIS rule surface evaluated once over a dense (water, slope, veg) grid.
+    Built on first use and then reused for every block of every raster.
+    """
+    global _lookup
+
+    if _lookup is None:
+        log = Logger('Grazing Likelihood FIS')
+        log.info(f'Building FIS lookup grid ({len(WATER_AXIS)} x {len(SLOPE_AXIS)} x {len(VEG_AXIS)})')
+
+        water, slope, veg = (a.ravel() for a in np.meshgrid(WATER_AXIS, SLOPE_AXIS, VEG_AXIS, indexing='ij'))
+        values = np.empty(len(water), dtype=np.float64)
+        for start in range(0, len(water), GRID_CHUNK_SIZE):
+            end = start + GRID_CHUNK_SIZE
+            values[start:end] = evaluate_fis(water[start:end], slope[start:end], veg[start:end])
+
+        # Results equal to the centroid of the "none" output set are treated as no grazing
+        x_vals = np.arange(0, 1, 0.001)
+        mfx = fuzz.trimf(x_vals, [0, 0, 0.0005])
+        defuzz_centroid = round(fuzz.defuzz(x_vals, mfx, 'centroid'), 6)
+        values[values == defuzz_centroid] = 0
+
+        _lookup = RegularGridInterpolator((WATER_AXIS, SLOPE_AXIS, VEG_AXIS), values.reshape(len(WATER_AXIS), len(SLOPE_AXIS), len(VEG_AXIS)), method='linear')
+
+    return _lookup
+
 
 def calculate_grazing_fis(water_promixity: str, slope: str, vegetation_suitability: str, output_raster: str):
 
     log = Logger('Grazing Likelihood FIS')
+    lookup = grazing_lookup()
 
+    log.info('Applying FIS to input data')
     with rasterio.open(water_promixity) as water_src, \
         rasterio.open(slope) as slope_src, \
             rasterio.open(vegetation_suitability) as veg_src:
-        water_array = water_src.read(1)
-        slope_array = slope_src.read(1)
+
+        if water_src.shape != slope_src.shape or water_src.shape != veg_src.shape:
+            raise ValueError("All input rasters must have the same shape.")
+
         slope_nd = slope_src.nodata
         meta = slope_src.meta
-        veg_array = veg_src.read(1)
-
-        # mask out nodata values
-        mask = slope_array == slope_nd
-        water_array = np.ma.masked_where(mask, water_array)
-        slope_array = np.ma.masked_where(mask, slope_array)
-        veg_array = np.ma.masked_where(mask, veg_array)
-
-    if water_array.shape != slope_array.shape or water_array.shape != veg_array.shape:
-        raise ValueError("All input rasters must have the same shape.")
-
-    raster_stack = np.stack((water_array, slope_array, veg_array))
-
-    num_rasters, height, width = raster_stack.shape
-    pixel_data = raster_stack.reshape(num_rasters, -1)
-
-    # limit input values to ranges
-    water_array[water_array > 50000] = 50000
-    slope_array[slope_array > 100] = 100
-    veg_array[veg_array > 4] = 4
-
-    # antecedents and consequent
-    water_in = ctrl.Antecedent(np.arange(0, 50000, 1), 'water')
-    slope_in = ctrl.Antecedent(np.arange(0, 100, 1), 'slope')
-    veg_in = ctrl.Antecedent(np.arange(0, 4, 0.01), 'veg')
-    grazing_out = ctrl.Consequent(np.arange(0, 1, 0.01), 'grazing')
-
-    water_in['close'] = fuzz.trapmf(water_in.universe, [0, 0, 100, 500])
-    water_in['moderately_far'] = fuzz.trapmf(water_in.universe, [100, 500, 800, 2000])
-    water_in['too_far'] = fuzz.trapmf(water_in.universe, [800, 2000, 50000, 50000])
-
-    slope_in['flat'] = fuzz.trapmf(slope_in.universe, [0, 0, 2, 3])
-    slope_in['gentle'] = fuzz.trapmf(slope_in.universe, [2, 3, 11, 17])
-    slope_in['too_steep'] = fuzz.trapmf(slope_in.universe, [11, 17, 100, 100])
-
-    veg_in['unsuitable'] = fuzz.trapmf(veg_in.universe, [0, 0, 0.5, 1])
-    veg_in['barely_suitable'] = fuzz.trapmf(veg_in.universe, [0.5, 1, 1.5, 2])
-    veg_in['moderately_suitable'] = fuzz.trapmf(veg_in.universe, [1.5, 2, 2.5, 3])
-    veg_in['suitable'] = fuzz.trapmf(veg_in.universe, [2.5, 3, 3.5, 4])
-    veg_in['preferred'] = fuzz.trimf(veg_in.universe, [3.5, 4, 4])
-
-    grazing_out['none'] = fuzz.trimf(grazing_out.universe, [0, 0, 0.0005])
-    grazing_out['low_prob_use'] = fuzz.trapmf(grazing_out.universe, [0, 0.0005, 0.4, 0.5])
-    grazing_out['moderate_prob_use'] = fuzz.trapmf(grazing_out.universe, [0.4, 0.5, 0.9, 0.95])
-    grazing_out['high_prob_use'] = fuzz.trapmf(grazing_out.universe, [0.9, 0.95, 1, 1])
-
-    log.info('Building Rules for FIS')
-    grazing_ctrl = ctrl.ControlSystem([
-        ctrl.Rule(veg_in['unsuitable'], grazing_out['none']),
-        ctrl.Rule(veg_in['barely_suitable'] & slope_in['flat'] & water_in['close'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['barely_suitable'] & slope_in['gentle'] & water_in['close'], grazing_out['moderate_prob_use']),
-        ctrl.Rule(veg_in['moderately_suitable'] & slope_in['flat'] & water_in['close'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['suitable'] & slope_in['flat'] & water_in['close'], grazing_out['moderate_prob_use']),
-        ctrl.Rule(veg_in['preferred'] & slope_in['flat'] & water_in['close'], grazing_out['high_prob_use']),
-        ctrl.Rule(veg_in['barely_suitable'] & slope_in['gentle'] & water_in['close'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['moderately_suitable'] & slope_in['gentle'] & water_in['close'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['suitable'] & slope_in['gentle'] & water_in['close'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['preferred'] & slope_in['gentle'] & water_in['close'], grazing_out['moderate_prob_use']),
-        ctrl.Rule(veg_in['barely_suitable'] & slope_in['too_steep'] & water_in['close'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['moderately_suitable'] & slope_in['too_steep'] & water_in['close'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['suitable'] & slope_in['too_steep'] & water_in['close'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['preferred'] & slope_in['too_steep'] & water_in['close'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['barely_suitable'] & slope_in['flat'] & water_in['moderately_far'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['moderately_suitable'] & slope_in['flat'] & water_in['moderately_far'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['suitable'] & slope_in['flat'] & water_in['moderately_far'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['preferred'] & slope_in['flat'] & water_in['moderately_far'], grazing_out['moderate_prob_use']),
-        ctrl.Rule(veg_in['barely_suitable'] & slope_in['gentle'] & water_in['moderately_far'], grazing_out['none']),
-        ctrl.Rule(veg_in['moderately_suitable'] & slope_in['gentle'] & water_in['moderately_far'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['suitable'] & slope_in['gentle'] & water_in['moderately_far'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['preferred'] & slope_in['gentle'] & water_in['moderately_far'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['barely_suitable'] & slope_in['too_steep'] & water_in['moderately_far'], grazing_out['none']),
-        ctrl.Rule(veg_in['moderately_suitable'] & slope_in['too_steep'] & water_in['moderately_far'], grazing_out['none']),
-        ctrl.Rule(veg_in['suitable'] & slope_in['too_steep'] & water_in['moderately_far'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['preferred'] & slope_in['too_steep'] & water_in['moderately_far'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['barely_suitable'] & slope_in['flat'] & water_in['too_far'], grazing_out['none']),
-        ctrl.Rule(veg_in['moderately_suitable'] & slope_in['flat'] & water_in['too_far'], grazing_out['none']),
-        ctrl.Rule(veg_in['suitable'] & slope_in['flat'] & water_in['too_far'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['preferred'] & slope_in['flat'] & water_in['too_far'], grazing_out['moderate_prob_use']),
-        ctrl.Rule(veg_in['barely_suitable'] & slope_in['gentle'] & water_in['too_far'], grazing_out['none']),
-        ctrl.Rule(veg_in['moderately_suitable'] & slope_in['gentle'] & water_in['too_far'], grazing_out['none']),
-        ctrl.Rule(veg_in['suitable'] & slope_in['gentle'] & water_in['too_far'], grazing_out['none']),
-        ctrl.Rule(veg_in['preferred'] & slope_in['gentle'] & water_in['too_far'], grazing_out['low_prob_use']),
-        ctrl.Rule(veg_in['barely_suitable'] & slope_in['too_steep'] & water_in['too_far'], grazing_out['none']),
-        ctrl.Rule(veg_in['moderately_suitable'] & slope_in['too_steep'] & water_in['too_far'], grazing_out['none']),
-        ctrl.Rule(veg_in['suitable'] & slope_in['too_steep'] & water_in['too_far'], grazing_out['none']),
-        ctrl.Rule(veg_in['preferred'] & slope_in['too_steep'] & water_in['too_far'], grazing_out['low_prob_use'])
-    ])
-
-    grazing_fis = ctrl.ControlSystemSimulation(grazing_ctrl)
-
-    x_vals = np.arange(0, 1, 0.001)
-    mfx = fuzz.trimf(x_vals, [0, 0, 0.0005])
-    defuzz_centroid = round(fuzz.defuzz(x_vals, mfx, 'centroid'), 6)
-
-    results = np.full(pixel_data.shape[1], slope_nd)
-    progbar = ProgressBar(len(results), 50, "Calculating Grazing Likelihood")
-    counter = 0
-    for i in range(pixel_data.shape[1]):
-        counter += 1
-        progbar.update(counter)
-        water = pixel_data[0, i]
-        slope = pixel_data[1, i]
-        veg = pixel_data[2, i]
-
-        if slope == slope_nd:
-            continue
-
-        grazing_fis.input['water'] = water
-        grazing_fis.input['slope'] = slope
-        grazing_fis.input['veg'] = veg
-        grazing_fis.compute()
-        results[i] = grazing_fis.output['grazing']
-
-    results[results == defuzz_centroid] = 0
-    result_raster = results.reshape(height, width)
-
-    with rasterio.open(output_raster, 'w', **meta) as dst:
-        dst.write(result_raster.astype(meta['dtype']), 1)
-
-    # def apply_fis(water, slope, veg):
-    #     """
-    #     Apply the FIS to the input values.
-    #     """
-    #     grazing_fis.input['water'] = water
-    #     grazing_fis.input['slope'] = slope
-    #     grazing_fis.input['veg'] = veg
-    #     grazing_fis.compute()
-    #     return grazing_fis.output['grazing']
-
-    # vectorized_fis = np.vectorize(apply_fis)
-
-    # log.info('Applying FIS to input data')
-
-    # with rasterio.open(slope) as slope_src, rasterio.open(water_promixity) as water_src, \
-    #         rasterio.open(vegetation_suitability) as veg_src:
-    #     meta = slope_src.meta
-
-    #     with rasterio.open(output_raster, 'w', **meta) as dst:
-    #         progbar = ProgressBar(len(list(slope_src.block_windows(1))), 50, "Writing Grazing Likelihood Raster")
-    #         counter = 0
-    #         for ji, window in dst.block_windows(1):
-    #             progbar.update(counter)
-    #             counter += 1
-    #             # Read the data from the source raster
-    #             water_data = water_src.read(1, window=window, masked=True)
-    #             slope_data = slope_src.read(1, window=window, masked=True)
-    #             veg_data = veg_src.read(1, window=window, masked=True)
-
-    #             # Apply the translation function to the data
-    #             out_data = vectorized_fis(water_data, slope_data, veg_data)
-
-    #             # Write the output data to the destination raster
-    #             dst.write(out_data.astype(meta['dtype']), window=window, indexes=1)
-
-    #         progbar.finish()
-
-    # output_array = vectorized_fis(water_array, slope_array, veg_array)
-    # output_array[output_array == defuzz_centroid] = 0
-
-    # with rasterio.open(output_raster, 'w', **meta) as dst:
-    #     dst.write(output_array.astype(meta['dtype']), 1)
+
+        with rasterio.open(output_raster, 'w', **meta) as dst:
+            windows = [window for _ji, window in slope_src.block_windows(1)]
+            progbar = ProgressBar(len(windows), 50, "Calculating Grazing Likelihood")
+            for counter, window in enumerate(windows):
+                progbar.update(counter + 1)
+                slope_data = slope_src.read(1, window=window)
+                water_data = water_src.read(1, window=window)
+                veg_data = veg_src.read(1, window=window)
+
+                # Every cell is evaluated when the slope raster has no nodata value
+                if slope_nd is None:
+                    out_data = np.zeros(slope_data.shape, dtype=np.float64)
+                    valid = np.ones(slope_data.shape, dtype=bool)
+                else:
+                    out_data = np.full(slope_data.shape, slope_nd, dtype=np.float64)
+                    valid = ~np.isnan(slope_data) if np.isnan(slope_nd) else slope_data != slope_nd
+                if np.any(valid):
+                    points = np.column_stack((
+                        np.clip(water_data[valid], WATER_AXIS[0], WATER_AXIS[-1]),
+                        np.clip(slope_data[valid], SLOPE_AXIS[0], SLOPE_AXIS[-1]),
+                        np.clip(veg_data[valid], VEG_AXIS[0], VEG_AXIS[-1])
+                    ))
+                    out_data[valid] = lookup(points)
+
+                dst.write(out_data.astype(meta['dtype']), window=window, indexes=1)
+            progbar.finish()
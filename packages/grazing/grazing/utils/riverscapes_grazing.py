@@ -2,62 +2,103 @@ import os
 import sqlite3
 import rasterio
 import numpy as np
-import numpy.ma as ma
-from rasterio.mask import mask
+from rasterio.features import rasterize
+from rasterio.windows import bounds as window_bounds
+from shapely.geometry import box
+from shapely import STRtree
 
-from rsxml import Logger
+from rsxml import Logger, ProgressBar
 from rscommons import GeopackageLayer, VectorBase
 
 
+def dgo_zonal_means(likelihood: str, dgo_ids: list, dgo_geoms: list) -> dict:
+    """Average of the distinct raster values inside each DGO in a single windowed pass over the raster.
+
+    Each block of the raster is labelled with the DGOs that overlap it (cells are assigned to the
+    DGO containing their centre, the same as rasterio.mask; DGOs tile the valley bottom so they
+    are assumed not to overlap), and the distinct (DGO, value) pairs are
+    reduced with bincount rather than masking the raster once per DGO.
+
+    Args:
+        likelihood (str): raster path
+        dgo_ids (list): DGO IDs
+        dgo_geoms (list): Shapely geometries in the same order as dgo_ids
+
+    Returns:
+        dict: DGO ID -> mean of the distinct values in that DGO. DGOs without data are omitted.
+    """
+
+    tree = STRtree(dgo_geoms)
+    pairs = []
+
+    with rasterio.open(likelihood) as src:
+        windows = [window for _ji, window in src.block_windows(1)]
+        progbar = ProgressBar(len(windows), 50, "Summarizing grazing likelihood by DGO")
+        for counter, window in enumerate(windows):
+            progbar.update(counter + 1)
+            candidates = tree.query(box(*window_bounds(window, src.transform)))
+            if len(candidates) == 0:
+                continue
+
+            # Labels are offset by one so zero is "no DGO"
+            labels = rasterize(
+                ((dgo_geoms[idx], int(idx) + 1) for idx in candidates),
+                out_shape=(int(window.height), int(window.width)),
+                transform=src.window_transform(window),
+                fill=0,
+                dtype='int32'
+            )
+            data = src.read(1, window=window)
+            valid = labels > 0
+            if src.nodata is not None:
+                valid &= ~np.isclose(data, src.nodata)
+            if not np.any(valid):
+                continue
+            pairs.append(np.unique(np.column_stack((labels[valid].astype(np.float64), data[valid].astype(np.float64))), axis=0))
+        progbar.finish()
+
+    if len(pairs) == 0:
+        return {}
+
+    # DGOs that straddle blocks can contribute the same value more than once
+    pairs = np.unique(np.concatenate(pairs), axis=0)
+    labels = pairs[:, 0].astype(np.int64)
+    sums = np.bincount(labels, weights=pairs[:, 1], minlength=len(dgo_ids) + 1)
+    counts = np.bincount(labels, minlength=len(dgo_ids) + 1)
+
+    return {dgo_ids[label - 1]: float(sums[label] / counts[label]) for label in np.nonzero(counts)[0] if label > 0}
+
+
 def riverscape_grazing(likelihood: str, gpkg_path: str, windows: dict):
 
     log = Logger('Riverscapes Grazing')
 
     dgo = os.path.join(gpkg_path, 'grazing_dgos')
-    dgo_vals = {}
+    dgo_ids = []
+    dgo_geoms = []
     igo_vals = {}
 
     log.info('Calculating grazing probability in DGOs')
-    with GeopackageLayer(dgo) as dgo_lyr, rasterio.open(likelihood) as src:
-
-        for dgo_ftr, _counter, _progbar in dgo_lyr.iterate_features("Processing DGO features"):
-            dgoid = dgo_ftr.GetFID()
-            dgo_geom = dgo_ftr.GetGeometryRef()
-            centerline_len = dgo_ftr.GetField('centerline_length')
-            seg_dist = dgo_ftr.GetField('seg_distance')
-            if seg_dist is None:
+    with GeopackageLayer(dgo) as dgo_lyr:
+        for dgo_ftr, _counter, _progbar in dgo_lyr.iterate_features("Loading DGO features"):
+            if dgo_ftr.GetField('seg_distance') is None:
                 continue
+            dgo_ids.append(dgo_ftr.GetFID())
+            dgo_geoms.append(VectorBase.ogr2shapely(dgo_ftr.GetGeometryRef()))
 
-            try:
-                dgo_shap = VectorBase.ogr2shapely(dgo_geom)
-                raw_raster = mask(src, [dgo_shap], crop=True)[0]
-                mask_raster = np.ma.masked_values(raw_raster, src.nodata)
-
-                vals = []
-                for val in np.unique(mask_raster):
-                    if val == src.nodata:
-                        continue
-                    vals.append(val)
-
-                vals = [v for v in vals if not ma.is_masked(v)]
-                if len(vals) == 0:
-                    log.warning(f'No values found in DGO {dgoid}')
-                    continue
-
-                dgo_vals[dgoid] = np.mean(vals)
-            except Exception as e:
-                log.error(f'Error processing DGO {dgoid}: {e}')
-                continue
+    dgo_vals = dgo_zonal_means(likelihood, dgo_ids, dgo_geoms)
+    for dgoid in set(dgo_ids) - set(dgo_vals):
+        log.warning(f'No values found in DGO {dgoid}')
 
     with sqlite3.connect(gpkg_path) as conn:
         cursor = conn.cursor()
+        seg_areas = dict(cursor.execute("SELECT DGOID, segment_area FROM grazing_dgos").fetchall())
+
         for igo_id, dgo_ids in windows.items():
             dgovals = []
             for dgoid in dgo_ids:
                 if dgoid in dgo_vals:
-                    cursor.execute(f"SELECT segment_area FROM grazing_dgos WHERE DGOID = {dgoid}")
-                    seg_area = cursor.fetchone()
-                    dgovals.append([dgo_vals[dgoid], seg_area[0]])
+                    dgovals.append([dgo_vals[dgoid], seg_areas[dgoid]])
                 else:
                     log.warning(f'DGO {dgoid} not found in grazing probability calculation')
             if len(dgovals) == 0:
@@ -69,17 +110,11 @@ def riverscape_grazing(likelihood: str, gpkg_path: str, windows: dict):
             )
 
         log.info('Updating DGO Attributes')
-        for dgoid, val in dgo_vals.items():
-            cursor.execute(
-                f"UPDATE DGOAttributes SET grazing_likelihood = {val} WHERE DGOID = {dgoid}"
-            )
+        cursor.executemany("UPDATE DGOAttributes SET grazing_likelihood = ? WHERE DGOID = ?", [(val, dgoid) for dgoid, val in dgo_vals.items()])
         conn.commit()
 
         log.info('Updating IGO Attributes')
-        for igo_id, val in igo_vals.items():
-            cursor.execute(
-                f"UPDATE IGOAttributes SET grazing_likelihood = {val} WHERE IGOID = {igo_id}"
-            )
+        cursor.executemany("UPDATE IGOAttributes SET grazing_likelihood = ? WHERE IGOID = ?", [(val, igo_id) for igo_id, val in igo_vals.items()])
         conn.commit()
 
     log.info('Grazing probability calculation complete')
@@ -0,0 +1,113 @@
+""" Testing for the vectorized grazing FIS against skfuzzy's control system
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+import skfuzzy.control as ctrl
+
+from grazing.utils.grazing_fis import (WATER_UNIVERSE, SLOPE_UNIVERSE, VEG_UNIVERSE, GRAZING_UNIVERSE, WATER_TERMS, SLOPE_TERMS, VEG_TERMS,
+                                       GRAZING_TERMS, RULES, evaluate_fis, calculate_grazing_fis)
+
+# Input values either side of and between the membership function breakpoints
+WATER_VALUES = [0, 50, 300, 650, 1200, 3000, 60000]
+SLOPE_VALUES = [0, 2.5, 7, 14, 40, 120]
+VEG_VALUES = [0, 0.75, 1.25, 1.8, 2.2, 2.75, 3.25, 3.75, 3.99]
+
+
+def skfuzzy_simulation() -> ctrl.ControlSystemSimulation:
+    """The grazing FIS built with skfuzzy's control system, the way it was evaluated one cell at a time"""
+    water_in = ctrl.Antecedent(WATER_UNIVERSE, 'water')
+    slope_in = ctrl.Antecedent(SLOPE_UNIVERSE, 'slope')
+    veg_in = ctrl.Antecedent(VEG_UNIVERSE, 'veg')
+    grazing_out = ctrl.Consequent(GRAZING_UNIVERSE, 'grazing')
+    for variable, terms in [(water_in, WATER_TERMS), (slope_in, SLOPE_TERMS), (veg_in, VEG_TERMS), (grazing_out, GRAZING_TERMS)]:
+        for term, mf in terms.items():
+            variable[term] = mf
+
+    rules = []
+    for veg_term, slope_term, water_term, out_term in RULES:
+        antecedent = veg_in[veg_term]
+        if slope_term is not None:
+            antecedent = antecedent & slope_in[slope_term]
+        if water_term is not None:
+            antecedent = antecedent & water_in[water_term]
+        rules.append(ctrl.Rule(antecedent, grazing_out[out_term]))
+
+    return ctrl.ControlSystemSimulation(ctrl.ControlSystem(rules))
+
+
+class GrazingFISTest(unittest.TestCase):
+    """Compare the array evaluation with skfuzzy cell by cell
+    """
+
+    def test_matches_skfuzzy(self):
+        water, slope, veg = (a.ravel() for a in np.meshgrid(WATER_VALUES, SLOPE_VALUES, VEG_VALUES, indexing='ij'))
+        values = evaluate_fis(water, slope, veg)
+
+        simulation = skfuzzy_simulation()
+        expected = np.empty(len(water))
+        for i, (water_val, slope_val, veg_val) in enumerate(zip(water, slope, veg)):
+            # skfuzzy clips the inputs to the universes the same way
+            simulation.input['water'] = min(water_val, WATER_UNIVERSE[-1])
+            simulation.input['slope'] = min(slope_val, SLOPE_UNIVERSE[-1])
+            simulation.input['veg'] = min(veg_val, VEG_UNIVERSE[-1])
+            simulation.compute()
+            expected[i] = simulation.output['grazing']
+
+        np.testing.assert_allclose(values, expected, atol=1e-9)
+
+    def test_shape(self):
+        values = evaluate_fis(np.full((2, 3), 50.0), np.full((2, 3), 1.0), np.full((2, 3), 3.9))
+        self.assertTupleEqual(values.shape, (6,))
+        self.assertTrue(np.all(values > 0.5))
+
+
+class GrazingRasterTest(unittest.TestCase):
+    """Run the FIS over small rasters with and without a slope nodata value
+    """
+
+    def setUp(self):
+        super(GrazingRasterTest, self).setUp()
+        self.folder = tempfile.mkdtemp()
+        self.water = self.write_raster('water.tif', np.array([[50, 50], [3000, 3000]]), None)
+        self.veg = self.write_raster('veg.tif', np.array([[3.9, 0.2], [3.9, 0.2]]), None)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+        super(GrazingRasterTest, self).tearDown()
+
+    def write_raster(self, name, array, nodata):
+        path = os.path.join(self.folder, name)
+        with rasterio.open(path, 'w', driver='GTiff', height=2, width=2, count=1, dtype='float32', nodata=nodata,
+                           transform=from_origin(0, 2, 1, 1)) as dst:
+            dst.write(array.astype(np.float32), 1)
+        return path
+
+    def read_output(self, slope):
+        output = os.path.join(self.folder, 'grazing.tif')
+        calculate_grazing_fis(self.water, slope, self.veg, output)
+        with rasterio.open(output) as src:
+            return src.read(1)
+
+    def test_slope_nodata(self):
+        slope = self.write_raster('slope.tif', np.array([[1, -9999], [1, 1]]), -9999)
+        values = self.read_output(slope)
+        self.assertEqual(values[0, 1], -9999)
+        self.assertGreater(values[0, 0], 0.5)
+
+    def test_slope_without_nodata(self):
+        slope = self.write_raster('slope.tif', np.array([[1, 1], [1, 1]]), None)
+        values = self.read_output(slope)
+        self.assertFalse(np.any(np.isnan(values)))
+        self.assertGreater(values[0, 0], 0.5)
+        # Unsuitable vegetation is (close to) never grazed
+        self.assertLess(values[0, 1], 0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,261 @@
+"""
+      Name: LTPBR Explorer API Sources
+
+   Purpose: Where the LTPBR export gets its JSON from. HttpSource downloads the
+            endpoints from the LTPBR Explorer API (or any server with the same
+            /{endpoint}.json routes, e.g. a local test server) and FileSource reads
+            previously saved {endpoint}.json files. Both hand the records back one
+            at a time, parsed incrementally from disk, so the full JSON payload is
+            never held in memory.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List
+import json
+import os
+import shutil
+import tempfile
+
+import requests
+from rsxml import Logger
+
+LTPBR_EXPLORER_URL = 'https://bda-explorer.herokuapp.com'
+
+# Characters read from a JSON file at a time while parsing it
+READ_CHUNK_SIZE = 2 ** 16
+
+# Pages requested from one endpoint before giving up on reaching a short page
+MAX_PAGES = 10000
+
+
+class ApiSource:
+    """Base class for the LTPBR Explorer JSON sources
+
+    Subclasses implement fetch(), returning the local JSON files (one per page)
+    that hold the records of an endpoint.
+    """
+
+    def fetch(self, endpoint: str) -> List[str]:
+        """Local JSON files for an endpoint. Each file holds a JSON array of records."""
+        raise NotImplementedError
+
+    def fetch_all(self, endpoints: List[str], workers: int = 4) -> Dict[str, List[str]]:
+        """Fetch several endpoints concurrently
+
+        Args:
+            endpoints (List[str]): endpoint names (e.g. projects, organizations, states)
+            workers (int, optional): number of concurrent fetches. Defaults to 4.
+
+        Returns:
+            Dict[str, List[str]]: endpoint -> local JSON files
+        """
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(endpoints)))) as executor:
+            return dict(zip(endpoints, executor.map(self.fetch, endpoints)))
+
+    def records(self, endpoint: str, paths: List[str] = None) -> Iterator[dict]:
+        """Iterate over the records of an endpoint one at a time
+
+        Args:
+            endpoint (str): endpoint name
+            paths (List[str], optional): files already returned by fetch(). Defaults to fetching them now.
+        """
+        for path in paths if paths is not None else self.fetch(endpoint):
+            yield from iter_json_file(path)
+
+    def close(self) -> None:
+        """Release any resources held by the source"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, _value, _traceback):
+        self.close()
+
+
+class FileSource(ApiSource):
+    """Read saved {endpoint}.json files from a folder (e.g. a test fixture)
+
+    Args:
+        folder (str): folder containing one {endpoint}.json file per endpoint
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def fetch(self, endpoint: str) -> List[str]:
+        path = os.path.join(self.folder, f'{endpoint}.json')
+        if not os.path.isfile(path):
+            raise Exception(f'No JSON file for the {endpoint} endpoint at {path}')
+        return [path]
+
+
+class HttpSource(ApiSource):
+    """Download endpoints from the LTPBR Explorer API (or another server with the same routes)
+
+    Responses are streamed straight to files in the cache folder. The ETag and
+    Last-Modified headers of each response are kept alongside, so a later export
+    using the same cache folder sends conditional requests and reuses the cached
+    file when the server answers 304 Not Modified.
+
+    Args:
+        base_url (str, optional): server root. Defaults to LTPBR_EXPLORER_URL.
+        cache_folder (str, optional): where to keep downloaded files. Defaults to a temporary folder removed on close().
+        page_size (int, optional): request the records page by page (?page=1&per_page=page_size) until a short page
+            is returned, or a page starts with the same record as the one before it (the server ignores paging).
+            Defaults to None, meaning the whole endpoint in one request.
+        timeout (int, optional): request timeout in seconds. Defaults to 100.
+    """
+
+    def __init__(self, base_url: str = LTPBR_EXPLORER_URL, cache_folder: str = None, page_size: int = None, timeout: int = 100):
+        self.base_url = base_url.rstrip('/')
+        self.page_size = page_size
+        self.timeout = timeout
+        self.temp_folder = cache_folder is None
+        self.cache_folder = tempfile.mkdtemp(prefix='ltpbr_') if cache_folder is None else cache_folder
+        os.makedirs(self.cache_folder, exist_ok=True)
+        self.session = requests.Session()
+
+    def close(self) -> None:
+        self.session.close()
+        if self.temp_folder:
+            shutil.rmtree(self.cache_folder, ignore_errors=True)
+
+    def fetch(self, endpoint: str) -> List[str]:
+        if self.page_size is None:
+            return [self._download(f'{self.base_url}/{endpoint}.json', os.path.join(self.cache_folder, f'{endpoint}.json'))]
+
+        log = Logger('API Request')
+        paths = []
+        previous_first_id = None
+        for page in range(1, MAX_PAGES + 1):
+            url = f'{self.base_url}/{endpoint}.json?page={page}&per_page={self.page_size}'
+            path = self._download(url, os.path.join(self.cache_folder, f'{endpoint}_{page:05d}.json'))
+            count = 0
+            first_id = None
+            for record in iter_json_file(path):
+                if count == 0 and isinstance(record, dict):
+                    first_id = record.get('id')
+                count += 1
+
+            if page > 1 and first_id is not None and first_id == previous_first_id:
+                log.warning(f'Page {page} of {endpoint} repeats page {page - 1}. The server is ignoring the paging parameters.')
+                return paths
+
+            if count > 0:
+                paths.append(path)
+            if count < self.page_size:
+                return paths
+            previous_first_id = first_id
+
+        raise Exception(f'The {endpoint} endpoint returned more than {MAX_PAGES} full pages of {self.page_size} records')
+
+    def _download(self, url: str, path: str) -> str:
+        """Stream one response to a file, sending a conditional request when the file is already cached"""
+        log = Logger('API Request')
+        validators_path = f'{path}.headers'
+
+        headers = {}
+        validators = {}
+        if os.path.isfile(path) and os.path.isfile(validators_path):
+            with open(validators_path, 'r', encoding='utf8') as file:
+                validators = json.load(file)
+            if validators.get('ETag'):
+                headers['If-None-Match'] = validators['ETag']
+            if validators.get('Last-Modified'):
+                headers['If-Modified-Since'] = validators['Last-Modified']
+
+        # The validators are only written back once the file they describe is complete, so an
+        # interrupted download can never be mistaken for an up to date cached file
+        if os.path.isfile(validators_path):
+            os.remove(validators_path)
+
+        log.info(f'Retrieving data from {url}')
+        temp_path = None
+        try:
+            with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as response:
+                if response.status_code == 304:
+                    log.info(f'Not modified since the last export. Using cached {path}')
+                    validators = {key: response.headers.get(key) or validators.get(key) for key in ['ETag', 'Last-Modified']}
+                else:
+                    if response.status_code != 200:
+                        raise Exception(f'Status code {response.status_code} from {url}')
+
+                    # Download next to the cached file and swap it into place once it is complete
+                    handle, temp_path = tempfile.mkstemp(prefix=f'{os.path.basename(path)}.', suffix='.part', dir=os.path.dirname(path))
+                    with os.fdopen(handle, 'wb') as file:
+                        for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+                            file.write(chunk)
+                    os.replace(temp_path, path)
+                    temp_path = None
+                    validators = {key: response.headers.get(key) for key in ['ETag', 'Last-Modified']}
+
+            with open(validators_path, 'w', encoding='utf8') as file:
+                json.dump(validators, file)
+        except Exception as e:
+            raise Exception(f"An error occurred retrieving {url}: {e}") from e
+        finally:
+            if temp_path is not None and os.path.isfile(temp_path):
+                os.remove(temp_path)
+
+        return path
+
+
+def iter_json_file(path: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[dict]:
+    """Parse a file holding a JSON array and yield its items one at a time
+
+    Only the item being parsed (and one chunk of the file) is held in memory.
+
+    Args:
+        path (str): JSON file whose top level value is an array
+        chunk_size (int, optional): characters read at a time. Defaults to READ_CHUNK_SIZE.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf8') as file:
+        buffer = ''
+        pos = 0
+        eof = False
+        started = False
+
+        def fill(pos: int):
+            """Drop the parsed text and read another chunk. Returns the new position and whether the file is done"""
+            nonlocal buffer
+            chunk = file.read(chunk_size)
+            buffer = buffer[pos:] + chunk
+            return 0, len(chunk) == 0
+
+        while True:
+            # Skip whitespace and the separators between items
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ',' or (not started and buffer[pos] == '[')):
+                if buffer[pos] == '[':
+                    started = True
+                pos += 1
+
+            if pos >= len(buffer):
+                if eof:
+                    if started:
+                        raise ValueError(f'Unterminated JSON array in {path}')
+                    return
+                pos, eof = fill(pos)
+                continue
+
+            if not started:
+                raise ValueError(f'Expected a JSON array in {path}')
+
+            if buffer[pos] == ']':
+                return
+
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The item continues past the end of the buffer
+                if eof:
+                    raise
+                pos, eof = fill(pos)
+                continue
+
+            # A number at the very end of the buffer might continue in the next chunk
+            if end == len(buffer) and not eof:
+                pos, eof = fill(pos)
+                continue
+
+            yield item
+            pos = end
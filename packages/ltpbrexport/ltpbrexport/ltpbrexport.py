@@ -8,7 +8,7 @@
 
       Date: 27 Mar 2024
 """
-from typing import Dict
+from typing import Dict, Iterator, List, Tuple
 import argparse
 import os
 import sys
@@ -16,7 +16,6 @@ import traceback
 import json
 import sqlite3
 from datetime import datetime
-import requests
 from osgeo import ogr
 
 from rsxml.util import safe_makedirs, parse_metadata
@@ -37,8 +36,16 @@ from rsxml.project_xml import (
 )
 
 from ltpbrexport.__version__ import __version__
+from ltpbrexport.api_source import LTPBR_EXPLORER_URL, ApiSource, FileSource, HttpSource
 
-LTPBR_EXPLORER_URL = 'https://bda-explorer.herokuapp.com'
+# Project features written to the GeoPackage per transaction
+WRITE_BATCH_SIZE = 1000
+
+# Fields copied from the lookup endpoints into the GeoPackage tables of the same name
+LOOKUP_FIELDS = {
+    'organizations': ['id', 'name', 'description', 'contact', 'website', 'created_at', 'updated_at', 'url'],
+    'states': ['id', 'name', 'iso_code', 'created_at', 'updated_at', 'url']
+}
 
 
 initGDALOGRErrors()
@@ -62,7 +69,7 @@ project_fields = {
 }
 
 
-def ltpbr_export(project_folder: str, epsg=4326, meta: Dict[str, str] = None) -> None:
+def ltpbr_export(project_folder: str, epsg=4326, meta: Dict[str, str] = None, source: ApiSource = None) -> None:
     """
     Retrieve all projects from the LTPBR Explorer web site (https://bda-explorer.herokuapp.com/)
     and store them as a Riverscapes project
@@ -71,6 +78,7 @@ def ltpbr_export(project_folder: str, epsg=4326, meta: Dict[str, str] = None) ->
         project_folder (str): absolute path where the riverscapes project will get created
         epsg: Coordinate reference system for the incoming LTPBR Explorer project points
         meta (Dict[str, str], optional): metadata key-value pairs. Defaults to None.
+        source (ApiSource, optional): where to get the JSON from. Defaults to the live LTPBR Explorer API.
     """
 
     log = Logger('LTPBRExport')
@@ -84,80 +92,58 @@ def ltpbr_export(project_folder: str, epsg=4326, meta: Dict[str, str] = None) ->
     with RSGeopackageLayer(geopkg_path, layer_name='projects', delete_dataset=True) as out_lyr:
         out_lyr.create_layer(ogr.wkbPoint, epsg=epsg, fields=project_fields)
 
-    # Add the lookup tables for Organizations and US States
-    schema_path = os.path.join(os.path.dirname(__file__), 'database', 'ltpbr_export_schema.sql')
-    with open(schema_path, 'r', encoding='utf8') as file:
-        sql_statements = file.read()
-        with sqlite3.connect(geopkg_path) as conn:
-            conn.execute('PRAGMA foreign_keys = ON;')
-            curs = conn.cursor()
-            curs.executescript(sql_statements)
-
-            insert_lookup_data(curs, 'organizations', ['id', 'name', 'description', 'contact', 'website', 'created_at', 'updated_at', 'url'])
-            insert_lookup_data(curs, 'states', ['id', 'name', 'iso_code', 'created_at', 'updated_at', 'url'])
-            conn.commit()
-
-    # Create a new Geometry Collection of all the project points
-    geometry_collection = ogr.Geometry(ogr.wkbGeometryCollection)
-
-    # Retrieve the projects from the LTPBR Explorer API endpoint and write them to GeoPackage
-    projects = get_json_data('projects')
-    affiliations = []
-    with RSGeopackageLayer(geopkg_path, 'projects', write=True) as out_lyr:
-        layer_defn: ogr.FeatureDefn = out_lyr.ogr_layer.GetLayerDefn()
-        out_lyr.ogr_layer.StartTransaction()
-
-        for proj in projects:
-            out_ftr = ogr.Feature(layer_defn)
-            out_ftr.SetFID(proj['id'])
-            geom: ogr.Geometry = ogr.CreateGeometryFromWkt(proj['lonlat'])
-            out_ftr.SetGeometry(geom)
-            geometry_collection.AddGeometry(geom)
-
-            for field_name in project_fields:
-                if field_name in proj:
-                    field_index = layer_defn.GetFieldIndex(field_name)
-                    if field_index >= 0:
-                        out_ftr.SetField(field_name, proj[field_name])
-
-            out_lyr.ogr_layer.CreateFeature(out_ftr)
+    own_source = source is None
+    source = HttpSource() if own_source else source
+    try:
+        # Download all the endpoints at the same time. The records are then read back one at a time
+        endpoints = source.fetch_all(['projects'] + list(LOOKUP_FIELDS.keys()))
 
-            # Project organization affiliations
-            affiliations += [(proj['id'], org['id']) for org in proj['organizations']]
+        # Retrieve the projects from the LTPBR Explorer API endpoint and write them to GeoPackage
+        project_count, affiliations, bounds = write_projects(geopkg_path, source.records('projects', endpoints['projects']))
 
-        out_lyr.ogr_layer.CommitTransaction()
+        # Add the lookup tables for Organizations and US States, then the project affiliations, in one transaction
+        schema_path = os.path.join(os.path.dirname(__file__), 'database', 'ltpbr_export_schema.sql')
+        with open(schema_path, 'r', encoding='utf8') as file:
+            sql_statements = file.read()
+            with sqlite3.connect(geopkg_path) as conn:
+                conn.execute('PRAGMA foreign_keys = ON;')
+                curs = conn.cursor()
+                curs.executescript(sql_statements)
 
-    # Write the project affiliations to the database
-    with sqlite3.connect(geopkg_path) as conn:
-        conn.execute('PRAGMA foreign_keys = ON;')
-        curs = conn.cursor()
-        curs.executemany('INSERT INTO project_organizations (project_id, organization_id) VALUES (?, ?)', affiliations)
-        conn.commit()
+                for table, fields in LOOKUP_FIELDS.items():
+                    insert_lookup_data(curs, table, fields, source.records(table, endpoints[table]))
 
-    log.info(f'Exported {len(projects)} projects to {geopkg_path}')
+                # Write the project affiliations to the database
+                curs.executemany('INSERT INTO project_organizations (project_id, organization_id) VALUES (?, ?)', affiliations)
+                conn.commit()
+    finally:
+        if own_source:
+            source.close()
 
-    # Build a bounding box from the geometry collection
-    bounding_rect = geometry_collection.GetEnvelope()
-    centroid = geometry_collection.Centroid()
+    log.info(f'Exported {project_count} projects to {geopkg_path}')
 
-    # Create a polygon representing the bounding rectangle
-    ring = ogr.Geometry(ogr.wkbLinearRing)
-    ring.AddPoint_2D(bounding_rect[0], bounding_rect[2])  # Lower-left corner
-    ring.AddPoint_2D(bounding_rect[1], bounding_rect[2])  # Lower-right corner
-    ring.AddPoint_2D(bounding_rect[1], bounding_rect[3])  # Upper-right corner
-    ring.AddPoint_2D(bounding_rect[0], bounding_rect[3])  # Upper-left corner
-    ring.AddPoint_2D(bounding_rect[0], bounding_rect[2])  # Close the polygon
+    if project_count == 0:
+        raise Exception('No projects were retrieved from the LTPBR Explorer')
 
-    polygon = ogr.Geometry(ogr.wkbPolygon)
-    polygon.AddGeometry(ring)
+    # Build a bounding box from the project points
+    min_x, max_x, min_y, max_y, centroid_x, centroid_y = bounds
 
-    # Write the polygon to a GeoJSON text file
+    # Write the bounding rectangle polygon to a GeoJSON text file
     geojson_data = {
         "type": "FeatureCollection",
         "features": [{
             "type": "Feature",
             "properties": {},
-            "geometry": json.loads(polygon.ExportToJson())
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[
+                    [min_x, min_y],  # Lower-left corner
+                    [max_x, min_y],  # Lower-right corner
+                    [max_x, max_y],  # Upper-right corner
+                    [min_x, max_y],  # Upper-left corner
+                    [min_x, min_y]  # Close the polygon
+                ]]
+            }
         }]
     }
 
@@ -184,8 +170,8 @@ def ltpbr_export(project_folder: str, epsg=4326, meta: Dict[str, str] = None) ->
         citation=None,
         meta_data=meta_formated,
         bounds=ProjectBounds(
-            centroid=Coords(centroid.GetX(), centroid.GetY()),
-            bounding_box=BoundingBox(bounding_rect[0], bounding_rect[2], bounding_rect[1], bounding_rect[3]),
+            centroid=Coords(centroid_x, centroid_y),
+            bounding_box=BoundingBox(min_x, min_y, max_x, max_y),
             filepath=os.path.relpath(bounds_path, os.path.dirname(project_xml))
         ),
         realizations=[Realization(
@@ -212,61 +198,86 @@ def ltpbr_export(project_folder: str, epsg=4326, meta: Dict[str, str] = None) ->
     log.info('LTPBR Explorer Export complete')
 
 
-def insert_lookup_data(curs: sqlite3.Cursor, table: str, fields) -> None:
+def write_projects(geopkg_path: str, projects: Iterator[dict], batch_size: int = WRITE_BATCH_SIZE) -> Tuple[int, List[Tuple[int, int]], Tuple[float, ...]]:
     """
-    Retrieves JSON data for an individual database table and
-    inserts it into the GeoPackage.
+    Write the project points to the projects feature class as they are read,
+    committing a transaction every batch_size features.
 
     Args:
-        curs (sqlite3.Cursor): Open SQLite Cursor
-        table (str): Name of the API endpoint and also the GeoPackage database table
-        fields (_type_): List of fields to retrieve from the endpoint and insert into
-                the GeoPackage
+        geopkg_path (str): GeoPackage containing the projects feature class
+        projects (Iterator[dict]): project records from the API
+        batch_size (int, optional): features per transaction. Defaults to WRITE_BATCH_SIZE.
+
+    Returns:
+        Tuple[int, List[Tuple[int, int]], Tuple[float, ...]]: number of projects, (project id, organization id)
+            affiliations and the (min x, max x, min y, max y, centroid x, centroid y) of the project points
     """
 
-    data = get_json_data(table)
     count = 0
-    for json_obj in data:
-        insert_query = f"INSERT INTO {table} ({', '.join(fields)}) VALUES ({', '.join(['?'] * len(fields))})"
-        values = tuple(json_obj[field] for field in fields)
-        curs.execute(insert_query, values)
-        count += 1
+    affiliations = []
+    min_x = min_y = float('inf')
+    max_x = max_y = float('-inf')
+    sum_x = sum_y = 0.0
+    points = 0
 
-    log = Logger('Lookup Data')
-    log.info(f'Inserted {count} records into {table}')
+    with RSGeopackageLayer(geopkg_path, 'projects', write=True) as out_lyr:
+        layer_defn: ogr.FeatureDefn = out_lyr.ogr_layer.GetLayerDefn()
+        field_indexes = {field_name: layer_defn.GetFieldIndex(field_name) for field_name in project_fields}
+        out_lyr.ogr_layer.StartTransaction()
 
+        for proj in projects:
+            out_ftr = ogr.Feature(layer_defn)
+            out_ftr.SetFID(proj['id'])
+            geom: ogr.Geometry = ogr.CreateGeometryFromWkt(proj['lonlat'])
+            out_ftr.SetGeometry(geom)
 
-def get_json_data(endpoint: str) -> dict:
-    """Call the LTPBR Explorer API and retrieve JSON data from a single
-    endpoint.
+            # Keep a running bounding box and centroid instead of a collection of every point
+            if geom is not None and not geom.IsEmpty():
+                x, y = geom.GetX(), geom.GetY()
+                min_x, max_x = min(min_x, x), max(max_x, x)
+                min_y, max_y = min(min_y, y), max(max_y, y)
+                sum_x += x
+                sum_y += y
+                points += 1
 
-    Args:
-        endpoint (str): Name of the endpoint to call (e.g. projects, organizations, states)
+            for field_name, field_index in field_indexes.items():
+                if field_name in proj and field_index >= 0:
+                    out_ftr.SetField(field_name, proj[field_name])
 
-    Returns:
-        dict: the JSON data returned from the API converted to Python data structure
+            out_lyr.ogr_layer.CreateFeature(out_ftr)
+
+            # Project organization affiliations
+            affiliations += [(proj['id'], org['id']) for org in proj['organizations']]
+
+            count += 1
+            if count % batch_size == 0:
+                out_lyr.ogr_layer.CommitTransaction()
+                out_lyr.ogr_layer.StartTransaction()
+
+        out_lyr.ogr_layer.CommitTransaction()
+
+    centroid = (sum_x / points, sum_y / points) if points > 0 else (0.0, 0.0)
+    return count, affiliations, (min_x, max_x, min_y, max_y) + centroid
+
+
+def insert_lookup_data(curs: sqlite3.Cursor, table: str, fields, records: Iterator[dict]) -> None:
     """
+    Inserts the JSON records for an individual database table into the GeoPackage
+    with a single executemany, consuming the records as they are parsed.
 
-    log = Logger('API Request')
+    Args:
+        curs (sqlite3.Cursor): Open SQLite Cursor
+        table (str): Name of the API endpoint and also the GeoPackage database table
+        fields (_type_): List of fields to retrieve from the endpoint and insert into
+                the GeoPackage
+        records (Iterator[dict]): JSON records from the endpoint
+    """
 
-    try:
-        # Send a GET request to the specified URL
-        url = f'https://bda-explorer.herokuapp.com/{endpoint}.json'
-        log.info(f'Retrieving data from {url}')
-        response = requests.get(url, timeout=100)
-
-        # Check if the request was successful (status code 200)
-        if response.status_code == 200:
-            # Parse JSON response
-            json_data = response.json()
-            return json_data
-        else:
-            # Print an error message if the request was not successful
-            print("Error:", response.status_code)
-            raise Exception(f"An error occurred: {e}") from e
-    except Exception as e:
-        print("An error occurred:", e)
-        raise Exception(f"An error occurred: {e}") from e
+    insert_query = f"INSERT INTO {table} ({', '.join(fields)}) VALUES ({', '.join(['?'] * len(fields))})"
+    curs.executemany(insert_query, (tuple(json_obj[field] for field in fields) for json_obj in records))
+
+    log = Logger('Lookup Data')
+    log.info(f'Inserted {curs.rowcount} records into {table}')
 
 
 def main():
@@ -276,6 +287,10 @@ def main():
     parser.add_argument('output_dir', help='Folder where output VBET project will be created', type=str)
     parser.add_argument('--epsg', help='EPSG for output feature class', type=int, default=4326)
     parser.add_argument('--meta', help='riverscapes project metadata as comma separated key=value pairs', type=str)
+    parser.add_argument('--api_url', help='LTPBR Explorer API root URL', type=str, default=LTPBR_EXPLORER_URL)
+    parser.add_argument('--json_folder', help='(optional) read saved {endpoint}.json files from this folder instead of the API', type=str)
+    parser.add_argument('--cache_folder', help='(optional) keep API downloads here so later exports only download what changed', type=str)
+    parser.add_argument('--page_size', help='(optional) retrieve the API records in pages of this size', type=int)
     parser.add_argument('--verbose', help='(optional) a little extra logging ', action='store_true', default=False)
     parser.add_argument('--debug', help='Add debug tools for tracing things like memory usage at a performance cost.', action='store_true', default=False)
     args = dotenv.parse_args_env(parser)
@@ -289,21 +304,24 @@ def main():
     log.title('LTPBR Export')
 
     meta = parse_metadata(args.meta)
+    source = FileSource(args.json_folder) if args.json_folder else HttpSource(args.api_url, args.cache_folder, args.page_size)
 
     try:
         if args.debug is True:
             from rscommons.debug import ThreadRun
             memfile = os.path.join(args.output_dir, 'vbet_mem.log')
-            retcode, max_obj = ThreadRun(ltpbr_export, memfile, args.output_dir, meta=meta)
+            retcode, max_obj = ThreadRun(ltpbr_export, memfile, args.output_dir, meta=meta, source=source)
             log.debug(f'Return code: {retcode}, [Max process usage] {max_obj}')
 
         else:
-            ltpbr_export(args.output_dir, args.epsg, meta=meta)
+            ltpbr_export(args.output_dir, args.epsg, meta=meta, source=source)
 
     except Exception as e:
         log.error(e)
         traceback.print_exc(file=sys.stdout)
         sys.exit(1)
+    finally:
+        source.close()
 
     sys.exit(0)
 
@@ -0,0 +1,102 @@
+""" Testing for the LTPBR Explorer JSON sources against local fixtures
+
+"""
+import unittest
+import functools
+import json
+import os
+import shutil
+import tempfile
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from ltpbrexport.api_source import FileSource, HttpSource, iter_json_file
+
+STATES = [
+    {'id': 1, 'name': 'Utah', 'iso_code': 'UT', 'url': 'https://example.com/states/1.json'},
+    {'id': 2, 'name': 'Oregon', 'iso_code': None, 'url': 'https://example.com/states/2.json', 'bounds': [-124.5, 42.0, -116.5, 46.3]},
+    {'id': 3, 'name': 'Idaho, "The Gem State"', 'iso_code': 'ID', 'url': 'https://example.com/states/3.json'}
+]
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """Serve the fixture folder without logging every request"""
+
+    def log_message(self, *args):
+        pass
+
+
+class ApiSourceTest(unittest.TestCase):
+    """Read the same records from a JSON file and from a local HTTP server
+    """
+
+    def setUp(self):
+        super(ApiSourceTest, self).setUp()
+        self.folder = tempfile.mkdtemp()
+        with open(os.path.join(self.folder, 'states.json'), 'w', encoding='utf8') as file:
+            json.dump(STATES, file, indent=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+        super(ApiSourceTest, self).tearDown()
+
+    def test_iter_json_file(self):
+        path = os.path.join(self.folder, 'states.json')
+        # Chunks much smaller than a record force records to be parsed across several reads
+        for chunk_size in [1, 7, 64, 100000]:
+            self.assertListEqual(list(iter_json_file(path, chunk_size)), STATES)
+
+        empty = os.path.join(self.folder, 'empty.json')
+        with open(empty, 'w', encoding='utf8') as file:
+            file.write(' [ ] ')
+        self.assertListEqual(list(iter_json_file(empty, 2)), [])
+
+    def test_file_source(self):
+        with FileSource(self.folder) as source:
+            self.assertListEqual(list(source.records('states')), STATES)
+            with self.assertRaises(Exception):
+                source.fetch('projects')
+
+    def serve(self) -> ThreadingHTTPServer:
+        """Serve the fixture folder on a free local port"""
+        server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=self.folder))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def test_http_source(self):
+        server = self.serve()
+        cache_folder = os.path.join(self.folder, 'cache')
+        try:
+            url = f'http://127.0.0.1:{server.server_address[1]}'
+            with HttpSource(url, cache_folder) as source:
+                endpoints = source.fetch_all(['states'])
+                self.assertListEqual(list(source.records('states', endpoints['states'])), STATES)
+
+            # A second export with the same cache folder reuses the unchanged download
+            with HttpSource(url, cache_folder) as source:
+                self.assertListEqual(list(source.records('states')), STATES)
+            self.assertTrue(os.path.isfile(os.path.join(cache_folder, 'states.json')))
+            self.assertTrue(os.path.isfile(os.path.join(cache_folder, 'states.json.headers')))
+
+            # A failed request leaves no partial download behind
+            with HttpSource(url, cache_folder) as source:
+                with self.assertRaises(Exception):
+                    source.fetch('projects')
+            self.assertListEqual(sorted(os.listdir(cache_folder)), ['states.json', 'states.json.headers'])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_http_source_ignored_paging(self):
+        # The fixture server ignores the page parameters and returns every record for every page
+        server = self.serve()
+        try:
+            url = f'http://127.0.0.1:{server.server_address[1]}'
+            for page_size in [2, 3]:
+                with HttpSource(url, page_size=page_size) as source:
+                    self.assertListEqual(list(source.records('states')), STATES)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+if __name__ == '__main__':
+    unittest.main()
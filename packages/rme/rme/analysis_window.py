@@ -7,73 +7,85 @@
 
 import math
 from functools import cached_property
+from typing import List, Tuple
 
 import numpy as np
+import shapely
 from shapely.geometry import Point
-from rasterio.mask import mask
+from shapely.geometry.base import BaseGeometry
+import rasterio
+from rasterio.features import geometry_mask
+from rasterio.windows import Window, transform as window_transform
 from osgeo import ogr
 
+from rscommons import VectorBase
 from rscommons.geometry_ops import reduce_precision, get_endpoints
 
 
-class AnalysisWindow:
-    """ class to support Riverscapes Metric calculations using polygon windows"""
+def clip_lines(geom_line: BaseGeometry, geom_windows: List[BaseGeometry]) -> List[ogr.Geometry]:
+    """clip one line to many windows in a single vectorized call
 
-    lyr_segments = None
-    buffer_raster_clip = None
+    Args:
+        geom_line (BaseGeometry): unclipped line (e.g. the flowline for a level path)
+        geom_windows (List[BaseGeometry]): windows or DGO polygons
 
-    def __init__(self, window_size: float, segment_dist: float, geom_flowline: ogr.Geometry, geom_centerline: ogr.Geometry, level_path: str, buffer_elevation: float):
+    Returns:
+        List[ogr.Geometry]: clipped lines in the same order as the windows
+    """
+    if len(geom_windows) == 0:
+        return []
+    windows = np.array(geom_windows, dtype=object)
+    invalid = ~shapely.is_valid(windows)
+    windows[invalid] = shapely.make_valid(windows[invalid])
+    shapely.prepare(geom_line)
+    clipped = shapely.intersection(windows, geom_line)
+    return [VectorBase.shapely2ogr(geom) for geom in clipped]
 
-        self.level_path = level_path
-        self.window_size = window_size
-        self.segment_distance = segment_dist
-        self.buffer_elevation = buffer_elevation
-        self.geom_window = self.generate_window()
-        self.geom_flowline_level_path = geom_flowline
-        self.geom_centerline_level_path = geom_centerline
-
-    def generate_window(self, buffer=0):
-        """generate the polygon geometry of the moving window for a level path"""
-
-        min_dist = self.segment_distance - 0.5 * self.window_size
-        max_dist = self.segment_distance + 0.5 * self.window_size
-        sql = f'LevelPathI = {self.level_path} AND seg_distance >= {min_dist} AND seg_distance <={max_dist}'
-        geom_window_sections = ogr.Geometry(ogr.wkbMultiPolygon)
-        for feat, *_ in self.lyr_segments.iterate_features(attribute_filter=sql):
-            geom = feat.GetGeometryRef()
-            if geom.GetGeometryName() in ['MULTIPOLYGON', 'GEOMETRYCOLLECTION']:
-                for i in range(0, geom.GetGeometryCount()):
-                    geo = geom.GetGeometryRef(i)
-                    if geo.GetGeometryName() == 'POLYGON':
-                        geom_window_sections.AddGeometry(geo)
-            else:
-                geom_window_sections.AddGeometry(geom)
-        geom_window = geom_window_sections.Buffer(buffer)
-        return geom_window
 
-    @cached_property
-    def window_flowline(self):
-        """create a cached flowline instance of WindowedLine"""
-        return AnalysisLine(self.geom_flowline_level_path, self.geom_window, self.buffer_elevation)
+def pixel_bounds(transform, bounds: Tuple[float, float, float, float]) -> Tuple[int, int, int, int]:
+    """rows and columns (start inclusive, end exclusive) of every cell that touches a bounding box"""
+    minx, miny, maxx, maxy = bounds
+    cols, rows = zip(*[~transform * (x, y) for x, y in ((minx, miny), (minx, maxy), (maxx, miny), (maxx, maxy))])
+    return math.floor(min(rows)), math.floor(min(cols)), math.ceil(max(rows)), math.ceil(max(cols))
 
-    @cached_property
-    def window_centerline(self):
-        """create a cached centerline instance of WindowedLine"""
-        return AnalysisLine(self.geom_centerline_level_path, self.geom_window, self.buffer_elevation)
 
-    def stream_gradient(self) -> float:
-        """return gradient metric for flowline"""
-        if self.window_flowline.max_elevation is None or self.window_flowline.min_elevation is None:
+class EndpointElevations:
+    """ reads one block of the DEM covering an area (e.g. a DGO) so the minimum elevation around any number
+    of line endpoints inside that area comes from memory rather than a rasterio.mask read per point"""
+
+    def __init__(self, src_raster: rasterio.DatasetReader, bounds: Tuple[float, float, float, float], buffer: float):
+        """
+        Args:
+            src_raster (rasterio.DatasetReader): open elevation raster
+            bounds (Tuple[float, float, float, float]): minx, miny, maxx, maxy of the area the points fall in
+            buffer (float): largest buffer that will be used around the points (raster units)
+        """
+        self.nodata = src_raster.nodata
+        minx, miny, maxx, maxy = bounds
+        row_off, col_off, row_end, col_end = pixel_bounds(src_raster.transform, (minx - buffer, miny - buffer, maxx + buffer, maxy + buffer))
+        row_off, col_off = max(row_off, 0), max(col_off, 0)
+        row_end, col_end = max(min(row_end, src_raster.height), row_off), max(min(col_end, src_raster.width), col_off)
+        window = Window(col_off, row_off, col_end - col_off, row_end - row_off)
+        self.data = src_raster.read(1, window=window)
+        self.transform = src_raster.window_transform(window)
+
+    def min_elevation(self, pnt: tuple, buffer: float) -> float:
+        """minimum elevation of the cells whose centres fall within the buffer of a point (same cells as rasterio.mask)"""
+        polygon = Point(pnt).buffer(buffer)
+        row_off, col_off, row_end, col_end = pixel_bounds(self.transform, polygon.bounds)
+        row_off, col_off = max(row_off, 0), max(col_off, 0)
+        row_end, col_end = min(row_end, self.data.shape[0]), min(col_end, self.data.shape[1])
+        if row_end <= row_off or col_end <= col_off:
             return None
-        gradient = (self.window_flowline.max_elevation - self.window_flowline.min_elevation) / self.window_flowline.length
-        return gradient
 
-    def valley_gradient(self):
-        """return gradient metric for valley centerline"""
-        if self.window_flowline.max_elevation is None or self.window_flowline.min_elevation is None:
+        data = self.data[row_off:row_end, col_off:col_end]
+        data_transform = window_transform(Window(col_off, row_off, data.shape[1], data.shape[0]), self.transform)
+        inside = geometry_mask([polygon], out_shape=data.shape, transform=data_transform, invert=True)
+        if self.nodata is not None:
+            inside &= ~np.isclose(data, self.nodata)
+        if not np.any(inside):
             return None
-        gradient = (self.window_flowline.max_elevation - self.window_flowline.min_elevation) / self.window_centerline.length
-        return gradient
+        return float(data[inside].min())
 
 
 class AnalysisLine():
@@ -82,22 +94,24 @@ class AnalysisLine():
     transform = None
     src_raster = None
 
-    def __init__(self, geom_line: ogr.Geometry, geom_window, buffer_elevation=None) -> None:
+    def __init__(self, geom_line: ogr.Geometry, geom_window, buffer_elevation=None, geom_clipped: ogr.Geometry = None) -> None:
         """ clip geometry and create new instance of AnalysisLine
 
         Args:
             geom_line (ogr.Geometry): unclipped line
             geom_window (ogr.Geometry): polygon or multipolygon window to clip the line
             buffer_elevation (float, optional): buffer distance to obtain elevation values. Defaults to None
+            geom_clipped (ogr.Geometry, optional): line already clipped to the window (see clip_lines). Defaults to None
         """
 
-        self.geom_line = self.clip_line(geom_line, geom_window)
+        self.geom_line = self.clip_line(geom_line, geom_window, geom_clipped)
         self.buffer_elevation = buffer_elevation
 
-    def clip_line(self, geom_line: ogr.Geometry, geom_window: ogr.Geometry):
+    def clip_line(self, geom_line: ogr.Geometry, geom_window: ogr.Geometry, geom_clipped: ogr.Geometry = None):
         """clip line to the window"""
 
-        geom_clipped = geom_window.Intersection(geom_line)
+        if geom_clipped is None:
+            geom_clipped = geom_window.Intersection(geom_line)
         if geom_clipped.GetGeometryName() == "MULTILINESTRING":
             geom_clipped = reduce_precision(geom_clipped, 6)
             geom_clipped = ogr.ForceToLineString(geom_clipped)
@@ -119,14 +133,12 @@ class AnalysisLine():
         endpoints = self.endpoints
         elevations = [None, None]
         if len(endpoints) == 2:
-            elevations = []
-            for pnt in endpoints:
-                point = Point(pnt)
-                polygon = point.buffer(self.buffer_elevation)  # BRAT uses 100m here for all stream sizes?
-                raw_raster, _out_transform = mask(self.src_raster, [polygon], crop=True)
-                mask_raster = np.ma.masked_values(raw_raster, self.src_raster.nodata)
-                value = float(mask_raster.min())  # BRAT uses mean here
-                elevations.append(value)
+            # One read covering both endpoints. BRAT uses 100m here for all stream sizes?
+            xs, ys = [pnt[0] for pnt in endpoints], [pnt[1] for pnt in endpoints]
+            sampler = EndpointElevations(self.src_raster, (min(xs), min(ys), max(xs), max(ys)), self.buffer_elevation)
+            elevations = [sampler.min_elevation(pnt, self.buffer_elevation) for pnt in endpoints]  # BRAT uses mean here
+            if None in elevations:
+                return None, None
             elevations.sort()
 
         return elevations[0], elevations[1]
@@ -32,15 +32,17 @@ from rscommons.copy_features import copy_features_fields
 from rscommons.vbet_network import copy_vaa_attributes, join_attributes
 from rscommons.augment_lyr_meta import augment_layermeta, add_layer_descriptions
 from rscommons.moving_window import moving_window_dgo_ids
+from rscommons.network_topology import level_path_key
 
 from rme.__version__ import __version__
-from rme.analysis_window import AnalysisLine
+from rme.analysis_window import AnalysisLine, EndpointElevations, clip_lines
 # from rme.rme_report import RMEReport, FILTER_NAMES
 from rme.utils.measurements import get_segment_measurements
 from rme.utils.check_vbet_inputs import vbet_inputs
 from rme.utils.summarize_functions import *
 from rme.utils.bespoke_functions import *
 from rme.utils.thematic_tables import create_thematic_table, create_measurement_table
+from rme.utils.secondary_metrics import calculate_secondary_metrics
 
 Path = str
 
@@ -369,17 +371,19 @@ def metric_engine(huc: int, in_flowlines: Path, in_waterbodies: Path, in_huc12:
 
     # associate single DGOs with single IGOs for non moving window metrics
     log.info('Associating DGOs with IGOs')
+    # DGOs and IGO stream sizes keyed by (level path, seg_distance), each read in one pass rather than queried per feature
     igo_dgo = {}
+    dgo_lookup = {}
+    igo_stream_size = {}
     with GeopackageLayer(segments) as lyr_segments, \
             GeopackageLayer(points) as lyr_points:
+        for feat_seg, *_ in lyr_segments.iterate_features():
+            dgo_lookup.setdefault((level_path_key(feat_seg.GetField('level_path')), feat_seg.GetField('seg_distance')), feat_seg.GetFID())
         for feat, *_ in lyr_points.iterate_features():
-            igo_id = feat.GetFID()
-            level_path = feat.GetField('level_path')
-            seg_distance = feat.GetField('seg_distance')
-            sql = f'level_path = {level_path} and seg_distance = {seg_distance}'
-            for feat_seg, *_ in lyr_segments.iterate_features(attribute_filter=sql):
-                igo_dgo[igo_id] = feat_seg.GetFID()
-                break
+            key = (level_path_key(feat.GetField('level_path')), feat.GetField('seg_distance'))
+            igo_stream_size.setdefault(key, feat.GetField('stream_size'))
+            if key in dgo_lookup:
+                igo_dgo[feat.GetFID()] = dgo_lookup[key]
 
     create_measurement_table(outputs_gpkg)
     # get measurements for DGOs
@@ -411,28 +415,36 @@ def metric_engine(huc: int, in_flowlines: Path, in_waterbodies: Path, in_huc12:
             geom_centerline = collect_linestring(
                 input_layers['VBET_CENTERLINES'], f'level_path = {level_path}', precision=8)
 
+            dgos = []
             for feat_seg_dgo, *_ in lyr_segments.iterate_features(attribute_filter=f'level_path = {level_path}'):
-                # Gather common components for metric calcuations
-                feat_geom = feat_seg_dgo.GetGeometryRef().Clone()
-                dgo_id = feat_seg_dgo.GetFID()
                 segment_distance = feat_seg_dgo.GetField('seg_distance')
                 if segment_distance is None:
                     continue
+                dgos.append((feat_seg_dgo.GetFID(), segment_distance, feat_seg_dgo.GetGeometryRef().Clone()))
 
-                with GeopackageLayer(points) as lyr_points:
-                    for pt_ftr, *_ in lyr_points.iterate_features(attribute_filter=f'level_path = {level_path} and seg_distance = {segment_distance}'):
-                        stream_size_id = pt_ftr.GetField('stream_size')
-                        break
-                if not 'stream_size_id' in locals():
+            # Clip the flowline and centerline to every DGO on the level path in one vectorized call each
+            dgo_geoms = [VectorBase.ogr2shapely(feat_geom) for _dgo_id, _segment_distance, feat_geom in dgos]
+            flowlines_clipped = clip_lines(VectorBase.ogr2shapely(geom_flowline), dgo_geoms)
+            centerlines_clipped = clip_lines(VectorBase.ogr2shapely(geom_centerline), dgo_geoms)
+
+            for (dgo_id, segment_distance, feat_geom), flowline_clipped, centerline_clipped in zip(dgos, flowlines_clipped, centerlines_clipped):
+                stream_size_id = igo_stream_size.get((level_path_key(level_path), segment_distance))
+                if stream_size_id is None:
                     log.warning(f'Unable to find stream size for dgo {dgo_id} in level path {level_path}')
                     stream_size_id = 0
 
                 stream_size = stream_size_lookup[stream_size_id]
+                buffer = buffer_distance[stream_size]
+
+                # The endpoints of both clipped lines fall inside the DGO so one DEM read covers all of them
+                min_x, max_x, min_y, max_y = feat_geom.GetEnvelope()
+                elevation_sampler = EndpointElevations(src_dem, (min_x, min_y, max_x, max_y), buffer)
+
                 stream_length, straight_length, min_elev, max_elev = get_segment_measurements(
-                    geom_flowline, src_dem, feat_geom, buffer_distance[stream_size], transform)
+                    geom_flowline, src_dem, feat_geom, buffer, transform, geom_clipped=flowline_clipped, elevation_sampler=elevation_sampler)
 
                 cl_length, cl_straight, cl_min_elev, cl_max_elev = get_segment_measurements(
-                    geom_centerline, src_dem, feat_geom, buffer_distance[stream_size], transform)
+                    geom_centerline, src_dem, feat_geom, buffer, transform, geom_clipped=centerline_clipped, elevation_sampler=elevation_sampler)
 
                 dgo_meas[dgo_id] = [stream_length, straight_length, cl_length, min_elev, max_elev, cl_min_elev, cl_max_elev]
 
@@ -565,89 +577,7 @@ def metric_engine(huc: int, in_flowlines: Path, in_waterbodies: Path, in_huc12:
 
     # calculate secondary metrics for dgo table
     secondary_metrics = generate_metric_list(outputs_gpkg, primary=0)
-    with sqlite3.connect(outputs_gpkg) as conn:
-        curs = conn.cursor()
-        curs.execute("SELECT machine_code, field_name from metrics")
-        lf_field_names = {row[0]: row[1] for row in curs.fetchall() if row[0][0] == 'L' and row[0][1] == 'F'}
-        for metric in secondary_metrics:
-            if metric == 'TRIBDENS':
-                curs.execute("SELECT dgo_geomorph.dgoid, tributaries, valleng FROM dgo_geomorph LEFT JOIN dgo_measurements ON dgo_geomorph.dgoid = dgo_measurements.dgoid")
-                data = curs.fetchall()
-                for dgo_id, tribs, length in data:
-                    if tribs is not None and length is not None:
-                        trib_density = float(tribs) / float(length)/1000
-                        curs.execute(f"""UPDATE dgo_geomorph SET tribs_per_km = {trib_density} WHERE dgoid = {dgo_id}""")
-            if metric == 'CHANSIN':
-                curs.execute("SELECT dgoid, strmleng, strmstrleng FROM dgo_measurements")
-                data = curs.fetchall()
-                for dgo_id, stream_length, straight_length in data:
-                    if stream_length is not None and straight_length is not None:
-                        sin = float(stream_length) / float(straight_length)
-                        curs.execute(f"UPDATE dgo_geomorph SET planform_sinuosity = {sin} WHERE dgoid = {dgo_id}")
-            if metric in ('LFAG', 'LFCON', 'LFCONHW', 'LFDEV', 'LFEXOTH', 'LFEXTSH', 'LFGRASS', 'LFHW', 'LFRIP', 'LFSHRUB', 'LFSPARSE', 'LFCONBPS', 'LFCONHWBPS', 'LFGRASSBPS', 'LFHWBPS', 'LFHWCONBPS', 'LFPEATBPS', 'LFPEATNONBPS', 'LFRIPBPS', 'LFSAVBPS', 'LFSHRUBBPS', 'LFSPARSEBPS'):
-                curs.execute(f"SELECT dgo_veg.dgoid, {lf_field_names[metric]}_prop, segment_area from dgo_veg LEFT JOIN dgos on dgos.dgoid = dgo_veg.dgoid")
-                data = curs.fetchall()
-                for dgo_id, veg_class, area in data:
-                    if veg_class is not None and area is not None:
-                        veg_area = float(veg_class) * float(area)
-                        curs.execute(f"UPDATE dgo_veg SET {lf_field_names[metric]} = {veg_area} WHERE dgoid = {dgo_id}")
-            if metric == 'ACRESVBPM':
-                curs.execute("SELECT dgoid, segment_area, centerline_length FROM dgos")
-                data = curs.fetchall()
-                for dgo_id, area, length in data:
-                    if area is not None and length is not None and length > 0:
-                        acres = (float(area) * 0.000247105) / (float(length) * 0.000621371)
-                        curs.execute(f"UPDATE dgo_geomorph SET acres_vb_per_mile = {acres} WHERE dgoid = {dgo_id}")
-            if metric == 'HECTVBPKM':
-                curs.execute("SELECT dgoid, segment_area, centerline_length FROM dgos")
-                data = curs.fetchall()
-                for dgo_id, area, length in data:
-                    if area is not None and length is not None and length > 0:
-                        hectares = (float(area) * 0.0001) / (float(length) * 0.001)
-                        curs.execute(f"UPDATE dgo_geomorph SET hect_vb_per_km = {hectares} WHERE dgoid = {dgo_id}")
-            if metric == 'STRMSIZE':
-                curs.execute("SELECT dgo_geomorph.dgoid, channel_area, strmleng FROM dgo_geomorph LEFT JOIN dgo_measurements ON dgo_geomorph.dgoid = dgo_measurements.dgoid")
-                data = curs.fetchall()
-                for dgo_id, area, length in data:
-                    if area is not None and length is not None and length > 0:
-                        size = float(area) / float(length)
-                        curs.execute(f"UPDATE dgo_geomorph SET channel_width = {size} WHERE dgoid = {dgo_id}")
-            if metric == 'ROADDENS':
-                curs.execute("SELECT dgo_impacts.dgoid, road_len, centerline_length FROM dgo_impacts LEFT JOIN dgos on dgos.dgoid = dgo_impacts.dgoid")
-                data = curs.fetchall()
-                for dgo_id, road_len, length in data:
-                    if road_len is not None and length is not None and length > 0:
-                        road_density = float(road_len) / float(length)
-                        curs.execute(f"UPDATE dgo_impacts SET road_dens = {road_density} WHERE dgoid = {dgo_id}")
-            if metric == 'RAILDENS':
-                curs.execute("SELECT dgo_impacts.dgoid, rail_len, centerline_length FROM dgo_impacts LEFT JOIN dgos on dgos.dgoid = dgo_impacts.dgoid")
-                data = curs.fetchall()
-                for dgo_id, rail_len, length in data:
-                    if rail_len is not None and length is not None and length > 0:
-                        rail_density = float(rail_len) / float(length)
-                        curs.execute(f"UPDATE dgo_impacts SET rail_dens = {rail_density} WHERE dgoid = {dgo_id}")
-            if metric == 'ACFPEXT':
-                curs.execute("SELECT dgo_impacts.dgoid, fldpln_access, segment_area FROM dgo_impacts LEFT JOIN dgos on dgos.dgoid = dgo_impacts.dgoid")
-                data = curs.fetchall()
-                for dgo_id, prop, area in data:
-                    if prop is not None and area is not None and area > 0:
-                        acpf = float(prop) * float(area)
-                        curs.execute(f"UPDATE dgo_impacts SET access_fldpln_extent = {acpf} WHERE dgoid = {dgo_id}")
-            if metric == 'EXRIP':
-                curs.execute("SELECT dgo_veg.dgoid, prop_riparian, segment_area FROM dgo_veg LEFT JOIN dgos on dgos.dgoid = dgo_veg.dgoid")
-                data = curs.fetchall()
-                for dgo_id, prop, area in data:
-                    if prop is not None and area is not None and area > 0:
-                        exrip = float(prop) * float(area)
-                        curs.execute(f"UPDATE dgo_veg SET ex_riparian = {exrip} WHERE dgoid = {dgo_id}")
-            if metric == 'HISTRIP':
-                curs.execute("SELECT dgo_veg.dgoid, hist_prop_riparian, segment_area FROM dgo_veg LEFT JOIN dgos on dgos.dgoid = dgo_veg.dgoid")
-                data = curs.fetchall()
-                for dgo_id, prop, area in data:
-                    if prop is not None and area is not None and area > 0:
-                        hisrip = float(prop) * float(area)
-                        curs.execute(f"UPDATE dgo_veg SET hist_riparian = {hisrip} WHERE dgoid = {dgo_id}")
-        conn.commit()
+    calculate_secondary_metrics(outputs_gpkg, secondary_metrics)
 
     # fill out igo_metrics table using moving window analysis
     for metric_group in metric_groups:
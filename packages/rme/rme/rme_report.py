@@ -1,13 +1,13 @@
 import argparse
 import sqlite3
 import os
-from collections import Counter
 from xml.etree import ElementTree as ET
 
 from rsxml import Logger, dotenv
 from rscommons import ModelConfig, RSReport, RSProject
 from rsxml.util import safe_makedirs
-from rscommons.plotting import box_plot, vertical_bar
+from rscommons.plotting import box_plot, vertical_bar, render_charts
+from rscommons.report.report_data import read_columns, summary_stats, value_counts
 from rme.__version__ import __version__
 
 # NOTE: to change a filter name or add a new filter, you must also add it to the
@@ -128,12 +128,9 @@ class RMEReport(RSReport):
         tbody.append(tr)
 
         # Just make it all 0 if there is no data
-        clean_data = [0 if x is None else x for x in data] or [0]
-        min_val = min(clean_data)
-        max_val = max(clean_data)
-        avg_val = sum(clean_data) / len(clean_data)
+        stats = summary_stats(data if len(data) > 0 else [0], fill_null=0)
 
-        for val in [avg_val, min_val, max_val]:
+        for val in [stats['Average'], stats['Minimum'], stats['Maximum']]:
             str_val, class_name = RSReport.format_value(val, float)
             td = ET.Element('td', attrib={'class': class_name})
             td.text = str_val
@@ -148,29 +145,28 @@ class RMEReport(RSReport):
         if self.intermediate_database is None:
             self.log.warning("No intermediate database provided, skipping metric plots")
             return
-        conn = sqlite3.connect(self.intermediate_database)
-        curs = conn.cursor()
-
-        curs.execute("""
-            SELECT LOWER(field_name), data_type, name
-            FROM metrics
-            WHERE field_name != '' AND is_active = 1
-        """)
-        metrics_info = curs.fetchall()
+        with sqlite3.connect(self.intermediate_database) as conn:
+            curs = conn.cursor()
+            curs.execute("""
+                SELECT LOWER(field_name), data_type, name
+                FROM metrics
+                WHERE field_name != '' AND is_active = 1
+            """)
+            metrics_info = curs.fetchall()
+
+        # Every metric column is read from the view in one pass
+        try:
+            frame = read_columns(self.intermediate_database, 'vw_igo_metrics', [metric_name for metric_name, _data_type, _name in metrics_info], self.sql_filter)
+        except sqlite3.OperationalError as e:
+            self.log.error(f"Error fetching data for metric plots ({e})")
+            return
 
+        chart_jobs = []
         for metric_name, data_type, name in metrics_info:
-            try:
-                curs.execute(
-                    f"""
-                    SELECT {metric_name}
-                    FROM vw_igo_metrics
-                    """
-                    + f"WHERE {self.sql_filter}" * (self.sql_filter is not None)
-                )
-                values = [row[0] for row in curs.fetchall()]
-            except sqlite3.OperationalError as e:
-                self.log.error(f"Error fetching data for metric {metric_name} ({e})")
+            if metric_name not in frame:
+                self.log.error(f"Error fetching data for metric {metric_name} (no such column)")
                 continue
+            values = frame[metric_name]
 
             card = ET.Element('div', attrib={'class': 'metrics-card', 'id': metric_name})
             title = ET.Element(
@@ -182,20 +178,20 @@ class RMEReport(RSReport):
 
             if data_type == "TEXT" or data_type == "INTEGER":
                 image_path = os.path.join(self.images_dir, f"{metric_name}_bar.png")
-                value_counts = Counter(values)
-                vertical_bar(
-                    value_counts.values(),
-                    [str(i) for i in value_counts.keys()],
+                labels, counts = value_counts(values)
+                chart_jobs.append((vertical_bar, (
+                    counts,
+                    [str(i) for i in labels],
                     "count",
                     f"{name} Distribution",
                     image_path
-                )
+                )))
 
             elif data_type == "REAL":
                 self.avg_min_max_table(values, card)
 
                 image_path = os.path.join(self.images_dir, f"{metric_name}_box.png")
-                box_plot(values, f"{name} Distribution", image_path)
+                chart_jobs.append((box_plot, (list(values), f"{name} Distribution", image_path)))
 
             # Get path in form images/(optional subdirectory)/image_name
             relative_dir = os.path.dirname(self.images_dir)
@@ -211,6 +207,8 @@ class RMEReport(RSReport):
             plot_wrapper.append(card)
         section.append(plot_wrapper)
 
+        render_charts(chart_jobs)
+
     def filters_section(self, parent_section):
         filter_name_pretty = self.filter_name.replace('_', ' ').title()
 
@@ -7,7 +7,8 @@ from rscommons.geometry_ops import reduce_precision, get_endpoints
 from rscommons import VectorBase
 
 
-def get_segment_measurements(geom_line: ogr.Geometry, src_raster: rasterio.DatasetReader, geom_window: ogr.Geometry, buffer: float, transform) -> tuple:
+def get_segment_measurements(geom_line: ogr.Geometry, src_raster: rasterio.DatasetReader, geom_window: ogr.Geometry, buffer: float, transform,
+                             geom_clipped: ogr.Geometry = None, elevation_sampler=None) -> tuple:
     """ return length of segment and endpoint elevations of a line
 
     Args:
@@ -16,13 +17,16 @@ def get_segment_measurements(geom_line: ogr.Geometry, src_raster: rasterio.Datas
         geom_window (ogr.Geometry): analysis window for clipping line
         buffer (float): buffer of endpoints to find min elevation
         transform(CoordinateTransform): transform used to obtain length
+        geom_clipped (ogr.Geometry, optional): line already clipped to the window (see analysis_window.clip_lines). Defaults to None.
+        elevation_sampler (EndpointElevations, optional): in-memory DEM block covering the window. Defaults to None (mask the raster per endpoint).
     Returns:
         float: stream length
         float: maximum elevation
         float: minimum elevation
     """
 
-    geom_clipped = geom_window.Intersection(geom_line)
+    if geom_clipped is None:
+        geom_clipped = geom_window.Intersection(geom_line)
     if geom_clipped.GetGeometryName() == "MULTILINESTRING":
         geom_clipped = reduce_precision(geom_clipped, 6)
         geom_clipped = ogr.ForceToLineString(geom_clipped)
@@ -32,6 +36,9 @@ def get_segment_measurements(geom_line: ogr.Geometry, src_raster: rasterio.Datas
     if len(endpoints) >= 2:
         elevations = []
         for pnt in endpoints:
+            if elevation_sampler is not None:
+                elevations.append(elevation_sampler.min_elevation(pnt, buffer))
+                continue
             point = Point(pnt)
             # BRAT uses 100m here for all stream sizes?
             polygon = point.buffer(buffer)
@@ -40,8 +47,8 @@ def get_segment_measurements(geom_line: ogr.Geometry, src_raster: rasterio.Datas
             value = float(mask_raster.min())  # BRAT uses mean here
             elevations.append(value)
     
-    # Handle case where there are insufficient endpoints
-    if len(endpoints) < 2:
+    # Handle case where there are insufficient endpoints (or no DEM cells around one of them)
+    if len(endpoints) < 2 or None in elevations:
         geom_clipped.Transform(transform)
         stream_length = geom_clipped.Length()
         return stream_length, None, None, None
@@ -0,0 +1,87 @@
+import sqlite3
+
+# Secondary (derived) DGO metrics. Each one is (target table, target field, query) where the query
+# returns the dgoid and the derived value (aliased as value) for every DGO that has the inputs it needs.
+# DGOs that are missing inputs are left untouched.
+SECONDARY_METRICS = {
+    'TRIBDENS': ('dgo_geomorph', 'tribs_per_km', """
+        SELECT g.dgoid, CAST(g.tributaries AS REAL) / m.valleng / 1000 AS value
+        FROM dgo_geomorph g LEFT JOIN dgo_measurements m ON g.dgoid = m.dgoid
+        WHERE g.tributaries IS NOT NULL AND m.valleng IS NOT NULL"""),
+    'CHANSIN': ('dgo_geomorph', 'planform_sinuosity', """
+        SELECT dgoid, CAST(strmleng AS REAL) / strmstrleng AS value
+        FROM dgo_measurements
+        WHERE strmleng IS NOT NULL AND strmstrleng IS NOT NULL"""),
+    'ACRESVBPM': ('dgo_geomorph', 'acres_vb_per_mile', """
+        SELECT dgoid, (segment_area * 0.000247105) / (centerline_length * 0.000621371) AS value
+        FROM dgos
+        WHERE segment_area IS NOT NULL AND centerline_length > 0"""),
+    'HECTVBPKM': ('dgo_geomorph', 'hect_vb_per_km', """
+        SELECT dgoid, (segment_area * 0.0001) / (centerline_length * 0.001) AS value
+        FROM dgos
+        WHERE segment_area IS NOT NULL AND centerline_length > 0"""),
+    'STRMSIZE': ('dgo_geomorph', 'channel_width', """
+        SELECT g.dgoid, CAST(g.channel_area AS REAL) / m.strmleng AS value
+        FROM dgo_geomorph g LEFT JOIN dgo_measurements m ON g.dgoid = m.dgoid
+        WHERE g.channel_area IS NOT NULL AND m.strmleng > 0"""),
+    'ROADDENS': ('dgo_impacts', 'road_dens', """
+        SELECT i.dgoid, CAST(i.road_len AS REAL) / d.centerline_length AS value
+        FROM dgo_impacts i LEFT JOIN dgos d ON d.dgoid = i.dgoid
+        WHERE i.road_len IS NOT NULL AND d.centerline_length > 0"""),
+    'RAILDENS': ('dgo_impacts', 'rail_dens', """
+        SELECT i.dgoid, CAST(i.rail_len AS REAL) / d.centerline_length AS value
+        FROM dgo_impacts i LEFT JOIN dgos d ON d.dgoid = i.dgoid
+        WHERE i.rail_len IS NOT NULL AND d.centerline_length > 0"""),
+    'ACFPEXT': ('dgo_impacts', 'access_fldpln_extent', """
+        SELECT i.dgoid, CAST(i.fldpln_access AS REAL) * d.segment_area AS value
+        FROM dgo_impacts i LEFT JOIN dgos d ON d.dgoid = i.dgoid
+        WHERE i.fldpln_access IS NOT NULL AND d.segment_area > 0"""),
+    'EXRIP': ('dgo_veg', 'ex_riparian', """
+        SELECT v.dgoid, CAST(v.prop_riparian AS REAL) * d.segment_area AS value
+        FROM dgo_veg v LEFT JOIN dgos d ON d.dgoid = v.dgoid
+        WHERE v.prop_riparian IS NOT NULL AND d.segment_area > 0"""),
+    'HISTRIP': ('dgo_veg', 'hist_riparian', """
+        SELECT v.dgoid, CAST(v.hist_prop_riparian AS REAL) * d.segment_area AS value
+        FROM dgo_veg v LEFT JOIN dgos d ON d.dgoid = v.dgoid
+        WHERE v.hist_prop_riparian IS NOT NULL AND d.segment_area > 0"""),
+}
+
+# Landfire class areas are all the class proportion multiplied by the DGO area
+LANDFIRE_AREA_METRICS = ('LFAG', 'LFCON', 'LFCONHW', 'LFDEV', 'LFEXOTH', 'LFEXTSH', 'LFGRASS', 'LFHW', 'LFRIP', 'LFSHRUB', 'LFSPARSE', 'LFCONBPS',
+                         'LFCONHWBPS', 'LFGRASSBPS', 'LFHWBPS', 'LFHWCONBPS', 'LFPEATBPS', 'LFPEATNONBPS', 'LFRIPBPS', 'LFSAVBPS', 'LFSHRUBBPS', 'LFSPARSEBPS')
+
+
+def landfire_area_metric(field_name: str) -> tuple:
+    """Secondary metric definition for a Landfire class area field"""
+    return ('dgo_veg', field_name, f"""
+        SELECT v.dgoid, CAST(v.{field_name}_prop AS REAL) * d.segment_area AS value
+        FROM dgo_veg v LEFT JOIN dgos d ON d.dgoid = v.dgoid
+        WHERE v.{field_name}_prop IS NOT NULL AND d.segment_area IS NOT NULL""")
+
+
+def calculate_secondary_metrics(gpkg_path: str, secondary_metrics: dict) -> None:
+    """Calculate the derived DGO metrics. Each metric is a single UPDATE ... FROM statement
+    so the whole table is written in one pass instead of one UPDATE per DGO.
+
+    Args:
+        gpkg_path (str): path to the RME outputs geopackage
+        secondary_metrics (dict): active secondary metrics keyed by machine code (from generate_metric_list)
+    """
+
+    with sqlite3.connect(gpkg_path) as conn:
+        curs = conn.cursor()
+        curs.execute("SELECT machine_code, field_name from metrics")
+        lf_field_names = {row[0]: row[1] for row in curs.fetchall() if row[0][0] == 'L' and row[0][1] == 'F'}
+
+        for metric in secondary_metrics:
+            if metric in SECONDARY_METRICS:
+                table, field, query = SECONDARY_METRICS[metric]
+            elif metric in LANDFIRE_AREA_METRICS:
+                table, field, query = landfire_area_metric(lf_field_names[metric])
+            else:
+                continue
+
+            curs.execute(f"""UPDATE {table} SET {field} = derived.value
+                FROM ({query}) AS derived
+                WHERE {table}.dgoid = derived.dgoid""")
+        conn.commit()
@@ -11,7 +11,8 @@ from shapely.geometry import shape
 import matplotlib.pyplot as plt
 from osgeo import ogr
 from rscommons import RSReport
-from rscommons.plotting import pie, horizontal_bar
+from rscommons.plotting import pie, horizontal_bar, render_charts
+from rscommons.report.report_data import read_columns, to_float, group_sums, upper_bin_sums
 from rsxml import Logger, dotenv
 from rsxml.util import safe_makedirs
 from rme.__version__ import __version__
@@ -36,152 +37,233 @@ BAR_WIDTH = 0.35
 PLOT_ALPHA = 0.5
 
 
-class WSCAReport(RSReport):
-    """ Watershed Condition Assessment Report """
-
-    def clustered_bar_chart(
-        self,
-        parent: ET.Element,
-        title: str,
-        data: List[List[float]],
-        series_labels: List[str],
-        x_labels: List[str],
-        colors: List[str],
-        x_label: str,
-        y_label: str,
-        is_vertical: bool = False
-    ) -> None:
-        """
-        Create and save a plot with multiple series as a clustered bar chart.
-
-        :param parent: The parent XML element to which the image will be added.
-        :param title: Title of the plot.
-        :param data: List of series data, each series being a list of floats.
-        :param series_labels: List of labels for each series.
-        :param x_labels: List of labels for the x-axis.
-        :param colors: List of colors for the series.
-        :param x_label: Label for the x-axis.
-        :param y_label: Label for the y-axis.
-        """
-        plt.clf()
-        _fig, ax = plt.subplots(figsize=(10, 6))
+def clustered_bar_chart(
+    title: str,
+    data: List[List[float]],
+    series_labels: List[str],
+    x_labels: List[str],
+    colors: List[str],
+    x_label: str,
+    y_label: str,
+    is_vertical: bool,
+    img_path: str
+) -> None:
+    """
+    Create and save a plot with multiple series as a clustered bar chart.
+
+    :param title: Title of the plot.
+    :param data: List of series data, each series being a list of floats.
+    :param series_labels: List of labels for each series.
+    :param x_labels: List of labels for the x-axis.
+    :param colors: List of colors for the series.
+    :param x_label: Label for the x-axis.
+    :param y_label: Label for the y-axis.
+    :param is_vertical: Vertical bars if True, otherwise horizontal.
+    :param img_path: Path of the image file to write.
+    """
+    _fig, ax = plt.subplots(figsize=(10, 6))
 
-        # Number of series and bars in each group
-        num_series = len(data)
-        num_categories = len(data[0])
-        bar_width = 0.8 / num_series  # Adjust bar width to fit all series within a group
+    # Number of series and bars in each group
+    num_series = len(data)
+    num_categories = len(data[0])
+    bar_width = 0.8 / num_series  # Adjust bar width to fit all series within a group
 
-        # Calculate the positions for the bars
-        indices = np.arange(num_categories)  # Base x positions for the groups
-        for i, series in enumerate(data):
-            bar_positions = indices + i * bar_width - (num_series * bar_width) / 2 + bar_width / 2
-
-            if is_vertical is True:
-                ax.bar(bar_positions, series, bar_width, label=series_labels[i], color=colors[i])
-            else:
-                ax.barh(bar_positions, series, bar_width, label=series_labels[i], color=colors[i])
+    # Calculate the positions for the bars
+    indices = np.arange(num_categories)  # Base x positions for the groups
+    for i, series in enumerate(data):
+        bar_positions = indices + i * bar_width - (num_series * bar_width) / 2 + bar_width / 2
 
         if is_vertical is True:
-            ax.set_xticks(indices)
-            ax.set_xticklabels(x_labels)
-
-            # Set chart labels and title
-            ax.set_xlabel(x_label)
-            ax.set_ylabel(y_label)
-            ax.set_title(title)
-            ax.legend()
-            plt.grid(axis='y', linestyle='--', alpha=PLOT_ALPHA)
+            ax.bar(bar_positions, series, bar_width, label=series_labels[i], color=colors[i])
         else:
-            ax.set_yticks(indices)
-            ax.set_yticklabels(x_labels)
-
-            # Set chart labels and title
-            ax.set_xlabel(y_label)
-            ax.set_ylabel(x_label)
-            ax.set_title(title)
-            ax.legend()
-            plt.grid(axis='x', linestyle='--', alpha=PLOT_ALPHA)
-
-        # Save and insert the image
-        img_path = os.path.join(self.images_dir, f"{title.replace(' ', '_')}.png")
-        plt.tight_layout()
-        plt.savefig(img_path)
-        plt.close()
-        self.insert_image(parent, img_path, title)
-
-    def stacked_clustered_bar_chart(
-        self,
-        parent: ET.Element,
-        title: str,
-        data: List[List[float]],
-        series_labels: List[str],
-        x_labels: List[str],
-        colors: List[str],
-        x_label: str,
-        y_label: str,
-        is_vertical: bool = False
-    ) -> None:
-        """
-        Create and save a plot with multiple series as a clustered bar chart.
-
-        Pairs of series are stacked together.
-
-        :param parent: The parent XML element to which the image will be added.
-        :param title: Title of the plot.
-        :param data: List of series data, each series being a list of floats.
-        :param series_labels: List of labels for each series.
-        :param x_labels: List of labels for the x-axis.
-        :param colors: List of colors for the series.
-        :param x_label: Label for the x-axis.
-        :param y_label: Label for the y-axis.
-        """
-        plt.clf()
-        _fig, ax = plt.subplots(figsize=(10, 6))
-
-        # Number of series and bars in each group
-        num_series = len(data) / 2.0
-        num_categories = len(data[0])
-        bar_width = 0.8 / num_series  # Adjust bar width to fit all series within a group
-
-        # Calculate the positions for the bars
-        indices = np.arange(num_categories)  # Base x positions for the groups
-        for i, series in enumerate(data):
-            stack = i/2.0
-            is_stack = i % 2
-            hatch = None if is_stack == 0 else 'x'
-            bottom = None if is_stack == 0 else data[i - 1]
-            bar_positions = indices + stack * bar_width - (num_series * bar_width) / 2 + (bar_width / 2) * (0.5 if is_stack == 0 else -0.5)
-            if is_vertical is True:
-                ax.bar(bar_positions, series, bar_width, bottom=bottom, label=series_labels[i], color=colors[i], hatch=hatch, edgecolor='black', linewidth=0.2)
-            else:
-                ax.barh(bar_positions, series, bar_width, left=bottom, label=series_labels[i], color=colors[i], hatch=hatch, edgecolor='black', linewidth=0.2)
-
+            ax.barh(bar_positions, series, bar_width, label=series_labels[i], color=colors[i])
+
+    if is_vertical is True:
+        ax.set_xticks(indices)
+        ax.set_xticklabels(x_labels)
+
+        # Set chart labels and title
+        ax.set_xlabel(x_label)
+        ax.set_ylabel(y_label)
+        ax.set_title(title)
+        ax.legend()
+        plt.grid(axis='y', linestyle='--', alpha=PLOT_ALPHA)
+    else:
+        ax.set_yticks(indices)
+        ax.set_yticklabels(x_labels)
+
+        # Set chart labels and title
+        ax.set_xlabel(y_label)
+        ax.set_ylabel(x_label)
+        ax.set_title(title)
+        ax.legend()
+        plt.grid(axis='x', linestyle='--', alpha=PLOT_ALPHA)
+
+    plt.tight_layout()
+    plt.savefig(img_path)
+    plt.close()
+
+
+def stacked_clustered_bar_chart(
+    title: str,
+    data: List[List[float]],
+    series_labels: List[str],
+    x_labels: List[str],
+    colors: List[str],
+    x_label: str,
+    y_label: str,
+    is_vertical: bool,
+    img_path: str
+) -> None:
+    """
+    Create and save a plot with multiple series as a clustered bar chart.
+
+    Pairs of series are stacked together.
+
+    :param title: Title of the plot.
+    :param data: List of series data, each series being a list of floats.
+    :param series_labels: List of labels for each series.
+    :param x_labels: List of labels for the x-axis.
+    :param colors: List of colors for the series.
+    :param x_label: Label for the x-axis.
+    :param y_label: Label for the y-axis.
+    :param is_vertical: Vertical bars if True, otherwise horizontal.
+    :param img_path: Path of the image file to write.
+    """
+    _fig, ax = plt.subplots(figsize=(10, 6))
+
+    # Number of series and bars in each group
+    num_series = len(data) / 2.0
+    num_categories = len(data[0])
+    bar_width = 0.8 / num_series  # Adjust bar width to fit all series within a group
+
+    # Calculate the positions for the bars
+    indices = np.arange(num_categories)  # Base x positions for the groups
+    for i, series in enumerate(data):
+        stack = i/2.0
+        is_stack = i % 2
+        hatch = None if is_stack == 0 else 'x'
+        bottom = None if is_stack == 0 else data[i - 1]
+        bar_positions = indices + stack * bar_width - (num_series * bar_width) / 2 + (bar_width / 2) * (0.5 if is_stack == 0 else -0.5)
         if is_vertical is True:
-            ax.set_xticks(indices)
-            ax.set_xticklabels(x_labels)
-
-            ax.set_xlabel(x_label)
-            ax.set_ylabel(y_label)
-            ax.set_title(title)
-            ax.legend()
-            plt.grid(axis='y', linestyle='--', alpha=PLOT_ALPHA)
+            ax.bar(bar_positions, series, bar_width, bottom=bottom, label=series_labels[i], color=colors[i], hatch=hatch, edgecolor='black', linewidth=0.2)
         else:
-            ax.set_yticks(indices)
-            ax.set_yticklabels(x_labels)
-
-            ax.set_xlabel(y_label)
-            ax.set_ylabel(x_label)
-            ax.set_title(title)
-            ax.legend()
-            plt.grid(axis='x', linestyle='--', alpha=PLOT_ALPHA)
+            ax.barh(bar_positions, series, bar_width, left=bottom, label=series_labels[i], color=colors[i], hatch=hatch, edgecolor='black', linewidth=0.2)
+
+    if is_vertical is True:
+        ax.set_xticks(indices)
+        ax.set_xticklabels(x_labels)
+
+        ax.set_xlabel(x_label)
+        ax.set_ylabel(y_label)
+        ax.set_title(title)
+        ax.legend()
+        plt.grid(axis='y', linestyle='--', alpha=PLOT_ALPHA)
+    else:
+        ax.set_yticks(indices)
+        ax.set_yticklabels(x_labels)
+
+        ax.set_xlabel(y_label)
+        ax.set_ylabel(x_label)
+        ax.set_title(title)
+        ax.legend()
+        plt.grid(axis='x', linestyle='--', alpha=PLOT_ALPHA)
+
+    plt.tight_layout()
+    plt.savefig(img_path)
+    plt.close()
+
+
+def stream_order_chart(blm_lengths: List[float], non_blm_lengths: List[float], img_path: str) -> None:
+    """Bar chart of BLM and Non-BLM stream lengths grouped by stream order"""
+    # Create the bar chart with two series
+    bar_width = 0.35  # Width of each bar
+    index = np.arange(len(blm_lengths))  # X-axis positions for bars
+
+    _fig, ax = plt.subplots(figsize=(10, 6))
+
+    # Plot bars for BLM and Non-BLM data, grouped by stream order
+    ax.bar(index - bar_width / 2, blm_lengths, bar_width, label='BLM', color=BLM_COLOR)  # , edgecolor='black')
+    ax.bar(index + bar_width / 2, non_blm_lengths, bar_width, label='Non-BLM', color=NON_BLM_COLOR)  # , edgecolor='black')
+
+    # Add labels, title, and legend
+    ax.set_xlabel('Stream Order')
+    ax.set_ylabel('Stream Length (miles)')
+    ax.set_title('Stream Order Lengths')
+    ax.set_xticks(index)
+    ax.set_xticklabels([str(order+1) for order in range(len(blm_lengths))])  # , rotation=45)
+    ax.legend()
+
+    plt.grid(axis='y', linestyle='--', alpha=PLOT_ALPHA)
+
+    # Save the chart as an image
+    # plt.tight_layout()  # Adjust layout to prevent clipping of labels
+    plt.savefig(img_path)
+    plt.close()
+
+
+def sinuosity_chart(bin_midpoints: np.ndarray, bar_width: float, bin_sums_blm: np.ndarray, bin_sums_non_blm: np.ndarray, img_path: str) -> None:
+    """Bar chart of BLM and Non-BLM stream lengths summed by sinuosity bin"""
+    plt.clf()
+    plt.bar(bin_midpoints - bar_width / 2, bin_sums_blm, width=bar_width, color=BLM_COLOR, label='BLM')
+    plt.bar(bin_midpoints + bar_width / 2, bin_sums_non_blm, width=bar_width, color=NON_BLM_COLOR, label='Non-BLM')
+
+    # Add labels, legend, and grid
+    plt.xlabel('Sinuosity')
+    plt.ylabel('Summed Stream Lengths (miles)')
+    plt.title('Stream Lengths Summed by Sinuosity Bins (BLM vs Non-BLM)')
+    plt.grid(axis='y', linestyle='--', alpha=PLOT_ALPHA)
+    plt.legend()
+
+    # Save the chart as an image
+    plt.savefig(img_path, bbox_inches="tight")
+    plt.close()
+
+
+def beaver_capacity_chart(bin_labels: List[str], colors: List[str], existing_bin_sums: List[float], historic_bin_sums: List[float], img_path: str) -> None:
+    """Bar chart of existing and historic beaver dam capacity for perennial streams"""
+    # Create the bar chart
+    bar_width = 0.4
+    x = np.arange(len(bin_labels))  # Positions for the bins
+
+    # Create bars with specific colors
+    plt.clf()
+    for i in range(len(bin_labels)):
+
+        plt.bar(
+            x[i] - bar_width / 2,
+            existing_bin_sums[i],
+            bar_width,
+            label='Existing Capacity' if i == 0 else "",  # Add label only for the first bin
+            color=colors[i],
+            edgecolor='black'
+        )
+
+        plt.bar(
+            x[i] + bar_width / 2,
+            historic_bin_sums[i],
+            bar_width,
+            label='Historic Capacity' if i == 0 else "",  # Add label only for the first bin
+            color=colors[i],
+            edgecolor='black',
+            hatch='x'
+        )
+
+    # Add labels, title, and legend
+    plt.xlabel('Beaver Dam Capacity (dams per km) for Perennial Streams')
+    plt.ylabel('Riverscape Length (miles)')
+    plt.title('Historic and Existing Beaver Dam Capacity')
+    plt.xticks(x, bin_labels)  # Set custom x-axis labels
+    plt.legend()
+
+    # Save the chart
+    plt.tight_layout()
+    plt.savefig(img_path, bbox_inches="tight")
+    plt.close()
 
-        plt.tight_layout()
 
-        # Save and insert the image
-        img_path = os.path.join(self.images_dir, f"{title.replace(' ', '_')}.png")
-        plt.savefig(img_path)
-        plt.close()
-        self.insert_image(parent, img_path, title)
+class WSCAReport(RSReport):
+    """ Watershed Condition Assessment Report """
 
     def __init__(self, huc: str, input_dir: str, output_dir: str, report_path: str, verbose: bool = False):
         super().__init__(None, report_path)
@@ -197,6 +279,9 @@ class WSCAReport(RSReport):
 
         safe_makedirs(self.images_dir)
 
+        # Charts are queued while the HTML is built and rendered together at the end.
+        self.chart_jobs = []
+
         ##############################################################################################################################
         ws_context_section = self.section('WSContext', 'Watershed Context')
 
@@ -284,6 +369,64 @@ class WSCAReport(RSReport):
         rcat_fld_plain_bins = [('< 0.2', 0.2), ('0.2 - 0.4', 0.4), ('0.4 - 0.6', 0.6), ('0.6 - 0.8', 0.8), ('0.8 - 1.0', 1.0)]
         self.rme_prop_field(s3_section, 'RCAT Floodplain Accessibility', 'rcat_igo_fldpln_access', 'rcat_igo_fldpln_access', rcat_fld_plain_bins, rme_gpkg)
 
+        render_charts(self.chart_jobs)
+
+    def clustered_bar_chart(
+        self,
+        parent: ET.Element,
+        title: str,
+        data: List[List[float]],
+        series_labels: List[str],
+        x_labels: List[str],
+        colors: List[str],
+        x_label: str,
+        y_label: str,
+        is_vertical: bool = False
+    ) -> None:
+        """
+        Queue a clustered bar chart (see clustered_bar_chart) and add its image to the report.
+
+        :param parent: The parent XML element to which the image will be added.
+        :param title: Title of the plot.
+        :param data: List of series data, each series being a list of floats.
+        :param series_labels: List of labels for each series.
+        :param x_labels: List of labels for the x-axis.
+        :param colors: List of colors for the series.
+        :param x_label: Label for the x-axis.
+        :param y_label: Label for the y-axis.
+        """
+        img_path = os.path.join(self.images_dir, f"{title.replace(' ', '_')}.png")
+        self.chart_jobs.append((clustered_bar_chart, (title, data, series_labels, x_labels, colors, x_label, y_label, is_vertical, img_path)))
+        self.insert_image(parent, img_path, title)
+
+    def stacked_clustered_bar_chart(
+        self,
+        parent: ET.Element,
+        title: str,
+        data: List[List[float]],
+        series_labels: List[str],
+        x_labels: List[str],
+        colors: List[str],
+        x_label: str,
+        y_label: str,
+        is_vertical: bool = False
+    ) -> None:
+        """
+        Queue a stacked clustered bar chart (see stacked_clustered_bar_chart) and add its image to the report.
+
+        :param parent: The parent XML element to which the image will be added.
+        :param title: Title of the plot.
+        :param data: List of series data, each series being a list of floats.
+        :param series_labels: List of labels for each series.
+        :param x_labels: List of labels for the x-axis.
+        :param colors: List of colors for the series.
+        :param x_label: Label for the x-axis.
+        :param y_label: Label for the y-axis.
+        """
+        img_path = os.path.join(self.images_dir, f"{title.replace(' ', '_')}.png")
+        self.chart_jobs.append((stacked_clustered_bar_chart, (title, data, series_labels, x_labels, colors, x_label, y_label, is_vertical, img_path)))
+        self.insert_image(parent, img_path, title)
+
     def physiography(self, parent, rs_context_dir: str, rsc_nhd_gpkg: str, rsc_metrics: dict) -> None:
 
         section = self.section('Physiography', 'Physiographic Attributes', parent, level=2)
@@ -306,7 +449,7 @@ class WSCAReport(RSReport):
         nhd_gpkg_layer = 'WBDHU10'
         dem_path = os.path.join(rs_context_dir, 'topography', 'dem.tif')
         hipso_curve_path = os.path.join(self.images_dir, 'hypsometric_curve.png')
-        hipsometric_curve(hipso_curve_path, rsc_nhd_gpkg, nhd_gpkg_layer, dem_path)
+        self.chart_jobs.append((hipsometric_curve, (hipso_curve_path, rsc_nhd_gpkg, nhd_gpkg_layer, dem_path)))
         self.insert_image(section, hipso_curve_path, 'Hypsometric Curve')
 
     def insert_image(self, parent, image_path: str, alt_text: str) -> None:
@@ -351,7 +494,7 @@ class WSCAReport(RSReport):
         ]
 
         pie_path = os.path.join(self.images_dir, 'stream_type_pie.png')
-        pie([x[1] for x in pie_values], [x[2] for x in pie_values], 'Stream Length Breakdown', None, pie_path)
+        self.chart_jobs.append((pie, ([x[1] for x in pie_values], [x[2] for x in pie_values], 'Stream Length Breakdown', None, pie_path)))
         self.insert_image(length_section, pie_path, 'Pie Chart')
 
         density_section = self.section('DrainageDensity', 'Drainage Density', parent, level=3)
@@ -449,14 +592,14 @@ class WSCAReport(RSReport):
             default_colors.insert(i, BLM_COLOR)
 
         pie_path = os.path.join(self.images_dir, f'{title_ns}_pie.png')
-        pie([x[1] for x in sorted_raw_data], [x[0] for x in sorted_raw_data], f'{title} Breakdown', default_colors, pie_path)
+        self.chart_jobs.append((pie, ([x[1] for x in sorted_raw_data], [x[0] for x in sorted_raw_data], f'{title} Breakdown', default_colors, pie_path)))
         self.insert_image(section, pie_path, 'Pie Chart')
 
         keys = [item[0] for item in sorted_raw_data]
         values = [item[2] for item in sorted_raw_data]
         labels = [key for key in keys]
         bar_path = os.path.join(self.images_dir, f'{title_ns}_bar.png')
-        horizontal_bar(values, labels, default_colors, 'Area (acres)',  f'{title} Breakdown', bar_path)
+        self.chart_jobs.append((horizontal_bar, (values, labels, default_colors, 'Area (acres)', f'{title} Breakdown', bar_path)))
         self.insert_image(section, bar_path, 'Bar Chart')
 
     def land_use(self, parent, rs_context_dir: str, vbet_dir: str, rcat_dir: str, anthro_dir: str, rme_dir: str) -> None:
@@ -650,137 +793,87 @@ class WSCAReport(RSReport):
 
         section = self.section('StreamOrder', 'Stream Order', parent, level=2)
 
-        with sqlite3.connect(rme_gpkg) as conn:
-            curs = conn.cursor()
+        # Both ownership series come from a single read of the DGOs
+        frame = read_columns(rme_gpkg, 'rme_dgos', ['rme_dgo_ownership', 'nhd_dgo_streamorder', 'nhd_dgo_streamlength'])
+        # Prepare lists to hold data for both series
+        stream_orders = []
+        blm_lengths = []
+        non_blm_lengths = []
 
-            # Prepare lists to hold data for both series
-            stream_orders = []
-            blm_lengths = []
-            non_blm_lengths = []
-            blm_data = {}
-            non_blm_data = {}
-
-            # Loop over ownership categories and fetch data
-            for owner_label, owner_condition in [('BLM', "= 'BLM'"), ('Non-BLM', "<> 'BLM'")]:
-                curs.execute(f'''
-                    SELECT nhd_dgo_streamorder, SUM(nhd_dgo_streamlength)
-                    FROM rme_dgos
-                    WHERE rme_dgo_ownership {owner_condition}
-                    GROUP BY nhd_dgo_streamorder
-                    ORDER BY nhd_dgo_streamorder''')
-
-                # Fetch the results and store them in dictionaries for lookup
-                if owner_label == 'BLM':
-                    blm_data = {row[0]: row[1] * MILES_PER_M for row in curs.fetchall()}  # Convert meters to miles
-                else:
-                    non_blm_data = {row[0]: row[1] * MILES_PER_M for row in curs.fetchall()}  # Convert meters to miles
-
-            # Combine data from both ownerships
-            stream_orders = list(set(blm_data.keys()).union(non_blm_data.keys()))
-            for stream_order in sorted(stream_orders):
-                blm_length = blm_data.get(stream_order, 0)  # Default to 0 if no data for this stream order
-                non_blm_length = non_blm_data.get(stream_order, 0)  # Default to 0 if no data for this stream order
-
-                # Append data to the lists for charting
-                blm_lengths.append(blm_length)
-                non_blm_lengths.append(non_blm_length)
-                stream_orders.append(stream_order)
+        is_blm = frame['rme_dgo_ownership'] == 'BLM'
+        # NULL ownership matches neither "= 'BLM'" nor "<> 'BLM'"
+        has_owner = np.array([owner is not None for owner in frame['rme_dgo_ownership']], dtype=bool)
+        lengths = frame.numeric('nhd_dgo_streamlength') * MILES_PER_M  # Convert meters to miles
+        blm_data = group_sums(frame['nhd_dgo_streamorder'][is_blm], lengths[is_blm])
+        non_blm_data = group_sums(frame['nhd_dgo_streamorder'][has_owner & ~is_blm], lengths[has_owner & ~is_blm])
 
-            # Create the bar chart with two series
-            bar_width = 0.35  # Width of each bar
-            index = np.arange(len(blm_lengths))  # X-axis positions for bars
+        # Combine data from both ownerships
+        for stream_order in sorted(set(blm_data.keys()).union(non_blm_data.keys()), key=lambda order: (order is None, order)):
+            blm_length = blm_data.get(stream_order, 0)  # Default to 0 if no data for this stream order
+            non_blm_length = non_blm_data.get(stream_order, 0)  # Default to 0 if no data for this stream order
 
-            _fig, ax = plt.subplots(figsize=(10, 6))
+            # Append data to the lists for charting
+            blm_lengths.append(blm_length)
+            non_blm_lengths.append(non_blm_length)
+            stream_orders.append(stream_order)
 
-            # Plot bars for BLM and Non-BLM data, grouped by stream order
-            ax.bar(index - bar_width / 2, blm_lengths, bar_width, label='BLM', color=BLM_COLOR)  # , edgecolor='black')
-            ax.bar(index + bar_width / 2, non_blm_lengths, bar_width, label='Non-BLM', color=NON_BLM_COLOR)  # , edgecolor='black')
+        img_path = os.path.join(self.images_dir, 'combined_stream_order_bar_chart.png')
+        self.chart_jobs.append((stream_order_chart, (blm_lengths, non_blm_lengths, img_path)))
 
-            # Add labels, title, and legend
-            ax.set_xlabel('Stream Order')
-            ax.set_ylabel('Stream Length (miles)')
-            ax.set_title('Stream Order Lengths')
-            ax.set_xticks(index)
-            ax.set_xticklabels([str(order+1) for order in range(len(blm_lengths))])  # , rotation=45)
-            ax.legend()
-
-            plt.grid(axis='y', linestyle='--', alpha=PLOT_ALPHA)
-
-            # Save the chart as an image
-            img_path = os.path.join(self.images_dir, 'combined_stream_order_bar_chart.png')
-            # plt.tight_layout()  # Adjust layout to prevent clipping of labels
-            plt.savefig(img_path)
-            plt.close()
-
-            # Insert the image into your report or interface
-            self.insert_image(section, img_path, 'Combined Stream Order Length Chart')
+        # Insert the image into your report or interface
+        self.insert_image(section, img_path, 'Combined Stream Order Length Chart')
 
     def sinuosity(self, parent, rme_gpkg):
 
         section = self.section('SinuosityAnalysis', 'Sinuosity Analysis', parent, level=2)
 
-        with sqlite3.connect(rme_gpkg) as conn:
-            curs = conn.cursor()
-
-            # Prepare to collect data for both series
-            bin_sums_blm = None
-            bin_sums_non_blm = None
-            bin_midpoints = None
-
-            for owner, owner_filter in [('BLM', " = 'BLM'",), ('Non-BLM', " <> 'BLM'",)]:
-                curs.execute(f'''
-                    SELECT
-                        nhd_dgo_streamlength, rme_igo_planform_sinuosity
-                    FROM rme_igos
-                    WHERE (rme_igo_planform_sinuosity IS NOT NULL)
-                        AND (rme_dgo_ownership {owner_filter})''')
-
-                raw_data = [(row[0] * MILES_PER_M, row[1]) for row in curs.fetchall()]
-
-                if len(raw_data) == 0:
-                    continue
-
-                lengths, gradients = zip(*raw_data)
-                num_bins = 5
-
-                # Compute the bins
-                bin_edges = np.linspace(min(gradients), max(gradients), num_bins + 1)
-
-                # Sum stream lengths for each gradient bin
-                bin_sums = np.histogram(gradients, bins=bin_edges, weights=lengths)[0]
-
-                # Midpoints for bar chart x-axis
-                if bin_midpoints is None:
-                    bin_midpoints = (bin_edges[:-1] + bin_edges[1:]) / 2
-
-                # Store data for each owner
-                if owner == 'BLM':
-                    bin_sums_blm = bin_sums
-                else:
-                    bin_sums_non_blm = bin_sums
-
-            # Check if both series have data
-            if bin_sums_blm is not None and bin_sums_non_blm is not None:
-                # Plot the bar chart with two series
-                bar_width = (bin_edges[1] - bin_edges[0]) / 3  # Smaller width for grouped bars
-
-                plt.clf()
-                plt.bar(bin_midpoints - bar_width / 2, bin_sums_blm, width=bar_width, color=BLM_COLOR, label='BLM')
-                plt.bar(bin_midpoints + bar_width / 2, bin_sums_non_blm, width=bar_width, color=NON_BLM_COLOR, label='Non-BLM')
+        # Both ownership series come from a single read of the IGOs
+        frame = read_columns(rme_gpkg, 'rme_igos', ['rme_dgo_ownership', 'nhd_dgo_streamlength', 'rme_igo_planform_sinuosity'])
+        owners = frame['rme_dgo_ownership']
+        has_owner = np.array([owner is not None for owner in owners], dtype=bool)
+        all_lengths = frame.numeric('nhd_dgo_streamlength') * MILES_PER_M
+        all_sinuosity = frame.numeric('rme_igo_planform_sinuosity')
+        has_sinuosity = ~np.isnan(all_sinuosity)
+
+        # Prepare to collect data for both series
+        bin_sums_blm = None
+        bin_sums_non_blm = None
+        bin_midpoints = None
+
+        for owner, owner_mask in [('BLM', owners == 'BLM'), ('Non-BLM', has_owner & (owners != 'BLM'))]:
+            selected = owner_mask & has_sinuosity
+            if not np.any(selected):
+                continue
+
+            lengths = all_lengths[selected]
+            gradients = all_sinuosity[selected]
+            num_bins = 5
+
+            # Compute the bins
+            bin_edges = np.linspace(np.min(gradients), np.max(gradients), num_bins + 1)
+
+            # Sum stream lengths for each gradient bin
+            bin_sums = np.histogram(gradients, bins=bin_edges, weights=lengths)[0]
+
+            # Midpoints for bar chart x-axis
+            if bin_midpoints is None:
+                bin_midpoints = (bin_edges[:-1] + bin_edges[1:]) / 2
+
+            # Store data for each owner
+            if owner == 'BLM':
+                bin_sums_blm = bin_sums
+            else:
+                bin_sums_non_blm = bin_sums
 
-                # Add labels, legend, and grid
-                plt.xlabel('Sinuosity')
-                plt.ylabel('Summed Stream Lengths (miles)')
-                plt.title('Stream Lengths Summed by Sinuosity Bins (BLM vs Non-BLM)')
-                plt.grid(axis='y', linestyle='--', alpha=PLOT_ALPHA)
-                plt.legend()
+        # Check if both series have data
+        if bin_sums_blm is not None and bin_sums_non_blm is not None:
+            # Plot the bar chart with two series
+            bar_width = (bin_edges[1] - bin_edges[0]) / 3  # Smaller width for grouped bars
 
-                # Save the chart as an image
-                img_path = os.path.join(self.images_dir, 'combined_sinuosity_histogram.png')
-                plt.savefig(img_path, bbox_inches="tight")
-                plt.close()
+            img_path = os.path.join(self.images_dir, 'combined_sinuosity_histogram.png')
+            self.chart_jobs.append((sinuosity_chart, (bin_midpoints, bar_width, bin_sums_blm, bin_sums_non_blm, img_path)))
 
-                self.insert_image(section, img_path, 'Combined Sinuosity Histogram')
+            self.insert_image(section, img_path, 'Combined Sinuosity Histogram')
 
     def vegetation(self, biophysical_section, rcat_dir):
 
@@ -829,45 +922,8 @@ class WSCAReport(RSReport):
             existing_bin_sums = sum_lengths_by_bins(existing_lengths)
             historic_bin_sums = sum_lengths_by_bins(historic_lengths)
 
-            # Create the bar chart
-            bar_width = 0.4
-            x = np.arange(len(bin_labels))  # Positions for the bins
-
-            # Create bars with specific colors
-            plt.clf()
-            for i in range(len(bin_labels)):
-
-                plt.bar(
-                    x[i] - bar_width / 2,
-                    existing_bin_sums[i],
-                    bar_width,
-                    label='Existing Capacity' if i == 0 else "",  # Add label only for the first bin
-                    color=colors[i],
-                    edgecolor='black'
-                )
-
-                plt.bar(
-                    x[i] + bar_width / 2,
-                    historic_bin_sums[i],
-                    bar_width,
-                    label='Historic Capacity' if i == 0 else "",  # Add label only for the first bin
-                    color=colors[i],
-                    edgecolor='black',
-                    hatch='x'
-                )
-
-            # Add labels, title, and legend
-            plt.xlabel('Beaver Dam Capacity (dams per km) for Perennial Streams')
-            plt.ylabel('Riverscape Length (miles)')
-            plt.title('Historic and Existing Beaver Dam Capacity')
-            plt.xticks(x, bin_labels)  # Set custom x-axis labels
-            plt.legend()
-
-            # Save the chart
-            plt.tight_layout()
             img_path = os.path.join(self.images_dir, 'combined_capacity_histogram.png')
-            plt.savefig(img_path, bbox_inches="tight")
-            plt.close()
+            self.chart_jobs.append((beaver_capacity_chart, (bin_labels, colors, existing_bin_sums, historic_bin_sums, img_path)))
 
             self.insert_image(section, img_path, 'Combined Beaver Data Capacity Histogram')
 
@@ -894,7 +950,7 @@ FROM DamLimitations DL
             labels = [x[0] for x in data]
 
             img_path = os.path.join(self.images_dir, 'beaver_unsuitable.png')
-            horizontal_bar(values, labels, None, 'Stream Length (miles)', 'Beaver Unsuitable Habitat', img_path)
+            self.chart_jobs.append((horizontal_bar, (values, labels, None, 'Stream Length (miles)', 'Beaver Unsuitable Habitat', img_path)))
             self.insert_image(ecology_section, img_path, 'Unsuitable Beaver Habitat')
 
     def confinement(self, parent, rme_gpkg):
@@ -993,16 +1049,19 @@ and conf_igo_confinement_ratio is not null and centerline_length is not null and
                     AND ({field_name} is not null)
                     AND (centerline_length is not null)''')
 
-            for row in curs.fetchall():
-                owner = row[0] if row[0] == 'BLM' else 'Non-BLM'
-                flow = 'Perennial' if row[1] in [46006, 55800] else 'Non-Perennial'
-                cumulative_field_value = row[2] * unit_conversion
-                binning_value = row[3]
+            rows = curs.fetchall()
+            owners = np.array(['BLM' if row[0] == 'BLM' else 'Non-BLM' for row in rows], dtype=object)
+            perennial = np.isin(to_float([row[1] for row in rows]), [46006, 55800])
+            cumulative_values = to_float([row[2] for row in rows]) * unit_conversion
+            binning_values = to_float([row[3] for row in rows])
+            uppers = [upper for _label, upper in bin_uppers]
 
-                for label, upper in bin_uppers:
-                    if binning_value <= upper:
-                        data[owner][flow][label] += cumulative_field_value
-                        break
+            for owner in ['BLM', 'Non-BLM']:
+                for flow, flow_mask in [('Perennial', perennial), ('Non-Perennial', ~perennial)]:
+                    selected = (owners == owner) & flow_mask
+                    bin_sums = upper_bin_sums(binning_values[selected], cumulative_values[selected], uppers)
+                    for (label, _upper), bin_sum in zip(bin_uppers, bin_sums):
+                        data[owner][flow][label] += float(bin_sum)
 
             # Prepare data for the chart
             chart_data = []
@@ -1036,7 +1095,7 @@ and conf_igo_confinement_ratio is not null and centerline_length is not null and
             labels = [x[0] for x in densities]
 
             img_path = os.path.join(self.images_dir, 'vbet_density.png')
-            horizontal_bar(values, labels, [BLM_COLOR, 'green'], 'Density (Acres per Mile)', 'Valley Bottom Density Distribution', img_path)
+            self.chart_jobs.append((horizontal_bar, (values, labels, [BLM_COLOR, 'green'], 'Density (Acres per Mile)', 'Valley Bottom Density Distribution', img_path)))
             self.insert_image(section, img_path, 'Valley Bottom Density')
 
 
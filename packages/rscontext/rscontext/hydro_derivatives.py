@@ -1,4 +1,4 @@
-"""Functions for cleaning the NHDPlusFlowlineVAA table in an NHDPlus geopackage.
+"""Spatial views joining NHDPlus tables to feature classes in an NHDPlus geopackage.
 """
 
 import os
@@ -43,24 +43,4 @@ def create_spatial_view(nhd_gpkg_path: str, network_layer: str, join_table: str,
 
         conn.commit()
 
-        curs.execute('VACUUM')
-
     return os.path.join(nhd_gpkg_path, out_view)
-
-
-def clean_nhdplus_vaa_table(nhd_gpkg_path):
-    """Removes rows from the NHDPlusFlowlineVAA table that do not have a corresponding row in the NHDFlowline table.
-    """
-
-    with sqlite3.connect(nhd_gpkg_path) as conn:
-        curs = conn.cursor()
-        join_data = curs.execute('SELECT NHDPlusFlowlineVAA.NHDPlusID FROM NHDPlusFlowlineVAA LEFT JOIN NHDFlowline ON NHDPlusFlowlineVAA.NHDPlusID = NHDFlowline.NHDPlusID WHERE NHDFlowline.NHDPlusID IS NULL').fetchall()
-        del_ids = [i[0] for i in join_data]
-
-        for id in del_ids:
-            curs.execute('DELETE FROM NHDPlusFlowlineVAA WHERE NHDPlusFlowlineVAA.NHDPlusID = ?', [id])
-        conn.commit()
-
-        curs.execute('VACUUM')
-
-    return
@@ -0,0 +1,166 @@
+"""Set based cleaning of the NHDPlus HR tables in the RS Context NHD geopackage.
+
+Rows are pruned with a single anti-join DELETE per table instead of pulling the
+tables into Python and deleting one NHDPlusID at a time. None of these functions
+VACUUM the geopackage. Call vacuum_geopackage() once after all the cleaning is done.
+"""
+import sqlite3
+from typing import List, Tuple
+
+import numpy as np
+import shapely
+from osgeo import ogr
+from rsxml import Logger
+from rscommons.classes.vector_base import VectorBase
+
+# Number of boundary vertices summarized by each envelope used to query the spatial index
+ENVELOPE_VERTICES = 16
+
+
+def clean_nhdplus_vaa_table(nhd_gpkg_path: str) -> int:
+    """Removes rows from the NHDPlusFlowlineVAA table that do not have a corresponding row in the NHDFlowline table.
+
+    Args:
+        nhd_gpkg_path (str): NHD geopackage
+
+    Returns:
+        int: number of rows deleted
+    """
+
+    with sqlite3.connect(nhd_gpkg_path) as conn:
+        curs = conn.cursor()
+        curs.execute('CREATE INDEX IF NOT EXISTS ux_vaa_nhdplusid ON NHDPlusFlowlineVAA(NHDPlusID)')
+        curs.execute('CREATE INDEX IF NOT EXISTS ux_flowlines_nhdplusid ON NHDFlowline(NHDPlusID)')
+        curs.execute('''
+            DELETE FROM NHDPlusFlowlineVAA
+            WHERE NHDPlusID IS NOT NULL
+                AND NOT EXISTS (SELECT 1 FROM NHDFlowline WHERE NHDFlowline.NHDPlusID = NHDPlusFlowlineVAA.NHDPlusID)''')
+        deleted = curs.rowcount
+        conn.commit()
+
+    Logger('NHD Cleaning').info(f'Removed {deleted:,} NHDPlusFlowlineVAA rows without a flowline')
+    return deleted
+
+
+def clean_nhdplus_catchments(gpkg_path: str, huc_boundary_lyr: str, hucid: str) -> int:
+    """Removes polygons from the NHDPlusCatchment feature class that are outside of the input watershed boundary.
+
+    Catchments that cross the watershed boundary are removed unless they have a flowline
+    with a ReachCode in the HUC8 of the watershed.
+
+    Args:
+        gpkg_path (str): NHD geopackage
+        huc_boundary_lyr (str): watershed boundary layer in the geopackage (e.g. WBDHU10)
+        hucid (str): watershed HUC code
+
+    Returns:
+        int: number of catchments deleted
+    """
+
+    log = Logger('NHD Cleaning')
+
+    driver = ogr.GetDriverByName('GPKG')
+    nhdsrc = driver.Open(gpkg_path)
+    huclyr = nhdsrc.GetLayerByName(huc_boundary_lyr)
+    hucftrs = [feature for feature in huclyr]
+    bound = VectorBase.ogr2shapely(hucftrs[0]).boundary
+
+    with sqlite3.connect(gpkg_path) as conn:
+        curs = conn.cursor()
+        curs.execute('CREATE INDEX IF NOT EXISTS ux_catchments_nhdplusid ON NHDPlusCatchment(NHDPlusID)')
+        curs.execute('CREATE INDEX IF NOT EXISTS ux_flowlines_nhdplusid ON NHDFlowline(NHDPlusID)')
+
+        # Catchments whose bounding box touches the boundary, then the exact test on just those
+        candidates = boundary_candidates(curs, 'NHDPlusCatchment', bound)
+        catchlyr = nhdsrc.GetLayerByName('NHDPlusCatchment')
+        nhdplusids = []
+        geoms = []
+        for fid in candidates:
+            feature = catchlyr.GetFeature(fid)
+            if feature is None or feature.GetField('NHDPlusID') is None or feature.GetGeometryRef() is None:
+                continue
+            nhdplusids.append(int(feature.GetField('NHDPlusID')))
+            geoms.append(VectorBase.ogr2shapely(feature))
+
+        shapely.prepare(bound)
+        crossing = shapely.intersects(np.asarray(geoms, dtype=object), bound) if len(geoms) > 0 else np.empty(0, dtype=bool)
+
+        curs.execute('CREATE TEMP TABLE boundary_catchments (NHDPlusID INTEGER PRIMARY KEY)')
+        curs.executemany('INSERT OR IGNORE INTO boundary_catchments (NHDPlusID) VALUES (?)',
+                         [(nhdplusid,) for nhdplusid, crosses in zip(nhdplusids, crossing) if crosses])
+
+        curs.execute('''
+            DELETE FROM NHDPlusCatchment
+            WHERE NHDPlusID IN (
+                SELECT NHDPlusID FROM boundary_catchments b
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM NHDFlowline f
+                    WHERE f.NHDPlusID = b.NHDPlusID AND instr(f.ReachCode, ?) > 0))''', [hucid[:8]])
+        deleted = curs.rowcount
+        curs.execute('DROP TABLE boundary_catchments')
+        conn.commit()
+
+    nhdsrc = None
+    log.info(f'Removed {deleted:,} NHDPlusCatchment polygons crossing the {huc_boundary_lyr} boundary')
+    return deleted
+
+
+def boundary_envelopes(boundary, vertices: int = ENVELOPE_VERTICES) -> List[Tuple[float, float, float, float]]:
+    """Bounding boxes (minx, maxx, miny, maxy) that together cover a boundary line.
+
+    Each box covers a run of consecutive vertices so the boxes hug the boundary
+    instead of covering the whole watershed like the envelope of the boundary would.
+
+    Args:
+        boundary: shapely LineString or MultiLineString
+        vertices (int, optional): vertices per box. Defaults to ENVELOPE_VERTICES.
+
+    Returns:
+        List[Tuple[float, float, float, float]]: envelopes
+    """
+    envelopes = []
+    for line in getattr(boundary, 'geoms', [boundary]):
+        coords = shapely.get_coordinates(line)
+        # Consecutive runs share their end vertex so no segment is left uncovered
+        for start in range(0, max(len(coords) - 1, 1), vertices - 1):
+            run = coords[start:start + vertices]
+            envelopes.append((float(run[:, 0].min()), float(run[:, 0].max()), float(run[:, 1].min()), float(run[:, 1].max())))
+    return envelopes
+
+
+def boundary_candidates(curs: sqlite3.Cursor, table: str, boundary) -> List[int]:
+    """Feature IDs of a geopackage feature class whose bounding boxes touch a boundary line.
+
+    The envelopes of the boundary are loaded into a temp table and joined to the
+    feature class spatial index (rtree). Feature classes without a spatial index
+    return every feature ID.
+
+    Args:
+        curs (sqlite3.Cursor): cursor on the geopackage
+        table (str): feature class
+        boundary: shapely LineString or MultiLineString
+
+    Returns:
+        List[int]: candidate feature IDs
+    """
+    curs.execute('SELECT column_name FROM gpkg_geometry_columns WHERE table_name = ?', [table])
+    geom_col = curs.fetchone()
+    rtree = f'rtree_{table}_{geom_col[0]}' if geom_col is not None else None
+    if rtree is None or curs.execute("SELECT 1 FROM sqlite_master WHERE name = ?", [rtree]).fetchone() is None:
+        return [row[0] for row in curs.execute(f'SELECT fid FROM {table}')]
+
+    curs.execute('CREATE TEMP TABLE boundary_envelopes (minx REAL, maxx REAL, miny REAL, maxy REAL)')
+    curs.executemany('INSERT INTO boundary_envelopes VALUES (?, ?, ?, ?)', boundary_envelopes(boundary))
+    candidates = [row[0] for row in curs.execute(f'''
+        SELECT DISTINCT r.id FROM boundary_envelopes b
+        JOIN "{rtree}" r ON r.minx <= b.maxx AND r.maxx >= b.minx AND r.miny <= b.maxy AND r.maxy >= b.miny''')]
+    curs.execute('DROP TABLE boundary_envelopes')
+    return candidates
+
+
+def vacuum_geopackage(gpkg_path: str) -> None:
+    """Rebuild a geopackage to reclaim the space freed by the cleaning. Run once per context build."""
+    log = Logger('NHD Cleaning')
+    log.info(f'Vacuuming {gpkg_path}')
+    with sqlite3.connect(gpkg_path) as conn:
+        conn.execute('VACUUM')
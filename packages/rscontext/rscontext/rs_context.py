@@ -30,7 +30,7 @@ from rscommons.download_dem import download_dem, verify_areas
 from rscommons.filegdb import export_table
 from rscommons.geographic_raster import gdal_dem_geographic
 from rscommons.project_bounds import generate_project_extents_from_layer
-from rscommons.raster_warp import raster_vrt_stitch, raster_warp
+from rscommons.raster_prep import RasterPrep
 from rscommons.national_map import download_shapefile_collection, get_ntd_urls, us_states
 from rscommons.vector_ops import copy_feature_class, get_geometry_unary_union
 from rscommons.geometry_ops import get_rectangle_as_geom
@@ -39,9 +39,9 @@ from rscommons.segment_network import segment_network
 
 from rscontext.__version__ import __version__
 from rscontext.boundary_management import raster_area_intersection
-from rscontext.clean_catchments import clean_nhdplus_catchments
-from rscontext.hydro_derivatives import clean_nhdplus_vaa_table, create_spatial_view
+from rscontext.hydro_derivatives import create_spatial_view
 from rscontext.clip_vector import clip_vector_layer
+from rscontext.nhd_cleaning import clean_nhdplus_catchments, clean_nhdplus_vaa_table, vacuum_geopackage
 from rscontext.nhdarea import split_nhd_polygon, nhd_poly_level_paths
 from rscontext.rs_context_report import RSContextReport
 from rscontext.rs_segmentation import rs_segmentation
@@ -355,6 +355,9 @@ def rs_context(huc: str, landfire_dir: str, ownership: str, fair_market: str, ec
         raise Exception(
             f'Could not find any .bil files in the prism folder: {prism_folder}. Found: \n' + "\n".join(all_files))
 
+    # The PRISM, vegetation and fair market value rasters are clipped together further down
+    raster_prep = RasterPrep(cfg.OUTPUT_EPSG)
+    prism_rasters = []
     for ptype in PrismTypes:
         try:
             # Next should always be guarded
@@ -362,8 +365,8 @@ def rs_context(huc: str, landfire_dir: str, ownership: str, fair_market: str, ec
         except StopIteration as exc:
             raise Exception(f'Could not find .bil file corresponding to "{ptype}"') from exc
         prism_node, project_raster_path = project.add_project_raster(datasets, LayerTypes[ptype])
-        raster_warp(source_raster_path, project_raster_path, cfg.OUTPUT_EPSG, buffered_clip_path500, {"cutlineBlend": 1})
-        raster_resolution_meta(project, project_raster_path, prism_node)
+        raster_prep.add(source_raster_path, project_raster_path, buffered_clip_path500, {"cutlineBlend": 1}, overview_resampling='AVERAGE')
+        prism_rasters.append((project_raster_path, prism_node))
 
     states = get_nhd_states(nhd[boundary])
 
@@ -409,14 +412,8 @@ def rs_context(huc: str, landfire_dir: str, ownership: str, fair_market: str, ec
     processing_boundary = os.path.join(hydro_deriv_gpkg_path, LayerTypes['HYDRODERIVATIVES'].sub_layers['PROCESSING_EXTENT'].rel_path)
     raster_area_intersection(dem_rasters, nhd[boundary], processing_boundary)
     need_dem_rebuild = force_download or not os.path.exists(dem_raster)
-    if need_dem_rebuild:
-        raster_vrt_stitch(dem_rasters, dem_raster, cfg.OUTPUT_EPSG, clip=processing_boundary, warp_options={"cutlineBlend": 1})
-        area_ratio = verify_areas(dem_raster, nhd[boundary])
-        if area_ratio < 0.85:
-            log.warning(f'DEM data less than 85%% of nhd extent ({area_ratio:%})')
-            # raise Exception(f'DEM data less than 85%% of nhd extent ({area_ratio:%})')
 
-    # Calculate slope rasters seperately and then stitch them
+    # Calculate slope rasters seperately and then stitch them together with the DEM
     slope_parts = []
     hillshade_parts = []
 
@@ -442,14 +439,28 @@ def rs_context(huc: str, landfire_dir: str, ownership: str, fair_market: str, ec
             gdal_dem_geographic(dem_r, hs_part_path, 'hillshade')
             need_hs_build = True
 
+    # The DEM, slope and hillshade mosaics share the processing boundary cutline and are built concurrently
+    with RasterPrep(cfg.OUTPUT_EPSG) as topo_prep:
+        if need_dem_rebuild:
+            topo_prep.add(dem_rasters, dem_raster, clip=processing_boundary, warp_options={"cutlineBlend": 1}, overview_resampling='AVERAGE')
+        if need_slope_build:
+            topo_prep.add(slope_parts, slope_raster, clip=processing_boundary, warp_options={"cutlineBlend": 1}, overview_resampling='AVERAGE', clean=parallel)
+        if need_hs_build:
+            topo_prep.add(hillshade_parts, hill_raster, clip=processing_boundary, warp_options={"cutlineBlend": 1}, overview_resampling='AVERAGE', clean=parallel)
+        topo_prep.run()
+
+    if need_dem_rebuild:
+        area_ratio = verify_areas(dem_raster, nhd[boundary])
+        if area_ratio < 0.85:
+            log.warning(f'DEM data less than 85%% of nhd extent ({area_ratio:%})')
+            # raise Exception(f'DEM data less than 85%% of nhd extent ({area_ratio:%})')
+
     if need_slope_build:
-        raster_vrt_stitch(slope_parts, slope_raster, cfg.OUTPUT_EPSG, clip=processing_boundary, clean=parallel, warp_options={"cutlineBlend": 1})
         verify_areas(slope_raster, nhd[boundary])
     else:
         log.info('Skipping slope build because nothing has changed.')
 
     if need_hs_build:
-        raster_vrt_stitch(hillshade_parts, hill_raster, cfg.OUTPUT_EPSG, clip=processing_boundary, clean=parallel, warp_options={"cutlineBlend": 1})
         verify_areas(hill_raster, nhd[boundary])
     else:
         log.info('Skipping hillshade build because nothing has changed.')
@@ -475,11 +486,18 @@ def rs_context(huc: str, landfire_dir: str, ownership: str, fair_market: str, ec
     ]
     out_veg_rasters = [existing_clip, historic_clip, veg_cover_clip, veg_height_clip,
                        hdist_clip, fdist_clip, fccs_clip, veg_condition_clip, veg_departure_clip, sclass_clip]
-    clip_vegetation(buffered_clip_path100, in_veg_rasters, out_veg_rasters, cfg.OUTPUT_EPSG)
+    clip_vegetation(buffered_clip_path100, in_veg_rasters, out_veg_rasters, cfg.OUTPUT_EPSG, raster_prep=raster_prep)
 
     ################################################################################################################################################
     log.info('Process the Fair Market Value Raster.')
-    raster_warp(fair_market, fair_market_clip, cfg.OUTPUT_EPSG, clip=buffered_clip_path500, warp_options={"cutlineBlend": 1})
+    raster_prep.add(fair_market, fair_market_clip, clip=buffered_clip_path500, warp_options={"cutlineBlend": 1}, overview_resampling='AVERAGE')
+
+    # Clip the PRISM, vegetation and fair market value rasters concurrently
+    with raster_prep:
+        raster_prep.run()
+
+    for project_raster_path, prism_node in prism_rasters:
+        raster_resolution_meta(project, project_raster_path, prism_node)
 
     ################################################################################################################################################
     # Clip the landownership Shapefile to a 10km buffer around the watershed boundary
@@ -527,6 +545,9 @@ def rs_context(huc: str, landfire_dir: str, ownership: str, fair_market: str, ec
     catchment_fields = {'fid': 'fid', 'geom': 'geom', 'NHDPlusID': 'NHDPlusID', 'AreaSqKM': 'AreaSqKM'}
     view_vaa_catchments = create_spatial_view(nhd_gpkg_path, 'NHDPlusCatchment', 'NHDPlusFlowlineVAA', 'vw_NHDPlusCatchmentVAA', catchment_fields, vaa_fields, 'NHDPlusID', 'POLYGON')
 
+    # Reclaim the space freed by cleaning the NHD tables once, now that the NHD geopackage is complete
+    vacuum_geopackage(nhd_gpkg_path)
+
     # copy the NHD Catchments to the hydro_derivatives geopackage
     catchments = os.path.join(hydro_deriv_gpkg_path, LayerTypes['HYDRODERIVATIVES'].sub_layers['CATCHMENTS'].rel_path)
     copy_feature_class(view_vaa_catchments, catchments, epsg=cfg.OUTPUT_EPSG)
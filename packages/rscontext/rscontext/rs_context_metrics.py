@@ -9,10 +9,11 @@ import sys
 from math import pi
 import json
 from shapely.geometry import Point
-from osgeo import ogr, osr
-from rscommons import GeopackageLayer, RSProject, RSLayer, ShapefileLayer
+from osgeo import ogr
+from rscommons import GeopackageLayer, RSProject, RSLayer
 from rsxml import dotenv, Logger
 from rscommons.classes.vector_base import VectorBase, get_utm_zone_epsg
+from rscommons.ownership_overlay import OwnershipOverlay
 from rscommons.raster_buffer_stats import raster_buffer_stats2
 
 
@@ -152,33 +153,10 @@ def land_ownership(project_path: str, ) -> dict:
         centroid: ogr.Geometry = geom_huc10.Centroid()
         x, _y, _ = centroid.GetPoint()
         utm = get_utm_zone_epsg(x)
-        srs_utm = osr.SpatialReference()
-        srs_utm.ImportFromEPSG(utm)
 
-    # Loop over all ownership polygons and intersect with watershed
-    ownership_areas = {}
-    with ShapefileLayer(os.path.join(project_path, 'ownership', 'ownership.shp')) as land_owner:
-        for feature, *_ in land_owner.iterate_features(clip_shape=geom_huc10):
-            feature: ogr.Feature
-            owner = feature.GetField('ADMIN_AGEN')
-            if owner is None or owner == '':
-                continue
-
-            geom: ogr.Geometry = feature.GetGeometryRef()
-            geom.TransformTo(huc_srs)
-            intersection = geom.Intersection(geom_huc10)
-            if intersection is None or intersection.IsEmpty():
-                continue
-            intersection.MakeValid()
-            if intersection.IsEmpty() or intersection.GetArea() == 0.0:
-                continue
-
-            if owner not in ownership_areas:
-                ownership_areas[owner] = 0.0
-
-            # Store the intersection area in the UTM projection
-            intersection.TransformTo(srs_utm)
-            ownership_areas[owner] += intersection.GetArea()
+    # Load and clip the ownership polygons to the watershed once, then total the areas by agency in the UTM projection
+    overlay = OwnershipOverlay.from_layer(os.path.join(project_path, 'ownership', 'ownership.shp'), clip_shape=VectorBase.ogr2shapely(geom_huc10))
+    ownership_areas = overlay.area_by_agency(epsg=utm)
 
     return ownership_areas
 
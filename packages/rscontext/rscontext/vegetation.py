@@ -2,10 +2,10 @@ import os
 import rasterio
 import numpy as np
 from rsxml import Logger
-from rscommons.raster_warp import raster_warp
+from rscommons.raster_prep import RasterPrep
 
 
-def clip_vegetation(boundary_path: str, veg_rasters: list, veg_raster_clips: list, output_epsg: int):
+def clip_vegetation(boundary_path: str, veg_rasters: list, veg_raster_clips: list, output_epsg: int, raster_prep: RasterPrep = None):
     """[summary]
 
     Args:
@@ -13,6 +13,7 @@ def clip_vegetation(boundary_path: str, veg_rasters: list, veg_raster_clips: lis
         veg_rasters (list): List of paths to all landfire rasters
         veg_raster_clips (list): List of output paths for clipped vegetation rasters; these two lists must be in the same order
         output_epsg (int): EPSG
+        raster_prep (RasterPrep, optional): Batch to add the clips to. The caller runs it. Defaults to None, meaning the clips are run here.
     """
     log = Logger('Vegetation Clip')
 
@@ -23,13 +24,8 @@ def clip_vegetation(boundary_path: str, veg_rasters: list, veg_raster_clips: lis
         msg = 'Number of vegetation rasters does not match number of output vegetation raster clips'
         raise ValueError(msg)
 
-    # https://gdal.org/python/osgeo.gdal-module.html#WarpOptions
-    warp_options = {"cutlineBlend": 2}
-
-    for i, rast in enumerate(veg_rasters):
-
-        log.info(f'Clipping vegetation raster {i + 1} of {len(veg_rasters)}: {rast}')
-
+    # Check all the rasters before clipping any of them
+    for rast in veg_rasters:
         if not os.path.isfile(rast):
             msg = f'Raster {rast} does not exist'
             raise FileNotFoundError(msg)
@@ -39,9 +35,6 @@ def clip_vegetation(boundary_path: str, veg_rasters: list, veg_raster_clips: lis
             widths.append(meta['transform'][0])
             heights.append(meta['transform'][4])
 
-        # Now do the raster warp
-        raster_warp(rast, veg_raster_clips[i], output_epsg, clip=boundary_path, warp_options=warp_options)
-
     if len(np.unique(widths)) > 1:
         msg = 'One or more vegetation raster cell widths do not match'
         raise Exception(msg)
@@ -49,4 +42,17 @@ def clip_vegetation(boundary_path: str, veg_rasters: list, veg_raster_clips: lis
         msg = 'One or more vegetation raster cell heights do not match'
         raise Exception(msg)
 
+    # https://gdal.org/python/osgeo.gdal-module.html#WarpOptions
+    warp_options = {"cutlineBlend": 2}
+
+    # All the rasters share the boundary cutline and are clipped concurrently
+    prep = RasterPrep(output_epsg) if raster_prep is None else raster_prep
+    for i, rast in enumerate(veg_rasters):
+        log.info(f'Queueing vegetation raster {i + 1} of {len(veg_rasters)}: {rast}')
+        prep.add(rast, veg_raster_clips[i], clip=boundary_path, warp_options=warp_options)
+
+    if raster_prep is None:
+        with prep:
+            prep.run()
+
     log.info('Complete')
@@ -0,0 +1,148 @@
+"""
+Name:       Epoch Stats
+
+Purpose:    Zonal statistics of a stack of epoch rasters over the DGO polygons.
+
+            The DGOs are rasterized once into a label grid for each raster grid and each
+            epoch raster is then read block by block in a single pass, counting the cells
+            of every DGO that reach every threshold at the same time. The resulting
+            attributes for all rasters and thresholds are written back to the DGO
+            layer in one go.
+"""
+from typing import Dict, List, Tuple
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.features import rasterize
+
+from rsxml import Logger
+from rscommons.classes.vector_classes import VectorBase
+
+# Attribute suffixes produced for each raster and threshold
+STAT_KEYS = ['area', 'areapc', 'width', 'widthpc']
+
+
+class DGOZones:
+    """DGO polygons and their measurements, with label grids cached per raster grid
+
+    Label i + 1 in a label grid is the DGO at position i. Cells are assigned to the DGO
+    that contains the cell centre (the same rule as rasterio.mask.mask).
+
+    Args:
+        polygon_path (str): DGO feature class (GeoPackage path/layer)
+    """
+
+    def __init__(self, polygon_path: str):
+        self.gpkg, self.layer = VectorBase.path_sorter(polygon_path)
+        gdf = gpd.read_file(self.gpkg, layer=self.layer, fid_as_index=True)
+
+        self.fids = gdf.index.to_numpy(dtype=np.int64)
+        self.geometries = gdf.geometry.values
+        self.areas = gdf.geometry.area.to_numpy(dtype=np.float64)
+        self.lengths = gdf['centerline_length'].to_numpy(dtype=np.float64)
+        self._labels = {}
+
+    def __len__(self) -> int:
+        return len(self.fids)
+
+    def labels(self, transform, shape) -> np.ndarray:
+        """Label grid of the DGOs for a raster grid (rasterized once per grid)"""
+        key = (tuple(transform), tuple(shape))
+        if key not in self._labels:
+            shapes = ((geom, idx + 1) for idx, geom in enumerate(self.geometries) if geom is not None and not geom.is_empty)
+            self._labels[key] = rasterize(shapes, out_shape=shape, transform=transform, fill=0, all_touched=False, dtype='int32')
+        return self._labels[key]
+
+
+def threshold_counts(raster_path: str, zones: DGOZones, thresholds: List[float]) -> Tuple[Dict[float, np.ndarray], float]:
+    """Count the cells of every DGO that reach each threshold in one pass over the raster
+
+    Args:
+        raster_path (str): epoch raster
+        zones (DGOZones): DGO polygons
+        thresholds (List[float]): cell values at or above a threshold are counted
+
+    Returns:
+        Tuple[Dict[float, np.ndarray], float]: threshold -> count per DGO (NaN for DGOs with no valid cells) and the cell area
+    """
+    log = Logger('Epoch Stats')
+    log.info(f'Counting cells for {len(thresholds)} thresholds in {raster_path}')
+
+    size = len(zones) + 1
+    valid_counts = np.zeros(size, dtype=np.int64)
+    counts = {threshold: np.zeros(size, dtype=np.int64) for threshold in thresholds}
+
+    with rasterio.open(raster_path) as src:
+        labels = zones.labels(src.transform, src.shape)
+        cell_area = src.res[0] * src.res[1]
+
+        for _ij, window in src.block_windows(1):
+            row_slice, col_slice = window.toslices()
+            block_labels = labels[row_slice, col_slice]
+            inside = block_labels > 0
+            if not np.any(inside):
+                continue
+
+            data = src.read(1, window=window)
+            valid = inside
+            if src.nodata is not None:
+                valid &= data != src.nodata
+            if np.issubdtype(data.dtype, np.floating):
+                valid &= ~np.isnan(data)
+
+            block_labels = block_labels[valid]
+            data = data[valid]
+            valid_counts += np.bincount(block_labels, minlength=size)
+            for threshold, threshold_count in counts.items():
+                threshold_count += np.bincount(block_labels[data >= threshold], minlength=size)
+
+    has_data = valid_counts[1:] > 0
+    return {threshold: np.where(has_data, threshold_count[1:], np.nan) for threshold, threshold_count in counts.items()}, cell_area
+
+
+def dgo_stats(zones: DGOZones, counts: np.ndarray, cell_area: float) -> Dict[str, np.ndarray]:
+    """Area, area percent, width and width percent of the cells counted in each DGO
+
+    Args:
+        zones (DGOZones): DGO polygons
+        counts (np.ndarray): cell count per DGO (NaN where the DGO has no valid cells)
+        cell_area (float): area of one raster cell
+
+    Returns:
+        Dict[str, np.ndarray]: one array per STAT_KEYS entry. Values are NaN where they can't be calculated.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        area = counts * cell_area
+        dgo_width = np.where(zones.lengths != 0, zones.areas / zones.lengths, 0)
+
+        areapc = np.where((zones.areas != 0) & (area != 0), area / zones.areas * 100, np.nan)
+        width = np.where(zones.lengths != 0, area / zones.lengths, np.nan)
+        widthpc = np.where((dgo_width != 0) & (width != 0), width / dgo_width * 100, np.nan)
+
+    return {
+        'area': area,
+        'areapc': np.clip(areapc, 0.0, 100.0),
+        'width': width,
+        'widthpc': np.clip(widthpc, 0.0, 100.0)
+    }
+
+
+def write_dgo_attributes(zones: DGOZones, columns: Dict[str, np.ndarray]) -> None:
+    """Add (or overwrite) columns on the DGO layer, rewriting the layer only once
+
+    Args:
+        zones (DGOZones): DGO polygons the column values are ordered by
+        columns (Dict[str, np.ndarray]): column name -> one value per DGO
+    """
+    log = Logger('Epoch Stats')
+    if len(columns) == 0:
+        return
+
+    log.info(f'Writing {len(columns)} attributes to {len(zones):,} DGOs')
+    gdf = gpd.read_file(zones.gpkg, layer=zones.layer, fid_as_index=True)
+    for name, values in columns.items():
+        gdf[name] = pd.Series(values, index=zones.fids)
+
+    gdf.to_file(zones.gpkg, layer=zones.layer, driver="GPKG")
@@ -15,21 +15,18 @@ import sys
 import argparse
 import sqlite3
 import traceback
-from typing import Tuple, List
+from typing import Dict, Tuple, List
 from datetime import datetime
-import geopandas as gpd
-import rasterio
-import rasterio.mask
 import numpy as np
 
 from rscommons import initGDALOGRErrors, ModelConfig
 from rsxml import Logger, dotenv
 from rscommons.classes.rs_project import RSLayer, RSProject, RSMeta, RSMetaTypes
-from rscommons.classes.vector_classes import VectorBase
 from rscommons.raster_warp import raster_warp
 from rscommons.vector_ops import copy_feature_class
 from rsxml.util import safe_makedirs
 from rsdynamics.__version__ import __version__
+from rsdynamics.epoch_stats import DGOZones, STAT_KEYS, dgo_stats, threshold_counts, write_dgo_attributes
 
 cfg = ModelConfig('https://xml.riverscapes.net/Projects/XSD/V2/RiverscapesProject.xsd', __version__)
 cfg.OUTPUT_EPSG = 2193  # NZTM
@@ -73,29 +70,46 @@ def rsdynamics(watershed_id: str, vbet_project_xml: str, thresholds: List[float]
     # As we are calculating stats, keep track of the spatial views we need to create later
     spatial_view_attributes = []
 
+    # Rasterize the DGOs once and count the cells at or above every threshold in a single pass over each epoch raster
+    zones = DGOZones(vbet_dgos)
+    selected_epochs = []
+    raster_counts = {}
+    for epoch_key, epoch_data in epoch_sets.items():
+
+        if epoch_data['epoch_length'] not in epochs:
+            log.info(f'Skipping epoch {epoch_key} because its length ({epoch_data["epoch_length"]}) is not in the specified epochs list')
+            continue
+
+        if epoch_data['wet'] is None or epoch_data['active'] is None:
+            log.warning(f'Skipping epoch {epoch_key} because either wet or active raster rasters are missing')
+            continue
+
+        selected_epochs.append(epoch_key)
+        if epoch_data['epoch_length'] > 1:
+            for raster_type in ['active', 'wet']:
+                raster_counts[epoch_data[raster_type]] = threshold_counts(epoch_data[raster_type], zones, thresholds)
+
+    # DGO attribute name -> value per DGO. Written to the GeoPackage in one go once every statistic is calculated
+    dgo_columns = {}
+
     # Loop over each threshold (e.g. 0.68, 0.95) and calculate stats for each epoch raster set
     for threshold in thresholds:
 
         log.info(f'Calculating zonal stats for threshold: {threshold}')
-        for epoch_key, epoch_data in epoch_sets.items():
-
-            if epoch_data['epoch_length'] not in epochs:
-                log.info(f'Skipping epoch {epoch_key} because its length ({epoch_data["epoch_length"]}) is not in the specified epochs list')
-                continue
-
-            if epoch_data['wet'] is None or epoch_data['active'] is None:
-                log.warning(f'Skipping epoch {epoch_key} because either wet or active raster rasters are missing')
-                continue
+        for epoch_key in selected_epochs:
+            epoch_data = epoch_sets[epoch_key]
 
             att_prefix = f'{epoch_key}_{int(threshold*100)}pc'.replace('-', '_')
             log.info(f'Processing epoch: {epoch_key} to produce attribute with prefix: {att_prefix}')
 
             if epoch_data['epoch_length'] > 1:
-                calc_raster_stats(epoch_data['active'], vbet_dgos, f'active_{att_prefix}', threshold, spatial_view_attributes)
-                calc_raster_stats(epoch_data['wet'], vbet_dgos, f'wet_{att_prefix}', threshold, spatial_view_attributes)
+                calc_raster_stats(raster_counts[epoch_data['active']], zones, f'active_{att_prefix}', threshold, dgo_columns, spatial_view_attributes)
+                calc_raster_stats(raster_counts[epoch_data['wet']], zones, f'wet_{att_prefix}', threshold, dgo_columns, spatial_view_attributes)
 
             # TODO: Reintroduce stable
-            # calc_stable_stats(vbet_dgos, att_prefix, threshold, spatial_view_attributes)
+            # calc_stable_stats(zones, att_prefix, dgo_columns, spatial_view_attributes)
+
+    write_dgo_attributes(zones, dgo_columns)
 
     # Create the output Riverscapes project.rs.xml based on the rscontext XML
     rsd_project = build_dynamics_project(vbet_project_xml, output_dir)
@@ -431,135 +445,57 @@ def process_epoch_rasters(raster_folder: str, output_dir: str, vbet_dgos: str) -
     return raster_paths
 
 
-def calc_raster_stats(raster_path: str, polygon_path: str, prefix: str, threshold: float, spatial_view_attributes: list) -> None:
+def calc_raster_stats(raster_counts: Tuple[Dict[float, np.ndarray], float], zones: DGOZones, prefix: str, threshold: float,
+                      dgo_columns: Dict[str, np.ndarray], spatial_view_attributes: list) -> None:
     """
-    Calculate zonal statistics for a raster based on polygons in a vector file.
-    The stats are added as new columns to the input vector file and saved to a new
-    output file (GeoPackage or Shapefile).
+    Calculate zonal statistics of an epoch raster for every DGO polygon from the cell
+    counts of that raster (see epoch_stats.threshold_counts). The stats are added
+    to dgo_columns and written to the DGO feature class later in one go.
     """
 
     log = Logger('Raster Stats')
-    log.info(f'Calculating raster stats for {prefix} at {raster_path}')
-
-    # Load polygons from the feature class that is already in the RS Dynamics project
-    gpkg, layer = VectorBase.path_sorter(polygon_path)
-    gdf = gpd.read_file(gpkg, layer=layer)
+    log.info(f'Calculating raster stats for {prefix}')
 
-    # Make lists to hold the stats
-    stats = {
-        "area": [],
-        "areapc": [],
-        "width": [],
-        "widthpc": []
-    }
+    counts, cell_area = raster_counts
+    stats = dgo_stats(zones, counts[threshold], cell_area)
 
-    # Set up the columns in the GeoDataFrame
     # Specify which spatial views are needed for the attributes
-    for stat_key in stats:
+    for stat_key in STAT_KEYS:
         attribute_name = f'{prefix}_{stat_key}'
-        gdf[attribute_name] = np.nan
+        dgo_columns[attribute_name] = stats[stat_key]
         spatial_view_attributes.append(attribute_name)
 
-    # Open the raster and calculate stats for each polygon using a mask
-    with rasterio.open(raster_path) as src:
-        for _, row in gdf.iterrows():
-
-            # Get the area of the polygon
-            dgo_area = row.geometry.area
-            dgo_length = row['centerline_length']
-            dgo_width = dgo_area / dgo_length if dgo_length != 0 else 0
-            # dgo_areas.append(dgo_area)
-
-            out_image, __out_transform = rasterio.mask.mask(src, [row.geometry], crop=True)
-            data = out_image[0]
-            data = data[data != src.nodata]
-            data = data[~np.isnan(data)]
-            if data.size > 0:
-
-                # Count the number of pixels with value 0.95 or above
-                count = np.sum(data >= threshold)
-                raster_area = float(count) * (src.res[0] * src.res[1])
-                stats['area'].append(raster_area)
-
-                row[f'{prefix}_area'] = raster_area
-
-                areapc = (raster_area / dgo_area) * 100 if dgo_area != 0 and raster_area != 0 else np.nan
-                areapc = min(areapc, 100.0)
-                areapc = max(areapc, 0.0)
-                stats['areapc'].append(areapc)
-
-                width = raster_area / dgo_length if dgo_length != 0 else np.nan
-                stats['width'].append(width)
-
-                widthpc = (width / dgo_width) * 100 if dgo_width != 0 and width != 0 else np.nan
-                widthpc = min(widthpc, 100.0)
-                widthpc = max(widthpc, 0.0)
-                stats['widthpc'].append(widthpc)
-            else:
-                for key, __value in stats.items():
-                    stats[key].append(np.nan)
-
-    # Assign the stats back to the GeoDataFrame
-    for stat_key, values in stats.items():
-        attribute_name = f'{prefix}_{stat_key}'
-        gdf[attribute_name] = values
-
-    # Write back to GeoPackage
-    gdf.to_file(gpkg, layer=layer, driver="GPKG")
-
 
-def calc_stable_stats(vbet_dgos: str, att_prefix: str, threshold: float, spatial_view_attributes: list) -> None:
+def calc_stable_stats(zones: DGOZones, att_prefix: str, dgo_columns: Dict[str, np.ndarray], spatial_view_attributes: list) -> None:
     """
     Calculate the stable area as the residual area after subtracting wetted,
     and alluvial areas from the total DGO area."""
 
-    # Load polygons from the feature class that is already in the RS Dynamics project
-    gpkg, layer = VectorBase.path_sorter(vbet_dgos)
-    gdf = gpd.read_file(gpkg, layer=layer)
-
-    stable_areas = []
-    stable_area_pcs = []
-    stable_widths = []
-    for _, row in gdf.iterrows():
-        dgo_area = row.geometry.area
-        dgo_length = row['centerline_length']
-
-        if f'wet_{att_prefix}_area' not in row or f'active_{att_prefix}_area' not in row:
-            stable_areas.append(np.nan)
-            stable_area_pcs.append(np.nan)
-            stable_widths.append(np.nan)
-            continue
-
-        wetted_area = row[f'wet_{att_prefix}_area']
-        alluvial_area = row[f'active_{att_prefix}_area']
-
-        if np.isnan(wetted_area) or np.isnan(alluvial_area):
-            stable_areas.append(np.nan)
-            stable_area_pcs.append(np.nan)
-            stable_widths.append(np.nan)
-            continue
-
-        stable_area = dgo_area - (wetted_area + alluvial_area)
-        stable_areas.append(stable_area)
-
-        stable_area_pc = (stable_area / dgo_area * 100) if dgo_area != 0 else 0
-        stable_area_pc = min(stable_area_pc, 100.0)
-        stable_area_pc = max(stable_area_pc, 0.0)
-        stable_area_pcs.append(stable_area_pc)
+    wetted_area = dgo_columns.get(f'wet_{att_prefix}_area')
+    alluvial_area = dgo_columns.get(f'active_{att_prefix}_area')
 
-        stable_width = stable_area / dgo_length if dgo_length != 0 else 0
-        stable_widths.append(stable_width)
-
-    gdf[f'stable_{att_prefix}_area'] = stable_areas
-    gdf[f'stable_{att_prefix}_pc'] = stable_area_pcs
-    gdf[f'stable_{att_prefix}_width'] = stable_widths
+    if wetted_area is None or alluvial_area is None:
+        stable_areas = np.full(len(zones), np.nan)
+        stable_area_pcs = np.full(len(zones), np.nan)
+        stable_widths = np.full(len(zones), np.nan)
+    else:
+        # NaN wetted or alluvial areas propagate to all three stats
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stable_areas = zones.areas - (wetted_area + alluvial_area)
+            stable_area_pcs = np.clip(np.where(zones.areas != 0, stable_areas / zones.areas * 100, 0), 0.0, 100.0)
+            stable_widths = np.where(zones.lengths != 0, stable_areas / zones.lengths, 0)
+        missing = np.isnan(stable_areas)
+        stable_area_pcs[missing] = np.nan
+        stable_widths[missing] = np.nan
+
+    dgo_columns[f'stable_{att_prefix}_area'] = stable_areas
+    dgo_columns[f'stable_{att_prefix}_pc'] = stable_area_pcs
+    dgo_columns[f'stable_{att_prefix}_width'] = stable_widths
 
     spatial_view_attributes.append(f'stable_{att_prefix}_area')
     spatial_view_attributes.append(f'stable_{att_prefix}_pc')
     spatial_view_attributes.append(f'stable_{att_prefix}_width')
 
-    gdf.to_file(gpkg, layer=layer, driver="GPKG")
-
 
 def main():
     """ Main entry point for New Zealand RS Context"""
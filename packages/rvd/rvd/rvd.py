@@ -200,13 +200,14 @@ def rvd(huc: int, flowlines_orig: Path, existing_veg_orig: Path, historic_veg_or
     watershed_name = create_database(huc, outputs_gpkg_path, metadata, cfg.OUTPUT_EPSG, os.path.join(os.path.abspath(os.path.dirname(__file__)), '..', 'database', 'rvd_schema.sql'))
     project.add_metadata([RSMeta('Watershed', watershed_name)])
 
-    geom_vbottom = get_geometry_unary_union(vbottom_path, spatial_ref=raster_srs)
+    # These HUC wide polygon layers can hold thousands of features so they are unioned in partitions across every CPU
+    geom_vbottom = get_geometry_unary_union(vbottom_path, spatial_ref=raster_srs, max_workers=None)
 
     flowareas_path = None
     if flow_areas_orig:
         flowareas_path = os.path.join(inputs_gpkg_path, LayerTypes['INPUTS'].sub_layers['FLOW_AREA'].rel_path)
         copy_feature_class(flow_areas_orig, flowareas_path, epsg=cfg.OUTPUT_EPSG)
-        geom_flow_areas = get_geometry_unary_union(flowareas_path)
+        geom_flow_areas = get_geometry_unary_union(flowareas_path, max_workers=None)
         # Difference with existing vbottom
         geom_vbottom = geom_vbottom.difference(geom_flow_areas)
     else:
@@ -216,7 +217,7 @@ def rvd(huc: int, flowlines_orig: Path, existing_veg_orig: Path, historic_veg_or
     if waterbodies_orig:
         waterbodies_path = os.path.join(inputs_gpkg_path, LayerTypes['INPUTS'].sub_layers['WATERBODIES'].rel_path)
         copy_feature_class(waterbodies_orig, waterbodies_path, epsg=cfg.OUTPUT_EPSG)
-        geom_waterbodies = get_geometry_unary_union(waterbodies_path)
+        geom_waterbodies = get_geometry_unary_union(waterbodies_path, max_workers=None)
         # Difference with existing vbottom
         geom_vbottom = geom_vbottom.difference(geom_waterbodies)
     else:
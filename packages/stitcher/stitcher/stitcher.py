@@ -10,10 +10,13 @@ import traceback
 import shutil
 import tempfile
 import zipfile
-import subprocess
+import sqlite3
 import argparse
+from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from osgeo import ogr
 from rscommons import (initGDALOGRErrors)
-from rsxml import Logger, dotenv
+from rsxml import Logger, ProgressBar, dotenv
 
 # Literal list of VBET feature classes to be stitched together.
 # This should be enhanced to "self discover" the feature classes
@@ -52,48 +55,217 @@ feature_classes = {
 
 }
 
+# OGR geometry type that each feature_classes key is forced to
+GEOMETRY_TYPES = {
+    'POLYGON': ogr.wkbPolygon,
+    'LINESTRING': ogr.wkbLineString,
+    'POINT': ogr.wkbPoint
+}
+
+
+def extract_gpkg(zip_path: str, relative_input_gpkg: str, dest_path: str) -> str:
+    """Pull just the one GeoPackage we need out of a project zip
+
+    Args:
+        zip_path (str): project zip downloaded from the Data Exchange
+        relative_input_gpkg (str): RELATIVE path of the GeoPackage inside the project
+        dest_path (str): where to write the extracted GeoPackage
+
+    Returns:
+        str: dest_path, or None if the project doesn't contain the GeoPackage
+    """
+    member_name = relative_input_gpkg.replace(os.sep, '/')
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        # Projects are sometimes zipped with a top level folder so match on the end of the path
+        members = [name for name in zip_ref.namelist() if name == member_name or name.endswith('/' + member_name)]
+        if len(members) == 0:
+            return None
+        with zip_ref.open(members[0]) as src, open(dest_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 2 ** 20)
+    return dest_path
+
+
+def get_columns(gpkg: str, table: str) -> List[str]:
+    """Non primary key column names for a GeoPackage table (empty list if the table doesn't exist)"""
+    with sqlite3.connect(gpkg) as conn:
+        rows = conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+    return [row[1] for row in rows if row[5] == 0]
 
-def stitch_projects(directory: str, relative_input_gpkg, output_gpkg: str, layers) -> None:
+
+def stitch_projects(directory: str, relative_input_gpkg, output_gpkg: str, layers, max_workers: int = None) -> None:
     """
     Stich together multiple VBET projects into a single geopackage
     directory: str - path to directory containing VBET zips downloaded from Data Exchange
     output_gpkg: str - path to output geopackage
+    max_workers: int - number of archives to extract ahead of the stitching. Defaults to the CPU count.
     """
+    log = Logger('Stitcher')
 
     # Get a list of zip files in the directory
     zip_files = [file for file in os.listdir(directory) if file.endswith('.zip')]
+    geometry_types = {fc: geometry_type for geometry_type, feature_class_list in layers.items() for fc in feature_class_list}
+    feature_class_names = list(geometry_types.keys())
+    max_workers = max_workers or os.cpu_count()
+
+    out_ds = ogr.Open(output_gpkg, 1)
+    if out_ds is None:
+        raise Exception(f'Unable to open the output GeoPackage {output_gpkg}')
+
+    out_columns = {fc: get_columns(output_gpkg, fc) for fc in feature_class_names}
+
+    # Drop the spatial indexes so the appends don't pay for R-Tree maintenance on every row.
+    # They get rebuilt once at the end.
+    geom_columns = {}
+    for fc in feature_class_names:
+        out_lyr = out_ds.GetLayerByName(fc)
+        if out_lyr is None:
+            raise Exception(f'Feature class {fc} not found in the output GeoPackage {output_gpkg}. It must already contain the template feature classes.')
+        geom_columns[fc] = out_lyr.GetGeometryColumn()
+
+    # Create a temporary directory to unzip the files
+    temp_dir = tempfile.mkdtemp()
+
+    try:
+        for fc in feature_class_names:
+            if _sql_scalar(out_ds, f"SELECT HasSpatialIndex('{fc}', '{geom_columns[fc]}')") == 1:
+                _sql_scalar(out_ds, f"SELECT DisableSpatialIndex('{fc}', '{geom_columns[fc]}')")
+
+        # Extraction runs ahead of the stitching on a thread pool (decompression releases the GIL) but
+        # only max_workers archives are ever extracted and waiting, and each GeoPackage is deleted as
+        # soon as it has been stitched, so disk use doesn't grow with the number of projects.
+        progbar = ProgressBar(len(zip_files), 50, "Stitching projects")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            def submit(idx: int):
+                return executor.submit(extract_gpkg, os.path.join(directory, zip_files[idx]), relative_input_gpkg, os.path.join(temp_dir, f'{idx}.gpkg'))
 
-    for zip_file in zip_files:
+            pending = {idx: submit(idx) for idx in range(min(max_workers, len(zip_files)))}
+            for idx, zip_file in enumerate(zip_files):
+                progbar.update(idx)
+                input_gpkg = pending.pop(idx).result()
+                if idx + max_workers < len(zip_files):
+                    pending[idx + max_workers] = submit(idx + max_workers)
 
-        # Skip the Alamosa River zip file, because it was used as the seed for the output.
-        # All subsequent Geopackages will be append to this one.
-        # if zip_file == 'VBET_Alamosa_River.zip':
-        #     continue
+                if input_gpkg is None:
+                    log.warning(f'{relative_input_gpkg} not found in {zip_file}. Skipping.')
+                    continue
 
-        # Create a temporary directory to unzip the file
-        temp_dir = tempfile.mkdtemp()
+                stitch_project(out_ds, input_gpkg, geometry_types, geom_columns, out_columns)
+                os.remove(input_gpkg)
+        progbar.finish()
 
+    finally:
+        log.info('Building spatial indexes')
+        for fc in feature_class_names:
+            _sql_scalar(out_ds, f"SELECT CreateSpatialIndex('{fc}', '{geom_columns[fc]}')")
+        out_ds = None
+
+        # Delete the temporary directory and its contents
+        shutil.rmtree(temp_dir)
+
+    # Rows inserted with SQL don't update the layer extents so refresh them once from the rebuilt spatial indexes
+    update_extents(output_gpkg, geom_columns)
+
+
+def stitch_project(out_ds, input_gpkg: str, geometry_types: Dict[str, str], geom_columns: Dict[str, str], out_columns: Dict[str, List[str]]) -> None:
+    """Append every feature class of one project GeoPackage to the output
+
+    Geometries are made valid on the way in. Those that are still the geometry type of the
+    output feature class are copied with a single INSERT ... SELECT. The few that make valid
+    turns into another type (e.g. a MultiPolygon or GeometryCollection) are forced to the
+    output type through OGR, the same as the ogr2ogr -nlt append this replaces.
+
+    Args:
+        out_ds (ogr.DataSource): output GeoPackage opened for update
+        input_gpkg (str): project GeoPackage
+        geometry_types (Dict[str, str]): feature class -> output geometry type (POLYGON, LINESTRING or POINT)
+        geom_columns (Dict[str, str]): feature class -> geometry column
+        out_columns (Dict[str, List[str]]): feature class -> output columns
+    """
+    log = Logger('Stitcher')
+
+    # SQLite won't ATTACH inside a transaction so each project gets one transaction covering all of its layers
+    out_ds.ExecuteSQL(f"ATTACH DATABASE '{input_gpkg}' AS src")
+    try:
+        out_ds.StartTransaction()
         try:
-            # Extract the zip file into the temporary directory
-            with zipfile.ZipFile(os.path.join(directory, zip_file), 'r') as zip_ref:
-                zip_ref.extractall(temp_dir)
+            for fc, geometry_type in geometry_types.items():
+                in_columns = set(get_columns(input_gpkg, fc))
+                if len(in_columns) == 0:
+                    log.warning(f'Feature class {fc} missing from {input_gpkg}')
+                    continue
+                geom_col = geom_columns[fc]
+                columns = [col for col in out_columns[fc] if col in in_columns and col != geom_col]
+                col_list = ', '.join(f'"{col}"' for col in columns + [geom_col])
+                select_list = ', '.join([f'"{col}"' for col in columns] + ['valid_geom'])
+                valid_select = ', '.join([f'"{col}"' for col in columns] + [f'ST_MakeValid("{geom_col}") AS valid_geom'])
+                out_ds.ExecuteSQL(f"""
+                    INSERT INTO main."{fc}" ({col_list})
+                    SELECT {select_list} FROM (SELECT {valid_select} FROM src."{fc}")
+                    WHERE valid_geom IS NULL OR ST_GeometryType(valid_geom) = '{geometry_type}'""")
+
+                coerce_features(out_ds, input_gpkg, fc, geometry_type, geom_col, columns)
+            out_ds.CommitTransaction()
+        except Exception:
+            out_ds.RollbackTransaction()
+            raise
+    finally:
+        out_ds.ExecuteSQL('DETACH DATABASE src')
+
+
+def coerce_features(out_ds, input_gpkg: str, fc: str, geometry_type: str, geom_col: str, columns: List[str]) -> None:
+    """Append the features whose valid geometry isn't the output geometry type, forcing them to that type"""
+
+    fids = []
+    result = out_ds.ExecuteSQL(f"""
+        SELECT rowid FROM (SELECT rowid, ST_MakeValid("{geom_col}") AS valid_geom FROM src."{fc}")
+        WHERE valid_geom IS NOT NULL AND ST_GeometryType(valid_geom) <> '{geometry_type}'""")
+    if result is not None:
+        fids = [feature.GetField(0) for feature in result]
+        out_ds.ReleaseResultSet(result)
+    if len(fids) == 0:
+        return
+
+    out_lyr = out_ds.GetLayerByName(fc)
+    out_defn = out_lyr.GetLayerDefn()
+    in_ds = ogr.Open(input_gpkg)
+    in_lyr = in_ds.GetLayerByName(fc)
+    for fid in fids:
+        in_feature = in_lyr.GetFeature(fid)
+        geom = in_feature.GetGeometryRef().MakeValid()
+        out_feature = ogr.Feature(out_defn)
+        for col in columns:
+            out_feature.SetField(col, in_feature.GetField(col))
+        out_feature.SetGeometry(ogr.ForceTo(geom, GEOMETRY_TYPES[geometry_type]))
+        out_lyr.CreateFeature(out_feature)
+    in_ds = None
+
 
-            for geometry_type, feature_class_list in layers.items():
-                for feature_class in feature_class_list:
-                    input_gpkg = os.path.join(temp_dir, relative_input_gpkg)
-                    cmd = f'ogr2ogr -f GPKG -makevalid -append -nlt {geometry_type} -nln {feature_class} {output_gpkg} {input_gpkg} {feature_class}'
-                    print(cmd)
-                    subprocess.run([cmd], shell=True, cwd=temp_dir)
+def update_extents(gpkg: str, geom_columns: Dict[str, str]) -> None:
+    """Set the gpkg_contents extent of each feature class from its spatial index"""
+    with sqlite3.connect(gpkg) as conn:
+        for fc, geom_col in geom_columns.items():
+            rtree = f'rtree_{fc}_{geom_col}'
+            conn.execute(f"""
+                UPDATE gpkg_contents SET
+                    min_x = (SELECT MIN(minx) FROM "{rtree}"),
+                    min_y = (SELECT MIN(miny) FROM "{rtree}"),
+                    max_x = (SELECT MAX(maxx) FROM "{rtree}"),
+                    max_y = (SELECT MAX(maxy) FROM "{rtree}"),
+                    last_change = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+                WHERE table_name = ?""", [fc])
+        conn.commit()
 
-            # # Now process the DGOs that are in the intermediates folder
-            # inter_gpkg = os.path.join(temp_dir, 'intermediates', 'vbet_intermediates.gpkg')
-            # cmd = f'ogr2ogr -f GPKG -append -makevalid -nlt POLYGON -nln vbet_dgos {output_gpkg} {inter_gpkg} vbet_dgos'
-            # print(cmd)
-            # subprocess.run([cmd], shell=True, cwd=temp_dir)
 
-        finally:
-            # Delete the temporary directory and its contents
-            shutil.rmtree(temp_dir)
+def _sql_scalar(ds, sql: str):
+    """Run a SQL statement through OGR and return the first value of the first row"""
+    result = ds.ExecuteSQL(sql)
+    value = None
+    if result is not None:
+        feature = result.GetNextFeature()
+        if feature is not None:
+            value = feature.GetField(0)
+        ds.ReleaseResultSet(result)
+    return value
 
 
 def main():
@@ -105,6 +277,7 @@ def main():
     parser.add_argument('input_gpkg', help='RELATIVE path within each project where the input feature classes exist', type=str)
     parser.add_argument('output_gpkg', help='Path to existing GeoPackage that possesses the template feature classes for the output', type=str)
     parser.add_argument('layers', help='Top level key from dictionary at top of file picking which layers to import', type=str)
+    parser.add_argument('--workers', help='(optional) number of project zips to extract ahead of the stitching. Defaults to the CPU count', type=int, default=None)
     parser.add_argument('--verbose', help='(optional) a little extra logging ', action='store_true', default=False)
     parser.add_argument('--debug', help='(optional) more output about things like memory usage. There is a performance cost', action='store_true', default=False)
 
@@ -119,7 +292,7 @@ def main():
         raise f'Invalid layer name: {args.layers}'
 
     try:
-        stitch_projects(args.directory, args.input_gpkg, args.output_gpkg, feature_classes[args.layers])
+        stitch_projects(args.directory, args.input_gpkg, args.output_gpkg, feature_classes[args.layers], args.workers)
 
     except Exception as e:
         log.error(e)
@@ -0,0 +1,180 @@
+"""
+Content-addressed checkpoint cache for the TauDEM mpiexec stages.
+
+Each stage is fingerprinted from the content hashes of its input rasters,
+its command line parameters and the installed TauDEM executable (so upgrading
+TauDEM invalidates the cache). When a re-run finds a fingerprint that matches
+the one recorded in the manifest (and the recorded outputs are still on disk
+and unchanged) the stage is skipped and the previous outputs are reused.
+"""
+import os
+import json
+import hashlib
+import shutil
+import threading
+from typing import Callable, Dict, List
+from concurrent.futures import ThreadPoolExecutor
+
+from rsxml import Logger
+from rscommons.hand import run_subprocess
+
+Path = str
+
+MANIFEST_NAME = 'taudem_cache.json'
+HASH_BLOCK_SIZE = 2 ** 20
+
+
+def file_hash(path: Path) -> str:
+    """SHA-256 of a file's contents, read in blocks so large rasters don't have to fit in memory
+
+    Args:
+        path (Path): file to hash
+
+    Returns:
+        str: hex digest
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class TauDEMStageCache:
+    """Records the inputs and outputs of every TauDEM stage in a JSON manifest
+    and skips stages whose fingerprint has not changed since the last run.
+    """
+
+    def __init__(self, cache_dir: Path, ncores: str):
+        self.manifest_path = os.path.join(cache_dir, MANIFEST_NAME)
+        self.ncores = ncores
+        self.log = Logger('TauDEM Cache')
+        self._lock = threading.Lock()
+        # Hashes of files produced (or verified) during this run so downstream stages don't re-read them
+        self._hashes: Dict[Path, str] = {}
+
+        self.manifest = {}
+        if os.path.isfile(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    self.manifest = json.load(f)
+            except (ValueError, OSError):
+                self.log.warning(f'Could not read cache manifest {self.manifest_path}. All stages will be recomputed.')
+                self.manifest = {}
+
+    def _hash(self, path: Path) -> str:
+        with self._lock:
+            if path in self._hashes:
+                return self._hashes[path]
+        digest = file_hash(path)
+        with self._lock:
+            self._hashes[path] = digest
+        return digest
+
+    def tool_version(self, tool: str) -> str:
+        """Identify the installed build of a TauDEM tool by the content hash of its executable
+
+        TauDEM only reports its version while it processes a raster so the executable itself is
+        hashed instead. Any upgrade or rebuild of the tool changes the hash.
+        """
+        executable = shutil.which(tool)
+        return self._hash(executable) if executable is not None else None
+
+    def fingerprint(self, tool: str, inputs: Dict[str, Path], params: List[str]) -> str:
+        """Build the cache key for one stage
+
+        Args:
+            tool (str): TauDEM executable name (pitremove, dinfflowdir...)
+            inputs (Dict[str, Path]): TauDEM flag -> input file path
+            params (List[str]): any extra parameters passed to the tool
+
+        Returns:
+            str: hex digest identifying this combination of inputs
+        """
+        key = {
+            'tool': tool,
+            'version': self.tool_version(tool),
+            'inputs': {flag: self._hash(path) for flag, path in sorted(inputs.items())},
+            'params': params
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def is_current(self, name: str, fingerprint: str, outputs: Dict[str, Path]) -> bool:
+        """True if the manifest says this stage already ran with these inputs and its outputs are intact"""
+        entry = self.manifest.get(name)
+        if entry is None or entry.get('fingerprint') != fingerprint:
+            return False
+        recorded = entry.get('outputs', {})
+        for flag, path in outputs.items():
+            if not os.path.isfile(path) or flag not in recorded or self._hash(path) != recorded[flag]:
+                return False
+        return True
+
+    def record(self, name: str, fingerprint: str, outputs: Dict[str, Path]):
+        """Store the fingerprint and output hashes for a stage and flush the manifest to disk"""
+        output_hashes = {}
+        for flag, path in outputs.items():
+            with self._lock:
+                self._hashes.pop(path, None)
+            output_hashes[flag] = self._hash(path)
+
+        with self._lock:
+            self.manifest[name] = {'fingerprint': fingerprint, 'outputs': output_hashes}
+            tmp_path = self.manifest_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.manifest, f, indent=2)
+            os.replace(tmp_path, self.manifest_path)
+
+    def run(self, cwd: Path, tool: str, inputs: Dict[str, Path], outputs: Dict[str, Path], params: List[str] = None, ncores: str = None,
+            post_process: Callable[[], None] = None, derived_outputs: Dict[str, Path] = None) -> bool:
+        """Run a TauDEM tool through mpiexec unless an identical run is already cached
+
+        Args:
+            cwd (Path): working directory for the subprocess
+            tool (str): TauDEM executable name
+            inputs (Dict[str, Path]): TauDEM flag -> input file path, e.g. {'-fel': pitfill}
+            outputs (Dict[str, Path]): TauDEM flag -> output file path
+            params (List[str], optional): extra arguments appended to the command. Defaults to None.
+            ncores (str, optional): MPI processes for this run (e.g. a share of the cores for concurrent stages). Defaults to the cache's ncores.
+            post_process (Callable[[], None], optional): step run on the tool's outputs after the tool. It is skipped along with the tool
+                when the stage is cached. Defaults to None.
+            derived_outputs (Dict[str, Path], optional): name -> file written by post_process. Cached with the tool outputs. Defaults to None.
+
+        Raises:
+            Exception: if the tool fails or does not produce its outputs
+
+        Returns:
+            bool: True if the stage was served from the cache
+        """
+        params = params or []
+        stage_outputs = {**outputs, **(derived_outputs or {})}
+        fingerprint = self.fingerprint(tool, inputs, params)
+        if self.is_current(tool, fingerprint, stage_outputs):
+            self.log.info(f'{tool}: inputs unchanged since the last run. Reusing cached outputs.')
+            return True
+
+        cmd = ['mpiexec', '-n', str(ncores or self.ncores), tool]
+        for flag, path in list(inputs.items()) + list(outputs.items()):
+            cmd += [flag, path]
+        cmd += params
+
+        status = run_subprocess(cwd, cmd)
+        if status != 0 or not all(os.path.isfile(path) for path in outputs.values()):
+            raise Exception(f'TauDEM: {tool} failed')
+
+        if post_process is not None:
+            post_process()
+            if not all(os.path.isfile(path) for path in stage_outputs.values()):
+                raise Exception(f'TauDEM: post processing for {tool} failed')
+
+        self.record(tool, fingerprint, stage_outputs)
+        return False
+
+
+def run_concurrently(*stages):
+    """Run independent stages at the same time. Each stage is a zero-argument callable.
+    Exceptions raised inside any stage are re-raised here once all the stages have finished.
+    """
+    with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+        futures = [executor.submit(stage) for stage in stages]
+    return [future.result() for future in futures]
@@ -23,12 +23,13 @@ from rsxml.util import safe_makedirs, parse_metadata, pretty_duration
 from rscommons import RSProject, RSLayer, ModelConfig, initGDALOGRErrors
 from rscommons import GeopackageLayer
 from rscommons.vector_ops import copy_feature_class
-from rscommons.hand import hand_rasterize, run_subprocess
+from rscommons.hand import hand_rasterize
 from rscommons.raster_warp import raster_warp
 from rscommons.augment_lyr_meta import augment_layermeta, add_layer_descriptions, raster_resolution_meta
 from rsxml import ProgressBar, Logger, dotenv
 
 from taudem.taudem_report import TauDEMReport
+from taudem.stage_cache import TauDEMStageCache, run_concurrently
 from taudem.__version__ import __version__
 
 initGDALOGRErrors()
@@ -184,70 +185,61 @@ def taudem(huc: int, input_channel_vector: Path, orig_dem: Path, project_folder:
     start_time = time.time()
     log.info('Starting TauDEM processes')
 
-    # TauDEM Products
+    # TauDEM Products. Every stage is checkpointed by the content of its inputs so
+    # re-runs only recompute what has actually changed.
+    cache = TauDEMStageCache(intermediates_path, NCORES)
+    path_pitfill = os.path.join(project_folder, LayerTypes['PITFILL'].rel_path)
+    path_ang = os.path.join(project_folder, LayerTypes['DINFFLOWDIR_ANG'].rel_path)
+    path_slp = os.path.join(project_folder, LayerTypes['DINFFLOWDIR_SLP'].rel_path)
+    hand_raster = os.path.join(project_folder, LayerTypes['HAND_RASTER'].rel_path)
+    path_sca = os.path.join(project_folder, LayerTypes['AREADINF_SCA'].rel_path)
+    path_slp_reclass = os.path.join(project_folder, LayerTypes['DINFFLOWDIR_SLP_RECLASS'].rel_path)
+    twi_raster = os.path.join(project_folder, LayerTypes['TWI_RASTER'].rel_path)
+
     # PitRemove
     log.info("Filling DEM pits")
-    path_pitfill = os.path.join(project_folder, LayerTypes['PITFILL'].rel_path)
-    pitfill_status = run_subprocess(intermediates_path, ["mpiexec", "-n", NCORES, "pitremove", "-z", hand_dem, "-fel", path_pitfill])
-    if pitfill_status != 0 or not os.path.isfile(path_pitfill):
-        raise Exception('TauDEM: pitfill failed')
+    cache.run(intermediates_path, 'pitremove', {'-z': hand_dem}, {'-fel': path_pitfill})
     _pitfill_node, pitfill_raster = project.add_project_raster(proj_nodes['Intermediates'], LayerTypes['PITFILL'])
 
     # Flow Dir
     log.info("Finding dinf flow direction")
-    path_ang = os.path.join(project_folder, LayerTypes['DINFFLOWDIR_ANG'].rel_path)
-    path_slp = os.path.join(project_folder, LayerTypes['DINFFLOWDIR_SLP'].rel_path)
-    dinfflowdir_status = run_subprocess(intermediates_path, ["mpiexec", "-n", NCORES, "dinfflowdir", "-fel", path_pitfill, "-ang", path_ang, "-slp", path_slp])
-    if dinfflowdir_status != 0 or not os.path.isfile(path_ang):
-        raise Exception('TauDEM: dinfflowdir failed')
+
+    def reclass_slope():
+        # Reclass slope to remove 0
+        log.info(f"Reclass zero slope for {path_slp}")
+        reclass_zero_slope(path_slp, path_slp_reclass)
+
+    # The reclassed slope is cached with the slope it comes from
+    cache.run(intermediates_path, 'dinfflowdir', {'-fel': path_pitfill}, {'-ang': path_ang, '-slp': path_slp},
+              post_process=reclass_slope, derived_outputs={'slp_reclass': path_slp_reclass})
     _dinfd_ang_node, dinf_ang_raster = project.add_project_raster(proj_nodes['Intermediates'], LayerTypes['DINFFLOWDIR_ANG'])
     _dinfd_slp_node, dinf_slp_raster = project.add_project_raster(proj_nodes['Outputs'], LayerTypes['DINFFLOWDIR_SLP'])
 
-    # generate hand
-    log.info("Generating HAND")
-    hand_raster = os.path.join(project_folder, LayerTypes['HAND_RASTER'].rel_path)
-    dinfdistdown_status = run_subprocess(intermediates_path, ["mpiexec", "-n", NCORES, "dinfdistdown", "-ang", path_ang, "-fel", path_pitfill, "-src", path_rasterized_drainage, "-dd", hand_raster, "-m", "ave", "v"])
-    if dinfdistdown_status != 0 or not os.path.isfile(hand_raster):
-        raise Exception('TauDEM: dinfdistdown failed')
-    _hand_node, hand_ras = project.add_project_raster(proj_nodes['Outputs'], LayerTypes['HAND_RASTER'])
+    # HAND and TWI run side by side so each gets half of the cores rather than oversubscribing them
+    branch_cores = str(max(1, int(NCORES) // 2))
 
-    # Generate Flow area
-    log.info("Finding flow area")
-    path_sca = os.path.join(project_folder, LayerTypes['AREADINF_SCA'].rel_path)
-    dinfflowarea_status = run_subprocess(intermediates_path, ["mpiexec", "-n", NCORES, "areadinf", "-ang", path_ang, "-sca", path_sca, "-nc"])
-    if dinfflowarea_status != 0 or not os.path.isfile(path_sca):
-        raise Exception('TauDEM: AreaDinf failed')
-    _area_dinf_node, area_dinf_raster = project.add_project_raster(proj_nodes['Outputs'], LayerTypes['AREADINF_SCA'])
+    def generate_hand():
+        log.info("Generating HAND")
+        cache.run(intermediates_path, 'dinfdistdown', {'-ang': path_ang, '-fel': path_pitfill, '-src': path_rasterized_drainage}, {'-dd': hand_raster}, ["-m", "ave", "v"], ncores=branch_cores)
 
-    # Reclass slope to remove 0
-    log.info(f"Reclass zero slope for {path_slp}")
-    path_slp_reclass = os.path.join(project_folder, LayerTypes['DINFFLOWDIR_SLP_RECLASS'].rel_path)
+    def generate_twi():
+        # Generate Flow area
+        log.info("Finding flow area")
+        cache.run(intermediates_path, 'areadinf', {'-ang': path_ang}, {'-sca': path_sca}, ["-nc"], ncores=branch_cores)
 
-    with rasterio.open(path_slp) as rio_slope:
-        out_meta = rio_slope.meta
-        out_meta['compress'] = 'lzw'
-        with rasterio.open(path_slp_reclass, 'w', **out_meta) as rio_out:
-            progbar = ProgressBar(len(list(rio_slope.block_windows(1))), 50, "Reclassifying zero-slope values ")
-            counter = 0
-            for _ji, window in rio_slope.block_windows(1):
-                progbar.update(counter)
-                counter += 1
-                data = rio_slope.read(1, window=window, masked=True)
-                data[data == 0] = 0.0001
-                rio_out.write(data, window=window, indexes=1)
-            progbar.finish()
+        # Generate TWI
+        log.info("Generating Topographic Wetness Index (TWI)")
+        cache.run(intermediates_path, 'twi', {'-slp': path_slp_reclass, '-sca': path_sca}, {'-twi': twi_raster}, ncores=branch_cores)
 
+    # HAND and the contributing area -> TWI chain only share read-only inputs so they can run side by side
+    run_concurrently(generate_hand, generate_twi)
+
+    _hand_node, hand_ras = project.add_project_raster(proj_nodes['Outputs'], LayerTypes['HAND_RASTER'])
+    _area_dinf_node, area_dinf_raster = project.add_project_raster(proj_nodes['Outputs'], LayerTypes['AREADINF_SCA'])
     # reclass_status = run_subprocess(intermediates_path, ['gdal_calc.py', '-A', path_slp, '--outfile', path_slp_reclass, '--calc=(A==0)*0.0001+(A>0)*A', '--co=COMPRESS=LZW'])
     # if reclass_status != 0 or not os.path.isfile(path_slp_reclass):
     #     raise Exception('TauDEM: reclass slope failed')
     _flowdir_node, flow_dir_raster = project.add_project_raster(proj_nodes['Intermediates'], LayerTypes['DINFFLOWDIR_SLP_RECLASS'])
-
-    # Generate TWI
-    log.info("Generating Topographic Wetness Index (TWI)")
-    twi_raster = os.path.join(project_folder, LayerTypes['TWI_RASTER'].rel_path)
-    twi_status = run_subprocess(intermediates_path, ["mpiexec", "-n", NCORES, "twi", "-slp", path_slp_reclass, "-sca", path_sca, '-twi', twi_raster])
-    if twi_status != 0 or not os.path.isfile(twi_raster):
-        raise Exception('TauDEM: TWI failed')
     _twi_node, twi_ras = project.add_project_raster(proj_nodes['Outputs'], LayerTypes['TWI_RASTER'])
 
     # Generate SlopeAveDown
@@ -301,6 +293,28 @@ def taudem(huc: int, input_channel_vector: Path, orig_dem: Path, project_folder:
     log.info('TauDEM Completed Successfully')
 
 
+def reclass_zero_slope(path_slp: Path, path_slp_reclass: Path):
+    """Replace zero slope values with a small positive value so TWI doesn't divide by zero
+
+    Args:
+        path_slp (Path): D-Inf slope raster
+        path_slp_reclass (Path): output raster
+    """
+    with rasterio.open(path_slp) as rio_slope:
+        out_meta = rio_slope.meta
+        out_meta['compress'] = 'lzw'
+        with rasterio.open(path_slp_reclass, 'w', **out_meta) as rio_out:
+            progbar = ProgressBar(len(list(rio_slope.block_windows(1))), 50, "Reclassifying zero-slope values ")
+            counter = 0
+            for _ji, window in rio_slope.block_windows(1):
+                progbar.update(counter)
+                counter += 1
+                data = rio_slope.read(1, window=window, masked=True)
+                data[data == 0] = 0.0001
+                rio_out.write(data, window=window, indexes=1)
+            progbar.finish()
+
+
 def main():
     """ Taudem Launcher
     """
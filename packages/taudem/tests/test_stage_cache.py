@@ -0,0 +1,115 @@
+""" Testing for the TauDEM stage cache with a fake TauDEM tool
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from taudem.stage_cache import TauDEMStageCache, MANIFEST_NAME
+
+TOOL = 'faketool'
+
+
+class StageCacheTest(unittest.TestCase):
+    """Run a fake tool that copies its input to its output. Each new TauDEMStageCache
+    stands in for a new run of the TauDEM project
+    """
+
+    def setUp(self):
+        super(StageCacheTest, self).setUp()
+        self.folder = tempfile.mkdtemp()
+        self.bin = os.path.join(self.folder, 'bin')
+        os.makedirs(self.bin)
+        self.write_tool('build 1')
+        path = mock.patch.dict(os.environ, {'PATH': self.bin + os.pathsep + os.environ.get('PATH', '')})
+        path.start()
+        self.addCleanup(path.stop)
+
+        self.commands = []
+        subprocess = mock.patch('taudem.stage_cache.run_subprocess', side_effect=self.run_tool)
+        subprocess.start()
+        self.addCleanup(subprocess.stop)
+
+        self.dem = os.path.join(self.folder, 'dem.tif')
+        self.pitfill = os.path.join(self.folder, 'pitfill.tif')
+        self.reclass = os.path.join(self.folder, 'reclass.tif')
+        self.post_runs = 0
+        with open(self.dem, 'w', encoding='utf8') as file:
+            file.write('dem 1')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+        super(StageCacheTest, self).tearDown()
+
+    def write_tool(self, content):
+        tool = os.path.join(self.bin, TOOL)
+        with open(tool, 'w', encoding='utf8') as file:
+            file.write(f'#!/bin/sh\n# {content}\n')
+        os.chmod(tool, 0o755)
+
+    def run_tool(self, _cwd, cmd):
+        """Stands in for mpiexec. Copies the -z input to the -fel output"""
+        self.commands.append(cmd)
+        shutil.copyfile(cmd[cmd.index('-z') + 1], cmd[cmd.index('-fel') + 1])
+        return 0
+
+    def post_process(self):
+        self.post_runs += 1
+        shutil.copyfile(self.pitfill, self.reclass)
+
+    def run_stage(self):
+        cache = TauDEMStageCache(self.folder, '2')
+        return cache.run(self.folder, TOOL, {'-z': self.dem}, {'-fel': self.pitfill},
+                         post_process=self.post_process, derived_outputs={'reclass': self.reclass})
+
+    def test_cache_hit(self):
+        self.assertFalse(self.run_stage())
+        self.assertTrue(os.path.isfile(os.path.join(self.folder, MANIFEST_NAME)))
+        self.assertListEqual(self.commands[0], ['mpiexec', '-n', '2', TOOL, '-z', self.dem, '-fel', self.pitfill])
+
+        # Nothing changed so neither the tool nor the post processing runs again
+        self.assertTrue(self.run_stage())
+        self.assertEqual(len(self.commands), 1)
+        self.assertEqual(self.post_runs, 1)
+
+    def test_input_changed(self):
+        self.run_stage()
+        with open(self.dem, 'w', encoding='utf8') as file:
+            file.write('dem 2')
+
+        self.assertFalse(self.run_stage())
+        self.assertEqual(len(self.commands), 2)
+        self.assertEqual(self.post_runs, 2)
+        with open(self.reclass, 'r', encoding='utf8') as file:
+            self.assertEqual(file.read(), 'dem 2')
+
+    def test_tool_changed(self):
+        self.run_stage()
+        self.write_tool('build 2')
+
+        self.assertFalse(self.run_stage())
+        self.assertEqual(len(self.commands), 2)
+
+    def test_output_missing(self):
+        for output in [self.pitfill, self.reclass]:
+            self.run_stage()
+            os.remove(output)
+
+            self.assertFalse(self.run_stage())
+            self.assertTrue(os.path.isfile(output))
+        self.assertEqual(len(self.commands), 3)
+        self.assertEqual(self.post_runs, 3)
+
+    def test_output_modified(self):
+        self.run_stage()
+        with open(self.pitfill, 'w', encoding='utf8') as file:
+            file.write('edited')
+
+        self.assertFalse(self.run_stage())
+        self.assertEqual(len(self.commands), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,7 +12,7 @@ from pathlib import Path
 
 import geopandas as gpd
 from rsxml import Logger
-from vector_prep import vector_prep, output_gdf
+from vector_prep import vector_prep_stream, output_gdf
 from fetch_arcgis_metadata import fetch_columns_from_hub_url, update_layer_definitions
 
 # Fixed namespace for RS_ROW_ID derivation — do not change once data is published
@@ -40,19 +40,19 @@ class RunInputs:
 
 
 def step_1(cfg: RunInputs, dist_dir):
-    """vector prep (error checks) and output to 4326"""
-    prepped_gdf = vector_prep(cfg.input_vector_path, None, cfg.tolerance, cfg.epsg)
+    """vector prep (error checks) streamed batch by batch to the 4326 output"""
     source_category_stub = 'usgov_sources' if cfg.source_category == 'usgov' else f'raw_{cfg.source_category}'
 
     output_dir = dist_dir / source_category_stub / cfg.layer_id / cfg.snapshot_id
     output_dir.mkdir(parents=True, exist_ok=True)
     output_file = output_dir / f"{cfg.layer_id}.gpkg"
-    output_gdf(prepped_gdf, output_file, cfg.input_layer_name)
-    return prepped_gdf, output_file
+    stats = vector_prep_stream(cfg.input_vector_path, output_file, None, cfg.tolerance, cfg.epsg, output_layer_name=cfg.input_layer_name)
+    return stats, output_file
 
-def step_2(gdf, cfg: RunInputs, output_file: Path):
-    """Add ST_ALLOT_PAST_NAME, ST_ALLOT_PAST_MULTI, and deterministic RS_ROW_ID from GlobalID."""
+def step_2(cfg: RunInputs, output_file: Path):
+    """Add ST_ALLOT_PAST_NAME, ST_ALLOT_PAST_MULTI, and deterministic RS_ROW_ID from GlobalID to the step_1 output."""
     log = Logger("Step2")
+    gdf = read_output(cfg, output_file)
     # Uniqueness check on GlobalID
     n_dupes = gdf['GlobalID'].duplicated().sum()
     if n_dupes > 0:
@@ -98,6 +98,14 @@ def step_2(gdf, cfg: RunInputs, output_file: Path):
     log.info(f"step_2 complete: added ST_ALLOT_PAST_NAME, ST_ALLOT_PAST_MULTI, RS_ROW_ID. Shape: {gdf.shape}")
     return gdf
 
+def read_output(cfg: RunInputs, output_file: Path) -> gpd.GeoDataFrame:
+    """Read back the cleaned layer written by step_1"""
+    log = Logger("Vector Prep Orchestrate")
+    log.info(f"Loading step_1 output from {output_file}")
+    gdf = gpd.read_file(output_file, layer=cfg.input_layer_name or output_file.stem)
+    log.info(f"Loaded {len(gdf)} features")
+    return gdf
+
 # Derived columns added by step_2 — hard-coded since they are always the same for this dataset.
 _STEP2_COLUMNS: list[dict] = [
     {
@@ -303,18 +311,14 @@ def main():
     log_file = logs_dir / f"vector_prep_orchestrate_{cfg.layer_id}_{cfg.snapshot_id}.log"
     log.setup(log_path=str(log_file), verbose=True)
     
-    # prepped_gdf, outputpath = step_1(cfg, dist_dir)
-    # log.info(f"Prepped dataframe with shape {gdf.shape} and outputed to {output_file}")
+    # stats, output_file = step_1(cfg, dist_dir)
+    # log.info(f"Prepped {stats['written']} features and outputed to {output_file}")
     
     # duplicates logic in step1
     source_category_stub = 'usgov_sources' if cfg.source_category == 'usgov' else f'raw_{cfg.source_category}'
     output_file = dist_dir / source_category_stub / cfg.layer_id / cfg.snapshot_id / f"{cfg.layer_id}.gpkg"
 
-    log.info(f"Loading step_1 output from {output_file}")
-    gdf = gpd.read_file(output_file)
-    log.info(f"Loaded {len(gdf)} features")
-
-    enriched_gdf = step_2(gdf, cfg, output_file)
+    enriched_gdf = step_2(cfg, output_file)
     log.info(f"Enriched dataframe with shape {enriched_gdf.shape} written to {output_file}")
 
     build_layer_defs(cfg)
@@ -8,6 +8,10 @@ and any fields.
 
 The output is always a GeoPackage layer with cleaned geometries, reprojected to EPSG:4326.
 
+Large layers are processed by vector_prep_stream(), which reads the input in batches,
+cleans the batches in parallel worker processes and appends each one to the output
+GeoPackage as soon as it is ready, so the whole layer is never held in memory.
+
 Philip Bailey
 27 Nov 2025
 """
@@ -15,9 +19,15 @@ import argparse
 import sys
 import os
 import traceback
+import importlib.util
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import numpy as np
 import geopandas as gpd
+import pyogrio
+import shapely
 from shapely.geometry.base import BaseGeometry
 from shapely import make_valid  # shapely >=1.8
 from rsxml import Logger, dotenv
@@ -25,6 +35,14 @@ from rsxml import Logger, dotenv
 # This script always produces the output in GeoPackage format
 OUTPUT_DRIVER = "GPKG"
 
+# Number of features read, cleaned and written at a time by vector_prep_stream
+DEFAULT_BATCH_SIZE = 100000
+
+# Read batches through Arrow when pyarrow is installed (much faster for wide layers)
+USE_ARROW = importlib.util.find_spec("pyarrow") is not None
+
+STAT_KEYS = ["input_count", "null_or_empty", "invalid_fixed", "invalid_unfixed", "simplified_count"]
+
 
 def vector_prep(input_dataset: Path | str, layer_name: str | None, tolerance: float, epsg: int | None) -> gpd.GeoDataFrame:
 
@@ -49,62 +67,171 @@ def vector_prep(input_dataset: Path | str, layer_name: str | None, tolerance: fl
     geom_types = gdf.geom_type.value_counts().to_dict()
     log.info(f"Geometry type of input: {geom_types}")
 
-    # Drop features with null geometry right away (to reduce work)
-    # We'll also handle empty/invalid ones in our cleaning step
-    # Create a copy to preserve original until final write
+    if epsg:
+        log.info(f"Reprojecting to EPSG:{epsg} for processing...")
+    log.info(f"Cleaning geometries (tolerance={tolerance})...")
+    gdf_proc, stats = prep_batch(gdf, tolerance, epsg)
+    log_stats(stats, len(gdf_proc))
+
+    # If nothing remains
+    if len(gdf_proc) == 0:
+        raise Exception("No valid geometries remain after cleaning. Aborting write.")
+
+    # Make sure there is a column called FID (some drivers require it)
+    if "FID" not in gdf_proc.columns:
+        gdf_proc = gdf_proc.reset_index(drop=True)
+        gdf_proc["FID"] = gdf_proc.index.astype('int64')
+
+    return gdf_proc
+
+
+def prep_batch(gdf: gpd.GeoDataFrame, tolerance: float, epsg: int | None) -> tuple[gpd.GeoDataFrame, dict]:
+    """Reproject, clean and drop the null/empty geometries of a GeoDataFrame (a whole layer or one batch of it)
+
+    Returns the cleaned GeoDataFrame and the clean_geometries diagnostics dict
+    (with an extra "dropped" count of the features removed after cleaning).
+    """
     gdf_proc = gdf.copy()
 
     # Reproject to specified Cartesian CRS for processing
     if epsg:
-        log.info(f"Reprojecting to EPSG:{epsg} for processing...")
         try:
             gdf_proc = gdf_proc.to_crs(epsg=epsg)
-            log.info(f"Reprojection complete. New CRS: {gdf_proc.crs}")
         except Exception as e:
             raise Exception(f"Failed to reproject to EPSG:{epsg}: {e}") from e
 
     # Clean geometries (fix invalids, simplify)
-    log.info(f"Cleaning geometries (tolerance={tolerance})...")
     cleaned_geom_series, stats = clean_geometries(gdf_proc.geometry, simplify_tolerance=tolerance)
 
     # assign cleaned geometries back
     gdf_proc["geometry"] = cleaned_geom_series
 
     # Drop rows where geometry is None or empty after cleaning
-    before_drop = len(gdf_proc)
-    gdf_proc = gdf_proc[~gdf_proc["geometry"].isna()]
-    gdf_proc = gdf_proc[~gdf_proc["geometry"].is_empty]
-    after_drop = len(gdf_proc)
-    dropped = before_drop - after_drop
+    keep = ~(gdf_proc["geometry"].isna() | gdf_proc["geometry"].is_empty)
+    stats["dropped"] = int((~keep).sum())
+    gdf_proc = gdf_proc[keep]
+
+    blank_strings_to_none(gdf_proc)
+    return gdf_proc, stats
+
+
+def blank_strings_to_none(gdf: gpd.GeoDataFrame) -> None:
+    """Set empty and whitespace-only strings to None in every text column (to avoid issues with some drivers)"""
+    for col in gdf.select_dtypes(include=['object']).columns:
+        if col == gdf.geometry.name:
+            continue
+        values = gdf[col]
+        try:
+            blank = values.str.strip().eq("")
+        except AttributeError:
+            # No string values in this column
+            blank = np.zeros(len(values), dtype=bool)
+        gdf[col] = values.where(~(values.isna() | blank), None)
+
 
+def log_stats(stats: dict, remaining: int) -> None:
+    """Log the clean_geometries diagnostics"""
+    log = Logger("Vector Prep")
     log.info(f"Input features: {stats['input_count']}")
     log.info(f"Null/empty geometries found: {stats['null_or_empty']}")
     log.info(f"Invalid geometries fixed: {stats['invalid_fixed']}")
     log.info(f"Invalid geometries unfixed (dropped): {stats['invalid_unfixed']}")
     log.info(f"Features simplified: {stats['simplified_count']}")
-    log.info(f"Dropped features after cleaning: {dropped}")
-    log.info(f"Remaining features to write: {len(gdf_proc)}")
+    log.info(f"Dropped features after cleaning: {stats['dropped']}")
+    log.info(f"Remaining features to write: {remaining}")
+
+
+def _prep_stream_batch(input_dataset: str, layer_name: str | None, skip_features: int, max_features: int,
+                       tolerance: float, epsg: int | None) -> tuple[gpd.GeoDataFrame, dict]:
+    """Worker: read one batch of the input, clean it and reproject it to EPSG 4326 for output"""
+    gdf = pyogrio.read_dataframe(input_dataset, layer=layer_name, skip_features=skip_features, max_features=max_features,
+                                 use_arrow=USE_ARROW)
+    gdf_proc, stats = prep_batch(gdf, tolerance, epsg)
+    return gdf_proc.to_crs(epsg=4326), stats
+
+
+def vector_prep_stream(input_dataset: Path | str, output_dataset: Path | str, layer_name: str | None, tolerance: float, epsg: int | None,
+                       batch_size: int = DEFAULT_BATCH_SIZE, workers: int | None = None, output_layer_name: str | None = None) -> dict:
+    """Clean a vector layer batch by batch and write it to a GeoPackage layer in EPSG 4326
+
+    The same cleaning as vector_prep() followed by output_gdf(), but the input is read
+    batch_size features at a time, the batches are cleaned in parallel worker processes
+    and each cleaned batch is appended to the output in input order as soon as it is ready.
+    Only a few batches are ever in memory at once.
+
+    Args:
+        input_dataset (Path | str): input vector (ShapeFile, GeoPackage etc.)
+        output_dataset (Path | str): output GeoPackage. Replaced if it already exists.
+        layer_name (str | None): input layer and output layer name (defaults to the first layer / the output file name)
+        tolerance (float): simplify tolerance (0 to skip)
+        epsg (int | None): Cartesian CRS to clean in
+        batch_size (int, optional): features per batch. Defaults to DEFAULT_BATCH_SIZE.
+        workers (int | None, optional): worker processes. Defaults to the number of CPUs.
+        output_layer_name (str | None, optional): output layer name when it differs from layer_name. Defaults to None.
+
+    Returns:
+        dict: clean_geometries diagnostics summed over all the batches, plus "dropped" and "written" counts
+    """
+    log = Logger("Vector Prep")
+    input_dataset = Path(input_dataset)
+    if not input_dataset.exists():
+        raise Exception(f"Input file does not exist: {input_dataset}")
 
-    # If nothing remains
-    if len(gdf_proc) == 0:
+    info = pyogrio.read_info(input_dataset, layer=layer_name, force_feature_count=True)
+    feature_count = info["features"]
+    log.info(f"Streaming {feature_count:,} features from {input_dataset} in batches of {batch_size:,}. CRS: {info['crs']}")
+
+    remove_existing(output_dataset)
+    out_layer = output_layer_name or layer_name or os.path.splitext(os.path.basename(output_dataset))[0]
+    # Keep the layer multi-part when the input is, so batches with only single-part geometries match the first batch written
+    promote_to_multi = str(info["geometry_type"]).startswith("Multi")
+
+    workers = workers or os.cpu_count() or 1
+    offsets = deque(range(0, feature_count, batch_size))
+    totals = {key: 0 for key in STAT_KEYS + ["dropped", "written"]}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        while offsets or pending:
+            # Keep a couple of batches queued per worker but no more, so memory stays bounded
+            while offsets and len(pending) < workers * 2:
+                pending.append(executor.submit(_prep_stream_batch, str(input_dataset), layer_name, offsets.popleft(), batch_size, tolerance, epsg))
+
+            batch, stats = pending.popleft().result()
+            for key in STAT_KEYS + ["dropped"]:
+                totals[key] += stats[key]
+
+            if len(batch) == 0:
+                continue
+
+            # Make sure there is a column called FID (some drivers require it). GDAL makes the FID column the
+            # GeoPackage fid when the layer is created and appended rows are then numbered on from the last fid,
+            # so the FID column is only written with the first batch.
+            first_batch = totals["written"] == 0
+            if first_batch and "FID" not in batch.columns:
+                batch = batch.reset_index(drop=True)
+                batch["FID"] = batch.index.astype('int64')
+            elif not first_batch and "FID" in batch.columns:
+                batch = batch.drop(columns=["FID"])
+
+            try:
+                batch.to_file(output_dataset, driver=OUTPUT_DRIVER, layer=out_layer, mode="w" if first_batch else "a",
+                              promote_to_multi=promote_to_multi)
+            except Exception as e:
+                raise Exception(f"Failed to write output: {e}") from e
+            totals["written"] += len(batch)
+            log.info(f"Written {totals['written']:,} features ({totals['input_count']:,} of {feature_count:,} read)")
+
+    log_stats(totals, totals["written"])
+    if totals["written"] == 0:
         raise Exception("No valid geometries remain after cleaning. Aborting write.")
-    
-    # Loop over all string columns and ensure that empty strings are set to None (to avoid issues with some drivers)
-    for col in gdf_proc.select_dtypes(include=['object']).columns:
-        gdf_proc[col] = gdf_proc[col].apply(lambda x: x if x and str(x).strip() != "" else None)
 
-    # Make sure there is a column called FID (some drivers require it)
-    if "FID" not in gdf_proc.columns:
-        gdf_proc = gdf_proc.reset_index(drop=True)
-        gdf_proc["FID"] = gdf_proc.index.astype('int64')
-    
-    return gdf_proc
+    return totals
 
 
-def output_gdf(gdf: gpd.GeoDataFrame, output_dataset:str, layer_name: str | None):
-    """Save the gpd to file (geopackage layer) in EPSG 4326"""
-    # Reproject to EPSG for final output
-    log = Logger ("Output GDF")
+def remove_existing(output_dataset: Path | str) -> None:
+    """Remove an existing output file before it is written"""
+    log = Logger("Output GDF")
 
     # If output exists and overwrite requested, remove it first (be careful with gpkg)
     if os.path.exists(output_dataset):
@@ -119,6 +246,13 @@ def output_gdf(gdf: gpd.GeoDataFrame, output_dataset:str, layer_name: str | None
             log.debug("Could not remove existing file prior to write (continuing)...")
 
 
+def output_gdf(gdf: gpd.GeoDataFrame, output_dataset:str, layer_name: str | None):
+    """Save the gpd to file (geopackage layer) in EPSG 4326"""
+    # Reproject to EPSG for final output
+    log = Logger ("Output GDF")
+
+    remove_existing(output_dataset)
+
     log.info("Reprojecting to EPSG 4326 for output")
     gdf = gdf.to_crs(epsg=4326)
 
@@ -161,68 +295,71 @@ def clean_geometries(gseries, simplify_tolerance):
       - drop null/empty
       - attempt to fix invalid/self-intersecting geometries
       - apply topology-preserving simplify (Shapely's simplify with preserve_topology=True)
+    Each step runs on the whole array of geometries at once. If a vectorized step fails
+    on a malformed geometry that step falls back to one feature at a time.
     Returns cleaned GeoSeries and diagnostics dict.
     """
-    cleaned = []
+    geoms = np.asarray(gseries.values, dtype=object).copy()
     stats = {
-        "input_count": len(gseries),
+        "input_count": len(geoms),
         "null_or_empty": 0,
         "invalid_fixed": 0,
         "invalid_unfixed": 0,
         "simplified_count": 0,
     }
 
-    for idx, geom in enumerate(gseries):
-        if geom is None:
-            stats["null_or_empty"] += 1
-            cleaned.append(None)
-            continue
-        # some drivers give empty geometries instead of None
-        try:
-            if geom.is_empty:
-                stats["null_or_empty"] += 1
-                cleaned.append(None)
-                continue
-        except Exception:
-            # if .is_empty fails, we'll try to continue
-            pass
-
-        # If geometry invalid, try to fix
-        try:
-            is_valid = geom.is_valid
-        except Exception:
-            # some malformed geometries might raise; attempt fix
-            is_valid = False
-
-        if not is_valid:
-            fixed = safe_make_valid(geom)
-            if fixed is not None and not fixed.is_empty:
-                geom = fixed
-                stats["invalid_fixed"] += 1
-            else:
-                stats["invalid_unfixed"] += 1
-                # keep as-is (or set to None) - we'll mark as None to drop later
-                cleaned.append(None)
-                continue
+    # some drivers give empty geometries instead of None
+    present = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+    stats["null_or_empty"] = int((~present).sum())
+    geoms[~present] = None
+
+    # If geometry invalid, try to fix
+    invalid = present & ~shapely.is_valid(geoms)
+    if np.any(invalid):
+        fixed = _apply(make_valid, safe_make_valid, geoms[invalid])
+        fixed_ok = ~(shapely.is_missing(fixed) | shapely.is_empty(fixed))
+        stats["invalid_fixed"] = int(fixed_ok.sum())
+        # mark unfixed as None to drop later
+        stats["invalid_unfixed"] = int((~fixed_ok).sum())
+        geoms[invalid] = np.where(fixed_ok, fixed, None)
+
+    # If simplify tolerance > 0, simplify while trying to preserve topology
+    if simplify_tolerance is not None and simplify_tolerance > 0:
+        valid = ~shapely.is_missing(geoms)
+        simplified = _apply(lambda arr: shapely.simplify(arr, simplify_tolerance, preserve_topology=True),
+                            lambda geom: _safe_simplify(geom, simplify_tolerance), geoms[valid])
+
+        # ensure simplification didn't produce empty geometry, otherwise keep original geom (already valid)
+        simplified_ok = ~(shapely.is_missing(simplified) | shapely.is_empty(simplified))
+        # if simplification creates invalid geometry, try to make valid again
+        reinvalid = simplified_ok & ~shapely.is_valid(simplified)
+        if np.any(reinvalid):
+            simplified[reinvalid] = _apply(make_valid, safe_make_valid, simplified[reinvalid])
+
+        stats["simplified_count"] = int(simplified_ok.sum())
+        geoms[valid] = np.where(simplified_ok, simplified, geoms[valid])
+
+    return gpd.GeoSeries(geoms, index=gseries.index, crs=gseries.crs), stats
+
+
+def _apply(vectorized, per_feature, geoms: np.ndarray) -> np.ndarray:
+    """Run a vectorized shapely operation, falling back to a per-feature function if it raises"""
+    try:
+        return np.asarray(vectorized(geoms), dtype=object)
+    except Exception as e:
+        Logger("Error").debug(f"Vectorized geometry operation failed ({e}). Retrying one feature at a time")
+        out = np.empty(len(geoms), dtype=object)
+        out[:] = [per_feature(geom) for geom in geoms]
+        return out
 
-        # If simplify tolerance > 0, simplify while trying to preserve topology
-        if simplify_tolerance is not None and simplify_tolerance > 0:
-            try:
-                simplified = geom.simplify(simplify_tolerance, preserve_topology=True)
-                # ensure simplification didn't produce empty / invalid geometry
-                if simplified is not None and not simplified.is_empty:
-                    # if simplification creates invalid geometry, try to make valid again
-                    if not simplified.is_valid:
-                        simplified = safe_make_valid(simplified)
-                    geom = simplified
-                    stats["simplified_count"] += 1
-            except Exception as e:
-                log = Logger("Error")
-                log.debug(f"simplify failed on feature {idx}: {e}")
-                # keep original geom (already valid)
-        cleaned.append(geom)
 
-    return gpd.GeoSeries(cleaned, index=gseries.index, crs=gseries.crs), stats
+def _safe_simplify(geom: BaseGeometry, tolerance: float):
+    """Simplify one geometry, or return None if it can't be simplified"""
+    try:
+        return geom.simplify(tolerance, preserve_topology=True)
+    except Exception as e:
+        Logger("Error").debug(f"simplify failed: {e}")
+        return None
 
 
 def main():
@@ -232,6 +369,8 @@ def main():
     parser.add_argument("--layer", help="Layer name (for geopackage). If not provided and input is geopackage, first layer is used.", default=None)
     parser.add_argument("--tolerance", type=float, help="Simplify tolerance in METRES (0 to skip).", default=0.0)
     parser.add_argument("--epsg", type=int, help="Cartesian CRS EPSG code to reproject to before processing (optional). Default is 5070 (NAD83 / Conus Albers).", default=5070)
+    parser.add_argument("--batch_size", type=int, help=f"Features read, cleaned and written at a time. Default is {DEFAULT_BATCH_SIZE}.", default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, help="Worker processes cleaning batches in parallel. Default is the number of CPUs.", default=None)
     parser.add_argument('--verbose', help='(optional) a little extra logging', action='store_true', default=False)
     args = dotenv.parse_args_env(parser)
 
@@ -239,8 +378,7 @@ def main():
     log.setup(log_path=os.path.join(os.path.dirname(args.output), "vector_prep.log"), verbose=args.verbose)
 
     try:
-        prepped_gdf = vector_prep(args.input, args.layer, float(args.tolerance), int(args.epsg))
-        output_gdf(prepped_gdf, args.output, args.layer)
+        vector_prep_stream(args.input, args.output, args.layer, float(args.tolerance), int(args.epsg), args.batch_size, args.workers)
     except Exception as e:
         log.error("Vector prep failed: %s", e)
         log.debug(traceback.format_exc())